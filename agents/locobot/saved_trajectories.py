@@ -2,14 +2,13 @@ import os
 import copy
 import time
 import shutil
-import json
 import math
-import cv2
 import numpy as np
 import open3d as o3d
 from droidlet import dashboard
 from droidlet.dashboard.o3dviz import o3dviz
 from droidlet.lowlevel.hello_robot.hello_robot_mover import HelloRobotMover
+from droidlet.lowlevel.hello_robot.frame_store import open_recording
 
 if __name__ == "__main__":
     o3dviz.start()
@@ -38,21 +37,15 @@ def load_data(idx):
     # root = "/home/soumith/collision/hello_data_log_1638331896.0773966/1"
     # root = "/home/soumith/collision/hello_data_log_1638338130.298805/2"
 
-    rgb_path = os.path.join(root, "rgb", str(idx) + ".jpg")
-    depth_path = os.path.join(root, "depth", str(idx) + ".npy")
-    odo_path = os.path.join(root, "data.json")
-
-    with open(odo_path) as f:
-        data = json.load(f)
-
-    odometry = data[str(idx)]
+    # reads both chunked recordings and the older per-frame folders
+    frame, odometry = open_recording(root)[idx]
     base_state = np.array(odometry["base_xyt"])
     cam_transform = np.array(odometry["cam_transform"])
     cam_pan_tilt = np.array(odometry["cam_pan_tilt"])
     print("cam pan_tilt", cam_pan_tilt)
 
-    rgb = cv2.imread(rgb_path)
-    depth = np.load(depth_path)
+    rgb = frame["rgb"]
+    depth = frame["depth"]
 
     # unrotate to compute point-cloud
     rgb = np.rot90(rgb, k=-1, axes=(1,0))
@@ -0,0 +1,369 @@
+"""
+Copyright (c) Facebook, Inc. and its affiliates.
+
+Chunked on-disk container for RGB-D recordings.
+
+Frames are appended by a capture thread into a bounded queue, grouped into
+fixed-size chunks by a background batcher and written out (optionally
+compressed) by a small pool of writer threads. Each chunk is a single ``.npz``
+file holding the stacked arrays of all its frames; ``index.jsonl`` is an
+append-only log with one line per finished chunk, so a recording that was cut
+short is still readable up to its last complete chunk.
+
+Layout of a recording directory::
+
+    root/
+        meta.json          # recording-level metadata (e.g. camera intrinsics)
+        index.jsonl        # one json line per chunk, in frame order
+        chunk_000000.npz
+        chunk_000001.npz
+        ...
+
+Recordings made before this format, with one file per frame and field, are
+read by ``LegacyFrameReader``; ``open_recording`` picks the right reader.
+"""
+import os
+import json
+import queue
+import pickle
+import threading
+import logging
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+INDEX_FILE = "index.jsonl"
+META_FILE = "meta.json"
+CHUNK_FILE = "chunk_{:06d}.npz"
+
+# prefix of the npz entries that store pickled, non-array payloads (e.g. lidar scans)
+_BLOB_PREFIX = "__blob__"
+_OFFSETS_SUFFIX = "__offsets__"
+
+
+def _pack_chunk(frames):
+    """Stacks the array fields of ``frames`` into a dict ready for ``np.savez``.
+
+    Array fields with a consistent shape and dtype across the chunk are stacked
+    along a new leading axis. Everything else is pickled and concatenated into a
+    single uint8 buffer, with an offsets array for random access.
+    """
+    arrays = {}
+    for key in frames[0]:
+        values = [f[key] for f in frames]
+        if all(isinstance(v, np.ndarray) for v in values) and (
+            len({(v.shape, v.dtype) for v in values}) == 1
+        ):
+            arrays[key] = np.stack(values)
+        else:
+            blobs = [pickle.dumps(v, protocol=pickle.HIGHEST_PROTOCOL) for v in values]
+            offsets = np.cumsum([0] + [len(b) for b in blobs], dtype=np.int64)
+            arrays[_BLOB_PREFIX + key] = np.frombuffer(b"".join(blobs), dtype=np.uint8)
+            arrays[_BLOB_PREFIX + key + _OFFSETS_SUFFIX] = offsets
+    return arrays
+
+
+def _unpack_chunk(npz):
+    """Inverse of ``_pack_chunk``: returns ``{key: stacked array or list of objects}``."""
+    fields = {}
+    for name in npz.files:
+        if name.endswith(_OFFSETS_SUFFIX):
+            continue
+        if name.startswith(_BLOB_PREFIX):
+            key = name[len(_BLOB_PREFIX) :]
+            buf = npz[name].tobytes()
+            offsets = npz[name + _OFFSETS_SUFFIX]
+            fields[key] = [
+                pickle.loads(buf[offsets[i] : offsets[i + 1]]) for i in range(len(offsets) - 1)
+            ]
+        else:
+            fields[name] = npz[name]
+    return fields
+
+
+class ChunkedFrameWriter:
+    """Asynchronous, chunked recorder.
+
+    ``put`` is cheap and never touches the disk: frames are handed to a bounded
+    queue and written by background threads. If the disk cannot keep up the
+    queue fills and ``put`` either blocks (``block=True``, default) or drops the
+    frame and counts it in ``dropped``.
+
+    Args:
+        root (str): output directory, created if needed
+        chunk_size (int): number of frames per chunk file
+        queue_size (int): maximum number of frames buffered in memory
+        num_writers (int): number of threads compressing and writing chunks
+        compress (bool): use ``np.savez_compressed`` for each chunk
+        meta (dict): optional recording-level metadata, stored in meta.json
+    """
+
+    def __init__(
+        self, root, chunk_size=32, queue_size=256, num_writers=2, compress=True, meta=None
+    ):
+        self.root = root
+        self.chunk_size = chunk_size
+        self.compress = compress
+        self.dropped = 0
+        self.num_frames = 0
+        os.makedirs(root, exist_ok=True)
+        if meta is not None:
+            with open(os.path.join(root, META_FILE), "w") as fp:
+                json.dump(meta, fp)
+
+        self._frames = queue.Queue(maxsize=queue_size)
+        # a chunk holds chunk_size frames; keep at most one pending chunk per writer
+        self._chunks = queue.Queue(maxsize=num_writers)
+        self._index_lock = threading.Lock()
+        self._next_index_chunk = 0
+        self._finished = {}
+        self._error = None
+
+        self._batcher = threading.Thread(target=self._batch_loop, daemon=True)
+        self._writers = [
+            threading.Thread(target=self._write_loop, daemon=True) for _ in range(num_writers)
+        ]
+        self._batcher.start()
+        for w in self._writers:
+            w.start()
+
+    def put(self, frame, meta=None, block=True):
+        """Queues one frame for writing.
+
+        Args:
+            frame (dict): ``{name: np.ndarray or picklable object}``. Every frame
+                of a recording must have the same keys.
+            meta (dict): json-serializable per-frame metadata (pose, timestamp...)
+            block (bool): wait for room in the queue instead of dropping the frame
+
+        Returns:
+            True if the frame was queued, False if it was dropped.
+        """
+        if self._error is not None:
+            raise RuntimeError("frame writer failed") from self._error
+        try:
+            self._frames.put((frame, meta or {}), block=block)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.num_frames += 1
+        return True
+
+    def close(self):
+        """Flushes the pending frames and waits for all chunks to be on disk."""
+        self._frames.put(None)
+        self._batcher.join()
+        for _ in self._writers:
+            self._chunks.put(None)
+        for w in self._writers:
+            w.join()
+        if self._error is not None:
+            raise RuntimeError("frame writer failed") from self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _batch_loop(self):
+        chunk_id = 0
+        start = 0
+        frames, metas = [], []
+        while True:
+            item = self._frames.get()
+            if item is not None:
+                frames.append(item[0])
+                metas.append(item[1])
+            if frames and (item is None or len(frames) == self.chunk_size):
+                self._chunks.put((chunk_id, start, frames, metas))
+                chunk_id += 1
+                start += len(frames)
+                frames, metas = [], []
+            if item is None:
+                return
+
+    def _write_loop(self):
+        while True:
+            item = self._chunks.get()
+            if item is None:
+                return
+            chunk_id, start, frames, metas = item
+            fname = CHUNK_FILE.format(chunk_id)
+            entry = {"chunk": fname, "start": start, "count": len(frames), "meta": metas}
+            try:
+                save = np.savez_compressed if self.compress else np.savez
+                tmp = os.path.join(self.root, fname + ".tmp")
+                with open(tmp, "wb") as fp:
+                    save(fp, **_pack_chunk(frames))
+                os.replace(tmp, os.path.join(self.root, fname))
+            except Exception as e:
+                logging.exception("failed to write chunk {}".format(fname))
+                self._error = e
+                entry = None
+            self._append_index(chunk_id, entry)
+
+    def _append_index(self, chunk_id, entry):
+        # chunks can finish out of order when there are several writers; keep
+        # the index in frame order so the reader can bisect it.
+        with self._index_lock:
+            self._finished[chunk_id] = entry
+            with open(os.path.join(self.root, INDEX_FILE), "a") as fp:
+                while self._next_index_chunk in self._finished:
+                    entry = self._finished.pop(self._next_index_chunk)
+                    if entry is not None:
+                        fp.write(json.dumps(entry) + "\n")
+                    self._next_index_chunk += 1
+
+
+class ChunkedFrameReader:
+    """Random-access reader for recordings written by ``ChunkedFrameWriter``.
+
+    Decompressed chunks are kept in a small LRU cache, so sequential reads and
+    reads clustered in time only decompress each chunk once.
+
+    Args:
+        root (str): recording directory
+        cache_size (int): number of decompressed chunks kept in memory
+    """
+
+    def __init__(self, root, cache_size=2):
+        self.root = root
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.meta = {}
+        meta_path = os.path.join(root, META_FILE)
+        if os.path.isfile(meta_path):
+            with open(meta_path, "r") as fp:
+                self.meta = json.load(fp)
+
+        self._chunks = []
+        with open(os.path.join(root, INDEX_FILE), "r") as fp:
+            for line in fp:
+                line = line.strip()
+                if line:
+                    self._chunks.append(json.loads(line))
+        self._starts = np.array([c["start"] for c in self._chunks], dtype=np.int64)
+        self._len = sum(c["count"] for c in self._chunks)
+
+    def __len__(self):
+        return self._len
+
+    def _locate(self, idx):
+        if idx < 0:
+            idx += self._len
+        if idx < 0 or idx >= self._len:
+            raise IndexError("frame index {} out of range".format(idx))
+        c = int(np.searchsorted(self._starts, idx, side="right")) - 1
+        return c, idx - self._chunks[c]["start"]
+
+    def _load_chunk(self, c):
+        if c in self._cache:
+            self._cache.move_to_end(c)
+            return self._cache[c]
+        with np.load(os.path.join(self.root, self._chunks[c]["chunk"])) as npz:
+            fields = _unpack_chunk(npz)
+        self._cache[c] = fields
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return fields
+
+    def get_meta(self, idx):
+        """Returns the per-frame metadata without touching the chunk files."""
+        c, i = self._locate(idx)
+        return self._chunks[c]["meta"][i]
+
+    def __getitem__(self, idx):
+        """Returns ``(frame, meta)`` where frame is ``{name: value}``."""
+        c, i = self._locate(idx)
+        fields = self._load_chunk(c)
+        frame = {k: v[i] for k, v in fields.items()}
+        return frame, self._chunks[c]["meta"][i]
+
+    def get_field(self, key, indices):
+        """Gathers one field for many frames, e.g. ``get_field("depth", range(10, 20))``.
+
+        Returns a stacked array when the field is an array field.
+        """
+        values = [self._load_chunk(c)[key][i] for c, i in map(self._locate, indices)]
+        if values and isinstance(values[0], np.ndarray):
+            return np.stack(values)
+        return values
+
+    def __iter__(self):
+        for idx in range(self._len):
+            yield self[idx]
+
+
+class LegacyFrameReader:
+    """Reads the per-frame layout written by ``LabelPropSaver`` before chunked recordings.
+
+    ::
+
+        root/
+            cam_intrinsics.npz.npy   # as written by np.save
+            data.json                # {name: pose metadata}
+            rgb/{name}.jpg
+            depth/{name}.npy
+            lidar/{name}.pkl
+
+    Frames are indexed in the order of their names, so index and name match for
+    recordings saved with ``save_frequency=1``. It has the same interface as
+    ``ChunkedFrameReader``; the ``rgb_dbg`` images are not read.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.meta = {}
+        for fname in ["cam_intrinsics.npz.npy", "cam_intrinsics.npy"]:
+            path = os.path.join(root, fname)
+            if os.path.isfile(path):
+                self.meta["cam_intrinsics"] = np.load(path).tolist()
+                break
+
+        self._data = {}
+        data_path = os.path.join(root, "data.json")
+        if os.path.isfile(data_path):
+            with open(data_path, "r") as fp:
+                self._data = json.load(fp)
+        self._names = sorted(
+            (os.path.splitext(f)[0] for f in os.listdir(os.path.join(root, "rgb"))), key=int
+        )
+
+    def __len__(self):
+        return len(self._names)
+
+    def get_meta(self, idx):
+        return self._data.get(self._names[idx], {})
+
+    def __getitem__(self, idx):
+        name = self._names[idx]
+        frame = {
+            "rgb": cv2.imread(os.path.join(self.root, "rgb", name + ".jpg")),
+            "depth": np.load(os.path.join(self.root, "depth", name + ".npy")),
+        }
+        lidar_path = os.path.join(self.root, "lidar", name + ".pkl")
+        if os.path.isfile(lidar_path):
+            with open(lidar_path, "rb") as fp:
+                frame["lidar"] = pickle.load(fp)
+        return frame, self.get_meta(idx)
+
+    def get_field(self, key, indices):
+        values = [self[idx][0][key] for idx in indices]
+        if values and isinstance(values[0], np.ndarray):
+            return np.stack(values)
+        return values
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+
+def open_recording(root):
+    """Returns a reader for the recording in ``root``, chunked or legacy."""
+    if os.path.isfile(os.path.join(root, INDEX_FILE)):
+        return ChunkedFrameReader(root)
+    if os.path.isdir(os.path.join(root, "rgb")):
+        return LegacyFrameReader(root)
+    raise FileNotFoundError("no recording in {}".format(root))
@@ -1,12 +1,9 @@
 import os
 import time
-import shutil
-import json
-import cv2
-import pickle
 import numpy as np
 import Pyro4
-from droidlet.lowlevel.pyro_utils import safe_call
+from droidlet.lowlevel.pyro_utils import safe_call, safe_result
+from droidlet.lowlevel.hello_robot.frame_store import ChunkedFrameWriter
 
 Pyro4.config.SERIALIZER = "pickle"
 Pyro4.config.SERIALIZERS_ACCEPTED.add("pickle")
@@ -15,31 +12,37 @@ Pyro4.config.PICKLE_PROTOCOL_VERSION = 2
 
 @Pyro4.expose
 class LabelPropSaver:
-    def __init__(self, root, bot, cam):
+    """Records RGB-D, lidar and pose into chunked recordings (see ``frame_store``).
+
+    Frames are handed to a ``ChunkedFrameWriter`` whose background threads do
+    the compression and disk writes, so a slow disk no longer stalls capture.
+    Read recordings back with ``frame_store.open_recording``, which also reads
+    the per-frame folders written by earlier versions.
+
+    The ``rgb_dbg`` images of those versions are no longer written: ``dbg_str``
+    is kept in the metadata of every frame instead, to be drawn when needed.
+    """
+
+    def __init__(self, root, bot, cam, chunk_size=32, queue_size=256, num_writers=2):
         self.bot = bot
         self.cam = cam
+        # base state RPCs go through their own async proxy so that they
+        # overlap with the (slower) camera RPCs instead of running after them
+        self.bot_async = Pyro4.Proxy(bot._pyroUri)
+        self.bot_async._pyroAsync()
 
         self.save_folder = root
-        self.save_frequency = 1  # save every 10 frames
+        self.save_frequency = 1  # save every N frames
         self.skip_frame_count = 0  # internal counter
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size
+        self.num_writers = num_writers
         self.dbg_str = "None"
         self.save_id = 0
         self._stop = False
 
     def return_paths(self, id_):
-        id_ = str(id_)
-        img_folder = os.path.join(self.save_folder, id_, "rgb")
-        img_folder_dbg = os.path.join(self.save_folder, id_, "rgb_dbg")
-        depth_folder = os.path.join(self.save_folder, id_, "depth")
-        lidar_folder = os.path.join(self.save_folder, id_, "lidar")
-        data_file = os.path.join(self.save_folder, id_, "data.json")
-        return img_folder, img_folder_dbg, depth_folder, lidar_folder, data_file
-
-    def create_dirs(self, id_):
-        img_folder, img_folder_dbg, depth_folder, lidar_folder, data_file = self.return_paths(id_)
-
-        for x in [img_folder, img_folder_dbg, depth_folder, lidar_folder]:
-            os.makedirs(x, exist_ok=True)
+        return os.path.join(self.save_folder, str(id_))
 
     def stop(self):
         self._stop = True
@@ -47,42 +50,41 @@ class LabelPropSaver:
     def save_batch(self, seconds):
         print("Logging data for {} seconds".format(seconds), end="", flush=True)
         self._stop = False
-        pose_dict = {}
         self.save_id += 1
-        self.create_dirs(self.save_id)
 
-        # save camera intrinsics
         cam_intrinsics = safe_call(self.cam.get_intrinsics)
-        cam_intrinsics_path = os.path.join(
-            self.save_folder, str(self.save_id), "cam_intrinsics.npz"
+        writer = ChunkedFrameWriter(
+            self.return_paths(self.save_id),
+            chunk_size=self.chunk_size,
+            queue_size=self.queue_size,
+            num_writers=self.num_writers,
+            meta={"cam_intrinsics": np.asarray(cam_intrinsics).tolist()},
         )
-        np.save(cam_intrinsics_path, cam_intrinsics)
 
         start_time = time.time()
         frame_count = 0
         end_time = seconds
         while time.time() - start_time <= seconds:
-            lidar = safe_call(self.cam.get_lidar_scan)
-            rgb, depth = safe_call(self.cam.get_rgb_depth, rotate=False, compressed=True)
-            base_pos = safe_call(self.bot.get_base_state)
-            cam_pan = safe_call(self.bot.get_pan)
-            cam_tilt = safe_call(self.bot.get_tilt)
-            cam_transform = safe_call(self.bot.get_camera_transform)
+            # the base state is sampled as the requests go out and the camera
+            # frame right after, so the frame is stamped with the request time
             timestamp = time.time()
+            base_pos = safe_call(self.bot_async.get_base_state)
+            cam_pan = safe_call(self.bot_async.get_pan)
+            cam_tilt = safe_call(self.bot_async.get_tilt)
+            cam_transform = safe_call(self.bot_async.get_camera_transform)
+            rgb, depth = safe_call(self.cam.get_rgb_depth, rotate=False, compressed=True)
+            lidar = safe_call(self.cam.get_lidar_scan)
 
-            name = "{}".format(frame_count)
             self.save(
-                self.save_id,
-                name,
+                writer,
                 timestamp,
                 lidar,
                 rgb,
                 depth,
-                base_pos,
-                cam_pan,
-                cam_tilt,
-                cam_transform,
-                pose_dict,
+                safe_result(self.bot_async.get_base_state, base_pos),
+                safe_result(self.bot_async.get_pan, cam_pan),
+                safe_result(self.bot_async.get_tilt, cam_tilt),
+                safe_result(self.bot_async.get_camera_transform, cam_transform),
             )
             frame_count += 1
             print(".", end="", flush=True)
@@ -90,6 +92,7 @@ class LabelPropSaver:
                 end_time = time.time() - start_time
                 print("pre-emptively stopped after {} seconds", round(end_time, 1))
                 break
+        writer.close()
         print(" {} frames at {} fps".format(frame_count, round(float(frame_count) / end_time, 1)))
 
     def ready(self):
@@ -97,8 +100,7 @@ class LabelPropSaver:
 
     def save(
         self,
-        id_,
-        name,
+        writer,
         timestamp,
         lidar,
         rgb,
@@ -107,42 +109,20 @@ class LabelPropSaver:
         cam_pan,
         cam_tilt,
         cam_transform,
-        pose_dict,
     ):
-        img_folder, img_folder_dbg, depth_folder, lidar_folder, data_file = self.return_paths(id_)
-
         self.skip_frame_count += 1
-        if self.skip_frame_count % self.save_frequency == 0:
-            # store the lidar
-            lidar_fname = lidar_folder + "/{}.pkl".format(name)
-            with open(lidar_fname, "wb") as fp:
-                pickle.dump(lidar, fp)
-            # store the images and depth
-            cv2.imwrite(
-                img_folder + "/{}.jpg".format(name),
-                rgb,
-            )
-
-            cv2.putText(rgb, self.dbg_str, (40, 40), cv2.FONT_HERSHEY_PLAIN, 1, (0, 0, 255))
-
-            cv2.imwrite(
-                img_folder_dbg + "/{}.jpg".format(name),
-                rgb,
-            )
-
-            np.save(depth_folder + "/{}.npy".format(name), depth)
-
-            # store pos
-            if pos is not None:
-                pose_dict[name] = {
-                    "timestamp": timestamp,
-                    "base_xyt": pos,
+        if self.skip_frame_count % self.save_frequency != 0:
+            return
+        meta = {"timestamp": timestamp, "dbg_str": self.dbg_str}
+        if pos is not None:
+            meta.update(
+                {
+                    "base_xyt": np.asarray(pos).tolist(),
                     "cam_pan_tilt": [cam_pan, cam_tilt],
-                    "cam_transform": cam_transform.tolist(),
+                    "cam_transform": np.asarray(cam_transform).tolist(),
                 }
-
-            with open(data_file, "w") as fp:
-                json.dump(pose_dict, fp)
+            )
+        writer.put({"rgb": rgb, "depth": depth, "lidar": lidar}, meta=meta)
 
 
 if __name__ == "__main__":
@@ -1,9 +1,11 @@
 import Pyro4
+from contextlib import contextmanager
 
 
-def safe_call(f, *args, **kwargs):
+@contextmanager
+def _pyro_errors(f):
     try:
-        return f(*args, **kwargs)
+        yield
     except Pyro4.errors.ConnectionClosedError as e:
         msg = "{} - {}".format(f._RemoteMethod__name, e)
         raise RuntimeError(msg)
@@ -11,3 +13,18 @@ def safe_call(f, *args, **kwargs):
         print("Pyro traceback:")
         print("".join(Pyro4.util.getPyroTraceback()))
         raise e
+
+
+def safe_call(f, *args, **kwargs):
+    with _pyro_errors(f):
+        return f(*args, **kwargs)
+
+
+def safe_result(f, future):
+    """Waits for ``future``, returned by ``safe_call(f, ...)`` on an async proxy.
+
+    Remote errors of async calls are only raised when the result is read, so
+    this gives them the same handling as ``safe_call``.
+    """
+    with _pyro_errors(f):
+        return future.value
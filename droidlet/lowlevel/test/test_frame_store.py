@@ -0,0 +1,94 @@
+import os
+import json
+import pickle
+import unittest
+import tempfile
+import cv2
+import numpy as np
+from droidlet.lowlevel.hello_robot.frame_store import (
+    ChunkedFrameWriter,
+    ChunkedFrameReader,
+    LegacyFrameReader,
+    open_recording,
+)
+
+
+class ChunkedFrameStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.root = os.path.join(tempfile.mkdtemp(), "recording")
+        self.rng = np.random.default_rng(0)
+
+    def _frame(self, i):
+        return {
+            "rgb": self.rng.integers(0, 255, (12, 16, 3), dtype=np.uint8),
+            "depth": self.rng.integers(0, 4000, (12, 16), dtype=np.uint16),
+            "lidar": (float(i), [i, i + 1]),
+        }
+
+    def test_roundtrip(self):
+        frames = [self._frame(i) for i in range(23)]
+        with ChunkedFrameWriter(
+            self.root, chunk_size=5, num_writers=3, meta={"cam_intrinsics": [[1, 0], [0, 1]]}
+        ) as writer:
+            for i, frame in enumerate(frames):
+                self.assertTrue(writer.put(frame, meta={"base_xyt": [i, 0, 0]}))
+
+        reader = ChunkedFrameReader(self.root)
+        self.assertEqual(len(reader), len(frames))
+        self.assertEqual(reader.meta["cam_intrinsics"], [[1, 0], [0, 1]])
+        for i in [22, 0, 7, 13, -1]:
+            frame, meta = reader[i]
+            expected = frames[i]
+            np.testing.assert_array_equal(frame["rgb"], expected["rgb"])
+            np.testing.assert_array_equal(frame["depth"], expected["depth"])
+            self.assertEqual(frame["lidar"], expected["lidar"])
+            self.assertEqual(meta["base_xyt"][0], i % len(frames))
+
+        depths = reader.get_field("depth", range(3, 9))
+        self.assertEqual(depths.shape, (6, 12, 16))
+        np.testing.assert_array_equal(depths[4], frames[7]["depth"])
+
+        with self.assertRaises(IndexError):
+            reader[len(frames)]
+
+    def test_drop_when_full(self):
+        writer = ChunkedFrameWriter(self.root, chunk_size=4, queue_size=1)
+        results = [writer.put(self._frame(i), block=False) for i in range(50)]
+        writer.close()
+        self.assertEqual(writer.dropped, results.count(False))
+        self.assertEqual(len(ChunkedFrameReader(self.root)), results.count(True))
+
+    def test_legacy_recording(self):
+        # per-frame layout written by earlier versions of LabelPropSaver
+        frames = [self._frame(i) for i in range(12)]
+        for folder in ["rgb", "depth", "lidar"]:
+            os.makedirs(os.path.join(self.root, folder))
+        np.save(os.path.join(self.root, "cam_intrinsics.npz"), np.eye(3))
+        data = {}
+        for i, frame in enumerate(frames):
+            cv2.imwrite(os.path.join(self.root, "rgb", "{}.jpg".format(i)), frame["rgb"])
+            np.save(os.path.join(self.root, "depth", "{}.npy".format(i)), frame["depth"])
+            with open(os.path.join(self.root, "lidar", "{}.pkl".format(i)), "wb") as fp:
+                pickle.dump(frame["lidar"], fp)
+            data[str(i)] = {"base_xyt": [i, 0, 0]}
+        with open(os.path.join(self.root, "data.json"), "w") as fp:
+            json.dump(data, fp)
+
+        reader = open_recording(self.root)
+        self.assertIsInstance(reader, LegacyFrameReader)
+        self.assertEqual(len(reader), len(frames))
+        self.assertEqual(reader.meta["cam_intrinsics"], np.eye(3).tolist())
+        frame, meta = reader[10]
+        self.assertEqual(frame["rgb"].shape, frames[10]["rgb"].shape)
+        np.testing.assert_array_equal(frame["depth"], frames[10]["depth"])
+        self.assertEqual(frame["lidar"], frames[10]["lidar"])
+        self.assertEqual(meta["base_xyt"], [10, 0, 0])
+
+    def test_open_chunked_recording(self):
+        with ChunkedFrameWriter(self.root, chunk_size=4) as writer:
+            writer.put(self._frame(0))
+        self.assertIsInstance(open_recording(self.root), ChunkedFrameReader)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,8 +7,10 @@ import os
 import cv2
 import json
 import glob
+from functools import lru_cache
 from droidlet.lowlevel.robot_mover_utils import transform_pose
-from numba import njit
+from droidlet.lowlevel.hello_robot.frame_store import ChunkedFrameWriter
+from numba import njit, prange
 from math import ceil, floor
 
 # Values for locobot in habitat.
@@ -22,16 +24,29 @@ CAMERA_HEIGHT = 0.6
 trans = np.array([0, 0, CAMERA_HEIGHT])
 
 
-# TODO: Consolidate camera intrinsics and their associated utils across locobot and habitat.
-def compute_uvone(height, width):
-    intrinsic_mat_inv = np.linalg.inv(intrinsic_mat)
+@lru_cache(maxsize=8)
+def _uvone_in_cam(height, width, intrinsics):
+    intrinsic_mat_inv = np.linalg.inv(np.array(intrinsics).reshape(3, 3))
     img_resolution = (height, width)
     img_pixs = np.mgrid[0 : img_resolution[0] : 1, 0 : img_resolution[1] : 1]
     img_pixs = img_pixs.reshape(2, -1)
     img_pixs[[0, 1], :] = img_pixs[[1, 0], :]
     uv_one = np.concatenate((img_pixs, np.ones((1, img_pixs.shape[1]))))
     uv_one_in_cam = np.dot(intrinsic_mat_inv, uv_one)
-    return uv_one_in_cam, intrinsic_mat, rot, trans
+    # shared by every caller through the cache
+    uv_one_in_cam.setflags(write=False)
+    return uv_one_in_cam
+
+
+# TODO: Consolidate camera intrinsics and their associated utils across locobot and habitat.
+def compute_uvone(height, width, intrinsics=None):
+    """
+    Returns the unprojected pixel grid of a (height, width) image, along with the camera intrinsics
+    and extrinsics. The grid is computed once per image size and intrinsics, and cached.
+    """
+    K = intrinsic_mat if intrinsics is None else np.asarray(intrinsics, dtype=np.float64)
+    uv_one_in_cam = _uvone_in_cam(height, width, tuple(K.ravel().tolist()))
+    return uv_one_in_cam, K, rot, trans
 
 
 def convert_depth_to_pcd(depth, pose, uv_one_in_cam, rot, trans):
@@ -48,29 +63,77 @@ def convert_depth_to_pcd(depth, pose, uv_one_in_cam, rot, trans):
     return pts_in_world
 
 
-@njit
-def get_annot(height, width, pts_in_cur_img, src_label):
+def project_to_poses(pts_in_world, base_poses, intrinsic_mat, rot, trans):
+    """
+    Projects points into the camera image of several robot base poses in one go.
+    Args:
+        pts_in_world (np.ndarray): (P, 3) points in the world frame (pyrobot)
+        base_poses (np.ndarray): (N, 3) robot base poses (x, y, theta)
+    Returns:
+        (P, N, 3) array of homogeneous pixel coordinates (u * z, v * z, z) of every point in every pose
+    """
+    base_poses = np.asarray(base_poses, dtype=np.float64).reshape(-1, 3)
+    n = len(base_poses)
+    # world -> current base is a translation by -(x, y) followed by a rotation by -theta
+    c, s = np.cos(-base_poses[:, 2]), np.sin(-base_poses[:, 2])
+    world_to_base = np.zeros((n, 3, 3))
+    world_to_base[:, 0, 0] = c
+    world_to_base[:, 0, 1] = -s
+    world_to_base[:, 1, 0] = s
+    world_to_base[:, 1, 1] = c
+    world_to_base[:, 2, 2] = 1.0
+    # fold base -> camera -> pixels and the per-pose rotation into one 3x3 matrix per pose
+    base_to_pix = np.dot(rot, intrinsic_mat.T)
+    mats = np.matmul(world_to_base.transpose(0, 2, 1), base_to_pix)
+    base_xyz = np.zeros((n, 3))
+    base_xyz[:, :2] = base_poses[:, :2]
+    offsets = -np.einsum("ni,nij->nj", base_xyz, mats) - np.dot(trans.reshape(-1), base_to_pix)
+    # a single (P, 3) x (3, 3N) product for all the poses
+    pts_in_imgs = np.dot(pts_in_world, mats.transpose(1, 0, 2).reshape(3, 3 * n))
+    pts_in_imgs = pts_in_imgs.reshape(-1, n, 3)
+    pts_in_imgs += offsets
+    return pts_in_imgs
+
+
+@njit(parallel=True)
+def get_annot(height, width, pts_in_cur_imgs, src_label, annot_imgs):
     """
-    This creates the new semantic labels of the projected points in the current image frame. Each new semantic label is the
-    semantic label corresponding to pts_in_cur_img in src_label.
+    This creates the new semantic labels of the projected points in each target image frame. Each new semantic label is the
+    semantic label corresponding to pts_in_cur_imgs in src_label. pts_in_cur_imgs is (P, N, 3) as returned by
+    project_to_poses, and annot_imgs (N, height, width) is filled in place. Target images are processed in parallel, and
+    when several points land on the same pixel the one closest to the camera wins.
     """
-    annot_img = np.zeros((height, width))
-    for indx in range(len(pts_in_cur_img)):
-        r = int(indx / width)
-        c = int(indx - r * width)
-        x, y, _ = pts_in_cur_img[indx]
+    for n in prange(pts_in_cur_imgs.shape[1]):
+        zbuf = np.full((height, width), np.inf)
+        for indx in range(pts_in_cur_imgs.shape[0]):
+            z = pts_in_cur_imgs[indx, n, 2]
+            if z <= 0:
+                continue
+            x = pts_in_cur_imgs[indx, n, 0] / z
+            y = pts_in_cur_imgs[indx, n, 1] / z
+
+            # We take ceil and floor combinations to fix quantization errors
+            if floor(x) >= 0 and ceil(x) < width and floor(y) >= 0 and ceil(y) < height:
+                for r in (floor(y), ceil(y)):
+                    for c in (floor(x), ceil(x)):
+                        if z < zbuf[r, c]:
+                            zbuf[r, c] = z
+                            annot_imgs[n, r, c] = src_label[indx]
+
+    return annot_imgs
 
-        # We take ceil and floor combinations to fix quantization errors
-        if floor(x) >= 0 and ceil(x) < height and floor(y) >= 0 and ceil(y) < width:
-            annot_img[ceil(y)][ceil(x)] = src_label[r][c]
-            annot_img[floor(y)][floor(x)] = src_label[r][c]
-            annot_img[ceil(y)][floor(x)] = src_label[r][c]
-            annot_img[floor(y)][ceil(x)] = src_label[r][c]
 
-    return annot_img
+class LabelPropagate(AbstractHandler):
+    """
+    Args:
+        intrinsics (np.ndarray): 3x3 camera intrinsics, defaults to the locobot camera in habitat
+        batch_size (int): number of target poses projected at once in propagate_batch, bounds peak memory
+    """
 
+    def __init__(self, intrinsics=None, batch_size=16):
+        self.intrinsics = intrinsics
+        self.batch_size = batch_size
 
-class LabelPropagate(AbstractHandler):
     def __call__(
         self,
         src_img,
@@ -93,25 +156,79 @@ class LabelPropagate(AbstractHandler):
             base_pose (np.ndarray): (x,y,theta) of current image
             cur_depth (np.ndarray): current depth
         """
+        # TODO: can use cur_depth for filtering. Not needed for baseline.
+        return self.propagate_batch(src_depth, src_label, src_pose, [base_pose])[0]
 
-        height, width, _ = src_img.shape
-        uv_one_in_cam, intrinsic_mat, rot, trans = compute_uvone(height, width)
-
-        pts_in_world = convert_depth_to_pcd(src_depth, src_pose, uv_one_in_cam, rot, trans)
-
-        # TODO: can use cur_pts_in_world for filtering. Not needed for baseline.
-        # cur_pts_in_world = convert_depth_to_pcd(cur_depth, base_pose, uv_one_in_cam, rot, trans)
-
-        # convert pts_in_world to current base
-        pts_in_cur_base = transform_pose(pts_in_world, (-base_pose[0], -base_pose[1], 0))
-        pts_in_cur_base = transform_pose(pts_in_cur_base, (0.0, 0.0, -base_pose[2]))
-
-        # conver point from current base to current camera frame
-        pts_in_cur_cam = pts_in_cur_base - trans.reshape(-1)
-        pts_in_cur_cam = np.dot(pts_in_cur_cam, rot)
-
-        # conver pts in current camera frame into 2D pix values
-        pts_in_cur_img = np.matmul(intrinsic_mat, pts_in_cur_cam.T).T
-        pts_in_cur_img /= pts_in_cur_img[:, 2].reshape([-1, 1])
+    def propagate_batch(self, src_depth, src_label, src_pose, base_poses):
+        """
+        Propagates src_label to many target poses. The source point cloud is built once, projected into all target
+        poses with one vectorized transform and splatted with z-buffering.
+        Args:
+            src_depth (np.ndarray): source depth to propagte from
+            src_label (np.ndarray): source semantic map to propagte from
+            src_pose (np.ndarray): (x,y,theta) of the source image
+            base_poses (np.ndarray): (N, 3) target poses
+        Returns:
+            np.ndarray of shape (N, height, width) with the propagated labels
+        """
+        height, width = src_depth.shape[:2]
+        uv_one_in_cam, intrinsic_mat, rot, trans = compute_uvone(height, width, self.intrinsics)
+
+        # points without depth carry no information and would otherwise win the z-buffer
+        valid = src_depth.reshape(-1) > 0
+        pts_in_world = convert_depth_to_pcd(src_depth, src_pose, uv_one_in_cam, rot, trans)[valid]
+        labels = src_label.reshape(-1)[valid].astype(np.float64)
+
+        base_poses = np.asarray(base_poses, dtype=np.float64).reshape(-1, 3)
+        annots = np.zeros((len(base_poses), height, width))
+        for i in range(0, len(base_poses), self.batch_size):
+            pts_in_cur_imgs = project_to_poses(
+                pts_in_world, base_poses[i : i + self.batch_size], intrinsic_mat, rot, trans
+            )
+            get_annot(height, width, pts_in_cur_imgs, labels, annots[i : i + self.batch_size])
+        return annots
+
+    def from_recording(self, reader, src_idx, src_label, tgt_indices):
+        """
+        Propagates src_label from one frame of a chunked recording to other frames of it.
+        Args:
+            reader (ChunkedFrameReader): recording written by the hello robot LabelPropSaver
+            src_idx (int): index of the annotated frame
+            src_label (np.ndarray): semantic map of frame src_idx
+            tgt_indices (list[int]): frames to propagate the labels to
+        Returns:
+            np.ndarray of shape (len(tgt_indices), height, width) with the propagated labels
+        """
+        src_depth, src_pose, base_poses = self._recording_poses(reader, src_idx, tgt_indices)
+        return self.propagate_batch(src_depth, src_label, src_pose, base_poses)
 
-        return get_annot(height, width, pts_in_cur_img, src_label)
+    def to_recording(self, reader, src_idx, src_label, tgt_indices, root, chunk_size=32):
+        """
+        Same as from_recording, but writes the propagated labels to a new chunked recording at root instead of
+        returning them. Labels are propagated batch_size frames at a time and handed to a ChunkedFrameWriter, which
+        stacks them into one file per chunk and writes the chunks in the background.
+        Args:
+            root (str): output directory; frame i holds the "label" of tgt_indices[i], with its index and pose in
+                the frame meta
+            chunk_size (int): number of frames per chunk file
+        Returns:
+            number of frames written
+        """
+        src_depth, src_pose, base_poses = self._recording_poses(reader, src_idx, tgt_indices)
+        with ChunkedFrameWriter(root, chunk_size=chunk_size, meta={"src_idx": src_idx}) as writer:
+            for i in range(0, len(base_poses), self.batch_size):
+                batch = slice(i, i + self.batch_size)
+                annots = self.propagate_batch(src_depth, src_label, src_pose, base_poses[batch])
+                for idx, base_pose, annot in zip(tgt_indices[batch], base_poses[batch], annots):
+                    writer.put(
+                        {"label": annot.astype(src_label.dtype)},
+                        meta={"idx": int(idx), "base_xyt": base_pose},
+                    )
+        return writer.num_frames
+
+    @staticmethod
+    def _recording_poses(reader, src_idx, tgt_indices):
+        src_frame, src_meta = reader[src_idx]
+        # only the target poses are needed, which live in the index: no chunk is decompressed for them
+        base_poses = [list(reader.get_meta(idx)["base_xyt"]) for idx in tgt_indices]
+        return src_frame["depth"], np.array(src_meta["base_xyt"]), base_poses
@@ -0,0 +1,117 @@
+"""
+Copyright (c) Facebook, Inc. and its affiliates.
+"""
+import tempfile
+import unittest
+
+import numpy as np
+
+from droidlet.lowlevel.hello_robot.frame_store import ChunkedFrameReader, ChunkedFrameWriter
+from droidlet.perception.robot.handlers.label_propagate import (
+    LabelPropagate,
+    compute_uvone,
+    get_annot,
+    project_to_poses,
+)
+
+HEIGHT, WIDTH = 48, 64
+INTRINSICS = np.array([[40.0, 0.0, WIDTH / 2], [0.0, 40.0, HEIGHT / 2], [0.0, 0.0, 1.0]])
+
+
+class LabelPropagateSyntheticTest(unittest.TestCase):
+    """Checks label propagation on synthetic depth and labels, without test assets."""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # depth in mm, with some missing readings
+        self.src_depth = rng.uniform(1000, 3000, (HEIGHT, WIDTH)).astype(np.float32)
+        self.src_depth[rng.uniform(size=(HEIGHT, WIDTH)) < 0.1] = 0
+        self.src_label = rng.integers(1, 10, (HEIGHT, WIDTH))
+        self.src_pose = np.array([0.5, -0.2, 0.3])
+        self.base_poses = self.src_pose + np.array(
+            [
+                [0.0, 0.0, 0.0],
+                [0.1, 0.0, 0.05],
+                [0.0, 0.2, -0.1],
+                [-0.1, 0.1, 0.2],
+                [0.2, -0.1, 0.0],
+            ]
+        )
+
+    def test_propagate_batch_matches_call(self):
+        lp = LabelPropagate(intrinsics=INTRINSICS)
+        annots = lp.propagate_batch(self.src_depth, self.src_label, self.src_pose, self.base_poses)
+        self.assertEqual(annots.shape, (len(self.base_poses), HEIGHT, WIDTH))
+        for annot, base_pose in zip(annots, self.base_poses):
+            expected = lp(None, self.src_depth, self.src_label, self.src_pose, base_pose, None)
+            np.testing.assert_array_equal(annot, expected)
+        # labels do propagate
+        self.assertTrue((annots > 0).mean() > 0.5)
+
+    def test_batch_size_chunking(self):
+        single_batch = LabelPropagate(intrinsics=INTRINSICS, batch_size=len(self.base_poses))
+        chunked = LabelPropagate(intrinsics=INTRINSICS, batch_size=2)
+        np.testing.assert_array_equal(
+            single_batch.propagate_batch(
+                self.src_depth, self.src_label, self.src_pose, self.base_poses
+            ),
+            chunked.propagate_batch(
+                self.src_depth, self.src_label, self.src_pose, self.base_poses
+            ),
+        )
+
+    def test_to_recording(self):
+        lp = LabelPropagate(intrinsics=INTRINSICS, batch_size=2)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            src_root, out_root = tmpdir + "/src", tmpdir + "/labels"
+            with ChunkedFrameWriter(src_root, chunk_size=2) as writer:
+                for pose in self.base_poses:
+                    writer.put({"depth": self.src_depth}, meta={"base_xyt": pose.tolist()})
+            reader = ChunkedFrameReader(src_root)
+
+            tgt_indices = [1, 2, 3, 4]
+            num_frames = lp.to_recording(
+                reader, 0, self.src_label, tgt_indices, out_root, chunk_size=3
+            )
+            self.assertEqual(num_frames, len(tgt_indices))
+
+            expected = lp.from_recording(reader, 0, self.src_label, tgt_indices)
+            labels = ChunkedFrameReader(out_root)
+            self.assertEqual(len(labels), len(tgt_indices))
+            for i, idx in enumerate(tgt_indices):
+                frame, meta = labels[i]
+                self.assertEqual(meta["idx"], idx)
+                self.assertEqual(frame["label"].dtype, self.src_label.dtype)
+                np.testing.assert_array_equal(frame["label"], expected[i])
+
+    def test_project_to_poses(self):
+        _, intrinsic_mat, rot, trans = compute_uvone(HEIGHT, WIDTH, INTRINSICS)
+        pts_in_world = np.random.default_rng(1).uniform(-2, 2, (20, 3))
+        pts_in_imgs = project_to_poses(pts_in_world, self.base_poses, intrinsic_mat, rot, trans)
+        self.assertEqual(pts_in_imgs.shape, (20, len(self.base_poses), 3))
+        for n, (x, y, theta) in enumerate(self.base_poses):
+            # world -> base -> camera -> pixels, one pose at a time
+            c, s = np.cos(-theta), np.sin(-theta)
+            world_to_base = np.array([[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]])
+            pts_in_base = (pts_in_world - [x, y, 0.0]) @ world_to_base.T
+            pts_in_cam = (pts_in_base - trans) @ rot
+            np.testing.assert_allclose(pts_in_imgs[:, n], pts_in_cam @ intrinsic_mat.T, atol=1e-9)
+
+    def test_nearer_point_wins(self):
+        # two points on pixel (row 10, col 20) at depths 2 and 1, in both orders
+        z = np.array([2.0, 1.0])
+        pts = np.stack([20 * z, 10 * z, z], axis=-1).reshape(2, 1, 3)
+        for order in ([0, 1], [1, 0]):
+            labels = np.array([1.0, 2.0])[order]
+            annots = get_annot(HEIGHT, WIDTH, pts[order], labels, np.zeros((1, HEIGHT, WIDTH)))
+            self.assertEqual(annots[0, 10, 20], 2.0)
+            self.assertEqual(np.count_nonzero(annots), 1)
+
+        # points behind the camera are dropped
+        behind = np.array([[[20.0, 10.0, -1.0]]])
+        annots = get_annot(HEIGHT, WIDTH, behind, np.array([3.0]), np.zeros((1, HEIGHT, WIDTH)))
+        self.assertEqual(np.count_nonzero(annots), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,6 +3,7 @@ from mrp.process_def import defined_processes, process
 from mrp.runtime.conda import Conda
 from mrp.runtime.docker import Docker
 from mrp.runtime.host import Host
+from mrp.telemetry import Telemetry
 from mrp.util import NoEscape
 from importlib.machinery import SourceFileLoader
 import click
@@ -89,6 +90,7 @@ __all__ = [
     "process",
     "defined_processes",
     "NoEscape",
+    "Telemetry",
     # Runtimes.
     "Docker",
     "Conda",
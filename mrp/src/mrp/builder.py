@@ -0,0 +1,49 @@
+from mrp import process_def
+from mrp import util
+import concurrent.futures
+import os
+import typing
+
+DEFAULT_JOBS = 4
+
+
+def build_key(name: str) -> str:
+    proc_def = process_def.defined_processes[name]
+    return proc_def.runtime._build_key(name, proc_def)
+
+
+def group_by_build(names) -> typing.Dict[str, typing.List[str]]:
+    """Group the processes by the environment they build, in order."""
+    groups = {}
+    for name in names:
+        groups.setdefault(build_key(name), []).append(name)
+    return groups
+
+
+def _lock_path(key):
+    return os.path.expanduser(f"~/.config/mrp/locks/{key.replace('/', '_')}.lock")
+
+
+def _build_group(key, names, cache, verbose):
+    # Another mrp invocation may be building the same environment.
+    with util.file_lock(_lock_path(key)):
+        open(util.build_log_path(key), "w").close()
+        for name in names:
+            proc_def = process_def.defined_processes[name]
+            proc_def.runtime._build(name, proc_def, cache, verbose)
+
+
+def build(names, cache: bool, verbose: bool, jobs: int = DEFAULT_JOBS):
+    """Build the environments of the processes, up to `jobs` at a time.
+
+    Yields (names, error) as each environment finishes building, with the
+    processes that share it and the exception raised by the build, if any.
+    """
+    groups = group_by_build(names)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(_build_group, key, group, cache, verbose): group
+            for key, group in groups.items()
+        }
+        for future in concurrent.futures.as_completed(futures):
+            yield futures[future], future.exception()
@@ -1,6 +1,8 @@
 import mrp
+from mrp import builder
 from mrp import life_cycle
 from mrp import process_def
+from mrp import startup as startup_lib
 from mrp import util
 from mrp.cmd import _autocomplete
 import a0
@@ -88,17 +90,93 @@ def down_existing(names: typing.List[str], force: bool):
         raise RuntimeError("Existing processes did not down in a timely manner.")
 
 
+def launch(name: str):
+    # Forks, so only called from the single threaded Launcher process.
+    pid = os.fork()
+    if pid != 0:
+        os.waitpid(pid, 0)
+        return
+
+    util.close_inherited_fds()
+    os.chdir("/")
+    os.setsid()
+    os.umask(0)
+
+    if os.fork() != 0:
+        os._exit(0)  # use this instead of sys.exit in child process
+
+    proc_def = process_def.defined_processes[name]
+
+    # Set up configuration.
+    with util.common_env_context(proc_def):
+        a0.Cfg(a0.env.topic()).write(json.dumps(proc_def.cfg))
+
+        with open(f"/tmp/mrp_{name}.log", "w", buffering=1) as logfile:
+            with contextlib.redirect_stdout(logfile), contextlib.redirect_stderr(
+                logfile
+            ):
+                click.echo(f"-- Process start time {a0.TimeWall.now()}")
+                life_cycle.set_launcher_running(name, True)
+                try:
+                    asyncio.run(proc_def.runtime._launcher(name, proc_def).run())
+                except BaseException as e:
+                    click.echo(f"FATAL: {e}")
+                    traceback.print_exc()
+                life_cycle.set_launcher_running(name, False)
+                if life_cycle.proc_info(name).state != life_cycle.State.STOPPED:
+                    life_cycle.set_state(name, life_cycle.State.STOPPED, return_code=-1)
+                os._exit(0)  # use this instead of sys.exit in child process
+
+
+class Launcher:
+    """Launches processes from a helper process, forked before mrp up starts
+    any thread.
+
+    A process forked while other threads run (builds, a0 watchers and
+    subscribers) inherits the locks they hold, and can deadlock on them. The
+    helper stays single threaded and forks the launched processes on request.
+    """
+
+    def __init__(self):
+        read_fd, write_fd = os.pipe()
+        self._pid = os.fork()
+        if self._pid == 0:
+            os.close(write_fd)
+            try:
+                with os.fdopen(read_fd) as requests:
+                    for name in requests:
+                        launch(name.rstrip("\n"))
+            except BaseException:
+                traceback.print_exc()
+            os._exit(0)  # use this instead of sys.exit in child process
+        os.close(read_fd)
+        self._requests = os.fdopen(write_fd, "w", buffering=1)
+
+    def __call__(self, name: str):
+        click.echo(f"running {name}...")
+        life_cycle.set_ask(name, life_cycle.Ask.UP)
+        life_cycle.set_state(name, life_cycle.State.STARTING)
+        self._requests.write(f"{name}\n")
+
+    def close(self):
+        """Waits for the requested launches to be forked."""
+        self._requests.close()
+        os.waitpid(self._pid, 0)
+
+
 @click.command()
 @click.argument("procs", nargs=-1, shell_complete=_autocomplete.defined_processes)
 @click.option("-v/-q", "--verbose/--quiet", is_flag=True, default=True)
 @click.option("--deps/--nodeps", is_flag=True, default=True)
 @click.option("--build/--nobuild", is_flag=True, default=True)
 @click.option("--cache/--nocache", is_flag=True, default=True)
+@click.option("-j", "--jobs", type=int, default=builder.DEFAULT_JOBS)
 @click.option("--run/--norun", is_flag=True, default=True)
 @click.option("-f", "--force/--noforce", is_flag=True, default=False)
 @click.option("--reset_logs", is_flag=True, default=False)
 @click.option("--attach", is_flag=True, default=False)
 @click.option("--wait", is_flag=True, default=False)
+@click.option("--ready_timeout", type=float, default=0)
 def cli(
     *cmd_procs,
     procs=None,
@@ -106,11 +184,13 @@ def cli(
     deps=True,
     build=True,
     cache=True,
+    jobs=builder.DEFAULT_JOBS,
     run=True,
     force=False,
     reset_logs=False,
     attach=False,
     wait=False,
+    ready_timeout=0,
 ):
     procs = procs or []
 
@@ -133,61 +213,70 @@ def cli(
     if wait and not run:
         raise ValueError("Cannot wait without running")
 
-    down_existing(names, force)
-
-    if reset_logs:
-        for name in names:
-            a0.File.remove(f"{name}.log.a0")
-
-    if build:
-        for name in names:
-            proc_def = process_def.defined_processes[name]
-            click.echo(f"building {name}...")
-            proc_def.runtime._build(name, proc_def, cache, verbose)
-            click.echo(f"built {name}\n")
+    # Forked first, while this process has no other thread.
+    launcher = Launcher() if run else None
+    try:
+        down_existing(names, force)
+
+        if reset_logs:
+            for name in names:
+                a0.File.remove(f"{name}.log.a0")
+
+        if run:
+            startup = startup_lib.Startup(names, launcher, ready_timeout)
+        failed = {}
+
+        def build_all():
+            reported = set()
+            try:
+                for built_names, error in builder.build(names, cache, verbose, jobs):
+                    if error:
+                        click.echo(
+                            f"failed to build {', '.join(built_names)}: {error}\n"
+                        )
+                        for name in built_names:
+                            failed[name] = f"failed to build: {error}"
+                    else:
+                        click.echo(f"built {', '.join(built_names)}\n")
+                    if run:
+                        startup.on_built(built_names, error)
+                    reported.update(built_names)
+                error = "build did not report this process"
+            except BaseException as e:
+                if not run:
+                    raise
+                traceback.print_exc()
+                error = e
+            finally:
+                # Startup waits on every name, so a build that stops early (or a
+                # builder bug) must not leave any of them pending.
+                remaining = [name for name in names if name not in reported]
+                if run and remaining:
+                    startup.on_built(remaining, error)
+
+        if build and run:
+            # Processes are launched, through the launcher, as soon as they are
+            # built and their deps are ready.
+            build_thread = threading.Thread(target=build_all)
+            build_thread.start()
+            failed = startup.run()
+            build_thread.join()
+        elif build:
+            build_all()
+        elif run:
+            startup.on_built(names)
+            failed = startup.run()
+    finally:
+        if launcher:
+            launcher.close()
+
+    if failed:
+        raise RuntimeError(
+            "Failed to start:\n"
+            + "\n".join(f"  {name}: {reason}" for name, reason in failed.items())
+        )
 
     if run:
-        for name in names:
-            click.echo(f"running {name}...")
-            life_cycle.set_ask(name, life_cycle.Ask.UP)
-            life_cycle.set_state(name, life_cycle.State.STARTING)
-
-            if os.fork() != 0:
-                continue
-
-            os.chdir("/")
-            os.setsid()
-            os.umask(0)
-
-            if os.fork() != 0:
-                os._exit(0)  # use this instead of sys.exit in child process
-
-            proc_def = process_def.defined_processes[name]
-
-            # Set up configuration.
-            with util.common_env_context(proc_def):
-                a0.Cfg(a0.env.topic()).write(json.dumps(proc_def.cfg))
-
-                with open(f"/tmp/mrp_{name}.log", "w", buffering=1) as logfile:
-                    with contextlib.redirect_stdout(
-                        logfile
-                    ), contextlib.redirect_stderr(logfile):
-                        click.echo(f"-- Process start time {a0.TimeWall.now()}")
-                        life_cycle.set_launcher_running(name, True)
-                        try:
-                            asyncio.run(
-                                proc_def.runtime._launcher(name, proc_def).run()
-                            )
-                        except BaseException as e:
-                            click.echo(f"FATAL: {e}")
-                            traceback.print_exc()
-                        life_cycle.set_launcher_running(name, False)
-                        if life_cycle.proc_info(name).state != life_cycle.State.STOPPED:
-                            life_cycle.set_state(
-                                name, life_cycle.State.STOPPED, return_code=-1
-                            )
-                        os._exit(0)  # use this instead of sys.exit in child process
-
         if attach:
             mrp.cmd.attach(names[0])
 
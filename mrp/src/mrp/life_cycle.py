@@ -1,12 +1,29 @@
 import a0
+import asyncio
 import dataclasses
 import enum
 import json
+import threading
 import typing
 import types
 
+# Each process has its own state topic, so that watchers of a process only
+# wake up for its changes. The index topic lists the known processes.
 _TOPIC = "mrp/state"
-_CFG = a0.Cfg(_TOPIC)
+_INDEX_TOPIC = "mrp/procs"
+_INDEX_CFG = a0.Cfg(_INDEX_TOPIC)
+_proc_cfgs = {}
+_registered = set()
+
+
+def _proc_topic(proc_name) -> str:
+    return f"{_TOPIC}/{proc_name}"
+
+
+def _proc_cfg(proc_name) -> a0.Cfg:
+    if proc_name not in _proc_cfgs:
+        _proc_cfgs[proc_name] = a0.Cfg(_proc_topic(proc_name))
+    return _proc_cfgs[proc_name]
 
 
 class Ask(enum.Enum):
@@ -66,72 +83,143 @@ class SystemState:
 
 
 def _ensure_setup() -> None:
-    _CFG.write_if_empty(json.dumps(SystemState(procs={}).asdict()))
+    _INDEX_CFG.write_if_empty(json.dumps({}))
 
 
-def system_state() -> SystemState:
+def _register(proc_name) -> None:
+    if proc_name not in _registered:
+        _ensure_setup()
+        _INDEX_CFG.mergepatch({proc_name: True})
+        _registered.add(proc_name)
+
+
+def _proc_names() -> typing.List[str]:
     _ensure_setup()
-    return SystemState.fromdict(json.loads(_CFG.read().payload))
+    return list(json.loads(_INDEX_CFG.read().payload))
+
+
+def _parse_proc_info(pkt) -> ProcInfo:
+    return ProcInfo.fromdict(json.loads(pkt.payload))
+
+
+def system_state() -> SystemState:
+    procs = {}
+    for proc_name in _proc_names():
+        try:
+            procs[proc_name] = proc_info(proc_name)
+        except KeyError:
+            # Registered, but its state is not written yet.
+            pass
+    return SystemState(procs=procs)
 
 
 def proc_info(proc_name) -> ProcInfo:
-    return system_state().procs[proc_name]
+    try:
+        return _parse_proc_info(_proc_cfg(proc_name).read())
+    except RuntimeError:
+        raise KeyError(proc_name)
 
 
-def system_state_watcher(callback) -> a0.CfgWatcher:
-    _ensure_setup()
+class SystemStateWatcher:
+    """Keeps an incrementally updated SystemState.
 
-    def callback_wrapper(pkt):
-        callback(SystemState.fromdict(json.loads(pkt.payload)))
+    Each process is watched on its own topic, and only its ProcInfo is
+    parsed when it changes. The callback is called with the current state,
+    on creation and after every change.
+    """
 
-    return a0.CfgWatcher(_TOPIC, callback_wrapper)
+    def __init__(self, callback):
+        self._callback = callback
+        self._lock = threading.RLock()
+        self._state = system_state()
+        self._watchers = {}
+
+        with self._lock:
+            for proc_name in self._state.procs:
+                self._watch(proc_name)
+            self._callback(self._state)
+        self._index_watcher = a0.CfgWatcher(_INDEX_TOPIC, self._on_index)
+
+    def system_state(self) -> SystemState:
+        return self._state
+
+    def _watch(self, proc_name):
+        def callback(pkt):
+            self._on_proc_info(proc_name, _parse_proc_info(pkt))
+
+        self._watchers[proc_name] = a0.CfgWatcher(_proc_topic(proc_name), callback)
+
+    def _on_index(self, pkt):
+        with self._lock:
+            for proc_name in json.loads(pkt.payload):
+                if proc_name not in self._watchers:
+                    self._watch(proc_name)
+
+    def _on_proc_info(self, proc_name, info):
+        with self._lock:
+            if self._state.procs.get(proc_name) == info:
+                return
+            procs = dict(self._state.procs)
+            procs[proc_name] = info
+            self._state = SystemState(procs=procs)
+            self._callback(self._state)
+
+
+def system_state_watcher(callback) -> SystemStateWatcher:
+    return SystemStateWatcher(callback)
 
 
 async def aio_system_state_watcher():
-    _ensure_setup()
-    async for pkt in a0.aio_cfg(_TOPIC):
-        yield SystemState.fromdict(json.loads(pkt.payload))
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def callback(system_state):
+        loop.call_soon_threadsafe(queue.put_nowait, system_state)
+
+    watcher = SystemStateWatcher(callback)  # noqa: F841
+    while True:
+        yield await queue.get()
 
 
 def proc_info_watcher(proc_name, callback) -> a0.CfgWatcher:
     ns = types.SimpleNamespace()
     ns.last_proc_info = None
 
-    def callback_wrapper(system_state):
-        if ns.last_proc_info != system_state.procs.get(proc_name):
-            ns.last_proc_info = system_state.procs[proc_name]
-            callback(system_state.procs[proc_name])
+    def callback_wrapper(pkt):
+        info = _parse_proc_info(pkt)
+        if ns.last_proc_info != info:
+            ns.last_proc_info = info
+            callback(info)
 
-    return system_state_watcher(callback_wrapper)
+    return a0.CfgWatcher(_proc_topic(proc_name), callback_wrapper)
 
 
 async def aio_proc_info_watcher(proc_name):
-    ns = types.SimpleNamespace()
-    ns.last_proc_info = None
+    last_proc_info = None
 
-    async for system_state in aio_system_state_watcher():
-        if ns.last_proc_info != system_state.procs.get(proc_name):
-            ns.last_proc_info = system_state.procs[proc_name]
-            yield system_state.procs[proc_name]
+    async for pkt in a0.aio_cfg(_proc_topic(proc_name)):
+        info = _parse_proc_info(pkt)
+        if last_proc_info != info:
+            last_proc_info = info
+            yield info
 
 
 def set_ask(proc_name, ask):
-    _CFG.mergepatch({"procs": {proc_name: {"ask": ask.value}}})
+    _register(proc_name)
+    _proc_cfg(proc_name).mergepatch({"ask": ask.value})
 
 
 def set_state(proc_name, state, return_code=0, error_info=""):
-    _CFG.mergepatch(
+    _register(proc_name)
+    _proc_cfg(proc_name).mergepatch(
         {
-            "procs": {
-                proc_name: {
-                    "state": state.value,
-                    "return_code": return_code,
-                    "error_info": error_info,
-                }
-            }
+            "state": state.value,
+            "return_code": return_code,
+            "error_info": error_info,
         }
     )
 
 
 def set_launcher_running(proc_name, launcher_running):
-    _CFG.mergepatch({"procs": {proc_name: {"launcher_running": launcher_running}}})
+    _register(proc_name)
+    _proc_cfg(proc_name).mergepatch({"launcher_running": launcher_running})
@@ -6,6 +6,7 @@ import typing
 
 if typing.TYPE_CHECKING:
     from mrp.runtime.base import BaseRuntime
+    from mrp.telemetry import Telemetry
 
 
 @dataclasses.dataclass
@@ -17,6 +18,8 @@ class ProcDef:
     cfg: dict
     deps: typing.List[str]
     env: dict
+    health_topic: typing.Optional[str] = None
+    telemetry: typing.Optional["Telemetry"] = None
 
     def asdict(self):
         return {
@@ -27,6 +30,8 @@ class ProcDef:
             "cfg": self.cfg,
             "deps": self.deps,
             "env": self.env,
+            "health_topic": self.health_topic,
+            "telemetry": self.telemetry and dataclasses.asdict(self.telemetry),
         }
 
 
@@ -40,7 +45,15 @@ def process(
     cfg: typing.Optional[dict] = None,
     deps: typing.Optional[typing.List[str]] = None,
     env: typing.Optional[dict] = None,
+    health_topic: typing.Optional[str] = None,
+    telemetry: typing.Optional["Telemetry"] = None,
 ) -> ProcDef:
+    """Define a process.
+
+    Processes are launched once their deps are ready: started, and, if they
+    have a health_topic, having published on that a0 pubsub topic.
+    telemetry sets how the process resource usage is sampled.
+    """
     deps = deps or []
     cfg = cfg or {}
     env = env or {}
@@ -71,6 +84,8 @@ def process(
         deps=deps,
         rule_file=rule_file,
         env=env,
+        health_topic=health_topic,
+        telemetry=telemetry,
     )
 
     return defined_processes[name]
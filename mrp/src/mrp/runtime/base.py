@@ -1,34 +1,8 @@
 from mrp import life_cycle
+from mrp import telemetry
 from mrp.process_def import ProcDef
-import a0
 import asyncio
-import contextlib
-import json
 import pathlib
-import psutil
-
-
-# psutil as_dict() does not produce a json-serializable dict.
-# https://github.com/giampaolo/psutil/issues/967
-#
-# When converted to a dict, fields like memory_info generate
-#     [11984896, 31031296, ...]
-# instead of
-#     {"rss": 11984896, "vms": 31031296, ...}
-# Losing field names.
-#
-# We cannot use a custom JSONEncoder, since psutil objects, like memory_info,
-# inherit from tuples.
-#
-# This is a workaround.
-def _walk_asdict(obj):
-    if hasattr(obj, "_asdict"):
-        return _walk_asdict(obj._asdict())
-    if isinstance(obj, dict):
-        return {k: _walk_asdict(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [_walk_asdict(v) for v in obj]
-    return obj
 
 
 class BaseLauncher:
@@ -47,7 +21,7 @@ class BaseLauncher:
                 await ondown()
                 break
 
-    async def log_psutil(self):
+    async def log_telemetry(self):
         down_requested_event = asyncio.Event()
 
         async def ondown():
@@ -55,27 +29,20 @@ class BaseLauncher:
 
         asyncio.ensure_future(self.down_watcher(ondown))
 
-        out = a0.Publisher(f"mrp/psutil/{self.name}")
-        while True:
-            with contextlib.suppress(asyncio.TimeoutError):
-                # TODO(lshamis): Make polling interval configurable.
-                await asyncio.wait_for(down_requested_event.wait(), 1.0)
-            if down_requested_event.is_set():
-                break
-            pid = self.get_pid()
-            if not pid:
-                # Note: Likely being restarted.
-                continue
-
-            try:
-                proc = psutil.Process(pid)
-                pkt = a0.Packet(
-                    [("content-type", "application/json")],
-                    json.dumps(_walk_asdict(proc.as_dict())),
-                )
-                out.pub(pkt)
-            except psutil.NoSuchProcess:
-                pass
+        pid = self.get_pid()
+        telemetry.register(self.name, pid, self.proc_def.telemetry)
+        try:
+            # The sampler runs in its own process, keep its pid up to date.
+            while not down_requested_event.is_set():
+                try:
+                    await asyncio.wait_for(down_requested_event.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+                if self.get_pid() != pid:
+                    pid = self.get_pid()
+                    telemetry.register(self.name, pid, self.proc_def.telemetry)
+        finally:
+            telemetry.unregister(self.name)
 
 
 class BaseRuntime:
@@ -88,5 +55,9 @@ class BaseRuntime:
     def _build(self, name: str, proc_def: ProcDef, cache: bool, verbose: bool):
         raise NotImplementedError("Runtime hasn't implemented build!")
 
+    def _build_key(self, name: str, proc_def: ProcDef) -> str:
+        """Identifies what _build produces. Processes with the same key share a build."""
+        return name
+
     def _launcher(self, name: str, proc_def: ProcDef) -> BaseLauncher:
         raise NotImplementedError("Runtime hasn't implemented a launcher!")
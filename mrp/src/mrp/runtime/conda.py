@@ -4,7 +4,9 @@ from mrp.process_def import ProcDef
 from mrp.runtime.base import BaseLauncher, BaseRuntime
 import asyncio
 import dataclasses
+import fcntl
 import filecmp
+import hashlib
 import json
 import os
 import pathlib
@@ -12,10 +14,86 @@ import pty
 import shutil
 import signal
 import subprocess
+import time
 import typing
 import yaml as pyyaml
 
 
+def cache_root():
+    """Where built environments are kept, shared by all processes and projects."""
+    return os.path.expanduser(os.environ.get("MRP_CONDA_CACHE", "~/.cache/mrp/conda"))
+
+
+def cache_max_age():
+    """Seconds an environment is kept in the cache after its last build or launch."""
+    return float(os.environ.get("MRP_CONDA_CACHE_MAX_AGE_DAYS", 30)) * 24 * 3600
+
+
+def _lock_env(cache_dir, shared):
+    """Lock a cached environment, without waiting.
+
+    Launchers hold a shared lock while their process runs. Rebuilding or
+    evicting the environment takes an exclusive lock. Returns the open lock
+    file, which holds the lock until closed, or None if the lock is taken.
+    """
+    lockfile = open(os.path.join(cache_dir, "lock"), "a")
+    try:
+        fcntl.flock(
+            lockfile, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB
+        )
+    except BlockingIOError:
+        lockfile.close()
+        return None
+    return lockfile
+
+
+def _touch(cache_dir):
+    pathlib.Path(cache_dir, "last_used").touch()
+
+
+def gc_cache(max_age=None):
+    """Evict the environments not built or launched in max_age seconds.
+
+    Environments in use by a running process are kept, whatever their age.
+    """
+    max_age = cache_max_age() if max_age is None else max_age
+    root = cache_root()
+    if not os.path.isdir(root):
+        return
+    deadline = time.time() - max_age
+
+    for entry in os.listdir(root):
+        cache_dir = os.path.join(root, entry)
+        if entry in ["names", "archives"] or not os.path.isdir(cache_dir):
+            continue
+        try:
+            last_used = os.path.getmtime(os.path.join(cache_dir, "last_used"))
+        except FileNotFoundError:
+            last_used = os.path.getmtime(cache_dir)
+        if last_used > deadline:
+            continue
+        lockfile = _lock_env(cache_dir, shared=False)
+        if not lockfile:
+            continue
+        with lockfile:
+            print(f"evicting unused conda env {cache_dir}")
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    archives = os.path.join(root, "archives")
+    if os.path.isdir(archives):
+        for entry in os.listdir(archives):
+            archive = os.path.join(archives, entry)
+            if os.path.getmtime(archive) <= deadline:
+                os.remove(archive)
+
+    # Names of evicted environments.
+    for dirpath, _, filenames in os.walk(os.path.join(root, "names")):
+        for filename in filenames:
+            link = os.path.join(dirpath, filename)
+            if os.path.islink(link) and not os.path.exists(link):
+                os.remove(link)
+
+
 @dataclasses.dataclass
 class CondaEnv:
     channels: typing.List[str]
@@ -55,6 +133,26 @@ class CondaEnv:
 
         return CondaEnv(channels, deps)
 
+    def normalize(self):
+        """Put the definition in canonical form.
+
+        Channels keep their order, which sets their priority. Dependencies are
+        deduplicated and sorted, with the pip dependencies last.
+        """
+        self.channels = list(dict.fromkeys(self.channels))
+
+        deps = set()
+        pip_deps = set()
+        for dep in self.dependencies:
+            if type(dep) == dict:
+                pip_deps.update(pip_dep.strip() for pip_dep in dep.get("pip", []))
+            else:
+                deps.add(dep.strip())
+
+        self.dependencies = sorted(deps)
+        if pip_deps:
+            self.dependencies.append({"pip": sorted(pip_deps)})
+
     def fix_empty(self):
         """Fix empty dependencies.
 
@@ -92,6 +190,18 @@ class Launcher(BaseLauncher):
         self.name = name
         self.env_name = env_name
         self.proc_def = proc_def
+        self.env_lock = None
+
+    def lock_env(self) -> bool:
+        """Keep the cached environment from being rebuilt or evicted while running."""
+        cache_dir = os.path.dirname(self.env_name)
+        if not os.path.exists(os.path.join(cache_dir, "spec.json")):
+            # A named environment, not managed by the cache.
+            return True
+        self.env_lock = _lock_env(cache_dir, shared=True)
+        if self.env_lock:
+            _touch(cache_dir)
+        return bool(self.env_lock)
 
     async def envvar_for_conda(self) -> dict:
         """Detect the envvar set by conda for our env."""
@@ -142,7 +252,7 @@ class Launcher(BaseLauncher):
 
         This includes:
         - piping stdout and stderr to the alephzero logger.
-        - logging the processes psutil stats.
+        - sampling the process telemetry.
         - watching for process death.
         - watching for user down request.
         """
@@ -153,7 +263,7 @@ class Launcher(BaseLauncher):
 
         try:
             await asyncio.gather(
-                self.log_psutil(),
+                self.log_telemetry(),
                 self.death_handler(),
                 self.down_task,
             )
@@ -165,6 +275,8 @@ class Launcher(BaseLauncher):
 
     async def run(self):
         """Run the command."""
+        if not self.lock_env():
+            raise RuntimeError(f"conda env {self.env_name} is being rebuilt")
         conda_envvar = await self.envvar_for_conda()
         if await self.run_cmd_with_conda_envvar(conda_envvar):
             life_cycle.set_state(self.name, life_cycle.State.STARTED)
@@ -217,6 +329,7 @@ class Conda(BaseRuntime):
             dependencies=[],
             use_mamba=None,
             setup_commands=[],
+            pack=False,
         ):
             if use_named_env and any([copy_named_env, yaml, channels, dependencies]):
                 raise ValueError(
@@ -232,6 +345,8 @@ class Conda(BaseRuntime):
                 use_mamba if use_mamba is not None else bool(shutil.which("mamba"))
             )
             self.setup_commands = setup_commands
+            self.pack = pack
+            self._content = None
             self._built = False
 
             if use_named_env:
@@ -259,6 +374,9 @@ class Conda(BaseRuntime):
             - querying a named env to duplicate.
             - given yaml file.
             """
+            if self._content is not None:
+                return self._content
+
             if self.copy_named_env:
                 self.conda_env = CondaEnv.merge(
                     self.conda_env, CondaEnv.from_named_env(self.copy_named_env)
@@ -272,58 +390,81 @@ class Conda(BaseRuntime):
 
             self.conda_env.fix_empty()
             self.conda_env.fix_pip()
-            return {
+            self.conda_env.normalize()
+            self._content = {
                 "channels": self.conda_env.channels,
                 "dependencies": self.conda_env.dependencies,
             }
+            return self._content
+
+        def _spec(self, root: pathlib.Path) -> dict:
+            """Everything that determines the built environment."""
+            spec = dict(self._generate_env_content(root))
+            spec["setup_commands"] = self.setup_commands
+            if self.setup_commands:
+                # Setup commands run from the project root.
+                spec["root"] = os.path.abspath(root)
+            return spec
+
+        def _spec_hash(self, root: pathlib.Path) -> str:
+            spec = json.dumps(self._spec(root), sort_keys=True)
+            return hashlib.sha256(spec.encode()).hexdigest()[:16]
+
+        def _env_id(self, root: pathlib.Path) -> str:
+            """Identifies the environment. Equal specs share it across processes and projects."""
+            return self.use_named_env or f"mrp_{self._spec_hash(root)}"
+
+        def _env_name(self, root: pathlib.Path) -> str:
+            """The name or prefix of the environment to activate.
+
+            This is the environment last built for this name, if any, so that
+            processes run without building keep their previous environment.
+            """
+            if self.use_named_env:
+                return self.use_named_env
+            if os.path.islink(self._name_link_path(root)):
+                return os.path.realpath(self._name_link_path(root))
+            return self._prefix(root)
 
-        def _env_name(self):
-            """The target environment name."""
-            return self.use_named_env or f"mrp_{self.name}"
+        def _cache_dir(self, root: pathlib.Path):
+            return os.path.join(cache_root(), self._spec_hash(root))
 
-        def _config_path(self):
-            dirpath = os.path.expanduser(f"~/.config/mrp/conda/{self._env_name()}/")
-            os.makedirs(dirpath, exist_ok=True)
-            return dirpath
+        def _prefix(self, root: pathlib.Path):
+            return os.path.join(self._cache_dir(root), "env")
 
-        def _yaml_path(self):
-            return os.path.join(self._config_path(), "conda_env.yaml")
+        def _yaml_path(self, root: pathlib.Path):
+            return os.path.join(self._cache_dir(root), "conda_env.yaml")
 
-        def _setup_commands_snapshot_path(self):
-            return os.path.join(self._config_path(), "setup_commands.snapshot")
+        def _spec_path(self, root: pathlib.Path):
+            return os.path.join(self._cache_dir(root), "spec.json")
 
-        def _conda_history_snapshot_path(self):
-            return os.path.join(self._config_path(), "history.snapshot")
+        def _conda_history_snapshot_path(self, root: pathlib.Path):
+            return os.path.join(self._cache_dir(root), "history.snapshot")
 
-        def _conda_history_path(self):
-            info = json.loads(
-                subprocess.check_output(
-                    ["conda", "env", "export", "--json", "-n", self._env_name()]
-                )
+        def _conda_history_path(self, root: pathlib.Path):
+            return os.path.join(self._prefix(root), "conda-meta/history")
+
+        def _archive_path(self, root: pathlib.Path):
+            return os.path.join(
+                cache_root(), "archives", f"{self._spec_hash(root)}.tar.gz"
             )
 
-            return os.path.join(info["prefix"], "conda-meta/history")
+        def _name_link_path(self, root: pathlib.Path):
+            # Processes are named per project.
+            project = hashlib.sha256(os.path.abspath(root).encode()).hexdigest()[:16]
+            return os.path.join(cache_root(), "names", project, f"mrp_{self.name}")
 
-        def _cache_valid(self, env_content):
+        def _cache_valid(self, root: pathlib.Path):
             try:
-                # Check if the env description has changed.
-                old_content = json.load(open(self._yaml_path()))
-                old_content_compare_key = json.dumps(old_content, sort_keys=True)
-                new_content_compare_key = json.dumps(env_content, sort_keys=True)
-                if old_content_compare_key != new_content_compare_key:
+                # The spec is written last, once the environment is complete.
+                if json.load(open(self._spec_path(root))) != self._spec(root):
                     print("detected change in environment definition.")
                     return False
 
-                # Check if the setup commands have changed.
-                if self.setup_commands != json.load(
-                    open(self._setup_commands_snapshot_path())
-                ):
-                    print("detected change in setup commands.")
-                    return False
-
                 # Check if unmanaged commands have been executed.
                 if not filecmp.cmp(
-                    self._conda_history_path(), self._conda_history_snapshot_path()
+                    self._conda_history_path(root),
+                    self._conda_history_snapshot_path(root),
                 ):
                     print("detected change in conda environment.")
                     return False
@@ -332,68 +473,161 @@ class Conda(BaseRuntime):
             except Exception:
                 return False
 
-        def _create_env(self, root: pathlib.Path, cache: bool, verbose: bool):
-            """Create the conda environment."""
-            yaml_path = self._yaml_path()
-            env_content = self._generate_env_content(root)
-            env_content["name"] = self._env_name()
-
-            if cache and self._cache_valid(env_content):
-                return
-
-            with open(yaml_path, "w") as env_fp:
-                json.dump(env_content, env_fp, indent=2)
+        def _run(self, args, root: pathlib.Path, verbose: bool, **kwargs):
+            result = util.run_build_command(args, self._env_id(root), verbose, **kwargs)
+            if result.returncode:
+                raise RuntimeError(
+                    f"Failed to set up conda env: {result.stdout.decode()}"
+                )
 
+        def _solve_env(self, root: pathlib.Path, verbose: bool):
+            """Create the environment from its definition."""
             print(
-                f"creating conda env for {self._env_name()}. This will take a minute..."
+                f"creating conda env for {self.name} in {self._prefix(root)}. This will take a minute..."
             )
 
+            with open(self._yaml_path(root), "w") as env_fp:
+                json.dump(self._generate_env_content(root), env_fp, indent=2)
+
             update_bin = "mamba" if self.use_mamba else "conda"
             # https://github.com/conda/conda/issues/7279
             # Updating an existing environment does not remove old packages, even with --prune.
-            subprocess.run(
-                [update_bin, "env", "remove", "-n", self._env_name()],
-                capture_output=not verbose,
+            shutil.rmtree(self._prefix(root), ignore_errors=True)
+            self._run(
+                [
+                    update_bin,
+                    "env",
+                    "update",
+                    "--prune",
+                    "-p",
+                    self._prefix(root),
+                    "-f",
+                    self._yaml_path(root),
+                ],
+                root,
+                verbose,
             )
-            result = subprocess.run(
-                [update_bin, "env", "update", "--prune", "-f", yaml_path],
-                capture_output=not verbose,
+
+        def _unpack_env(self, root: pathlib.Path, verbose: bool):
+            """Restore the environment from its conda-pack archive, without solving."""
+            print(
+                f"restoring conda env for {self.name} from {self._archive_path(root)}"
+            )
+
+            prefix = self._prefix(root)
+            shutil.rmtree(prefix, ignore_errors=True)
+            os.makedirs(prefix)
+            self._run(
+                ["tar", "-xzf", self._archive_path(root), "-C", prefix], root, verbose
+            )
+            self._run(
+                f"source {prefix}/bin/activate && conda-unpack",
+                root,
+                verbose,
+                shell=True,
+                executable="/bin/bash",
             )
-            if result.returncode:
-                raise RuntimeError(f"Failed to set up conda env: {result.stderr}")
 
-            print(f"running setup commands for {self._env_name()}")
+        def _pack_env(self, root: pathlib.Path, verbose: bool):
+            """Archive the environment with conda-pack, to restore on other machines."""
+            if not shutil.which("conda-pack"):
+                print("conda-pack not found. Skipping the environment archive.")
+                return
+
+            archive_path = self._archive_path(root)
+            os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+            try:
+                self._run(
+                    [
+                        "conda-pack",
+                        "-p",
+                        self._prefix(root),
+                        "-o",
+                        f"{archive_path}.tmp",
+                        "--format",
+                        "tar.gz",
+                        "--ignore-editable-packages",
+                        "--force",
+                    ],
+                    root,
+                    verbose,
+                )
+            except RuntimeError as e:
+                # The environment itself is usable.
+                print(f"failed to pack conda env: {e}")
+                return
+            os.replace(f"{archive_path}.tmp", archive_path)
+
+        def _create_env(self, root: pathlib.Path, cache: bool, verbose: bool):
+            """Create the conda environment."""
+            if cache and self._cache_valid(root):
+                _touch(self._cache_dir(root))
+                return
+
+            os.makedirs(self._cache_dir(root), exist_ok=True)
+            lockfile = _lock_env(self._cache_dir(root), shared=False)
+            if not lockfile:
+                raise RuntimeError(
+                    f"conda env {self._prefix(root)} is in use by running processes"
+                    " or another build. Down them before rebuilding it."
+                )
+            with lockfile:
+                self._create_locked_env(root, cache, verbose)
+
+        def _create_locked_env(self, root: pathlib.Path, cache: bool, verbose: bool):
+            # Invalidate the cache entry until the environment is complete.
+            if os.path.exists(self._spec_path(root)):
+                os.remove(self._spec_path(root))
+
+            restored = cache and os.path.exists(self._archive_path(root))
+            if restored:
+                self._unpack_env(root, verbose)
+            else:
+                self._solve_env(root, verbose)
+
+            print(f"running setup commands for {self.name}")
 
             setup_command = "\n".join(
                 [util.shell_join(cmd) for cmd in self.setup_commands]
             )
-            result = subprocess.run(
+            self._run(
                 f"""
                     eval "$(conda shell.bash hook)"
-                    conda activate {self._env_name()}
+                    conda activate {self._prefix(root)}
                     cd {root}
                     {setup_command}
                 """,
+                root,
+                verbose,
                 shell=True,
                 executable="/bin/bash",
-                capture_output=not verbose,
             )
-            if result.returncode:
-                raise RuntimeError(f"Failed to set up conda env: {result.stderr}")
+
+            if self.pack and not restored:
+                self._pack_env(root, verbose)
 
             # Snapshot successful build info.
             shutil.copy2(
-                self._conda_history_path(), self._conda_history_snapshot_path()
-            )
-            json.dump(
-                self.setup_commands, open(self._setup_commands_snapshot_path(), "w")
+                self._conda_history_path(root), self._conda_history_snapshot_path(root)
             )
+            json.dump(self._spec(root), open(self._spec_path(root), "w"), indent=2)
+            _touch(self._cache_dir(root))
+
+        def _link_name(self, root: pathlib.Path):
+            """Point the name of the environment to its last build."""
+            link_path = self._name_link_path(root)
+            os.makedirs(os.path.dirname(link_path), exist_ok=True)
+            tmp_link_path = f"{link_path}.{os.getpid()}.tmp"
+            os.symlink(self._prefix(root), tmp_link_path)
+            os.replace(tmp_link_path, link_path)
 
         def _build(self, root: pathlib.Path, cache: bool, verbose: bool):
             if self._built:
                 return
             if not self.use_named_env:
                 self._create_env(root, cache, verbose)
+                self._link_name(root)
+                gc_cache()
             self._built = True
 
     def __init__(
@@ -407,6 +641,7 @@ class Conda(BaseRuntime):
         dependencies=[],
         setup_commands=[],
         use_mamba=None,
+        pack=False,
     ):
         """Declare a conda runtime environment.
 
@@ -420,6 +655,7 @@ class Conda(BaseRuntime):
             dependencies: Create a new conda environment using the given dependencies.
             setup_commands: Commands to run during the build phase.
             use_mamba: Use mamba instead of conda. If not set, mamba will be autodetected.
+            pack: Archive the built environment with conda-pack into the cache, to restore it on machines that share the archive without solving.
         """
         if shared_env and any(
             [use_named_env, copy_named_env, yaml, channels, dependencies]
@@ -440,6 +676,7 @@ class Conda(BaseRuntime):
                 dependencies,
                 use_mamba,
                 setup_commands,
+                pack,
             )
 
         self.run_command = run_command
@@ -460,10 +697,15 @@ class Conda(BaseRuntime):
             self._env.name = name
         self._env._build(proc_def.root, cache, verbose)
 
+    def _build_key(self, name: str, proc_def: ProcDef):
+        return self._env._env_id(proc_def.root)
+
     def _launcher(self, name: str, proc_def: ProcDef):
         if self._env.name == "__defer__":
             self._env.name = name
-        return Launcher(self.run_command, name, self._env._env_name(), proc_def)
+        return Launcher(
+            self.run_command, name, self._env._env_name(proc_def.root), proc_def
+        )
 
 
 __all__ = ["Conda"]
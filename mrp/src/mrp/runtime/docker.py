@@ -120,7 +120,7 @@ class Launcher(BaseLauncher):
                 log_pipe(ptl.err, self.proc.log(stderr=True, follow=True)),
                 self.stdout_pipe(),
                 self.stdin_pipe(),
-                self.log_psutil(),
+                self.log_telemetry(),
                 self.death_handler(),
                 self.down_task,
             )
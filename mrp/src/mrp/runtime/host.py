@@ -7,7 +7,6 @@ import os
 import pathlib
 import pty
 import signal
-import subprocess
 import typing
 
 
@@ -30,7 +29,7 @@ class Launcher(BaseLauncher):
 
         try:
             await asyncio.gather(
-                self.log_psutil(),
+                self.log_telemetry(),
                 self.death_handler(),
                 self.down_task,
             )
@@ -120,14 +119,15 @@ class Host(BaseRuntime):
             build_command = "\n".join(
                 [util.shell_join(cmd) for cmd in self.build_commands]
             )
-            result = subprocess.run(
+            result = util.run_build_command(
                 build_command,
+                name,
+                verbose,
                 shell=True,
                 executable="/bin/bash",
-                capture_output=not verbose,
             )
             if result.returncode:
-                raise RuntimeError(f"Failed to build: {result.stderr}")
+                raise RuntimeError(f"Failed to build: {result.stdout.decode()}")
 
     def _launcher(self, name: str, proc_def: ProcDef):
         return Launcher(self.run_command, name, proc_def)
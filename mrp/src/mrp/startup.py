@@ -0,0 +1,166 @@
+from mrp import life_cycle
+from mrp import process_def
+import a0
+import click
+import threading
+import time
+import typing
+
+
+def topological_order(names) -> typing.List[str]:
+    """Order the processes so that each comes after the deps among them."""
+    names = list(names)
+    order = []
+    visiting = set()
+    visited = set()
+
+    def visit(name, path):
+        if name in visited:
+            return
+        if name in visiting:
+            cycle = path[path.index(name) :] + [name]
+            raise ValueError(f"Dependency cycle: {' -> '.join(cycle)}")
+        visiting.add(name)
+        for dep in process_def.defined_processes[name].deps:
+            if dep in names:
+                visit(dep, path + [name])
+        visiting.remove(name)
+        visited.add(name)
+        order.append(name)
+
+    for name in names:
+        visit(name, [])
+    return order
+
+
+class Startup:
+    """Launch processes as soon as they are built and their deps are ready.
+
+    A process is ready once started (or exited successfully) and, if it
+    has a health_topic, once it published on it. Deps outside of the
+    started processes are not waited on.
+    """
+
+    def __init__(self, names, launch, timeout: float = 0):
+        self.names = topological_order(names)
+        self.deps = {
+            name: [
+                dep
+                for dep in process_def.defined_processes[name].deps
+                if dep in self.names
+            ]
+            for name in self.names
+        }
+        self.launch = launch
+        self.timeout = timeout
+
+        self.cv = threading.Condition()
+        self.built = set()
+        self.launched = set()
+        self.healthy = set()
+        self.ready = {}
+        self.failed = {}
+        self._health_subs = []
+
+    def on_built(self, names, error=None):
+        with self.cv:
+            for name in names:
+                if error:
+                    self.failed[name] = f"failed to build: {error}"
+                else:
+                    self.built.add(name)
+            self.cv.notify()
+
+    def _notify(self, *args):
+        with self.cv:
+            self.cv.notify()
+
+    def _on_health(self, name):
+        def callback(pkt):
+            with self.cv:
+                self.healthy.add(name)
+                self.cv.notify()
+
+        return callback
+
+    def _is_done(self):
+        return all(name in self.ready or name in self.failed for name in self.names)
+
+    def _update_ready(self, t0):
+        for name in self.launched:
+            if name in self.ready or name in self.failed:
+                continue
+            info = life_cycle.proc_info(name)
+            has_health = process_def.defined_processes[name].health_topic
+            stopped = info.state == life_cycle.State.STOPPED
+            healthy = name in self.healthy
+            # A process that reported healthy and then exited cleanly is ready.
+            if stopped and (info.return_code or (has_health and not healthy)):
+                self.failed[name] = f"stopped with return code {info.return_code}"
+                continue
+            started = info.state == life_cycle.State.STARTED or stopped
+            if started and (not has_health or healthy):
+                self.ready[name] = time.time() - t0
+                click.echo(f"{name} ready after {self.ready[name]:.2f}s")
+
+    def _launch_ready(self):
+        for name in self.names:
+            if name in self.launched or name in self.failed:
+                continue
+            failed_deps = [dep for dep in self.deps[name] if dep in self.failed]
+            if failed_deps:
+                self.failed[name] = f"dependency failed: {', '.join(failed_deps)}"
+                continue
+            if name not in self.built:
+                continue
+            if not all(dep in self.ready for dep in self.deps[name]):
+                continue
+
+            health_topic = process_def.defined_processes[name].health_topic
+            if health_topic:
+                # Subscribe first, to not miss the first health report.
+                self._health_subs.append(
+                    a0.Subscriber(
+                        health_topic,
+                        a0.INIT_AWAIT_NEW,
+                        a0.ITER_NEXT,
+                        self._on_health(name),
+                    )
+                )
+            self.launch(name)
+            self.launched.add(name)
+
+    def run(self):
+        """Launch the processes and wait until they are all ready or failed.
+
+        Returns the failed processes, with the reason.
+        """
+        t0 = time.time()
+        watcher = life_cycle.system_state_watcher(self._notify)  # noqa: F841
+
+        with self.cv:
+            while True:
+                self._update_ready(t0)
+                self._launch_ready()
+                if self._is_done():
+                    break
+
+                remaining = 1.0
+                if self.timeout:
+                    remaining = min(remaining, t0 + self.timeout - time.time())
+                    if remaining <= 0:
+                        for name in self.names:
+                            if name not in self.ready and name not in self.failed:
+                                self.failed[name] = f"not ready after {self.timeout}s"
+                        break
+                # The state is re-read on wake up, the timeout only guards
+                # against missed notifications.
+                self.cv.wait(timeout=remaining)
+
+        self._health_subs.clear()
+        if self.ready:
+            click.echo(
+                f"started {len(self.ready)}/{len(self.names)} processes "
+                f"in {max(self.ready.values()):.2f}s"
+            )
+        return self.failed
@@ -0,0 +1,391 @@
+"""Process telemetry.
+
+One sampler process, shared by every launcher, reads a small set of
+attributes of each running process at a fixed rate, on a single thread.
+Launchers run in their own (forked) processes, so they register their
+process, pid and settings on the mrp/telemetry_registry cfg topic. The
+first registration starts the sampler, which exits once nothing is
+registered.
+
+Samples are published on mrp/telemetry/<name> as zigzag varints:
+    kind, timestamp (us), value...
+where kind is KEYFRAME, with absolute values, or DELTA, with differences to
+the previous sample. The attribute names are in the "fields" header. A
+summary of the last window of samples is published, as json, on
+mrp/telemetry/<name>/summary.
+"""
+import a0
+import dataclasses
+import fcntl
+import json
+import os
+import psutil
+import subprocess
+import sys
+import threading
+import time
+import typing
+
+KEYFRAME = 0
+DELTA = 1
+
+# Attribute name -> (psutil reader, field names).
+# Fields are integers: cpu times in microseconds, rss in bytes.
+_ATTRS = {
+    "cpu": (
+        lambda proc: [int(t * 1e6) for t in proc.cpu_times()[:2]],
+        ["cpu_user_us", "cpu_system_us"],
+    ),
+    "rss": (lambda proc: [proc.memory_info().rss], ["rss"]),
+    "threads": (lambda proc: [proc.num_threads()], ["num_threads"]),
+    "ctx_switches": (
+        lambda proc: list(proc.num_ctx_switches()),
+        ["ctx_voluntary", "ctx_involuntary"],
+    ),
+    "fds": (lambda proc: [proc.num_fds()], ["num_fds"]),
+}
+
+# Fields that only increase. Their summary is a rate per second.
+_COUNTERS = {"cpu_user_us", "cpu_system_us", "ctx_voluntary", "ctx_involuntary"}
+
+
+@dataclasses.dataclass
+class Telemetry:
+    """Telemetry settings of a process.
+
+    Args:
+        hz: Samples per second.
+        attrs: Attributes to sample, from: cpu, rss, threads, ctx_switches, fds.
+        keyframe_interval: Samples between absolute samples, for late subscribers.
+        summary_interval: Seconds between summaries, each over the samples since the last.
+    """
+
+    hz: float = 10.0
+    attrs: typing.List[str] = dataclasses.field(
+        default_factory=lambda: ["cpu", "rss", "threads", "ctx_switches"]
+    )
+    keyframe_interval: int = 100
+    summary_interval: float = 1.0
+
+    def __post_init__(self):
+        unknown = [attr for attr in self.attrs if attr not in _ATTRS]
+        if unknown:
+            raise ValueError(f"Unknown telemetry attrs: {', '.join(unknown)}")
+
+    def fields(self) -> typing.List[str]:
+        return [field for attr in self.attrs for field in _ATTRS[attr][1]]
+
+
+def _zigzag(value: int) -> int:
+    return (value << 1) ^ (value >> 63)
+
+
+def _unzigzag(value: int) -> int:
+    return (value >> 1) ^ -(value & 1)
+
+
+def encode_varints(values: typing.List[int]) -> bytes:
+    out = bytearray()
+    for value in values:
+        value = _zigzag(value)
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def decode_varints(data: bytes) -> typing.List[int]:
+    values = []
+    value = 0
+    shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            values.append(_unzigzag(value))
+            value = 0
+            shift = 0
+    return values
+
+
+class SampleDecoder:
+    """Decode the samples of a telemetry topic, in order, into dicts."""
+
+    def __init__(self):
+        self._last = None
+
+    def decode(self, pkt) -> typing.Optional[dict]:
+        """Returns None until the first keyframe."""
+        fields = dict(pkt.headers)["fields"].split(",")
+        kind, *values = decode_varints(pkt.payload)
+        if kind == DELTA:
+            if self._last is None:
+                return None
+            values = [last + delta for last, delta in zip(self._last, values)]
+        self._last = values
+        return dict(zip(["timestamp_us"] + fields, values))
+
+
+class _Stream:
+    def __init__(self, name, get_pid, config: Telemetry):
+        self.name = name
+        self.get_pid = get_pid
+        self.config = config
+        self.fields = config.fields()
+        self.headers = [
+            ("content-type", "application/x-mrp-telemetry"),
+            ("fields", ",".join(self.fields)),
+        ]
+        self.period = 1.0 / config.hz
+        self.next_sample = time.monotonic()
+        self.next_summary = self.next_sample + config.summary_interval
+
+        self.pid = None
+        self.proc = None
+        self.last = None
+        self.num_samples = 0
+        self.window = []
+
+        self.pub = a0.Publisher(f"mrp/telemetry/{name}")
+        self.summary_pub = a0.Publisher(f"mrp/telemetry/{name}/summary")
+
+    def _read(self):
+        pid = self.get_pid()
+        if not pid:
+            # Likely being restarted.
+            return None
+        if pid != self.pid:
+            self.pid = pid
+            self.proc = psutil.Process(pid)
+            self.last = None
+        with self.proc.oneshot():
+            values = [int(time.time() * 1e6)]
+            for attr in self.config.attrs:
+                values.extend(_ATTRS[attr][0](self.proc))
+        return values
+
+    def sample(self):
+        try:
+            values = self._read()
+        except psutil.Error:
+            return
+        if values is None:
+            return
+
+        keyframe = (
+            self.last is None or self.num_samples % self.config.keyframe_interval == 0
+        )
+        if keyframe:
+            payload = [KEYFRAME] + values
+        else:
+            payload = [DELTA] + [value - last for value, last in zip(values, self.last)]
+        self.pub.pub(a0.Packet(self.headers, encode_varints(payload)))
+
+        self.last = values
+        self.num_samples += 1
+        self.window.append(values)
+
+    def summarize(self):
+        window, self.window = self.window, []
+        if not window:
+            return
+        duration = (window[-1][0] - window[0][0]) / 1e6
+        summary = {"num_samples": len(window), "duration": duration}
+        for i, field in enumerate(self.fields, start=1):
+            column = [values[i] for values in window]
+            if field in _COUNTERS:
+                rates = [
+                    (b[i] - a[i]) / max(b[0] - a[0], 1) * 1e6
+                    for a, b in zip(window, window[1:])
+                ]
+                summary[f"{field}_per_s"] = {
+                    "mean": (column[-1] - column[0]) / duration if duration else 0,
+                    "max": max(rates, default=0),
+                }
+            else:
+                summary[field] = {
+                    "min": min(column),
+                    "mean": sum(column) / len(column),
+                    "max": max(column),
+                    "last": column[-1],
+                }
+        self.summary_pub.pub(
+            a0.Packet([("content-type", "application/json")], json.dumps(summary))
+        )
+
+
+class Sampler:
+    """A thread that samples all the registered processes."""
+
+    def __init__(self):
+        self._cv = threading.Condition()
+        self._streams = {}
+        self._thread = None
+
+    def add(self, name: str, get_pid, config: Telemetry = None):
+        with self._cv:
+            self._streams[name] = _Stream(name, get_pid, config or Telemetry())
+            if not self._thread:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cv.notify()
+
+    def remove(self, name: str):
+        with self._cv:
+            stream = self._streams.pop(name, None)
+            self._cv.notify()
+        if stream:
+            stream.summarize()
+
+    def _run(self):
+        with self._cv:
+            while True:
+                now = time.monotonic()
+                for stream in list(self._streams.values()):
+                    if now >= stream.next_sample:
+                        stream.sample()
+                        # Skip missed samples rather than bursting to catch up.
+                        missed = int((now - stream.next_sample) / stream.period)
+                        stream.next_sample += stream.period * (missed + 1)
+                    if now >= stream.next_summary:
+                        stream.summarize()
+                        stream.next_summary += stream.config.summary_interval
+
+                deadlines = [
+                    min(stream.next_sample, stream.next_summary)
+                    for stream in self._streams.values()
+                ]
+                timeout = min(deadlines) - time.monotonic() if deadlines else None
+                if timeout is None or timeout > 0:
+                    self._cv.wait(timeout)
+
+
+_REGISTRY_TOPIC = "mrp/telemetry_registry"
+_REGISTRY_CFG = a0.Cfg(_REGISTRY_TOPIC)
+# Seconds the sampler keeps running with nothing registered.
+_IDLE_TIMEOUT = 5.0
+
+
+def _lock_path() -> str:
+    return os.path.join(a0.env.root(), "mrp_telemetry.lock")
+
+
+def _try_lock(lockfile) -> bool:
+    try:
+        fcntl.flock(lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+
+def _read_registry() -> dict:
+    _REGISTRY_CFG.write_if_empty(json.dumps({}))
+    return json.loads(_REGISTRY_CFG.read().payload)
+
+
+def _ensure_sampler():
+    with open(_lock_path(), "a") as lockfile:
+        if not _try_lock(lockfile):
+            # Held by the running sampler.
+            return
+    # If several launchers get here at once, all but one sampler exit.
+    subprocess.Popen(
+        [sys.executable, "-m", "mrp.telemetry"],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        close_fds=True,
+        start_new_session=True,
+    )
+
+
+def register(name: str, pid: typing.Optional[int], config: Telemetry = None):
+    """Sample the process name, with the given pid, in the sampler process.
+
+    Call again when the pid changes.
+    """
+    _read_registry()
+    _REGISTRY_CFG.mergepatch(
+        {
+            name: {
+                "pid": pid,
+                "launcher_pid": os.getpid(),
+                "config": dataclasses.asdict(config or Telemetry()),
+            }
+        }
+    )
+    _ensure_sampler()
+
+
+def unregister(name: str):
+    _read_registry()
+    _REGISTRY_CFG.mergepatch({name: None})
+
+
+class _RegistrySampler:
+    """Samples the processes of the registry, as it changes."""
+
+    def __init__(self):
+        self.sampler = Sampler()
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def get_pid(self, name):
+        return lambda: self.entries.get(name, {}).get("pid")
+
+    def update(self, registry):
+        with self.lock:
+            # Launchers that died without unregistering.
+            for name, entry in list(registry.items()):
+                if not psutil.pid_exists(entry["launcher_pid"]):
+                    unregister(name)
+                    del registry[name]
+
+            for name in list(self.entries):
+                if name not in registry:
+                    del self.entries[name]
+                    self.sampler.remove(name)
+            for name, entry in registry.items():
+                old_entry = self.entries.get(name)
+                self.entries[name] = entry
+                if not old_entry or old_entry["config"] != entry["config"]:
+                    config = Telemetry(**entry["config"])
+                    self.sampler.add(name, self.get_pid(name), config)
+
+    def idle(self):
+        with self.lock:
+            return not self.entries
+
+
+def main():
+    with open(_lock_path(), "a") as lockfile:
+        if not _try_lock(lockfile):
+            return
+
+        registry_sampler = _RegistrySampler()
+        watcher = a0.CfgWatcher(  # noqa: F841
+            _REGISTRY_TOPIC,
+            lambda pkt: registry_sampler.update(json.loads(pkt.payload)),
+        )
+        idle_since = None
+        while True:
+            time.sleep(1.0)
+            registry_sampler.update(_read_registry())
+            if not registry_sampler.idle():
+                idle_since = None
+                continue
+            idle_since = idle_since or time.monotonic()
+            if time.monotonic() - idle_since < _IDLE_TIMEOUT:
+                continue
+
+            # A launcher registers before it checks the lock, so whatever it
+            # registered is seen here, after the lock is released.
+            fcntl.flock(lockfile, fcntl.LOCK_UN)
+            if not _read_registry() or not _try_lock(lockfile):
+                return
+            idle_since = None
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 import a0
 import asyncio
+import click
 import collections.abc
 import contextlib
+import fcntl
 import glob
 import os
 import pwd
@@ -9,6 +11,7 @@ import random
 import shlex
 import string
 import subprocess
+import threading
 
 
 def common_env(proc_def):
@@ -154,3 +157,65 @@ def shell_join(items):
     return " ".join(
         item.value if type(item) == NoEscape else shlex.quote(item) for item in items
     )
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Exclusive lock on a file, held across threads and mrp invocations."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as lockfile:
+        fcntl.flock(lockfile, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+
+def close_inherited_fds():
+    """Close the fds inherited through a fork, except stdio and alephzero's.
+
+    Builds run concurrently with launches. A forked launcher would otherwise
+    keep a build's output pipe open, so the build never reads EOF, and keep
+    the build's environment locks held.
+    """
+    a0_root = a0.env.root()
+    for fd in os.listdir("/proc/self/fd"):
+        fd = int(fd)
+        if fd < 3:
+            continue
+        try:
+            if os.readlink(f"/proc/self/fd/{fd}").startswith(a0_root):
+                continue
+            os.close(fd)
+        except OSError:
+            # The fd of the listdir, closed since.
+            pass
+
+
+def build_log_path(key):
+    return f"/tmp/mrp_build_{key.replace('/', '_')}.log"
+
+
+_build_echo_lock = threading.Lock()
+
+
+def run_build_command(args, key, verbose, **kwargs):
+    """Run a build step, appending its output to the build log of `key`.
+
+    Builds run concurrently, so verbose output is echoed a line at a time,
+    prefixed by the key. stderr is merged into the returned stdout.
+    """
+    proc = subprocess.Popen(
+        args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, **kwargs
+    )
+    output = []
+    with open(build_log_path(key), "ab") as logfile:
+        for line in proc.stdout:
+            logfile.write(line)
+            logfile.flush()
+            output.append(line)
+            if verbose:
+                with _build_echo_lock:
+                    click.echo(f"[{key}] {line.decode(errors='replace')}", nl=False)
+    proc.wait()
+    return subprocess.CompletedProcess(args, proc.returncode, b"".join(output), None)
@@ -0,0 +1,43 @@
+import mrp
+import os
+import select
+import threading
+
+
+def test_launch_closes_inherited_fds():
+    mrp.process(name="proc", runtime=mrp.Host(run_command=["sleep", "3"]))
+
+    # As a build, concurrent with the launch, reading its command output.
+    read_fd, write_fd = os.pipe()
+    mrp.cmd.up("proc", reset_logs=True, build=False)
+    os.close(write_fd)
+
+    # The launcher does not hold the write end, the read end sees EOF.
+    readable, _, _ = select.select([read_fd], [], [], 2.0)
+    assert readable
+    assert os.read(read_fd, 1) == b""
+    os.close(read_fd)
+
+    mrp.cmd.down("proc")
+    mrp.cmd.wait("proc")
+
+
+def test_launch_forks_before_threads(monkeypatch):
+    mrp.process(name="proc", runtime=mrp.Host(run_command=["sleep", "3"]))
+
+    # Only the launcher helper is forked by up, before any thread is started.
+    num_threads = threading.active_count()
+    fork = os.fork
+    forks = []
+
+    def recording_fork():
+        forks.append(threading.active_count())
+        return fork()
+
+    monkeypatch.setattr(os, "fork", recording_fork)
+    mrp.cmd.up("proc", reset_logs=True)
+    monkeypatch.undo()
+    assert forks == [num_threads]
+
+    mrp.cmd.down("proc")
+    mrp.cmd.wait("proc")
@@ -1,17 +1,14 @@
 import a0
 import mrp
 import mrp.process_def
-import os
-import shutil
 import subprocess
+import tempfile
 
 
-def reset_state(*procs):
+def reset_state(monkeypatch):
     mrp.process_def.defined_processes.clear()
-    for proc in procs:
-        shutil.rmtree(
-            os.path.expanduser(f"~/.config/mrp/conda/mrp_{proc}"), ignore_errors=True
-        )
+    # Build in an empty environment cache.
+    monkeypatch.setenv("MRP_CONDA_CACHE", tempfile.mkdtemp())
 
 
 def read_logs(topic):
@@ -24,8 +21,8 @@ def read_logs(topic):
     return output
 
 
-def test_conda_nobuild():
-    reset_state("proc")
+def test_conda_nobuild(monkeypatch):
+    reset_state(monkeypatch)
 
     proc_def = mrp.process(name="proc")
 
@@ -65,8 +62,8 @@ def test_conda_nobuild():
     assert read_logs("proc") == ["Python 3.8.8\r"]
 
 
-def test_conda_build_cache():
-    reset_state("proc")
+def test_conda_build_cache(monkeypatch):
+    reset_state(monkeypatch)
 
     proc_def = mrp.process(name="proc")
 
@@ -147,7 +144,8 @@ def test_conda_build_cache():
     assert open(test_counter_path).read() == "3\n"
 
     # Update the conda history, poisoning the cache.
-    subprocess.run(["conda", "install", "-n", "mrp_proc", "-y", "pycparser"])
+    prefix = proc_def.runtime._env._prefix(proc_def.root)
+    subprocess.run(["conda", "install", "-p", prefix, "-y", "pycparser"])
 
     # Catch that the conda env has been updated.
     proc_def.runtime = mrp.Conda(
@@ -160,3 +158,41 @@ def test_conda_build_cache():
 
     # The setup should have run and the counter should be incremented.
     assert open(test_counter_path).read() == "4\n"
+
+
+def test_conda_shared_cache(monkeypatch):
+    reset_state(monkeypatch)
+
+    test_counter_path = "/tmp/test_counter"
+    test_counter_increment_command = [
+        "bash",
+        "-c",
+        "echo $(( $(cat /tmp/test_counter) + 1 )) > /tmp/test_counter",
+    ]
+    open(test_counter_path, "w").write("0")
+
+    mrp.process(
+        name="proc_a",
+        runtime=mrp.Conda(
+            dependencies=["python=3.8.8", "pip"],
+            setup_commands=[test_counter_increment_command],
+            run_command=[],
+        ),
+    )
+    mrp.cmd.up("proc_a", reset_logs=True)
+    mrp.cmd.wait("proc_a")
+    assert open(test_counter_path).read() == "1\n"
+
+    # The same environment, listed in another order, is not built again.
+    mrp.process(
+        name="proc_b",
+        runtime=mrp.Conda(
+            dependencies=["pip", "python=3.8.8"],
+            setup_commands=[test_counter_increment_command],
+            run_command=["python", "--version"],
+        ),
+    )
+    mrp.cmd.up("proc_b", reset_logs=True)
+    mrp.cmd.wait("proc_b")
+    assert open(test_counter_path).read() == "1\n"
+    assert read_logs("proc_b") == ["Python 3.8.8\r"]
@@ -0,0 +1,90 @@
+from mrp.runtime import conda
+from mrp.runtime.conda import Conda
+import os
+import pytest
+import time
+
+
+def env_id(**kwargs):
+    return Conda.SharedEnv("env", **kwargs)._env_id("/root")
+
+
+def test_same_spec():
+    assert env_id(dependencies=["numpy", "python=3.8"]) == env_id(
+        dependencies=["python=3.8", "numpy", "numpy"]
+    )
+    assert env_id(dependencies=["pip", {"pip": ["b", "a"]}]) == env_id(
+        dependencies=[{"pip": ["a", "b"]}]
+    )
+
+
+def test_different_spec():
+    assert env_id(dependencies=["numpy"]) != env_id(dependencies=["scipy"])
+    assert env_id(dependencies=["numpy"]) != env_id(
+        dependencies=["numpy"], setup_commands=[["echo", "0"]]
+    )
+    # Channels are in order of priority.
+    assert env_id(channels=["a", "b"]) != env_id(channels=["b", "a"])
+
+
+def test_setup_commands_root():
+    shared_env = Conda.SharedEnv("env", setup_commands=[["make"]])
+    assert shared_env._env_id("/a") != Conda.SharedEnv(
+        "env", setup_commands=[["make"]]
+    )._env_id("/b")
+    # Without setup commands, the env does not depend on the project.
+    assert Conda.SharedEnv("env")._env_id("/a") == Conda.SharedEnv("env")._env_id("/b")
+
+
+def test_cache_root(monkeypatch):
+    monkeypatch.setenv("MRP_CONDA_CACHE", "/tmp/mrp_cache")
+    shared_env = Conda.SharedEnv("env")
+    assert shared_env._prefix("/root") == os.path.join(
+        "/tmp/mrp_cache", shared_env._env_id("/root")[len("mrp_") :], "env"
+    )
+
+
+def test_name_link_per_project():
+    # Processes of the same name, in two projects, keep their own last build.
+    assert Conda.SharedEnv("proc")._name_link_path("/a") != Conda.SharedEnv(
+        "proc"
+    )._name_link_path("/b")
+
+
+def make_cached_env(name, age):
+    cache_dir = os.path.join(conda.cache_root(), name)
+    os.makedirs(os.path.join(cache_dir, "env"))
+    last_used = os.path.join(cache_dir, "last_used")
+    open(last_used, "w").close()
+    os.utime(last_used, (time.time() - age, time.time() - age))
+    return cache_dir
+
+
+def test_gc_cache(monkeypatch, tmp_path):
+    monkeypatch.setenv("MRP_CONDA_CACHE", str(tmp_path))
+    old = make_cached_env("old", age=7200)
+    recent = make_cached_env("recent", age=0)
+    in_use = make_cached_env("in_use", age=7200)
+    os.makedirs(tmp_path / "names" / "project")
+    os.symlink(os.path.join(old, "env"), tmp_path / "names" / "project" / "mrp_a")
+    os.symlink(os.path.join(recent, "env"), tmp_path / "names" / "project" / "mrp_b")
+
+    lock = conda._lock_env(in_use, shared=True)
+    conda.gc_cache(max_age=3600)
+    lock.close()
+
+    assert not os.path.exists(old)
+    assert os.path.exists(recent)
+    assert os.path.exists(in_use)
+    assert os.listdir(tmp_path / "names" / "project") == ["mrp_b"]
+
+
+def test_rebuild_in_use(monkeypatch, tmp_path):
+    monkeypatch.setenv("MRP_CONDA_CACHE", str(tmp_path))
+    shared_env = Conda.SharedEnv("env", dependencies=["python"])
+    os.makedirs(shared_env._cache_dir("/root"))
+
+    lock = conda._lock_env(shared_env._cache_dir("/root"), shared=True)
+    with pytest.raises(RuntimeError, match="in use"):
+        shared_env._create_env("/root", cache=False, verbose=False)
+    lock.close()
@@ -1,3 +1,4 @@
+from mrp.runtime.conda import cache_root
 import mrp
 import mrp.process_def
 
@@ -43,4 +44,4 @@ def test_conda_env():
     assert captured_env["A0_TOPIC"] == "proc"
     assert captured_env["PYTHONUNBUFFERED"] == "1"
     assert captured_env["foo"] == "bar"
-    assert captured_env["CONDA_PREFIX"].endswith("/envs/mrp_proc")
+    assert captured_env["CONDA_PREFIX"].startswith(cache_root())
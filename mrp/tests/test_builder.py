@@ -0,0 +1,50 @@
+from mrp import builder
+from mrp import util
+import mrp
+import time
+
+
+def test_group_by_build():
+    shared_env = mrp.Conda.SharedEnv("shared", channels=["conda-forge"])
+    mrp.process(name="a", runtime=mrp.Conda(shared_env=shared_env, run_command=[]))
+    mrp.process(name="b", runtime=mrp.Conda(shared_env=shared_env, run_command=[]))
+    mrp.process(name="c", runtime=mrp.Conda(dependencies=["numpy"], run_command=[]))
+    mrp.process(name="d", runtime=mrp.Conda(dependencies=["numpy"], run_command=[]))
+    mrp.process(name="e", runtime=mrp.Host(run_command=[]))
+
+    groups = builder.group_by_build(["a", "b", "c", "d", "e"])
+    assert sorted(groups.values()) == [["a", "b"], ["c", "d"], ["e"]]
+
+
+def test_parallel_build():
+    for name in ["a", "b", "c"]:
+        mrp.process(
+            name=name,
+            runtime=mrp.Host(
+                run_command=[],
+                build_commands=[["sleep", "1"], ["echo", f"built {name}"]],
+            ),
+        )
+
+    t0 = time.time()
+    results = list(builder.build(["a", "b", "c"], cache=True, verbose=False, jobs=3))
+    assert time.time() - t0 < 2.5
+
+    assert sorted(names for names, _ in results) == [["a"], ["b"], ["c"]]
+    assert all(error is None for _, error in results)
+    for name in ["a", "b", "c"]:
+        assert open(util.build_log_path(name)).read() == f"built {name}\n"
+
+
+def test_failed_build():
+    mrp.process(name="ok", runtime=mrp.Host(run_command=[], build_commands=[["true"]]))
+    mrp.process(
+        name="bad", runtime=mrp.Host(run_command=[], build_commands=[["false"]])
+    )
+
+    errors = {
+        names[0]: error
+        for names, error in builder.build(["ok", "bad"], cache=True, verbose=False)
+    }
+    assert errors["ok"] is None
+    assert isinstance(errors["bad"], RuntimeError)
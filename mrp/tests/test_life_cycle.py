@@ -0,0 +1,85 @@
+from mrp import life_cycle
+from mrp import util
+import pytest
+import threading
+
+
+@pytest.fixture
+def unique_name():
+    names = []
+
+    def make_name():
+        names.append(f"test_{util.random_string()}")
+        return names[-1]
+
+    yield make_name
+
+    # Nothing runs these processes, leave them stopped for other commands.
+    for name in names:
+        life_cycle.set_state(name, life_cycle.State.STOPPED)
+
+
+def wait_until(cv, predicate):
+    with cv:
+        assert cv.wait_for(predicate, timeout=3.0)
+
+
+def test_proc_info(unique_name):
+    name = unique_name()
+    life_cycle.set_ask(name, life_cycle.Ask.UP)
+    life_cycle.set_state(name, life_cycle.State.STOPPED, return_code=3)
+
+    info = life_cycle.proc_info(name)
+    assert info.ask == life_cycle.Ask.UP
+    assert info.state == life_cycle.State.STOPPED
+    assert info.return_code == 3
+    assert life_cycle.system_state().procs[name] == info
+
+
+def test_proc_info_watcher_ignores_other_procs(unique_name):
+    name = unique_name()
+    other_name = unique_name()
+    life_cycle.set_state(name, life_cycle.State.STARTING)
+
+    cv = threading.Condition()
+    seen = []
+
+    def callback(info):
+        with cv:
+            seen.append(info.state)
+            cv.notify()
+
+    watcher = life_cycle.proc_info_watcher(name, callback)  # noqa: F841
+    wait_until(cv, lambda: seen == [life_cycle.State.STARTING])
+
+    life_cycle.set_state(other_name, life_cycle.State.STARTED)
+    life_cycle.set_state(name, life_cycle.State.STARTED)
+    wait_until(cv, lambda: len(seen) == 2)
+    assert seen == [life_cycle.State.STARTING, life_cycle.State.STARTED]
+
+
+def test_system_state_watcher(unique_name):
+    name = unique_name()
+    life_cycle.set_state(name, life_cycle.State.STARTED)
+
+    cv = threading.Condition()
+    states = []
+
+    def callback(system_state):
+        with cv:
+            states.append(system_state)
+            cv.notify()
+
+    watcher = life_cycle.system_state_watcher(callback)
+    # Called on creation, with the current state.
+    assert states[0].procs[name].state == life_cycle.State.STARTED
+
+    # Processes that appear later are watched too.
+    new_name = unique_name()
+    life_cycle.set_state(new_name, life_cycle.State.STARTING)
+    wait_until(cv, lambda: new_name in states[-1].procs)
+
+    life_cycle.set_state(name, life_cycle.State.STOPPED)
+    wait_until(cv, lambda: states[-1].procs[name].state == life_cycle.State.STOPPED)
+    assert states[-1].procs[new_name].state == life_cycle.State.STARTING
+    assert watcher.system_state() == states[-1]
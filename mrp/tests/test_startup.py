@@ -0,0 +1,89 @@
+from mrp import startup
+import mrp
+import pytest
+import sys
+import time
+
+
+def test_topological_order():
+    mrp.process(name="a", deps=["b", "c"])
+    mrp.process(name="b", deps=["c"])
+    mrp.process(name="c")
+    mrp.process(name="d", deps=["e"])
+
+    assert startup.topological_order(["a", "b", "c"]) == ["c", "b", "a"]
+    # Deps outside of the given processes are ignored.
+    assert startup.topological_order(["a", "b", "d"]) == ["b", "a", "d"]
+
+
+def test_dependency_cycle():
+    mrp.process(name="a", deps=["b"])
+    mrp.process(name="b", deps=["a"])
+
+    with pytest.raises(ValueError, match="a -> b -> a"):
+        startup.topological_order(["a", "b"])
+
+
+def test_health_gating(tmp_path):
+    # a reports healthy after a second, b starts only then.
+    mrp.process(
+        name="a",
+        runtime=mrp.Host(
+            run_command=[
+                sys.executable,
+                "-c",
+                "import a0, time; "
+                f"time.sleep(1); open('{tmp_path}/a', 'w').write(str(time.time())); "
+                "a0.Publisher('mrp_test/a_health').pub('ok')",
+            ]
+        ),
+        health_topic="mrp_test/a_health",
+    )
+    mrp.process(
+        name="b",
+        runtime=mrp.Host(
+            run_command=[
+                sys.executable,
+                "-c",
+                f"import time; open('{tmp_path}/b', 'w').write(str(time.time()))",
+            ]
+        ),
+        deps=["a"],
+    )
+
+    t0 = time.time()
+    mrp.cmd.up("b", reset_logs=True)
+    mrp.cmd.wait("a", "b")
+
+    assert float(open(tmp_path / "a").read()) >= t0 + 1
+    assert float(open(tmp_path / "b").read()) >= float(open(tmp_path / "a").read())
+
+
+def test_failed_dependency():
+    # Without a health topic, a would be ready as soon as started.
+    mrp.process(
+        name="a",
+        runtime=mrp.Host(run_command=["false"]),
+        health_topic="mrp_test/a_health",
+    )
+    mrp.process(name="b", runtime=mrp.Host(run_command=["true"]), deps=["a"])
+
+    with pytest.raises(RuntimeError, match="b: dependency failed: a"):
+        mrp.cmd.up("b", reset_logs=True)
+    mrp.cmd.wait("a")
+
+
+def test_build_exception(monkeypatch):
+    mrp.process(name="a", runtime=mrp.Host(run_command=["true"]))
+    mrp.process(name="b", runtime=mrp.Host(run_command=["true"]), deps=["a"])
+
+    def build(*args, **kwargs):
+        yield ["a"], None
+        raise RuntimeError("builder crashed")
+
+    monkeypatch.setattr(mrp.builder, "build", build)
+
+    # b is never reported by the builder, up must fail rather than wait forever.
+    with pytest.raises(RuntimeError, match="b: failed to build: builder crashed"):
+        mrp.cmd.up("b", reset_logs=True)
+    mrp.cmd.wait("a")
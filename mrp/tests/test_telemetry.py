@@ -0,0 +1,81 @@
+from mrp import telemetry
+from mrp import util
+import a0
+import json
+import os
+import psutil
+import pytest
+import time
+
+
+def test_varints():
+    values = [0, 1, -1, 127, -128, 2**40, -(2**62)]
+    data = telemetry.encode_varints(values)
+    assert telemetry.decode_varints(data) == values
+    # Small deltas take a byte.
+    assert len(telemetry.encode_varints([0, 3, -5])) == 3
+
+
+def test_unknown_attr():
+    with pytest.raises(ValueError):
+        telemetry.Telemetry(attrs=["cpu", "open_files"])
+
+
+def read_all(topic):
+    pkts = []
+    r = a0.ReaderSync(
+        a0.File(a0.env.topic_tmpl_pubsub().format(topic=topic)), a0.INIT_OLDEST
+    )
+    while r.can_read():
+        pkts.append(r.read())
+    return pkts
+
+
+def test_sampler():
+    name = f"test_{util.random_string()}"
+    sampler = telemetry.Sampler()
+    config = telemetry.Telemetry(hz=100, keyframe_interval=10, summary_interval=0.2)
+    sampler.add(name, os.getpid, config)
+    time.sleep(0.5)
+    sampler.remove(name)
+
+    decoder = telemetry.SampleDecoder()
+    samples = [decoder.decode(pkt) for pkt in read_all(f"mrp/telemetry/{name}")]
+    assert len(samples) > 20
+    assert set(samples[0]) == {"timestamp_us"} | set(config.fields())
+    assert all(sample["rss"] > 0 for sample in samples)
+    timestamps = [sample["timestamp_us"] for sample in samples]
+    assert timestamps == sorted(timestamps)
+
+    summaries = [
+        json.loads(pkt.payload) for pkt in read_all(f"mrp/telemetry/{name}/summary")
+    ]
+    assert len(summaries) >= 2
+    assert sum(summary["num_samples"] for summary in summaries) == len(samples)
+    assert summaries[-1]["num_threads"]["max"] >= 1
+    assert "cpu_user_us_per_s" in summaries[-1]
+
+
+def test_shared_sampler():
+    # Two launchers (here, the same process) share one sampler process.
+    names = [f"test_{util.random_string()}" for _ in range(2)]
+    config = telemetry.Telemetry(hz=100)
+    for name in names:
+        telemetry.register(name, os.getpid(), config)
+    time.sleep(1.5)
+    for name in names:
+        telemetry.unregister(name)
+    time.sleep(0.2)
+
+    for name in names:
+        decoder = telemetry.SampleDecoder()
+        samples = [decoder.decode(pkt) for pkt in read_all(f"mrp/telemetry/{name}")]
+        assert len(samples) > 20
+        assert all(sample["rss"] > 0 for sample in samples)
+
+    samplers = [
+        proc
+        for proc in psutil.process_iter(["cmdline"])
+        if (proc.info["cmdline"] or [])[-2:] == ["-m", "mrp.telemetry"]
+    ]
+    assert len(samplers) == 1
@@ -0,0 +1,83 @@
+"""Time loading every msg package, parsed from source and from the compiled schemas.
+
+Each load runs in a fresh interpreter, after `import capnp`, to time a cold
+start. Times are medians, in milliseconds.
+
+    python scripts/benchmark_import.py
+"""
+import argparse
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+import fairomsg
+
+PARSE_SOURCES = """
+import site
+import time
+import capnp
+from fairomsg import serdes
+pkgs = serdes.get_pkgs()
+t0 = time.perf_counter()
+parser = capnp.SchemaParser()
+for pkg in pkgs:
+    parser.load(serdes._get_full_filepath(pkg), imports=site.getsitepackages())
+print(time.perf_counter() - t0)
+"""
+
+LOAD_COMPILED = """
+import time
+import capnp
+from fairomsg import serdes
+pkgs = serdes.get_pkgs()
+t0 = time.perf_counter()
+for pkg in pkgs:
+    serdes.get_msgs(pkg)
+print(time.perf_counter() - t0)
+"""
+
+
+def time_cold(code, iters):
+    times = [
+        float(subprocess.check_output([sys.executable, "-c", code]).split()[-1])
+        for _ in range(iters)
+    ]
+    return 1000 * np.median(times)
+
+
+def time_cache_hits(num_threads, hits=100_000):
+    def run():
+        for _ in range(hits):
+            fairomsg.get_msgs("sensor_msgs")
+
+    threads = [threading.Thread(target=run) for _ in range(num_threads)]
+    t0 = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return 1e9 * (time.perf_counter() - t0) / (num_threads * hits)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--iters", type=int, default=10)
+    args = parser.parse_args()
+
+    # Compiles the schemas, if not installed.
+    fairomsg.get_msgs("std_msgs")
+
+    num_pkgs = len(fairomsg.get_pkgs())
+    parsed = time_cold(PARSE_SOURCES, args.iters)
+    compiled = time_cold(LOAD_COMPILED, args.iters)
+    print(f"load {num_pkgs} packages, parsed:   {parsed:.2f}ms")
+    print(f"load {num_pkgs} packages, compiled: {compiled:.2f}ms")
+    for num_threads in [1, 4]:
+        print(f"cache hit, {num_threads} threads: {time_cache_hits(num_threads):.0f}ns")
+
+
+if __name__ == "__main__":
+    main()
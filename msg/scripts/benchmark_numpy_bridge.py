@@ -0,0 +1,117 @@
+"""Compare np.save-in-Data against the numpy_bridge, for RGB-D images and point clouds.
+
+Each round trip builds and serializes a message, then reads the array back
+from the bytes, as a receiver would. "bridge" builds a new message for each
+array, "reused" refills a single message. Times are medians, in milliseconds.
+
+    python scripts/benchmark_numpy_bridge.py
+"""
+import argparse
+import io
+import time
+
+import numpy as np
+
+import fairomsg
+from fairomsg import numpy_bridge
+
+sensor_msgs = fairomsg.get_msgs("sensor_msgs")
+
+
+def npy_to_image(arr):
+    img = sensor_msgs.Image()
+    with io.BytesIO() as f:
+        np.save(f, arr)
+        img.data = f.getvalue()
+    return img.to_bytes()
+
+
+def npy_from_image(blob):
+    with sensor_msgs.Image.from_bytes(blob) as img:
+        with io.BytesIO(img.data) as f:
+            return np.load(f)
+
+
+def npy_to_point_cloud(points):
+    pc = sensor_msgs.PointCloud2()
+    with io.BytesIO() as f:
+        np.save(f, points)
+        pc.data = f.getvalue()
+    return pc.to_bytes()
+
+
+def npy_from_point_cloud(blob):
+    with sensor_msgs.PointCloud2.from_bytes(blob) as pc:
+        with io.BytesIO(pc.data) as f:
+            return np.load(f)
+
+
+def bridge_to_image(arr):
+    return numpy_bridge.image_from_numpy(arr).to_bytes()
+
+
+def bridge_to_point_cloud(points):
+    return numpy_bridge.point_cloud_from_numpy(points).to_bytes()
+
+
+def reused_builder(msg, data):
+    """Refill the same message, as a publisher of same-size arrays can."""
+
+    def to_bytes(arr):
+        data.view(np.uint8)[...] = arr.view(np.uint8)
+        msg.clear_write_flag()
+        return msg.to_bytes()
+
+    return to_bytes
+
+
+def time_round_trip(to_bytes, from_bytes, arr, iters):
+    serialize = []
+    deserialize = []
+    for _ in range(iters):
+        t0 = time.perf_counter()
+        blob = to_bytes(arr)
+        t1 = time.perf_counter()
+        out = from_bytes(blob)
+        t2 = time.perf_counter()
+        serialize.append(t1 - t0)
+        deserialize.append(t2 - t1)
+    assert np.array_equal(out, arr)
+    return 1000 * np.median(serialize), 1000 * np.median(deserialize)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--iters", type=int, default=20)
+    args = parser.parse_args()
+
+    rgbd = np.random.randint(0, 2**16, (1080, 1920, 4), dtype=np.uint16)
+    points = np.zeros(
+        1_000_000, dtype=[("x", "f4"), ("y", "f4"), ("z", "f4"), ("rgb", "u4")]
+    )
+    for name in ["x", "y", "z"]:
+        points[name] = np.random.rand(len(points))
+
+    image_builder = reused_builder(*numpy_bridge.new_image(1080, 1920, "16UC4"))
+    point_cloud_builder = reused_builder(
+        *numpy_bridge.new_point_cloud(len(points), points.dtype)
+    )
+    from_image = numpy_bridge.image_from_bytes
+    from_point_cloud = numpy_bridge.point_cloud_from_bytes
+
+    cases = [
+        ("1080p RGB-D", "np.save", npy_to_image, npy_from_image, rgbd),
+        ("1080p RGB-D", "bridge", bridge_to_image, from_image, rgbd),
+        ("1080p RGB-D", "reused", image_builder, from_image, rgbd),
+        ("1M points", "np.save", npy_to_point_cloud, npy_from_point_cloud, points),
+        ("1M points", "bridge", bridge_to_point_cloud, from_point_cloud, points),
+        ("1M points", "reused", point_cloud_builder, from_point_cloud, points),
+    ]
+    print(f"{'message':<12} {'method':<8} {'serialize':>11} {'deserialize':>12}")
+    for message, method, to_bytes, from_bytes, arr in cases:
+        ser, de = time_round_trip(to_bytes, from_bytes, arr, args.iters)
+        print(f"{message:<12} {method:<8} {ser:>9.2f}ms {de:>10.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
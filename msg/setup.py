@@ -1,4 +1,8 @@
+import os
+import sys
+
 from setuptools import setup, find_packages
+from setuptools.command.build_py import build_py
 
 
 __author__ = "Leonid Shamis"
@@ -10,6 +14,24 @@ install_requires = [
 ]
 
 
+class BuildPyWithSchemas(build_py):
+    """Compile the msg schemas at install time, so that they load without parsing."""
+
+    def run(self):
+        super().run()
+        sys.path.insert(0, self.build_lib)
+        try:
+            from fairomsg import serdes
+        except ImportError:
+            # Without pycapnp, the schemas are compiled on first use instead.
+            return
+        finally:
+            sys.path.pop(0)
+        serdes.compile_schemas(
+            os.path.join(self.build_lib, "fairomsg", "def", serdes.compiled_filename())
+        )
+
+
 setup(
     name="fairomsg",
     author="Leonid Shamis",
@@ -18,5 +40,7 @@ setup(
     packages=find_packages(where="src"),
     package_dir={"": "src"},
     install_requires=install_requires,
+    extras_require={"numpy": ["numpy"]},
     include_package_data=True,
+    cmdclass={"build_py": BuildPyWithSchemas},
 )
@@ -0,0 +1,286 @@
+"""NumPy arrays as sensor_msgs Image and PointCloud2 messages, without copies.
+
+Builders allocate the capnp segment for the whole message up front, and give
+a writable array over the `data` field, to be filled in place. Readers give
+a read-only array over the `data` field of the received bytes.
+"""
+import re
+import sys
+
+import numpy as np
+
+from .serdes import get_msgs
+
+# Encodings that are not of the generic form, e.g. "32FC1".
+_NAMED_ENCODINGS = {
+    "mono8": "8UC1",
+    "mono16": "16UC1",
+    "rgb8": "8UC3",
+    "bgr8": "8UC3",
+    "rgba8": "8UC4",
+    "bgra8": "8UC4",
+    "rgb16": "16UC3",
+    "bgr16": "16UC3",
+    "rgba16": "16UC4",
+    "bgra16": "16UC4",
+}
+_GENERIC_ENCODING = re.compile(r"(8|16|32|64)(U|S|F)C(\d+)")
+_KINDS = {"U": "u", "S": "i", "F": "f"}
+
+# PointField datatype constants.
+_POINT_FIELD_DTYPES = {
+    1: np.dtype(np.int8),
+    2: np.dtype(np.uint8),
+    3: np.dtype(np.int16),
+    4: np.dtype(np.uint16),
+    5: np.dtype(np.int32),
+    6: np.dtype(np.uint32),
+    7: np.dtype(np.float32),
+    8: np.dtype(np.float64),
+}
+_POINT_FIELD_DATATYPES = {
+    dtype: datatype for datatype, dtype in _POINT_FIELD_DTYPES.items()
+}
+
+# Room for everything but the data, in 8-byte words.
+_MESSAGE_OVERHEAD_WORDS = 64
+
+
+def _sensor_msgs():
+    return get_msgs("sensor_msgs")
+
+
+def _is_bigendian(dtype):
+    if dtype.byteorder == "=":
+        return sys.byteorder == "big"
+    return dtype.byteorder == ">"
+
+
+def _byteorder(is_bigendian):
+    return ">" if is_bigendian else "<"
+
+
+def parse_encoding(encoding):
+    """Returns the dtype and number of channels of an image encoding."""
+    generic = _NAMED_ENCODINGS.get(encoding, encoding)
+    match = _GENERIC_ENCODING.fullmatch(generic)
+    if not match:
+        raise ValueError(f"Unsupported image encoding: {encoding}")
+    bits, kind, channels = match.groups()
+    return np.dtype(f"{_KINDS[kind]}{int(bits) // 8}"), int(channels)
+
+
+def encoding_for(dtype, channels):
+    """The generic encoding of an image of `channels` values of `dtype`."""
+    dtype = np.dtype(dtype)
+    kinds = {v: k for k, v in _KINDS.items()}
+    if dtype.kind not in kinds:
+        raise ValueError(f"Unsupported image dtype: {dtype}")
+    return f"{dtype.itemsize * 8}{kinds[dtype.kind]}C{channels}"
+
+
+def _new_message(struct, nbytes):
+    # A first segment large enough for the data keeps the message in a single
+    # segment, which is serialized with a single copy.
+    return struct.new_message(
+        num_first_segment_words=(nbytes + 7) // 8 + _MESSAGE_OVERHEAD_WORDS
+    )
+
+
+def _init_data(msg, nbytes):
+    msg.init("data", nbytes)
+    return np.frombuffer(msg.get_data_as_view("data"), dtype=np.uint8)
+
+
+def _copy_into(data, arr):
+    if arr.dtype == data.dtype and arr.flags.c_contiguous:
+        # A byte copy, much faster than an assignment field by field.
+        data.reshape(-1).view(np.uint8)[...] = arr.reshape(-1).view(np.uint8)
+    else:
+        data.reshape(arr.shape)[...] = arr
+
+
+def new_image(height, width, encoding, is_bigendian=False):
+    """Allocate an Image message.
+
+    Returns:
+        The message builder, and a writable (height, width, channels) array
+        over its data, to fill in before serializing the message.
+
+    The message can be refilled and serialized again, for a stream of images
+    of the same size, after `msg.clear_write_flag()`.
+    """
+    dtype, channels = parse_encoding(encoding)
+    dtype = dtype.newbyteorder(_byteorder(is_bigendian))
+    step = width * channels * dtype.itemsize
+
+    img = _new_message(_sensor_msgs().Image, height * step)
+    img.height = height
+    img.width = width
+    img.encoding = encoding
+    img.isBigendian = int(is_bigendian)
+    img.step = step
+    data = _init_data(img, height * step)
+    return img, data.view(dtype).reshape(height, width, channels)
+
+
+def image_from_numpy(arr, encoding=None):
+    """Build an Image message from a (height, width[, channels]) array."""
+    arr = np.asarray(arr)
+    channels = arr.shape[2] if arr.ndim == 3 else 1
+    encoding = encoding or encoding_for(arr.dtype, channels)
+    height, width = arr.shape[:2]
+    img, data = new_image(height, width, encoding, _is_bigendian(arr.dtype))
+    _copy_into(data, arr)
+    return img
+
+
+def _image_array(img, data):
+    dtype, channels = parse_encoding(img.encoding)
+    dtype = dtype.newbyteorder(_byteorder(img.isBigendian))
+    shape = (img.height, img.width, channels)
+    # Rows may be padded up to step.
+    arr = np.ndarray(
+        shape,
+        dtype=dtype,
+        buffer=data,
+        strides=(img.step, channels * dtype.itemsize, dtype.itemsize),
+    )
+    return arr[:, :, 0] if channels == 1 else arr
+
+
+def image_to_numpy(img):
+    """A read-only array over the data of an Image reader.
+
+    The array is only valid while the bytes the reader was created from are.
+    Single channel images are (height, width) arrays.
+    """
+    return _image_array(img, img.get_data_as_view("data"))
+
+
+def _view_into(blob, view):
+    """The offset of a memoryview within the bytes it was read from, if it is."""
+    blob_addr = np.frombuffer(blob, dtype=np.uint8).ctypes.data
+    view_addr = np.frombuffer(view, dtype=np.uint8).ctypes.data
+    offset = view_addr - blob_addr
+    if 0 <= offset and offset + view.nbytes <= len(blob):
+        return offset
+    return None
+
+
+def _data_from_bytes(msg, blob):
+    view = msg.get_data_as_view("data")
+    offset = _view_into(blob, view)
+    if offset is None:
+        return np.frombuffer(bytes(view), dtype=np.uint8)
+    # Referencing the blob keeps the array valid after the reader is closed.
+    return np.frombuffer(blob, dtype=np.uint8, count=view.nbytes, offset=offset)
+
+
+def image_from_bytes(blob):
+    """A read-only array over the data of a serialized Image.
+
+    The array references `blob`, and stays valid as long as it is alive.
+    """
+    with _sensor_msgs().Image.from_bytes(blob) as img:
+        return _image_array(img, _data_from_bytes(img, blob))
+
+
+def _point_dtype(fields, point_step, is_bigendian):
+    byteorder = _byteorder(is_bigendian)
+    formats = []
+    for field in fields:
+        dtype = _POINT_FIELD_DTYPES[field.datatype].newbyteorder(byteorder)
+        formats.append((dtype, (field.count,)) if field.count > 1 else dtype)
+    return np.dtype(
+        {
+            "names": [field.name for field in fields],
+            "formats": formats,
+            "offsets": [field.offset for field in fields],
+            "itemsize": point_step,
+        }
+    )
+
+
+def new_point_cloud(num_points, dtype, is_dense=True):
+    """Allocate an unorganized PointCloud2 message.
+
+    Args:
+        num_points: The width of the cloud, of height 1.
+        dtype: A structured dtype with a field per PointField, e.g.
+            [("x", "f4"), ("y", "f4"), ("z", "f4"), ("rgb", "u4")].
+        is_dense: Whether the cloud has no invalid points.
+
+    Returns:
+        The message builder, and a writable (num_points,) structured array
+        over its data, to fill in before serializing the message.
+
+    As with new_image, the message can be refilled and serialized again.
+    """
+    dtype = np.dtype(dtype)
+    nbytes = num_points * dtype.itemsize
+
+    pc = _new_message(_sensor_msgs().PointCloud2, nbytes)
+    pc.height = 1
+    pc.width = num_points
+    fields = pc.init("fields", len(dtype.names))
+    for field, name in zip(fields, dtype.names):
+        field_dtype, offset = dtype.fields[name][:2]
+        base = field_dtype.base.newbyteorder("=")
+        if base not in _POINT_FIELD_DATATYPES:
+            raise ValueError(f"Unsupported point field dtype: {field_dtype}")
+        field.name = name
+        field.offset = offset
+        field.datatype = _POINT_FIELD_DATATYPES[base]
+        field.count = int(np.prod(field_dtype.shape)) if field_dtype.shape else 1
+    pc.isBigendian = _is_bigendian(dtype[0].base)
+    pc.pointStep = dtype.itemsize
+    pc.rowStep = nbytes
+    pc.isDense = is_dense
+    data = _init_data(pc, nbytes)
+    return pc, data.view(dtype)
+
+
+def point_cloud_from_numpy(points, names=None, is_dense=True):
+    """Build a PointCloud2 message from a structured array.
+
+    An (N, k) array is taken as k fields, named by `names`.
+    """
+    points = np.asarray(points)
+    if points.dtype.names is None:
+        if names is None or len(names) != points.shape[1]:
+            raise ValueError("Unstructured points need a name for each column.")
+        dtype = np.dtype([(name, points.dtype) for name in names])
+        points = np.ascontiguousarray(points).view(dtype).reshape(-1)
+    pc, data = new_point_cloud(points.shape[0], points.dtype, is_dense)
+    _copy_into(data, points)
+    return pc
+
+
+def _point_cloud_array(pc, data):
+    dtype = _point_dtype(pc.fields, pc.pointStep, pc.isBigendian)
+    arr = np.ndarray(
+        (pc.height, pc.width),
+        dtype=dtype,
+        buffer=data,
+        strides=(pc.rowStep, pc.pointStep),
+    )
+    return arr[0] if pc.height == 1 else arr
+
+
+def point_cloud_to_numpy(pc):
+    """A read-only structured array over the data of a PointCloud2 reader.
+
+    The array is only valid while the bytes the reader was created from are.
+    Unorganized clouds (of height 1) are (width,) arrays.
+    """
+    return _point_cloud_array(pc, pc.get_data_as_view("data"))
+
+
+def point_cloud_from_bytes(blob):
+    """A read-only structured array over the data of a serialized PointCloud2.
+
+    The array references `blob`, and stays valid as long as it is alive.
+    """
+    with _sensor_msgs().PointCloud2.from_bytes(blob) as pc:
+        return _point_cloud_array(pc, _data_from_bytes(pc, blob))
@@ -2,27 +2,160 @@ import os
 import site
 import threading
 import glob
+import hashlib
 
 import capnp
 
-_schema_parser = capnp.SchemaParser()
+# Schemas are compiled once, from the .capnp files in def/, into a single
+# CodeGeneratorRequest. Loading it skips parsing the .capnp files.
+_def_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "def")
+_user_cache_dir = os.path.expanduser("~/.cache/fairomsg")
+_schema_loader = None
+_file_ids = {}
 capnp_cache = {}
 lock = threading.Lock()
 
+
 def _get_full_filepath(msgpkg):
-    filedir = os.path.dirname(os.path.abspath(__file__))
-    return os.path.join(filedir, f"def/{msgpkg}.capnp")
+    return os.path.join(_def_dir, f"{msgpkg}.capnp")
+
+
+def _load_schema_capnp(parser):
+    schema_path = os.path.join(os.path.dirname(capnp.__file__), "schema.capnp")
+    return parser.load(schema_path, imports=site.getsitepackages())
+
+
+def _sources_hash():
+    h = hashlib.sha256()
+    for pkg in sorted(get_pkgs()):
+        with open(_get_full_filepath(pkg), "rb") as f:
+            h.update(pkg.encode())
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+def compiled_filename():
+    return f"schemas-{_sources_hash()}.bin"
+
+
+def compile_schemas(path):
+    """Parse every message package, and write their schema nodes to path."""
+    print("capnp compiling fairomsg schemas")
+    parser = capnp.SchemaParser()
+    schema_capnp = _load_schema_capnp(parser)
+
+    nodes = {}
+
+    def collect(schema):
+        node = schema.node
+        nodes[node.id] = node
+        for nested in node.nestedNodes:
+            collect(schema.get_nested(nested.name))
+
+    files = []
+    for pkg in sorted(get_pkgs()):
+        module = parser.load(_get_full_filepath(pkg), imports=site.getsitepackages())
+        collect(module.schema)
+        files.append((module.schema.node.id, pkg))
+
+    request = schema_capnp.CodeGeneratorRequest.new_message()
+    request_nodes = request.init("nodes", len(nodes))
+    for i, node in enumerate(nodes.values()):
+        # The parser's Node type is not the one schema_capnp defines, copy
+        # through bytes.
+        with schema_capnp.Node.from_bytes(node.as_builder().to_bytes()) as copy:
+            request_nodes[i] = copy
+    requested_files = request.init("requestedFiles", len(files))
+    for requested_file, (file_id, pkg) in zip(requested_files, files):
+        requested_file.id = file_id
+        requested_file.filename = pkg
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # Other processes may be compiling too, and read the file as soon as it exists.
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(request.to_bytes())
+    os.replace(tmp_path, path)
+
+
+def _compiled_path():
+    """The schemas compiled at install time, else by a previous run, else now."""
+    filename = compiled_filename()
+    installed_path = os.path.join(_def_dir, filename)
+    if os.path.exists(installed_path):
+        return installed_path
+    cached_path = os.path.join(_user_cache_dir, filename)
+    if not os.path.exists(cached_path):
+        compile_schemas(cached_path)
+    return cached_path
+
+
+def _load_compiled():
+    global _schema_loader
+    schema_capnp = _load_schema_capnp(capnp.SchemaParser())
+    loader = capnp.SchemaLoader()
+    with open(_compiled_path(), "rb") as f:
+        blob = f.read()
+    with schema_capnp.CodeGeneratorRequest.from_bytes(
+        blob, traversal_limit_in_words=len(blob)
+    ) as request:
+        for node in request.nodes:
+            loader.load_dynamic(node)
+        for requested_file in request.requestedFiles:
+            _file_ids[requested_file.filename] = requested_file.id
+    _schema_loader = loader
+
+
+def _build_module(schema, module):
+    # Mirrors capnp.SchemaParser.load, for schemas from a SchemaLoader.
+    for nested in schema.get_proto().nestedNodes:
+        nested_schema = _schema_loader.get(nested.id)
+        proto = nested_schema.get_proto()
+        if proto.isStruct:
+            local_module = capnp.lib.capnp._StructModule(
+                nested_schema.as_struct(), nested.name
+            )
+        elif proto.isConst:
+            module.__dict__[nested.name] = nested_schema.as_const_value()
+            continue
+        elif proto.isEnum:
+            local_module = capnp.lib.capnp._EnumModule(
+                nested_schema.as_enum(), nested.name
+            )
+        elif proto.isInterface:
+            local_module = capnp.lib.capnp._InterfaceModule(
+                nested_schema.as_interface(), nested.name
+            )
+        else:
+            continue
+        module.__dict__[nested.name] = local_module
+        _build_module(nested_schema, local_module)
+
+
+def _load(msgpkg):
+    if _schema_loader is None:
+        _load_compiled()
+    if msgpkg not in _file_ids:
+        raise ValueError(f"Unknown msg package: {msgpkg}")
+    schema = _schema_loader.get(_file_ids[msgpkg])
+    module = capnp.lib.capnp._ModuleType(f"{msgpkg}.capnp")
+    module.schema = schema
+    module.__file__ = _get_full_filepath(msgpkg)
+    _build_module(schema, module)
+    return module
 
 
 def get_msgs(msgpkg):
+    # Cache hits are lock-free: a dict lookup is atomic.
+    msgs = capnp_cache.get(msgpkg)
+    if msgs is not None:
+        return msgs
     with lock:
         if msgpkg not in capnp_cache:
-            print(f"capnp loading {msgpkg}")
-            capnp_cache[msgpkg] = _schema_parser.load(_get_full_filepath(msgpkg), imports=site.getsitepackages()
-            )
-    return capnp_cache[msgpkg]
+            capnp_cache[msgpkg] = _load(msgpkg)
+        return capnp_cache[msgpkg]
+
 
 def get_pkgs():
-    filedir = os.path.dirname(os.path.abspath(__file__))
-    filenames = glob.glob(f"{filedir}/def/*.capnp")
+    filenames = glob.glob(f"{_def_dir}/*.capnp")
     return [os.path.splitext(os.path.basename(filename))[0] for filename in filenames]
@@ -1,5 +1,7 @@
+import capnp
+import site
 import pytest
-from fairomsg import get_msgs, get_pkgs
+from fairomsg import get_msgs, get_pkgs, serdes
 
 @pytest.fixture
 def pkg_names():
@@ -10,4 +12,21 @@ def test_get_pkgs(pkg_names):
 
 def test_get_msgs(pkg_names):
     for pkg_name in pkg_names:
-        get_msgs(pkg_name)
\ No newline at end of file
+        get_msgs(pkg_name)
+
+def test_get_msgs_is_cached():
+    assert get_msgs("sensor_msgs") is get_msgs("sensor_msgs")
+
+
+def test_compiled_schemas_match_sources(pkg_names):
+    parser = capnp.SchemaParser()
+    for pkg_name in pkg_names:
+        parsed = parser.load(
+            serdes._get_full_filepath(pkg_name), imports=site.getsitepackages()
+        )
+        compiled = get_msgs(pkg_name)
+        for node in parsed.schema.node.nestedNodes:
+            parsed_schema = parsed.schema.get_nested(node.name)
+            if parsed_schema.get_proto().isStruct:
+                fieldnames = parsed_schema.as_struct().fieldnames
+                assert getattr(compiled, node.name).schema.fieldnames == fieldnames
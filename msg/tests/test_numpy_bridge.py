@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from fairomsg import numpy_bridge
+
+
+@pytest.mark.parametrize(
+    "arr",
+    [
+        np.random.randint(0, 255, (48, 64, 3), dtype=np.uint8),
+        np.random.rand(48, 64).astype(np.float32),
+        np.random.randint(0, 2**16, (48, 64), dtype=np.uint16),
+    ],
+)
+def test_image_round_trip(arr):
+    img = numpy_bridge.image_from_numpy(arr)
+    assert img.height == 48
+    assert img.width == 64
+    assert img.step == 64 * arr.itemsize * (arr.shape[2] if arr.ndim == 3 else 1)
+
+    out = numpy_bridge.image_from_bytes(img.to_bytes())
+    np.testing.assert_array_equal(out, arr)
+    assert out.dtype == arr.dtype
+    assert not out.flags.writeable
+
+
+def test_image_named_encoding():
+    arr = np.random.randint(0, 255, (4, 5, 3), dtype=np.uint8)
+    img = numpy_bridge.image_from_numpy(arr, encoding="rgb8")
+    assert img.encoding == "rgb8"
+    np.testing.assert_array_equal(numpy_bridge.image_from_bytes(img.to_bytes()), arr)
+
+    with pytest.raises(ValueError):
+        numpy_bridge.parse_encoding("bayer_rggb8")
+
+
+def test_image_reader_is_zero_copy():
+    img, data = numpy_bridge.new_image(4, 5, "mono16")
+    data[...] = 7
+    blob = img.to_bytes()
+
+    out = numpy_bridge.image_from_bytes(blob)
+    assert np.shares_memory(out, np.frombuffer(blob, dtype=np.uint8))
+    assert (out == 7).all()
+
+
+def test_image_padded_rows():
+    sensor_msgs = numpy_bridge.get_msgs("sensor_msgs")
+    img = sensor_msgs.Image.new_message(
+        height=2, width=3, encoding="8UC1", step=4, data=bytes(range(8))
+    )
+    out = numpy_bridge.image_from_bytes(img.to_bytes())
+    np.testing.assert_array_equal(out, [[0, 1, 2], [4, 5, 6]])
+
+
+def test_point_cloud_round_trip():
+    dtype = np.dtype([("x", "f4"), ("y", "f4"), ("z", "f4"), ("rgb", "u4")])
+    points = np.zeros(100, dtype=dtype)
+    points["x"] = np.arange(100)
+    points["rgb"] = 0xFF0000
+
+    pc = numpy_bridge.point_cloud_from_numpy(points)
+    assert [field.name for field in pc.fields] == ["x", "y", "z", "rgb"]
+    assert pc.pointStep == 16
+    assert pc.width == 100
+
+    out = numpy_bridge.point_cloud_from_bytes(pc.to_bytes())
+    assert out.dtype.names == dtype.names
+    np.testing.assert_array_equal(out, points)
+    assert not out.flags.writeable
+
+
+def test_point_cloud_from_unstructured():
+    xyz = np.random.rand(10, 3)
+    pc = numpy_bridge.point_cloud_from_numpy(xyz, names=["x", "y", "z"])
+    out = numpy_bridge.point_cloud_from_bytes(pc.to_bytes())
+    np.testing.assert_array_equal(np.stack([out[n] for n in "xyz"], axis=-1), xyz)
+
+    with pytest.raises(ValueError):
+        numpy_bridge.point_cloud_from_numpy(xyz)
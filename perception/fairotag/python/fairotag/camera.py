@@ -7,6 +7,7 @@ from collections import namedtuple
 import numpy as np
 import sophus as sp
 import cv2
+from scipy.spatial.transform import Rotation as R
 
 # Default parameters
 GRID_WIDTH = 5
@@ -20,7 +21,12 @@ CameraIntrinsics = namedtuple("CameraIntrinsics", "fx, fy, ppx, ppy, coeffs")
 
 
 class CameraModule:
-    def __init__(self, dictionary=None, parameters=None, criteria=None):
+    def __init__(self, dictionary=None, parameters=None, criteria=None, detection_scale=1.0):
+        """
+        detection_scale: Scale at which images are searched for markers. Values below 1 speed up
+            detection in high-resolution images, the corners found are then refined at full
+            resolution.
+        """
         # Aruco hyperparams
         if dictionary is None:
             dictionary = cv2.aruco.Dictionary_get(cv2.aruco.DICT_4X4_50)
@@ -34,56 +40,107 @@ class CameraModule:
             criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 0.0001)
         self.criteria = criteria
 
+        self.detection_scale = detection_scale
+
         # Initialize
         self.intrinsics = None
         self.registered_markers = {}
 
+        # Intrinsics as arrays, cached for the intrinsics they were computed from
+        self._cached_intrinsics = None
+        self._camera_matrix = None
+        self._dist_coeffs = None
+
     def register_marker_size(self, marker_id, length):
         """ Enable pose estimation of given marker ID by registering length of marker """
         self.registered_markers[marker_id] = length
 
+    def _get_camera_arrays(self):
+        if self._cached_intrinsics is not self.intrinsics:
+            self._camera_matrix = self._intrinsics2matrix(self.intrinsics)
+            self._dist_coeffs = np.asarray(self.intrinsics.coeffs, dtype=np.float64)
+            self._cached_intrinsics = self.intrinsics
+
+        return self._camera_matrix, self._dist_coeffs
+
+    def _detect_corners(self, img):
+        if self.detection_scale == 1.0:
+            corners, ids, _ = cv2.aruco.detectMarkers(
+                img, dictionary=self.dictionary, parameters=self.parameters
+            )
+            return corners, ids
+
+        # Detect in downscaled img
+        img_small = cv2.resize(
+            img,
+            None,
+            fx=self.detection_scale,
+            fy=self.detection_scale,
+            interpolation=cv2.INTER_AREA,
+        )
+        corners, ids, _ = cv2.aruco.detectMarkers(
+            img_small, dictionary=self.dictionary, parameters=self.parameters
+        )
+        if ids is None:
+            return corners, ids
+
+        # Refine corners in full resolution img
+        if len(img.shape) > 2:
+            img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        else:
+            img_gray = img
+        # (corners are off by up to a downscaled pixel, the search window must cover it)
+        half_window = int(np.ceil(2.0 / self.detection_scale))
+        corners_small = np.concatenate(corners, axis=1).reshape(-1, 1, 2)
+        corners_full = (corners_small + 0.5) / self.detection_scale - 0.5
+        cv2.cornerSubPix(
+            img_gray,
+            corners_full,
+            winSize=(half_window, half_window),
+            zeroZone=(-1, -1),
+            criteria=self.criteria,
+        )
+        corners = list(corners_full.reshape(-1, 1, 4, 2))
+
+        return corners, ids
+
+    def _estimate_poses(self, corners, lengths):
+        """Estimate marker poses, with one solve per marker length"""
+        matrix, coeffs = self._get_camera_arrays()
+
+        poses = [None] * len(corners)
+        for length in set(lengths) - {None}:
+            indices = [i for i, l in enumerate(lengths) if l == length]
+            rvecs, tvecs, _ = cv2.aruco.estimatePoseSingleMarkers(
+                [corners[i] for i in indices], length, matrix, coeffs
+            )
+            rotations = R.from_rotvec(rvecs.reshape(-1, 3)).as_matrix()
+            for i, r, t in zip(indices, rotations, tvecs.reshape(-1, 3)):
+                poses[i] = sp.SE3(r, t)
+
+        return poses
+
     def detect_markers(self, img):
         # Detect markers in img
-        corners, ids, rejected_candidates = cv2.aruco.detectMarkers(
-            img, dictionary=self.dictionary, parameters=self.parameters
-        )
+        corners, ids = self._detect_corners(img)
 
         # Return empty list if no marker found
         if ids is None:
             return []
 
         # Estimate pose of detected markers
-        num_markers = len(corners)
         ids = ids.squeeze(-1)
+        lengths = [None] * len(ids)
+        poses = [None] * len(ids)
         if self.intrinsics is None:
             print(
                 "Warning: Intrinsics not set in CameraModule. Pose estimation of markers unavailble."
             )
 
         else:
-            poses = []
-            lengths = []
-            for id, corner in zip(ids, corners):
-                # No pose estimation if marker id not registered
-                if id not in self.registered_markers:
-                    poses.append(None)
-                    lengths.append(None)
-                    continue
-
-                # Pose estimation using registered length
-                length = self.registered_markers[id]
-                rvecs, tvecs, _ = cv2.aruco.estimatePoseSingleMarkers(
-                    corner,
-                    length,
-                    self._intrinsics2matrix(self.intrinsics),
-                    self.intrinsics.coeffs,
-                )
-                r = rvecs[0].squeeze()
-                t = tvecs[0].squeeze()
-                pose = sp.SE3(sp.SO3.exp(r).matrix(), t)
-
-                lengths.append(length)
-                poses.append(pose)
+            # No pose estimation if marker id not registered
+            lengths = [self.registered_markers.get(id) for id in ids]
+            poses = self._estimate_poses(corners, lengths)
 
         # Output
         markers = []
@@ -126,10 +183,11 @@ class CameraModule:
                 tvec = m.pose.translation()[None, :]
                 rvec = m.pose.so3().log()[None, :]
                 length = m.length / 2.0
+                matrix, coeffs = self._get_camera_arrays()
                 img_rend = cv2.aruco.drawAxis(
                     img_rend,
-                    self._intrinsics2matrix(self.intrinsics),
-                    self.intrinsics.coeffs,
+                    matrix,
+                    coeffs,
                     rvec,
                     tvec,
                     length,
@@ -7,7 +7,7 @@ import gtsam
 
 
 DEFAULT_HUBER_C = 1.345
-USE_ANALYTICAL_JACOBIANS = False
+USE_ANALYTICAL_JACOBIANS = True
 
 
 # Factor graph object
@@ -28,10 +28,6 @@ class FactorGraph:
 
         self.n_variables = 0
 
-        # TODOs for incremental smoothing:
-        # - maintain active values
-        # - update/delete factors
-
     @staticmethod
     def _process_noise(noise):
         if noise is None:
@@ -127,13 +123,135 @@ class FactorGraph:
         return {name: gtsam2sophus(result_values.atPose3(var)) for name, var in self.vars.items()}
 
 
+class IncrementalFactorGraph(FactorGraph):
+    """FactorGraph backed by gtsam.ISAM2
+    - Factors and variables persist across calls to optimize
+    - Each optimize only adds the factors & variables added since the last one to the solution,
+      and warm-starts from the previous estimate
+    - The factors of old optimize calls can be summarized, marginalizing out the variables only
+      they constrain, to keep the problem bounded
+    """
+
+    def __init__(self, relinearize_threshold=0.01, n_iterations=1):
+        super().__init__()
+
+        self.isam_params = gtsam.ISAM2Params()
+        self.isam_params.setRelinearizeThreshold(relinearize_threshold)
+        self.isam = gtsam.ISAM2(self.isam_params)
+        self.n_iterations = n_iterations
+
+        # self.gtsam_graph & self.values only hold what is not yet in self.isam
+        self.estimate = gtsam.Values()
+
+        # Factors added by each optimize call, and the summary of the marginalized ones
+        # (priors are kept as is, constrained noise models cannot be summarized)
+        self.factor_batches = []
+        self.priors = gtsam.NonlinearFactorGraph()
+        self.summary = gtsam.NonlinearFactorGraph()
+
+    def init_variable(self, name, pose=sp.SE3()):
+        # Variables already in the solution are warm-started from their estimate
+        if name in self.vars and self.estimate.exists(self.vars[name]):
+            return
+        super().init_variable(name, pose)
+
+    def bfs_initialization(self, root_var_name):
+        """Initialize new variables from their neighbors, starting from the root & the estimate"""
+        queue = [(var, self.estimate.atPose3(var)) for var in self.estimate.keys()]
+        root = self.vars[root_var_name]
+        if not self.estimate.exists(root):
+            queue.append((root, self.values.atPose3(root)))
+        visited = set()
+
+        while queue:
+            curr_var, pose = queue.pop(0)
+            if curr_var in visited:
+                continue
+            if self.values.exists(curr_var):
+                self.values.update(curr_var, pose)
+
+            for next_var, transform in self.factor_edges[curr_var]:
+                if next_var not in visited and not self.estimate.exists(next_var):
+                    queue.append((next_var, pose * transform))
+
+            visited.add(curr_var)
+
+    def optimize(self, verbosity=0):
+        self.isam.update(self.gtsam_graph, self.values)
+        for _ in range(self.n_iterations - 1):
+            self.isam.update()
+        self.estimate = self.isam.calculateEstimate()
+
+        self.factor_batches.append(self.gtsam_graph)
+        self.gtsam_graph = gtsam.NonlinearFactorGraph()
+        self.values = gtsam.Values()
+        for edges in self.factor_edges.values():
+            edges.clear()
+
+        return {name: gtsam2sophus(self.estimate.atPose3(var)) for name, var in self.vars.items()}
+
+    def marginalize(self, n_batches, var_names):
+        """Summarize the factors of the first n_batches optimize calls into linear factors (fixed
+        at the current estimate), marginalizing out var_names, which only they constrain.
+        """
+        assert not self.gtsam_graph.size(), "Optimize before marginalizing."
+        marginal_vars = [self.vars[name] for name in var_names]
+
+        old_factors = gtsam.NonlinearFactorGraph()
+        old_factors.push_back(self.summary)
+        for batch in self.factor_batches[:n_batches]:
+            for i in range(batch.size()):
+                factor = batch.at(i)
+                if isinstance(factor, gtsam.PriorFactorPose3):
+                    self.priors.push_back(factor)
+                else:
+                    old_factors.push_back(factor)
+        self.factor_batches = self.factor_batches[n_batches:]
+
+        # Eliminate marginalized variables, then combine what remains into one factor per set of
+        # variables, which keeps the summary as sparse as the graph
+        linear_factors = old_factors.linearize(self.estimate)
+        _, remaining = linear_factors.eliminatePartialSequential(marginal_vars)
+        groups = {}
+        for i in range(remaining.size()):
+            factor = remaining.at(i)
+            group = groups.setdefault(tuple(sorted(factor.keys())), gtsam.GaussianFactorGraph())
+            group.push_back(factor)
+        self.summary = gtsam.NonlinearFactorGraph()
+        for group in groups.values():
+            self.summary.push_back(
+                gtsam.LinearContainerFactor(gtsam.HessianFactor(group), self.estimate)
+            )
+
+        # Rebuild the solution without the marginalized variables
+        factors = gtsam.NonlinearFactorGraph()
+        factors.push_back(self.priors)
+        factors.push_back(self.summary)
+        for batch in self.factor_batches:
+            factors.push_back(batch)
+        values = gtsam.Values()
+        for var in self.estimate.keys():
+            if var not in marginal_vars:
+                values.insert(var, self.estimate.atPose3(var))
+
+        self.isam = gtsam.ISAM2(self.isam_params)
+        self.isam.update(factors, values)
+        self.estimate = self.isam.calculateEstimate()
+
+        for name in var_names:
+            var = self.vars.pop(name)
+            del self.factor_edges[var]
+
+
 # Helper functions
 def sophus2gtsam(pose):
     return gtsam.Pose3(pose.matrix())
 
 
 def gtsam2sophus(pose):
-    return sp.SE3(pose.matrix())
+    # Rotations drift from orthogonal as updates compose, which Sophus rejects
+    rotation = gtsam.Rot3.ClosestTo(pose.rotation().matrix())
+    return sp.SE3(gtsam.Pose3(rotation, pose.translation()).matrix())
 
 
 # Custom factor for frames
@@ -142,20 +260,32 @@ def pose_jacobian_numerical(f, x, delta=1e-5):
     for i in range(6):
         delta_arr = np.zeros(6)
         delta_arr[i] = delta
-        pose_offset_p = gtsam.Pose3.Expmap(delta_arr) * x
-        pose_offset_n = gtsam.Pose3.Expmap(-delta_arr) * x
+        pose_offset_p = x * gtsam.Pose3.Expmap(delta_arr)
+        pose_offset_n = x * gtsam.Pose3.Expmap(-delta_arr)
         jac[:, i] = (f(pose_offset_p) - f(pose_offset_n)) / (2 * delta)
 
     return jac
 
 
-def pose_jacobian_analytical(f, x):  # TODO: Debug
-    jac = np.zeros([6, 6])
-    jac_x = gtsam.Pose3.LogmapDerivative(x)
-    for i in range(6):
-        jac[:, i] = f(gtsam.Pose3.Expmap(jac_x[:, i]))
+def frame_error_jacobians(pose0, pose1, pose2):
+    """Closed form Jacobians of the frame error w.r.t. pose0, pose1 & pose2
 
-    return jac
+    With the error e = Log(pose2^-1 * pose01), pose01 = pose0^-1 * pose1, and poses perturbed on
+    the right (x * Exp(d), as gtsam retracts):
+    - de/dpose0 = -J * Ad(pose01^-1)
+    - de/dpose1 = J
+    - de/dpose2 = -J * Ad(pose_diff^-1), pose_diff = pose2^-1 * pose01
+    where J is the derivative of Log at pose_diff.
+    """
+    pose01 = pose0.between(pose1)
+    pose_diff = pose2.between(pose01)
+    jac_log = gtsam.Pose3.LogmapDerivative(pose_diff)
+
+    jac0 = -jac_log @ pose01.inverse().AdjointMap()
+    jac1 = jac_log
+    jac2 = -jac_log @ pose_diff.inverse().AdjointMap()
+
+    return jac0, jac1, jac2
 
 
 def frame_error_func(this: gtsam.CustomFactor, v, H: Optional[List[np.ndarray]]):
@@ -174,21 +304,19 @@ def frame_error_func(this: gtsam.CustomFactor, v, H: Optional[List[np.ndarray]])
     # Compute Jacobians
     if H is not None:
         if USE_ANALYTICAL_JACOBIANS:
-            jac_func = pose_jacobian_analytical
+            H[0], H[1], H[2] = frame_error_jacobians(pose0, pose1, pose2)
         else:
-            jac_func = pose_jacobian_numerical
-
-        H[0] = jac_func(
-            lambda x: pose_err(x, pose1, pose2),
-            x=pose0,
-        )
-        H[1] = jac_func(
-            lambda x: pose_err(pose0, x, pose2),
-            x=pose1,
-        )
-        H[2] = jac_func(
-            lambda x: pose_err(pose0, pose1, x),
-            x=pose2,
-        )
+            H[0] = pose_jacobian_numerical(
+                lambda x: pose_err(x, pose1, pose2),
+                x=pose0,
+            )
+            H[1] = pose_jacobian_numerical(
+                lambda x: pose_err(pose0, x, pose2),
+                x=pose1,
+            )
+            H[2] = pose_jacobian_numerical(
+                lambda x: pose_err(pose0, pose1, x),
+                x=pose2,
+            )
 
     return error
@@ -6,7 +6,7 @@ import numpy as np
 import sophus as sp
 
 from .camera import MarkerInfo
-from .graph import FactorGraph
+from .graph import FactorGraph, IncrementalFactorGraph
 from .viz import SceneViz
 
 
@@ -43,12 +43,22 @@ class Frame:
 
 
 class Scene:
-    def __init__(self, camera_noise=None, calib_noise=None):
+    def __init__(self, camera_noise=None, calib_noise=None, tracking_window=None):
+        """
+        tracking_window: Number of past updates kept in the incremental tracking graph, older ones
+            are marginalized. Keeps all updates if None.
+        """
         # Initialize data containers
         self._frames = {}
         self._objects = {}
         self._snapshots = []
 
+        # Incremental tracking
+        self._tracking_window = tracking_window
+        self._tracking_graph = None
+        self._tracking_steps = []
+        self._n_tracking_steps = 0
+
         # Noise
         if camera_noise is None:
             self._camera_noise = np.array(DEFAULT_CAMERA_NOISE)
@@ -72,6 +82,7 @@ class Scene:
         assert name not in self._objects.keys(), f"Object name already exists: {name}"
         assert frame in self._frames.keys(), f"Unknown frame: {frame}"
 
+        self.reset_tracking()
         is_anchor = pose_in_frame is not None
         pose_in_frame = sp.SE3() if pose_in_frame is None else pose_in_frame
         pose = self._frames[frame].pose * pose_in_frame
@@ -103,6 +114,7 @@ class Scene:
 
     def add_frame(self, name, pose=None):
         pose = sp.SE3() if pose is None else pose
+        self.reset_tracking()
 
         f = Frame(name, pose)
         self._frames[name] = f
@@ -202,7 +214,7 @@ class Scene:
         graph.add_prior("f__world", sp.SE3())
 
     def _add_detected_markers(self, graph, detected_markers, prefix, lock_frames):
-        updated_frames = set("world")
+        updated_frames = {"world"}
 
         for camera_name, markers in detected_markers.items():
             # Init camera
@@ -244,13 +256,13 @@ class Scene:
         self._init_frame(graph, frame2_name, prefix=prefix, lock_frames=lock_frames)
         graph.add_observation(f1_node, f2_node, transform, self._calib_noise)
 
-    def _optimize_and_update(self, graph, verbosity=0):
+    def _optimize_and_update(self, graph, verbosity=0, prefix=""):
         # Optimize graph
         results = graph.optimize(verbosity=verbosity)
 
         # Extract results
         for frame_name, frame in self._frames.items():
-            f_node = f"f__{frame_name}"
+            f_node = f"f__{frame_name}" if frame_name == "world" else f"f_{prefix}_{frame_name}"
             if f_node in results:
                 frame.pose = results[f_node]
                 frame.is_visible = True
@@ -263,36 +275,82 @@ class Scene:
                 frame = self._frames[obj.frame]
                 obj.pose = frame.pose * obj.pose_in_frame
 
-            o_node = f"o__{obj_name}"
+            o_node = f"o__{obj_name}" if obj.frame == "world" else f"o_{prefix}_{obj_name}"
             if o_node in results:
                 obj.pose = results[o_node]
                 obj.is_visible = True
 
+    def _start_tracking_step(self):
+        if self._tracking_graph is None:
+            self._tracking_graph = IncrementalFactorGraph()
+            self._add_world_prior(self._tracking_graph, lock_frames=True)
+
+        prefix = f"s{self._n_tracking_steps}"
+        self._n_tracking_steps += 1
+        self._tracking_steps.append(prefix)
+        return self._tracking_graph, prefix
+
+    def _marginalize_tracking_steps(self):
+        # Marginalize in batches of tracking_window steps, as each marginalization rebuilds iSAM2
+        window = self._tracking_window
+        if window is None or len(self._tracking_steps) < 2 * window:
+            return
+        old_steps = self._tracking_steps[:-window]
+        self._tracking_steps = self._tracking_steps[-window:]
+
+        # Each step is one batch of factors in the graph
+        old_prefixes = tuple(f"{kind}_{step}_" for step in old_steps for kind in ("f", "o"))
+        graph = self._tracking_graph
+        graph.marginalize(
+            len(old_steps), [name for name in graph.vars if name.startswith(old_prefixes)]
+        )
+
+    def reset_tracking(self):
+        """Drop the incremental tracking graph, e.g. after the scene changes"""
+        self._tracking_graph = None
+        self._tracking_steps = []
+        self._n_tracking_steps = 0
+
     def update_pose_estimations(
         self,
         detected_markers: Dict[str, List[MarkerInfo]],
         frame_transforms: Optional[List[Tuple[str, str, sp.SE3]]] = None,
         verbosity=0,
+        incremental=False,
     ):
         """Estimate relative poses between frames
 
         Auxilliary observations between frames:
             frame_transform => (frame1_name, frame2_name, transform)
             frame_transforms => List[frame_transform] - all frame transforms in snapshot
-        """
-        graph = FactorGraph()
 
+        Incremental mode:
+            Instead of solving from the current detections only, keeps a graph across calls
+            (iSAM2) and only adds the new observations. Objects in the world frame are smoothed
+            over all past updates, other frames get new poses every update.
+        """
         # Reset visibility
         self._reset_visibility()
 
         # Add factors
-        self._add_world_prior(graph, lock_frames=True)
-        self._add_detected_markers(graph, detected_markers, prefix="", lock_frames=True)
+        if incremental:
+            graph, prefix = self._start_tracking_step()
+        else:
+            graph, prefix = FactorGraph(), ""
+            self._add_world_prior(graph, lock_frames=True)
+        self._add_detected_markers(graph, detected_markers, prefix=prefix, lock_frames=True)
         if frame_transforms is not None:
-            self._add_frame_transforms(graph, frame_transforms, prefix="", lock_frames=True)
+            self._add_frame_transforms(graph, frame_transforms, prefix=prefix, lock_frames=True)
+
+        # Initialize new variables from the estimate
+        if incremental:
+            graph.bfs_initialization("f__world")
 
         # Optimize graph & update data
-        self._optimize_and_update(graph, verbosity=verbosity)
+        self._optimize_and_update(graph, verbosity=verbosity, prefix=prefix)
+
+        if incremental:
+            self._marginalize_tracking_steps()
 
     def add_snapshot(
         self,
@@ -318,6 +376,7 @@ class Scene:
     ):
         """Calibrate extrinsics between cameras & markers in each frame"""
         graph = FactorGraph()
+        self.reset_tracking()
 
         # Reset visibility
         self._reset_visibility()
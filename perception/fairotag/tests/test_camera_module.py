@@ -71,3 +71,22 @@ def test_detected_markers(detected_markers):
         else:
             assert marker.length is None
             assert marker.pose is None
+
+
+def test_downscaled_detection(intrinsics):
+    img = cv2.imread(INPUT_IMGFILE)
+    markers = {}
+    for scale in [1.0, 0.5]:
+        camera = frt.CameraModule(detection_scale=scale)
+        camera.set_intrinsics(intrinsics=intrinsics)
+        camera.register_marker_size(0, MARKER_LENGTH)
+        markers[scale] = {m.id: m for m in camera.detect_markers(img)}
+
+    # Same markers found, with corners refined to full resolution
+    assert markers[0.5].keys() == markers[1.0].keys()
+    for id, marker in markers[1.0].items():
+        assert np.allclose(markers[0.5][id].corner, marker.corner, atol=1.0)
+        if id == 0:
+            assert np.allclose(
+                markers[0.5][id].pose.translation(), marker.pose.translation(), atol=5e-3
+            )
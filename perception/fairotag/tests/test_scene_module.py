@@ -142,3 +142,72 @@ def _test_scene_calibration2(setup_dict):
     print(t23_inferred.log() - t23_gt.log())
     assert np.allclose(t01_inferred.log(), t01_gt.log(), atol=1e-2)
     assert np.allclose(t23_inferred.log(), t23_gt.log(), atol=1e-2)
+
+
+def test_incremental_tracking(setup_dict):
+    """
+    Tracks marker A with incremental updates after calibrating the cameras,
+    then with camera B only.
+    """
+    window = 5
+    scene = frt.Scene(tracking_window=window)
+
+    scene.add_camera("0", pose_in_frame=sp.SE3())
+    scene.add_camera("1")
+
+    scene.add_frame("ee")
+    scene.add_marker(2, frame="ee", pose_in_frame=sp.SE3())
+
+    for t02, t12 in zip(setup_dict["t02_samples"], setup_dict["t12_samples"]):
+        detected_markers = {
+            "0": [frt.MarkerInfo(id=2, pose=t02, corner=None, length=None)],
+            "1": [frt.MarkerInfo(id=2, pose=t12, corner=None, length=None)],
+        }
+        scene.add_snapshot(detected_markers)
+    scene.calibrate_extrinsics()
+
+    # Track
+    for i, (t02, t12) in enumerate(zip(setup_dict["t02_samples"], setup_dict["t12_samples"])):
+        if i < 20:
+            detected_markers = {
+                "0": [frt.MarkerInfo(id=2, pose=t02, corner=None, length=None)],
+                "1": [frt.MarkerInfo(id=2, pose=t12, corner=None, length=None)],
+            }
+        else:
+            detected_markers = {
+                "1": [frt.MarkerInfo(id=2, pose=t12, corner=None, length=None)],
+            }
+        scene.update_pose_estimations(detected_markers, incremental=True)
+
+        t02_inferred = scene.get_marker_info(2)["pose"]
+        assert np.allclose(t02_inferred.log(), t02.log(), atol=1e-2)
+
+    # Old updates are marginalized
+    n_steps = len(scene._tracking_steps)
+    assert window <= n_steps < 2 * window
+    assert len(scene._tracking_graph.vars) == 3 + 2 * n_steps
+
+
+def test_frame_error_jacobians():
+    import gtsam
+    from fairotag.graph import frame_error_jacobians, pose_jacobian_numerical
+
+    # Rotations well inside the injectivity radius of Log, where the
+    # numerical Jacobians are accurate
+    rng = np.random.default_rng(0)
+    poses = [
+        gtsam.Pose3.Expmap(np.concatenate([rng.uniform(-1.0, 1.0, 3), rng.normal(size=3)]))
+        for _ in range(3)
+    ]
+
+    def pose_err(pose0, pose1, pose2):
+        return pose2.localCoordinates(pose0.between(pose1))
+
+    jacs_analytical = frame_error_jacobians(*poses)
+    jacs_numerical = [
+        pose_jacobian_numerical(lambda x: pose_err(x, poses[1], poses[2]), poses[0]),
+        pose_jacobian_numerical(lambda x: pose_err(poses[0], x, poses[2]), poses[1]),
+        pose_jacobian_numerical(lambda x: pose_err(poses[0], poses[1], x), poses[2]),
+    ]
+    for jac_a, jac_n in zip(jacs_analytical, jacs_numerical):
+        assert np.allclose(jac_a, jac_n, atol=1e-6)
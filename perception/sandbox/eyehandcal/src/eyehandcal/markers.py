@@ -0,0 +1,54 @@
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+# ArUco marker detection. Only needs cv2 and numpy, so that detection workers
+# start without importing torch.
+
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+_aruco_detector = None
+
+
+def _get_aruco_detector():
+    # created once per process
+    global _aruco_detector
+    if _aruco_detector is None:
+        aruco_dict = cv2.aruco.Dictionary_get(cv2.aruco.DICT_4X4_50)
+        aruco_param = cv2.aruco.DetectorParameters_create()
+        aruco_param.cornerRefinementMethod = cv2.aruco.CORNER_REFINE_SUBPIX
+        _aruco_detector = (aruco_dict, aruco_param)
+    return _aruco_detector
+
+
+def detect_marker_corners(img):
+    """
+        img: np.ndarray
+        return: {marker_id: (x,y)} first corner of every detected marker
+    """
+    aruco_dict, aruco_param = _get_aruco_detector()
+    corners, idx, rej = cv2.aruco.detectMarkers(img.astype(np.uint8), dictionary=aruco_dict, parameters=aruco_param)
+    if idx is None:
+        return {}
+    marker_corners = {}
+    for corner, marker_id in zip(corners, idx.squeeze(axis=1).tolist()):
+        # keep the first detection of a marker id, as the target lookup always did
+        marker_corners.setdefault(marker_id, corner[0,0,:].tolist())
+    return marker_corners
+
+
+def detect_marker_corners_shm(shm_name, offset, shape, dtype):
+    # worker side: view the image in the shared block, without copying it through the pipe
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        img = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+        marker_corners = detect_marker_corners(img)
+        del img
+    finally:
+        shm.close()
+    return marker_corners
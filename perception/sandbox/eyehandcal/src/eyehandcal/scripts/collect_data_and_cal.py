@@ -25,7 +25,7 @@ from polymetis import RobotInterface
 from realsense_wrapper import RealsenseAPI
 
 from eyehandcal.utils import detect_corners, quat2rotvec, build_proj_matrix, mean_loss, find_parameter, rotmat, dist_in_hull, \
-    hand_marker_proj_world_camera, world_marker_proj_hand_camera
+    hand_marker_proj_world_camera, world_marker_proj_hand_camera, stack_obs_data, batch_rotmat
 
 
 def realsense_images(max_pixel_diff=200):
@@ -127,6 +127,8 @@ def main(argv):
     parser.add_argument('--time-to-go', default=3, type=float, help="time_to_go in seconds for each movement")
     parser.add_argument('--imagedir', default=None, help="folder to save debug images")
     parser.add_argument('--pixel-tolerance', default=2.0, type=float, help="mean pixel error tolerance (stage 2)")
+    parser.add_argument('--num-workers', default=None, type=int, help="number of processes detecting markers (default: detect in process)")
+    parser.add_argument('--corner-cache-dir', default=None, help="folder caching marker detections of each image (default: no cache)")
     proj_funcs = {'hand_marker_proj_world_camera' :hand_marker_proj_world_camera, 
                   'world_marker_proj_hand_camera' :world_marker_proj_hand_camera,
                   'wrist_camera': world_marker_proj_hand_camera,
@@ -180,7 +182,7 @@ def main(argv):
 
     print(f"Done. Data has {len(data)} poses.")
 
-    corner_data = detect_corners(data, target_idx=args.marker_id)
+    corner_data = detect_corners(data, target_idx=args.marker_id, num_workers=args.num_workers, cache_dir=args.corner_cache_dir)
 
     intrinsics = corner_data[0]['intrinsics']
     num_of_camera=len(intrinsics)
@@ -197,17 +199,19 @@ def main(argv):
             cal_results.append(CalibrationResult(num_marker_seen=len(obs_data_std)))
             continue
 
+        obs_data = stack_obs_data(obs_data_std)
+
         # stage 1 - assuming marker is attach to EE origin, solve camera pose first
         if args.proj_func == "hand_marker_proj_world_camera":
-            p3d = torch.stack([p[1] for p in obs_data_std]).detach().numpy()
+            p3d = obs_data.pos.detach().numpy()
         elif args.proj_func == "world_marker_proj_hand_camera":
-            p3d = torch.stack([rotmat(-p[2]).matmul(-p[1]) for p in obs_data_std]).detach().numpy()
+            p3d = batch_rotmat(-obs_data.ori).matmul(-obs_data.pos.unsqueeze(-1)).squeeze(-1).detach().numpy()
 
-        p2d = torch.stack([p[0] for p in obs_data_std]).detach().numpy()
+        p2d = obs_data.corners.detach().numpy()
         retval, rvec, tvec = cv2.solvePnP(p3d, p2d, K.numpy(), distCoeffs=None, flags=cv2.SOLVEPNP_SQPNP)
         rvec_cam = torch.tensor(-rvec.reshape(-1))
         tvec_cam = -rotmat(rvec_cam).matmul(torch.tensor(tvec.reshape(-1)))
-        pixel_error = mean_loss(obs_data_std, torch.cat([rvec_cam, tvec_cam, torch.zeros(3)]), K, proj_func).item()
+        pixel_error = mean_loss(obs_data, torch.cat([rvec_cam, tvec_cam, torch.zeros(3)]), K, proj_func).item()
         print('stage 1 mean pixel error', pixel_error)
 
         # stage 2 - allow marker to move, joint optimize camera pose and marker
@@ -229,7 +233,7 @@ def main(argv):
             marker_max_displacement = 0.1 #meter
             param=torch.cat([rvec_cam, tvec_cam, torch.randn(3)*marker_max_displacement]).clone().detach()
             param.requires_grad=True
-            L = lambda param: mean_loss(obs_data_std, param, K, proj_func)
+            L = lambda param: mean_loss(obs_data, param, K, proj_func)
             try:
                 param_star=find_parameter(param, L)
             except Exception as e:
@@ -4,9 +4,19 @@
 # This source code is licensed under the license found in the
 # LICENSE file in the root directory of this source tree.
 
+import os
+import json
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
 import torch
 import cv2
 import math
+from collections import namedtuple
+
+from eyehandcal.markers import detect_marker_corners, detect_marker_corners_shm
 
 def uncompress_image(data):
     for d in data:
@@ -18,25 +28,77 @@ def uncompress_image(data):
                 d['imgs'].append(cv2.imdecode(img_jpeg_encoded, cv2.IMREAD_COLOR))
 
 
-def detect_corners(data, target_idx=9):
+# Bump when the detection settings change, to invalidate cached detections
+CORNER_CACHE_VERSION = 1
+
+def _image_hash(img):
+    h = hashlib.sha1(f'{CORNER_CACHE_VERSION}:{img.shape}:{img.dtype}'.encode())
+    h.update(np.ascontiguousarray(img).data)
+    return h.hexdigest()
+
+
+def _detect_marker_corners_parallel(imgs, num_workers):
+    """
+    Copy the images into one shared memory block once, then detect over a process pool.
+    Workers are spawned rather than forked, as callers may already run gRPC or camera threads,
+    and only import eyehandcal.markers.
+    """
+    nbytes = [img.nbytes for img in imgs]
+    shm = shared_memory.SharedMemory(create=True, size=max(sum(nbytes), 1))
+    try:
+        offsets = np.cumsum([0] + nbytes[:-1]).tolist()
+        for img, offset in zip(imgs, offsets):
+            np.ndarray(img.shape, dtype=img.dtype, buffer=shm.buf, offset=offset)[...] = img
+        with ProcessPoolExecutor(max_workers=num_workers,
+                                 mp_context=multiprocessing.get_context('spawn')) as executor:
+            return list(executor.map(detect_marker_corners_shm,
+                                     [shm.name] * len(imgs), offsets,
+                                     [img.shape for img in imgs], [img.dtype.str for img in imgs]))
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def detect_corners(data, target_idx=9, num_workers=None, cache_dir=None):
     """
         data: [{'img': [np.ndarray]}]
+        num_workers: size of the detection process pool (default: None, detects in process).
+            Spawned workers re-import the calling script, which takes seconds when it imports
+            torch, so the pool only pays off on large datasets.
+        cache_dir: directory caching the detections of each image by content hash, so
+            detection is skipped for images already seen (with any target_idx)
         return: [{'corners', [(x,y)]}]
     """
-    aruco_dict = cv2.aruco.Dictionary_get(cv2.aruco.DICT_4X4_50)
-    aruco_param = cv2.aruco.DetectorParameters_create()
-    aruco_param.cornerRefinementMethod = cv2.aruco.CORNER_REFINE_SUBPIX
-    for i,d in enumerate(data):
-        d['corners'] = []
-        for j, img in enumerate(d['imgs']):
-            result=cv2.aruco.detectMarkers(img.astype(np.uint8), dictionary=aruco_dict, parameters=aruco_param)
-            corners, idx, rej = result
-            if idx is not None and target_idx in idx:
-                corner_i = idx.squeeze(axis=1).tolist().index(target_idx)
-                target_corner=corners[corner_i][0,0,:].tolist()
-                d['corners'].append(target_corner)
-            else:
-                d['corners'].append(None)
+    imgs = [img for d in data for img in d['imgs']]
+    hashes = [_image_hash(img) for img in imgs] if cache_dir is not None else None
+
+    detections = [None] * len(imgs)
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        for k, h in enumerate(hashes):
+            cache_file = os.path.join(cache_dir, f'{h}.json')
+            if os.path.exists(cache_file):
+                with open(cache_file, 'r') as f:
+                    detections[k] = {int(marker_id): corner for marker_id, corner in json.load(f).items()}
+
+    todo = [k for k, detection in enumerate(detections) if detection is None]
+    num_workers = min(num_workers or 1, len(todo))
+    if num_workers > 1:
+        results = _detect_marker_corners_parallel([imgs[k] for k in todo], num_workers)
+    else:
+        results = [detect_marker_corners(imgs[k]) for k in todo]
+
+    for k, marker_corners in zip(todo, results):
+        detections[k] = marker_corners
+        if cache_dir is not None:
+            cache_file = os.path.join(cache_dir, f'{hashes[k]}.json')
+            with open(cache_file + '.tmp', 'w') as f:
+                json.dump(marker_corners, f)
+            os.replace(cache_file + '.tmp', cache_file)
+
+    detections = iter(detections)
+    for d in data:
+        d['corners'] = [next(detections).get(target_idx) for _ in d['imgs']]
     return data
 
 
@@ -65,6 +127,36 @@ def rotmat(v):
     return torch.matrix_exp(v_ss)
 
 
+def batch_rotmat(v, eps=1e-8):
+    """
+    Rodrigues formula over the last dimension, (..., 3) rotvecs -> (..., 3, 3) rotation matrices
+    pytorch backward() compatible, including at zero rotation
+    """
+    theta2 = (v * v).sum(-1)[..., None, None]
+    small = theta2 < eps
+    theta2_safe = torch.where(small, torch.ones_like(theta2), theta2)
+    theta_safe = theta2_safe.sqrt()
+    # sin(theta)/theta, (1-cos(theta))/theta^2, with their Taylor expansions near zero
+    a = torch.where(small, 1 - theta2 / 6, torch.sin(theta_safe) / theta_safe)
+    b = torch.where(small, 0.5 - theta2 / 24, (1 - torch.cos(theta_safe)) / theta2_safe)
+
+    zero = torch.zeros_like(v[..., 0])
+    v_ss = torch.stack([
+        zero, -v[..., 2], v[..., 1],
+        v[..., 2], zero, -v[..., 0],
+        -v[..., 1], v[..., 0], zero,
+    ], dim=-1).reshape(v.shape[:-1] + (3, 3))
+    eye = torch.eye(3, dtype=v.dtype, device=v.device)
+    return eye + a * v_ss + b * v_ss.matmul(v_ss)
+
+
+def _transform(m, v):
+    """
+    (..., 3, 3) matrices times (..., 3) vectors, broadcasting over the leading dimensions
+    """
+    return m.matmul(v.unsqueeze(-1)).squeeze(-1)
+
+
 
 # TODO: use fairotag.camera.Camera._intrinsic
 def build_proj_matrix(fx, fy, ppx, ppy, coeff=None):
@@ -74,40 +166,88 @@ def build_proj_matrix(fx, fy, ppx, ppy, coeff=None):
                                 [0., 0.,  1.]])
 
 
+# Projection functions take either a single sample (param: 9, pos/ori: 3, K: 3x3) or
+# a batch of samples with matching leading dimensions (param: Nx9 or 9, pos/ori: Nx3, K: Nx3x3 or 3x3)
 def hand_marker_proj_world_camera(param, pos_ee_base, ori_ee_base, K):
-    camera_base_ori = param[:3]
-    camera_base_pos = param[3:6]
-    p_marker_ee = param[6:9]
-    p_marker_camera = rotmat(-camera_base_ori).matmul(
-            (rotmat(ori_ee_base).matmul(p_marker_ee) + pos_ee_base)-camera_base_pos)
-    p_marker_image = K.matmul(p_marker_camera)
-    return p_marker_image[:2]/p_marker_image[2]
+    camera_base_ori = param[..., :3]
+    camera_base_pos = param[..., 3:6]
+    p_marker_ee = param[..., 6:9]
+    p_marker_camera = _transform(batch_rotmat(-camera_base_ori),
+            (_transform(batch_rotmat(ori_ee_base), p_marker_ee) + pos_ee_base)-camera_base_pos)
+    p_marker_image = _transform(K, p_marker_camera)
+    return p_marker_image[..., :2]/p_marker_image[..., 2:]
 
 def world_marker_proj_hand_camera(param, pos_ee_base, ori_ee_base, K):
-    ori_camera_ee = param[:3]
-    pos_camera_ee = param[3:6]
-    pos_marker_base = param[6:9]
-    pos_marker_camera = rotmat(-ori_camera_ee).matmul(
-            (rotmat(-ori_ee_base).matmul(pos_marker_base - pos_ee_base)-pos_camera_ee))
-    pos_marker_image = K.matmul(pos_marker_camera)
-    return pos_marker_image[:2]/pos_marker_image[2]
+    ori_camera_ee = param[..., :3]
+    pos_camera_ee = param[..., 3:6]
+    pos_marker_base = param[..., 6:9]
+    pos_marker_camera = _transform(batch_rotmat(-ori_camera_ee),
+            (_transform(batch_rotmat(-ori_ee_base), pos_marker_base - pos_ee_base)-pos_camera_ee))
+    pos_marker_image = _transform(K, pos_marker_camera)
+    return pos_marker_image[..., :2]/pos_marker_image[..., 2:]
 
 
 def pointloss(param, obs_marker_2d, pos_ee_base, ori_ee_base, K, proj_func):
     proj_marker_2d = proj_func(param, pos_ee_base, ori_ee_base, K)
-    return (obs_marker_2d - proj_marker_2d).norm()
+    return (obs_marker_2d - proj_marker_2d).norm(dim=-1)
 
 
+"""
+Observations stacked into tensors
+    corners: Nx2 marker corner in image
+    pos: Nx3 end-effector position in base frame
+    ori: Nx3 end-effector orientation (rotvec) in base frame
+    camera_idx: N camera index of each observation (multi-camera solve)
+    marker_idx: N marker index of each observation (multi-marker solve)
+"""
+ObsData = namedtuple('ObsData', field_names=['corners', 'pos', 'ori', 'camera_idx', 'marker_idx'],
+                     defaults=[None, None])
+
+
+def stack_obs_data(data, camera_idx=0, marker_idx=0):
+    """
+        data: [(corner, pos, ori)]
+        return: ObsData of the stacked samples, all observed by camera_idx & of marker_idx
+    """
+    n = len(data)
+    return ObsData(
+        corners=torch.stack([d[0] for d in data]),
+        pos=torch.stack([d[1] for d in data]),
+        ori=torch.stack([d[2] for d in data]),
+        camera_idx=torch.full((n,), camera_idx, dtype=torch.long),
+        marker_idx=torch.full((n,), marker_idx, dtype=torch.long))
+
+
+def cat_obs_data(obs_data_list):
+    """
+    Concatenate ObsData (e.g. one per camera & marker) into a single ObsData for a joint solve
+    """
+    return ObsData(*[torch.cat(field) for field in zip(*obs_data_list)])
+
 
 def mean_loss(data, param, K, proj_func=hand_marker_proj_world_camera):
-    losses = []
-    for d in data:
-        corner = d[0]
-        ee_base_pos = d[1]
-        ee_base_ori = d[2]
-        ploss = pointloss(param, corner, ee_base_pos, ee_base_ori, K, proj_func)
-        losses.append(ploss)
-    return torch.stack(losses).mean()
+    """
+        data: ObsData, or [(corner, pos, ori)] (stacked on every call, prefer stacking once)
+        return: mean reprojection error in pixels
+    """
+    if not isinstance(data, ObsData):
+        data = stack_obs_data(data)
+    return pointloss(param, data.corners, data.pos, data.ori, K, proj_func).mean()
+
+
+def multi_mean_loss(data, param, Ks, proj_func=hand_marker_proj_world_camera):
+    """
+    Joint loss over several cameras & markers
+        data: ObsData with camera_idx & marker_idx
+        param: [rx, ry, rz, x, y, z] of each camera, followed by [px, py, pz] of each marker
+        Ks: Cx3x3 projection matrix of each camera
+        return: mean reprojection error in pixels
+    """
+    num_of_camera = len(Ks)
+    camera_params = param[:num_of_camera * 6].reshape(num_of_camera, 6)
+    marker_params = param[num_of_camera * 6:].reshape(-1, 3)
+    sample_param = torch.cat([camera_params[data.camera_idx], marker_params[data.marker_idx]], dim=-1)
+    return pointloss(sample_param, data.corners, data.pos, data.ori, Ks[data.camera_idx], proj_func).mean()
 
 def find_parameter(param, L):
     optimizer=torch.optim.LBFGS([param], max_iter=1000, lr=1, line_search_fn='strong_wolfe')
@@ -121,7 +261,11 @@ def find_parameter(param, L):
     return param.detach()
 
 
-def sim_data(n, K, noise_std=0):
+def sim_data(n, K, noise_std=0, camera_yaw=0., p_marker_ee=(0., 0., 0.2)):
+    """
+    camera_yaw: rotates the camera about the base z axis (cameras all look at the robot)
+    p_marker_ee: marker position on ee frame
+    """
     from torchcontrol.transform import Rotation as R
     from torchcontrol.transform import Transformation as T
     #  z                 marker
@@ -137,10 +281,13 @@ def sim_data(n, K, noise_std=0):
     D=2.0 #camera-distance to robot base
     H=0.2
     get_ee = lambda q: torch.DoubleTensor([L * math.cos(q), L * math.sin(q), H])
-    p_marker_0=torch.DoubleTensor([0., 0., 0.2]) #marker position on ee frame
+    p_marker_0=torch.DoubleTensor(p_marker_ee) #marker position on ee frame
     T_camera_ee = T.from_rot_xyz(
                 rotation=R.from_rotvec(torch.DoubleTensor([-math.pi/2, 0, 0])) * R.from_rotvec(torch.DoubleTensor([0, -math.pi/2, 0])),  # camera orientation
                 translation=torch.DoubleTensor([D, 0., 0.]))  # camera position
+    T_camera_ee = T.from_rot_xyz(
+                rotation=R.from_rotvec(torch.DoubleTensor([0., 0., camera_yaw])),
+                translation=torch.zeros(3, dtype=torch.float64)) * T_camera_ee
     gt_param = torch.cat([T_camera_ee.rotation().as_rotvec(), T_camera_ee.translation(), p_marker_0])
     data=[]
     for i in range(n):
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# Copyright (c) Meta Platforms, Inc. and affiliates.
+# All rights reserved.
+
+# This source code is licensed under the license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""
+Compare the per-sample loss loop against the batched loss on sim_data, for a single
+loss+backward evaluation and for a full find_parameter solve.
+"""
+
+import time
+import argparse
+
+import torch
+
+from eyehandcal.utils import build_proj_matrix, sim_data, mean_loss, pointloss, find_parameter, \
+    stack_obs_data, hand_marker_proj_world_camera
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--num-samples', default=[100, 1000], type=int, nargs='+')
+parser.add_argument('--repeat', default=20, type=int, help="number of loss+backward evaluations to average")
+args = parser.parse_args()
+
+
+def per_sample_loss(data, param, K):
+    return torch.stack([
+        pointloss(param, corner, pos, ori, K, hand_marker_proj_world_camera) for corner, pos, ori in data
+    ]).mean()
+
+
+def time_loss(L, repeat):
+    param = torch.zeros(9, dtype=torch.float64, requires_grad=True)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        L(param).backward()
+    return (time.perf_counter() - start) / repeat
+
+
+def time_solve(L):
+    torch.manual_seed(0)
+    param = torch.zeros(9, dtype=torch.float64, requires_grad=True)
+    start = time.perf_counter()
+    param_star = find_parameter(param, L)
+    return time.perf_counter() - start, L(param_star).item()
+
+
+K = build_proj_matrix(fx=613.9306030273438,  fy=614.3072713216146, ppx=322.1438802083333, ppy=241.59906514485678)
+for n in args.num_samples:
+    obs_data_std, gt_param = sim_data(n=n, K=K, noise_std=5.0)
+    obs_data = stack_obs_data(obs_data_std)
+    losses = {
+        'per-sample': lambda param: per_sample_loss(obs_data_std, param, K),
+        'batched': lambda param: mean_loss(obs_data, param, K),
+    }
+    for name, L in losses.items():
+        loss_time = time_loss(L, args.repeat)
+        solve_time, final_loss = time_solve(L)
+        print(f'n={n:5d} {name:>10s}: loss+backward {loss_time * 1e3:8.2f} ms  '
+              f'solve {solve_time:7.2f} s  final loss {final_loss:.3f}')
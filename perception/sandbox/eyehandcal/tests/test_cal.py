@@ -8,6 +8,7 @@
 import os
 import pickle
 import json
+import math
 
 import torch
 torch.set_printoptions(linewidth=160)
@@ -15,7 +16,8 @@ import matplotlib.pyplot as plt
 import pytest
 
 from eyehandcal.utils import detect_corners, build_proj_matrix, sim_data, mean_loss, \
-    quat2rotvec, find_parameter, rotmat, hand_marker_proj_world_camera, uncompress_image
+    quat2rotvec, find_parameter, rotmat, hand_marker_proj_world_camera, uncompress_image, \
+    world_marker_proj_hand_camera, batch_rotmat, pointloss, stack_obs_data, cat_obs_data, multi_mean_loss
 
 localpath=os.path.abspath(os.path.dirname(__file__))
 
@@ -40,6 +42,55 @@ def test_with_sim_data():
     print('truth param loss', L(gt_param).item(), gt_param)
 
 
+def test_batch_rotmat():
+    v = torch.randn(10, 3, dtype=torch.float64)
+    v[0] = 0.
+    R = batch_rotmat(v)
+    for i in range(len(v)):
+        assert torch.allclose(R[i], rotmat(v[i]))
+
+    # gradient is finite at zero rotation
+    v = torch.zeros(3, dtype=torch.float64, requires_grad=True)
+    batch_rotmat(v).sum().backward()
+    assert torch.isfinite(v.grad).all()
+
+
+@pytest.mark.parametrize("proj_func", [hand_marker_proj_world_camera, world_marker_proj_hand_camera])
+def test_batched_loss_matches_per_sample(proj_func):
+    K = build_proj_matrix(fx=613.9306030273438,  fy=614.3072713216146, ppx=322.1438802083333, ppy=241.59906514485678)
+    obs_data_std, gt_param = sim_data(n=20, K=K, noise_std=5.0)
+    param = gt_param + torch.randn_like(gt_param) * 0.1
+
+    per_sample_loss = torch.stack([
+        pointloss(param, corner, pos, ori, K, proj_func) for corner, pos, ori in obs_data_std]).mean()
+    assert torch.allclose(mean_loss(stack_obs_data(obs_data_std), param, K, proj_func), per_sample_loss)
+    assert torch.allclose(mean_loss(obs_data_std, param, K, proj_func), per_sample_loss)
+
+
+def test_with_multi_camera_sim_data():
+    K = build_proj_matrix(fx=613.9306030273438,  fy=614.3072713216146, ppx=322.1438802083333, ppy=241.59906514485678)
+
+    noise_sigma = 5.0
+    obs_data_list = []
+    gt_camera_params = []
+    camera_yaws = [0., math.pi / 4, -math.pi / 4]
+    for camera_idx, camera_yaw in enumerate(camera_yaws):
+        obs_data_std, gt_param = sim_data(n=100, K=K, noise_std=noise_sigma, camera_yaw=camera_yaw)
+        obs_data_list.append(stack_obs_data(obs_data_std, camera_idx=camera_idx))
+        gt_camera_params.append(gt_param[:6])
+    obs_data = cat_obs_data(obs_data_list)
+    Ks = K.expand(len(camera_yaws), 3, 3)
+    gt_param = torch.cat(gt_camera_params + [gt_param[6:9]])
+
+    # initialize near the truth, the joint problem shares the marker across cameras
+    param = (gt_param + torch.randn_like(gt_param) * 0.05).requires_grad_(True)
+    L = lambda param: multi_mean_loss(obs_data, param, Ks)
+    param_star = find_parameter(param, L)
+
+    assert L(param_star) < noise_sigma * 2
+    assert torch.allclose(param_star, gt_param, atol=0.05)
+
+
 @pytest.fixture(scope='module')
 def collected_data():
     # please download from https://drive.google.com/file/d/1w-2jA6jEMqmhrGqt33ClKc_jGCUuyZnL/view?usp=sharing
@@ -54,6 +105,20 @@ def data_with_corners(collected_data):
     data_with_corners = detect_corners(collected_data)
     return data_with_corners
 
+def test_detect_corners_parallel_and_cached(collected_data, tmp_path):
+    serial = [d['corners'] for d in detect_corners(collected_data, num_workers=1)]
+    parallel = [d['corners'] for d in detect_corners(collected_data, num_workers=4, cache_dir=tmp_path)]
+    assert parallel == serial
+    assert len(os.listdir(tmp_path)) == sum(len(d['imgs']) for d in collected_data)
+
+    # cached detections are reused for any marker, without detecting again
+    cached = [d['corners'] for d in detect_corners(collected_data, num_workers=0, cache_dir=tmp_path)]
+    assert cached == serial
+    other_marker = [d['corners'] for d in detect_corners(collected_data, target_idx=0, num_workers=1)]
+    cached_other_marker = [d['corners'] for d in detect_corners(collected_data, target_idx=0, cache_dir=tmp_path)]
+    assert cached_other_marker == other_marker
+
+
 def test_plot_corners(data_with_corners):
     corner_count = 0
     for i, d in enumerate(data_with_corners[:3]):
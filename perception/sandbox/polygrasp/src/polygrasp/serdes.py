@@ -67,6 +67,11 @@ def bytes_to_open3d_pcd(arr_bytes: bytes):
 
 """Capnp conversions"""
 
+# Arrays go through np.save in the data field rather than fairomsg.numpy_bridge:
+# the bridge only serializes faster when a message is refilled for arrays of
+# one size, and the arrays here change size from call to call. np.load also
+# gives writable arrays of any dtype, bool masks included.
+
 
 def pcd_to_capnp(pcd: o3d.geometry.PointCloud):
     result = sensor_msgs.PointCloud2()
@@ -6,7 +6,9 @@
 #define polymetis_SERVER_H
 
 #include "spdlog/spdlog.h"
+#include <atomic>
 #include <chrono>
+#include <condition_variable>
 #include <fstream>
 #include <mutex>
 #include <string>
@@ -21,6 +23,7 @@
 
 #include "polymetis.grpc.pb.h"
 
+#include "polymetis/robot_state_record.h"
 #include "polymetis/utils.h"
 #include "torch_server_ops.hpp"
 #include "yaml-cpp/yaml.h"
@@ -30,6 +33,9 @@
 #define THRESHOLD_NS 1500000000         // 1.5s
 #define SPIN_INTERVAL_USEC 5000        // 0.005s (200hz)
 #define RT_LOW_PRIO 40
+#define MAX_CACHED_CONTROLLERS 16
+#define DEFAULT_STATE_BATCH_SIZE 100
+#define DEFAULT_LOG_CHUNK_SIZE 1000
 
 using grpc::Server;
 using grpc::ServerBuilder;
@@ -54,13 +60,34 @@ enum ControllerStatus {
 /**
 TODO
 */
+enum PendingUpdate { NO_UPDATE, PARAM_DICT_UPDATE, PARAM_TENSOR_UPDATE };
+
+/**
+State of the custom controller. The controller is only ever replaced or
+updated by the control loop, at the start of a tick: the RPCs prepare new
+controllers & parameters on their own thread and hand them over through the
+atomic "pending" fields, so that neither side waits for the other.
+*/
 struct CustomControllerContext {
   uint episode_begin = -1;
   uint episode_end = -1;
   uint timestep = 0;
-  ControllerStatus status = UNINITIALIZED;
-  std::mutex controller_mtx;
+  std::atomic<ControllerStatus> status{UNINITIALIZED};
   std::unique_ptr<TorchScriptedController> custom_controller;
+
+  // Controller to switch to, and the controller it replaced, to be freed by
+  // the RPC that published the new one
+  std::atomic<TorchScriptedController *> pending_controller{nullptr};
+  std::atomic<TorchScriptedController *> retired_controller{nullptr};
+
+  // Incremented every time a new controller is set, so that parameter updates
+  // can be matched against the controller whose schema they were built for
+  uint64_t controller_id = 0;
+
+  // Parameters staged in custom_controller, and the log index at which the
+  // control loop applied them (-1 on failure)
+  std::atomic<PendingUpdate> pending_update{NO_UPDATE};
+  uint update_index = -1;
 };
 
 /**
@@ -107,6 +134,14 @@ public:
   Status ControlUpdate(ServerContext *context, const RobotState *robot_state,
                        TorqueCommand *torque_command) override;
 
+  /**
+  Runs ControlUpdate on each robot state read from the stream & writes back
+  the torque commands, without the per-call overhead of unary RPCs.
+  */
+  Status
+  ControlStream(ServerContext *context,
+                ServerReaderWriter<TorqueCommand, RobotState> *stream) override;
+
   // User client methods
 
   /**
@@ -127,12 +162,30 @@ public:
   Status GetRobotStateStream(ServerContext *context, const Empty *,
                              ServerWriter<RobotState> *writer) override;
 
+  /**
+  Streams every `stride`-th new robot state as they are recorded. A subscriber
+  that falls behind gets all the states it missed in a single batch, and
+  states overwritten in the log before being sent are counted as dropped.
+  */
+  Status SubscribeRobotState(ServerContext *context,
+                             const RobotStateStreamRequest *request,
+                             ServerWriter<RobotStateBatch> *writer) override;
+
   /**
   TODO
   */
   Status GetRobotStateLog(ServerContext *context, const LogInterval *interval,
                           ServerWriter<RobotState> *writer) override;
 
+  /**
+  Streams the robot states of a log interval in chunks of columns, one per
+  field, each packed into a single block of bytes.
+  */
+  Status
+  GetRobotStateLogChunked(ServerContext *context,
+                          const RobotStateLogRequest *request,
+                          ServerWriter<RobotStateLogChunk> *writer) override;
+
   /**
   TODO
   */
@@ -140,6 +193,15 @@ public:
                        ServerReader<ControllerChunk> *stream,
                        LogInterval *interval) override;
 
+  /**
+  Switches to a controller cached by an earlier SetController call, with new
+  values for some of its attributes. Fails with NOT_FOUND if the digest is not
+  (or no longer) cached.
+  */
+  Status SetCachedController(ServerContext *context,
+                             const CachedController *cached_controller,
+                             LogInterval *interval) override;
+
   /**
   TODO
   */
@@ -147,6 +209,21 @@ public:
                           ServerReader<ControllerChunk> *stream,
                           LogInterval *interval) override;
 
+  /**
+  Returns the names & shapes of the current controller's parameters.
+  */
+  Status GetControllerParamSchema(ServerContext *context, const Empty *,
+                                  ParamSchema *schema) override;
+
+  /**
+  Updates parameters of the current controller in place from a flat float32
+  payload laid out according to GetControllerParamSchema. Unlike
+  UpdateController, no TorchScript module is deserialized.
+  */
+  Status UpdateControllerParams(ServerContext *context,
+                                const ParamUpdate *update,
+                                LogInterval *interval) override;
+
   /**
   TODO
   */
@@ -159,7 +236,36 @@ public:
   Status GetEpisodeInterval(ServerContext *context, const Empty *,
                             LogInterval *interval) override;
 
+  /**
+  Writes the episode interval once, then every time it changes.
+  */
+  Status StreamEpisodeInterval(ServerContext *context, const Empty *,
+                               ServerWriter<LogInterval> *writer) override;
+
 private:
+  // Switch in new_controller & wait for its first step
+  void switchController(
+      std::unique_ptr<TorchScriptedController> &new_controller,
+      LogInterval *interval);
+
+  // Publish the parameters staged in the custom controller & wait for the
+  // control loop to apply them
+  Status publishUpdate(PendingUpdate update, LogInterval *interval);
+
+  // Wait (at most SPIN_INTERVAL_USEC) for the control loop to change the
+  // episode markers or to pick up a pending controller or update
+  void waitForControlLoop();
+
+  // Wait (at most SPIN_INTERVAL_USEC) for the robot state at `index` to be
+  // recorded
+  void waitForRobotState(ulong index);
+
+  // Copy a field of an incoming RobotState into the controller input
+  void updateStateField(TorchRobotState::Field field,
+                        const google::protobuf::RepeatedField<float> &values) {
+    torch_robot_state_->update_field(field, values.data(), values.size());
+  }
+
   std::vector<char> controller_model_buffer_; // buffer for loading controllers
   std::vector<char>
       updates_model_buffer_; // buffer for loading controller update params
@@ -168,12 +274,23 @@ private:
 
   std::mutex service_mtx_;
 
-  CircularBuffer<RobotState> robot_state_buffer_ =
-      CircularBuffer<RobotState>(MAX_CIRCULAR_BUFFER_SIZE);
+  CircularBuffer<RobotStateRecord> robot_state_buffer_ =
+      CircularBuffer<RobotStateRecord>(MAX_CIRCULAR_BUFFER_SIZE);
 
   CustomControllerContext custom_controller_context_;
   RobotClientContext robot_client_context_;
 
+  TorchModuleCache controller_cache_{MAX_CACHED_CONTROLLERS};
+
+  // Signalled by the control loop when an episode starts or ends, and when it
+  // picks up a pending controller or update
+  std::mutex control_loop_mtx_;
+  std::condition_variable control_loop_cv_;
+
+  // Signalled by the control loop when a robot state is recorded
+  std::mutex robot_state_mtx_;
+  std::condition_variable robot_state_cv_;
+
   std::unique_ptr<TorchRobotState> torch_robot_state_;
 };
 
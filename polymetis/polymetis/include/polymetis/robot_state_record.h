@@ -0,0 +1,223 @@
+// Copyright (c) Facebook, Inc. and its affiliates.
+
+// This source code is licensed under the MIT license found in the
+// LICENSE file in the root directory of this source tree.
+#ifndef POLYMETIS_ROBOT_STATE_RECORD_H
+#define POLYMETIS_ROBOT_STATE_RECORD_H
+
+#include <algorithm>
+#include <cstdint>
+#include <limits>
+#include <string>
+#include <vector>
+
+#include "polymetis.grpc.pb.h"
+
+#define MAX_RECORD_DOFS 16
+#define EE_POSE_SIZE 16
+
+/**
+Fixed-size, trivially copyable copy of a RobotState, as kept in the state log
+of the server. Per-joint fields hold at most MAX_RECORD_DOFS values. The mass
+matrix & Jacobian are only used by the controller of the current tick and are
+not recorded.
+*/
+struct RobotStateRecord {
+  enum Field {
+    JOINT_POSITIONS,
+    JOINT_VELOCITIES,
+    JOINT_TORQUES_COMPUTED,
+    PREV_JOINT_TORQUES_COMPUTED,
+    PREV_JOINT_TORQUES_COMPUTED_SAFENED,
+    MOTOR_TORQUES_MEASURED,
+    MOTOR_TORQUES_EXTERNAL,
+    MOTOR_TORQUES_DESIRED,
+    NUM_FIELDS
+  };
+
+  int64_t timestamp_seconds;
+  int32_t timestamp_nanos;
+  float prev_controller_latency_ms;
+  bool prev_command_successful;
+  int32_t error_code;
+
+  uint8_t sizes[NUM_FIELDS];
+  float values[NUM_FIELDS][MAX_RECORD_DOFS];
+  uint8_t ee_pose_size;
+  float ee_pose[EE_POSE_SIZE];
+};
+
+// RobotState names of the RobotStateRecord::Field fields, in order
+static const char *const RECORD_FIELD_NAMES[RobotStateRecord::NUM_FIELDS] = {
+    "joint_positions",
+    "joint_velocities",
+    "joint_torques_computed",
+    "prev_joint_torques_computed",
+    "prev_joint_torques_computed_safened",
+    "motor_torques_measured",
+    "motor_torques_external",
+    "motor_torques_desired",
+};
+
+using RepeatedFloat = google::protobuf::RepeatedField<float>;
+
+// RobotState accessors of the RobotStateRecord::Field fields, in order
+inline const RepeatedFloat &recordField(const RobotState &robot_state,
+                                        int field) {
+  switch (field) {
+  case RobotStateRecord::JOINT_POSITIONS:
+    return robot_state.joint_positions();
+  case RobotStateRecord::JOINT_VELOCITIES:
+    return robot_state.joint_velocities();
+  case RobotStateRecord::JOINT_TORQUES_COMPUTED:
+    return robot_state.joint_torques_computed();
+  case RobotStateRecord::PREV_JOINT_TORQUES_COMPUTED:
+    return robot_state.prev_joint_torques_computed();
+  case RobotStateRecord::PREV_JOINT_TORQUES_COMPUTED_SAFENED:
+    return robot_state.prev_joint_torques_computed_safened();
+  case RobotStateRecord::MOTOR_TORQUES_MEASURED:
+    return robot_state.motor_torques_measured();
+  case RobotStateRecord::MOTOR_TORQUES_EXTERNAL:
+    return robot_state.motor_torques_external();
+  default:
+    return robot_state.motor_torques_desired();
+  }
+}
+
+inline RepeatedFloat *mutableRecordField(RobotState *robot_state, int field) {
+  switch (field) {
+  case RobotStateRecord::JOINT_POSITIONS:
+    return robot_state->mutable_joint_positions();
+  case RobotStateRecord::JOINT_VELOCITIES:
+    return robot_state->mutable_joint_velocities();
+  case RobotStateRecord::JOINT_TORQUES_COMPUTED:
+    return robot_state->mutable_joint_torques_computed();
+  case RobotStateRecord::PREV_JOINT_TORQUES_COMPUTED:
+    return robot_state->mutable_prev_joint_torques_computed();
+  case RobotStateRecord::PREV_JOINT_TORQUES_COMPUTED_SAFENED:
+    return robot_state->mutable_prev_joint_torques_computed_safened();
+  case RobotStateRecord::MOTOR_TORQUES_MEASURED:
+    return robot_state->mutable_motor_torques_measured();
+  case RobotStateRecord::MOTOR_TORQUES_EXTERNAL:
+    return robot_state->mutable_motor_torques_external();
+  default:
+    return robot_state->mutable_motor_torques_desired();
+  }
+}
+
+/**
+Copies a RobotState into a record, without allocating.
+*/
+inline void toRecord(const RobotState &robot_state, RobotStateRecord *record) {
+  record->timestamp_seconds = robot_state.timestamp().seconds();
+  record->timestamp_nanos = robot_state.timestamp().nanos();
+  record->prev_controller_latency_ms = robot_state.prev_controller_latency_ms();
+  record->prev_command_successful = robot_state.prev_command_successful();
+  record->error_code = robot_state.error_code();
+
+  for (int field = 0; field < RobotStateRecord::NUM_FIELDS; field++) {
+    const RepeatedFloat &values = recordField(robot_state, field);
+    int size = std::min(values.size(), MAX_RECORD_DOFS);
+    std::copy(values.begin(), values.begin() + size, record->values[field]);
+    record->sizes[field] = size;
+  }
+
+  int ee_pose_size = std::min(robot_state.ee_pose().size(), EE_POSE_SIZE);
+  std::copy(robot_state.ee_pose().begin(),
+            robot_state.ee_pose().begin() + ee_pose_size, record->ee_pose);
+  record->ee_pose_size = ee_pose_size;
+}
+
+/**
+Fills an empty RobotState from a record.
+*/
+inline void fromRecord(const RobotStateRecord &record, RobotState *robot_state) {
+  robot_state->mutable_timestamp()->set_seconds(record.timestamp_seconds);
+  robot_state->mutable_timestamp()->set_nanos(record.timestamp_nanos);
+  robot_state->set_prev_controller_latency_ms(record.prev_controller_latency_ms);
+  robot_state->set_prev_command_successful(record.prev_command_successful);
+  robot_state->set_error_code(record.error_code);
+
+  for (int field = 0; field < RobotStateRecord::NUM_FIELDS; field++) {
+    mutableRecordField(robot_state, field)
+        ->Add(record.values[field], record.values[field] + record.sizes[field]);
+  }
+  robot_state->mutable_ee_pose()->Add(record.ee_pose,
+                                      record.ee_pose + record.ee_pose_size);
+}
+
+/**
+Adds a column of `num_states` x `width` values to a log chunk, or of
+`num_states` values if `width` is negative, & returns its data to fill in.
+*/
+template <typename T>
+inline T *addLogColumn(RobotStateLogChunk *chunk, const char *name,
+                       const char *dtype, int num_states, int width = -1) {
+  RobotStateColumn *column = chunk->add_columns();
+  column->set_name(name);
+  TensorData *values = column->mutable_values();
+  values->set_dtype(dtype);
+  values->add_shape(num_states);
+  if (width >= 0) {
+    values->add_shape(width);
+  }
+
+  // Values are written in host byte order, which is little-endian on all
+  // supported platforms
+  std::string *data = values->mutable_data();
+  data->resize(sizeof(T) * num_states * (width >= 0 ? width : 1));
+  return reinterpret_cast<T *>(&(*data)[0]);
+}
+
+/**
+Packs records into the columns of an empty log chunk. Each repeated field is
+as wide as its largest size in the chunk, shorter rows are padded with NaN.
+*/
+inline void toLogChunk(const std::vector<const RobotStateRecord *> &records,
+                       RobotStateLogChunk *chunk) {
+  int num_states = records.size();
+  chunk->set_num_states(num_states);
+
+  int64_t *seconds = addLogColumn<int64_t>(chunk, "timestamp_seconds",
+                                           "int64", num_states);
+  int32_t *nanos =
+      addLogColumn<int32_t>(chunk, "timestamp_nanos", "int32", num_states);
+  float *latencies = addLogColumn<float>(chunk, "prev_controller_latency_ms",
+                                         "float32", num_states);
+  bool *successes = addLogColumn<bool>(chunk, "prev_command_successful",
+                                       "bool", num_states);
+  int32_t *error_codes =
+      addLogColumn<int32_t>(chunk, "error_code", "int32", num_states);
+  for (int i = 0; i < num_states; i++) {
+    seconds[i] = records[i]->timestamp_seconds;
+    nanos[i] = records[i]->timestamp_nanos;
+    latencies[i] = records[i]->prev_controller_latency_ms;
+    successes[i] = records[i]->prev_command_successful;
+    error_codes[i] = records[i]->error_code;
+  }
+
+  for (int field = 0; field <= RobotStateRecord::NUM_FIELDS; field++) {
+    bool is_ee_pose = field == RobotStateRecord::NUM_FIELDS;
+    const char *name = is_ee_pose ? "ee_pose" : RECORD_FIELD_NAMES[field];
+
+    int width = 0;
+    for (const RobotStateRecord *record : records) {
+      width = std::max<int>(width, is_ee_pose ? record->ee_pose_size
+                                              : record->sizes[field]);
+    }
+
+    float *values =
+        addLogColumn<float>(chunk, name, "float32", num_states, width);
+    std::fill(values, values + num_states * width,
+              std::numeric_limits<float>::quiet_NaN());
+    for (int i = 0; i < num_states; i++) {
+      const float *row =
+          is_ee_pose ? records[i]->ee_pose : records[i]->values[field];
+      int size =
+          is_ee_pose ? records[i]->ee_pose_size : records[i]->sizes[field];
+      std::copy(row, row + size, values + i * width);
+    }
+  }
+}
+
+#endif
@@ -7,41 +7,53 @@
 
 #include <chrono>
 #include <istream>
+#include <memory>
 #include <streambuf>
 #include <vector>
 
 #include "polymetis.grpc.pb.h"
 
 /**
-Circular buffer class. Preallocates a std::vector with a certain capacity, then
+Circular buffer class. Preallocates storage for a certain capacity, then wraps
 around. Returns NULL* if attempting to an element that is too stale (i.e. when
 buffer is above capacity, it drops the earliest elements).
+
+Elements are default-initialized, so the memory of a buffer of trivial types
+(such as RobotStateRecord) is only touched as it is filled. Writers can fill the
+next element in place through next() & commit() instead of copying it in.
 */
 template <typename T> class CircularBuffer {
 private:
-  std::vector<T> elems;
+  std::unique_ptr<T[]> elems;
+  std::size_t capacity_;
   ulong index = 0;
 
 public:
-  CircularBuffer<T>(int capacity) { elems.reserve(capacity); }
+  CircularBuffer<T>(int capacity)
+      : elems(new T[capacity]), capacity_(capacity) {}
 
-  std::size_t capacity() { return elems.capacity(); }
+  std::size_t capacity() { return capacity_; }
 
-  void clear() {
-    index = 0;
-    elems.clear();
-  }
+  void clear() { index = 0; }
 
-  void append(T elem) {
-    elems[index % capacity()] = elem;
-    index++;
+  void append(const T &elem) {
+    *next() = elem;
+    commit();
   }
 
+  /**
+  Returns the element to be appended next. It becomes visible to get() &
+  size() after commit().
+  */
+  T *next() { return &elems[index % capacity_]; }
+
+  void commit() { index++; }
+
   T *get(int i) {
-    if (i >= index || index - i > capacity()) {
+    if (i >= index || index - i > capacity_) {
       return NULL;
     }
-    return &elems[i % capacity()];
+    return &elems[i % capacity_];
   }
 
   ulong size() { return index; }
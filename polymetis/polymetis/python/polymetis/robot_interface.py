@@ -3,7 +3,8 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 import io
-from typing import Dict, Generator, List, Tuple
+from queue import Queue
+from typing import Callable, Dict, Generator, List, Optional, Tuple
 import time
 import tempfile
 import threading
@@ -13,11 +14,27 @@ from omegaconf import DictConfig
 import hydra
 
 import grpc  # This requires `conda install grpcio protobuf`
+import numpy as np
 import torch
 
 import polymetis
-from polymetis_pb2 import LogInterval, RobotState, ControllerChunk, Empty
+from polymetis_pb2 import (
+    LogInterval,
+    RobotState,
+    RobotStateLogRequest,
+    ControllerChunk,
+    CachedController,
+    Empty,
+    ParamUpdate,
+)
 from polymetis_pb2_grpc import PolymetisControllerServerStub
+from polymetis.utils.policy_cache import (
+    ScriptedPolicyCache,
+    policy_digest,
+    to_module_attribute,
+)
+from polymetis.utils.robot_state_log import chunks_to_columns, states_to_columns
+from polymetis.utils.robot_state_stream import RobotStateSample, RobotStateSubscription
 
 import torchcontrol as toco
 from torchcontrol.transform import Rotation as R
@@ -97,6 +114,22 @@ class BaseRobotInterface:
                 client_ver == server_ver
             ), "Version mismatch between client & server detected! Set enforce_version=False to bypass this error."
 
+        # Parameters of the current policy updatable through the tensor fast path,
+        # as {name: (index, shape, dtype)}, the server's id for the policy, and the
+        # log index at which the policy started
+        self._param_schema = None
+        self._controller_id = 0
+        self._episode_start = -1
+
+        # Parameter schemas of the policies sent so far, by digest (None if the
+        # server does not support tensor updates)
+        self._param_schemas = {}
+
+        # Scripted policies, and the digests of the policies cached by the server
+        # (None if the server does not support cached controllers)
+        self._policy_cache = ScriptedPolicyCache()
+        self._server_digests = set()
+
         self.use_mirror_sim = use_mirror_sim
         if use_mirror_sim:
             self.mirror_sim_client = hydra.utils.instantiate(mirror_cfg.robot_client)
@@ -108,9 +141,10 @@ class BaseRobotInterface:
         self.channel.close()
 
     @staticmethod
-    def _get_msg_generator(scripted_module) -> Generator:
+    def _get_msg_generator(scripted_module, module_digest: str = "") -> Generator:
         """Given a scripted module, return a generator of its serialized bits
-        as byte chunks of max size MAX_BYTES_PER_MSG."""
+        as byte chunks of max size MAX_BYTES_PER_MSG. If given, `module_digest`
+        is sent with the first chunk for the server to cache the module."""
         # Write into bytes buffer
         buffer = io.BytesIO()
         torch.jit.save(scripted_module, buffer)
@@ -120,11 +154,15 @@ class BaseRobotInterface:
         def msg_generator():
             # A generator which chunks a scripted module into messages of
             # size MAX_BYTES_PER_MSG and send these messages to the server.
+            digest = module_digest
             while True:
                 chunk = buffer.read(MAX_BYTES_PER_MSG)
                 if not chunk:  # end of buffer
                     break
-                msg = ControllerChunk(torchscript_binary_chunk=chunk)
+                msg = ControllerChunk(
+                    torchscript_binary_chunk=chunk, module_digest=digest
+                )
+                digest = ""
                 yield msg
 
         return msg_generator
@@ -143,22 +181,49 @@ class BaseRobotInterface:
 
         """
         robot_state_generator = self.grpc_connection.GetRobotStateLog(log_interval)
+        results, _ = self._read_log_stream(robot_state_generator, timeout)
+        return results
+
+    def _get_robot_state_log_columns(
+        self, log_interval: LogInterval, timeout: float = None
+    ) -> Dict[str, np.ndarray]:
+        """Same as `_get_robot_state_log`, as a dict of arrays (see `chunks_to_columns`)."""
+        chunk_generator = self.grpc_connection.GetRobotStateLogChunked(
+            RobotStateLogRequest(interval=log_interval)
+        )
+        chunks, error = self._read_log_stream(chunk_generator, timeout)
+        if error is not None and error.code() == grpc.StatusCode.UNIMPLEMENTED:
+            # Servers without chunked logs only stream RobotState messages
+            return states_to_columns(self._get_robot_state_log(log_interval, timeout))
+        return chunks_to_columns(chunks)
+
+    def _read_log_stream(
+        self, stream, timeout: float = None
+    ) -> Tuple[list, Optional[grpc.RpcError]]:
+        """Reads a stream of log messages, cancelling it at exit.
+
+        Returns:
+            The messages read & the error that terminated the stream, if any.
+        """
 
         def cancel_rpc():
             log.info("Cancelling attempt to get robot state log.")
-            robot_state_generator.cancel()
+            stream.cancel()
             log.info(f"Cancellation completed.")
 
         atexit.register(cancel_rpc)
 
         results = []
+        errors = []
 
         def read_stream():
             try:
-                for state in robot_state_generator:
-                    results.append(state)
+                for msg in stream:
+                    results.append(msg)
             except grpc.RpcError as e:
-                log.error(f"Unable to read stream of robot states: {e}")
+                if e.code() != grpc.StatusCode.UNIMPLEMENTED:
+                    log.error(f"Unable to read stream of robot states: {e}")
+                errors.append(e)
 
         read_thread = threading.Thread(target=read_stream)
         read_thread.start()
@@ -168,12 +233,38 @@ class BaseRobotInterface:
             raise TimeoutError("Operation timed out.")
         else:
             atexit.unregister(cancel_rpc)
-            return results
+            return results, errors[0] if errors else None
 
     def get_robot_state(self) -> RobotState:
         """Returns the latest RobotState."""
         return self.grpc_connection.GetRobotState(EMPTY)
 
+    def subscribe_robot_state(
+        self,
+        callback: Optional[Callable[[RobotStateSample], None]] = None,
+        queue: Optional[Queue] = None,
+        rate: Optional[float] = None,
+        stride: int = 1,
+    ) -> RobotStateSubscription:
+        """Subscribes to the stream of robot states instead of polling `get_robot_state`.
+
+        States are read on a background thread from a single streaming RPC.
+        Repeated fields are exposed as NumPy / torch views (see `RobotStateSample`).
+
+        Args:
+            callback: called with each delivered state, on the reader thread.
+            queue: queue receiving each delivered state; states that do not fit are dropped.
+            rate: maximum delivery rate (Hz) to the callback / queue. Defaults to every state.
+            stride: only every `stride`-th state is sent by the server.
+
+        Returns:
+            A `RobotStateSubscription` giving access to the latest state and the
+            received / dropped / latency counters. Call `close()` to unsubscribe.
+        """
+        return RobotStateSubscription(
+            self.channel, callback=callback, queue=queue, rate=rate, stride=stride
+        )
+
     def get_previous_interval(self, timeout: float = None) -> LogInterval:
         """Get the log indices associated with the currently running policy."""
         log_interval = self.grpc_connection.GetEpisodeInterval(EMPTY)
@@ -200,6 +291,21 @@ class BaseRobotInterface:
         log_interval = self.get_previous_interval(timeout)
         return self._get_robot_state_log(log_interval, timeout=timeout)
 
+    def get_previous_log_columns(self, timeout: float = None) -> Dict[str, np.ndarray]:
+        """Get the RobotStates associated with the currently running policy, as arrays.
+
+        Args:
+            timeout: Amount of time (in seconds) to wait before throwing a TimeoutError.
+
+        Returns:
+            A dict of arrays, one per RobotState field: `timestamp` in seconds,
+            and a `num_states x size` array per repeated field. The mass matrix
+            & Jacobian are not logged.
+
+        """
+        log_interval = self.get_previous_interval(timeout)
+        return self._get_robot_state_log_columns(log_interval, timeout=timeout)
+
     def send_torch_policy(
         self,
         torch_policy: toco.PolicyModule,
@@ -227,24 +333,31 @@ class BaseRobotInterface:
             )
         start_time = time.time()
 
-        # Script & chunk policy
-        scripted_policy = torch.jit.script(torch_policy)
-        msg_generator = self._get_msg_generator(scripted_policy)
-
-        # Send policy as stream
-        try:
-            log_interval = self.grpc_connection.SetController(msg_generator())
-        except grpc.RpcError as e:
-            raise grpc.RpcError(f"POLYMETIS SERVER ERROR --\n{e.details()}") from None
+        # Script policy, reusing the scripted module of a structurally identical policy
+        digest = policy_digest(torch_policy)
+        scripted_policy, overrides = self._policy_cache.get(torch_policy, digest)
+
+        # Send only the overridden attributes if the server has the module cached,
+        # or else the policy as stream
+        log_interval = None
+        if self._server_digests is not None and digest in self._server_digests:
+            log_interval = self._set_cached_controller(digest, overrides)
+        if log_interval is None:
+            msg_generator = self._get_msg_generator(scripted_policy, digest or "")
+            try:
+                log_interval = self.grpc_connection.SetController(msg_generator())
+            except grpc.RpcError as e:
+                raise grpc.RpcError(
+                    f"POLYMETIS SERVER ERROR --\n{e.details()}"
+                ) from None
+            if self._server_digests is not None and digest is not None:
+                self._server_digests.add(digest)
+        self._episode_start = log_interval.start
+        self._param_schema = self._lookup_param_schema(digest, log_interval)
 
         if blocking:
             # Check policy termination
-            while log_interval.end == -1:
-                log_interval = self.grpc_connection.GetEpisodeInterval(EMPTY)
-
-                if timeout is not None and time.time() - start_time > timeout:
-                    raise TimeoutError("Operation timed out.")
-                time.sleep(1.0 / POLLING_RATE)
+            log_interval = self._wait_for_episode_end(log_interval, start_time, timeout)
 
             # Retrieve robot state log
             if timeout is not None:
@@ -252,9 +365,120 @@ class BaseRobotInterface:
                 timeout = timeout - time_passed
             return self._get_robot_state_log(log_interval, timeout=timeout)
 
+    def _set_cached_controller(
+        self, digest: str, overrides: Dict[str, object]
+    ) -> Optional[LogInterval]:
+        """Starts the policy cached by the server under `digest` with the given
+        attribute values. Returns None if the server does not have it cached."""
+        request = CachedController(
+            module_digest=digest,
+            attributes=[
+                to_module_attribute(name, value) for name, value in overrides.items()
+            ],
+        )
+        try:
+            return self.grpc_connection.SetCachedController(request)
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.NOT_FOUND:
+                # Evicted from the server cache
+                self._server_digests.discard(digest)
+                return None
+            if e.code() == grpc.StatusCode.UNIMPLEMENTED:
+                self._server_digests = None
+                return None
+            raise grpc.RpcError(f"POLYMETIS SERVER ERROR --\n{e.details()}") from None
+
+    def _wait_for_episode_end(
+        self, log_interval: LogInterval, start_time: float, timeout: float = None
+    ) -> LogInterval:
+        """Blocks until the episode starting at `log_interval` ends, and returns its interval."""
+        # The server pushes episode intervals as they change
+        remaining = None if timeout is None else timeout - (time.time() - start_time)
+        try:
+            for log_interval in self.grpc_connection.StreamEpisodeInterval(
+                EMPTY, timeout=remaining
+            ):
+                if log_interval.end != -1:
+                    return log_interval
+        except grpc.RpcError as e:
+            if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED:
+                raise TimeoutError("Operation timed out.") from None
+            if e.code() != grpc.StatusCode.UNIMPLEMENTED:
+                raise grpc.RpcError(
+                    f"POLYMETIS SERVER ERROR --\n{e.details()}"
+                ) from None
+
+        # Poll servers that do not stream episode intervals
+        while log_interval.end == -1:
+            log_interval = self.grpc_connection.GetEpisodeInterval(EMPTY)
+
+            if timeout is not None and time.time() - start_time > timeout:
+                raise TimeoutError("Operation timed out.")
+            time.sleep(1.0 / POLLING_RATE)
+        return log_interval
+
+    def _lookup_param_schema(
+        self, digest: Optional[str], log_interval: LogInterval
+    ) -> Optional[Dict[str, Tuple[int, torch.Size, torch.dtype]]]:
+        """Returns the parameter layout of the policy started at `log_interval`.
+
+        Policies with the same digest have the same layout, so the server is
+        only asked for it the first time a digest is sent.
+        """
+        if self._param_schemas is None:
+            return None
+        # Servers that do not report the controller id need the schema request
+        if log_interval.controller_id and digest in self._param_schemas:
+            self._controller_id = log_interval.controller_id
+            return self._param_schemas[digest]
+
+        schema = self._get_param_schema()
+        if schema is not None and digest is not None:
+            self._param_schemas[digest] = schema
+        return schema
+
+    def _get_param_schema(
+        self,
+    ) -> Optional[Dict[str, Tuple[int, torch.Size, torch.dtype]]]:
+        """Retrieves the parameter layout of the current policy from the server."""
+        try:
+            schema = self.grpc_connection.GetControllerParamSchema(EMPTY)
+        except grpc.RpcError as e:
+            log.warning(
+                f"Unable to get controller parameter schema, falling back to scripted updates: {e.details()}"
+            )
+            if e.code() == grpc.StatusCode.UNIMPLEMENTED:
+                self._param_schemas = None
+            return None
+        self._controller_id = schema.controller_id
+        # Servers that do not report dtypes only accept float32 values
+        return {
+            param.name: (
+                i,
+                torch.Size(param.shape),
+                getattr(torch, param.dtype or "float32"),
+            )
+            for i, param in enumerate(schema.params)
+        }
+
+    def _matches_param_schema(self, param_dict: Dict[str, torch.Tensor]) -> bool:
+        if self._param_schema is None:
+            return False
+        for name, value in param_dict.items():
+            if name not in self._param_schema:
+                return False
+            _, shape, dtype = self._param_schema[name]
+            if value.shape != shape or value.dtype != dtype:
+                return False
+        return True
+
     def update_current_policy(self, param_dict: Dict[str, torch.Tensor]) -> int:
         """Updates the current policy's with a (possibly incomplete) dictionary holding the updated values.
 
+        If all the parameters are part of the schema negotiated in `send_torch_policy`,
+        and the values have the shape & dtype of those parameters, the values are
+        sent as a flat payload and copied into the running policy in place. Otherwise, they are sent as a scripted parameter container.
+
         Args:
             param_dict: A dictionary mapping from param_name to updated torch.Tensor values.
 
@@ -262,6 +486,23 @@ class BaseRobotInterface:
             Index offset from the beginning of the episode when the update was applied.
 
         """
+        if self._matches_param_schema(param_dict):
+            update = ParamUpdate(
+                param_indices=[self._param_schema[name][0] for name in param_dict],
+                data=b"".join(
+                    value.detach().cpu().contiguous().numpy().tobytes()
+                    for value in param_dict.values()
+                ),
+                controller_id=self._controller_id,
+            )
+            try:
+                update_interval = self.grpc_connection.UpdateControllerParams(update)
+            except grpc.RpcError as e:
+                raise grpc.RpcError(
+                    f"POLYMETIS SERVER ERROR --\n{e.details()}"
+                ) from None
+            return update_interval.start - self._episode_start
+
         # Script & chunk params
         scripted_params = torch.jit.script(ParamDictContainer(param_dict))
         msg_generator = self._get_msg_generator(scripted_params)
@@ -492,7 +733,7 @@ class RobotInterface(BaseRobotInterface):
             )
 
         # Plan trajectory
-        waypoints = toco.planning.generate_joint_space_min_jerk(
+        plan = toco.planning.plan_joint_space_min_jerk(
             start=joint_pos_current,
             goal=joint_pos_desired,
             time_to_go=time_to_go,
@@ -501,8 +742,8 @@ class RobotInterface(BaseRobotInterface):
 
         # Create & execute policy
         torch_policy = toco.policies.JointTrajectoryExecutor(
-            joint_pos_trajectory=[waypoint["position"] for waypoint in waypoints],
-            joint_vel_trajectory=[waypoint["velocity"] for waypoint in waypoints],
+            joint_pos_trajectory=plan["position"],
+            joint_vel_trajectory=plan["velocity"],
             Kq=self.Kq_default if Kq is None else Kq,
             Kqd=self.Kqd_default if Kqd is None else Kqd,
             Kx=self.Kx_default,
@@ -598,7 +839,7 @@ class RobotInterface(BaseRobotInterface):
             ee_pose_desired = T.from_rot_xyz(
                 rotation=R.from_quat(ee_quat_desired), translation=ee_pos_desired
             )
-            waypoints = toco.planning.generate_cartesian_target_joint_min_jerk(
+            plan = toco.planning.plan_cartesian_target_joint_min_jerk(
                 joint_pos_start=joint_pos_current,
                 ee_pose_goal=ee_pose_desired,
                 time_to_go=time_to_go,
@@ -609,8 +850,8 @@ class RobotInterface(BaseRobotInterface):
 
             # Create joint tracking policy and run
             torch_policy = toco.policies.JointTrajectoryExecutor(
-                joint_pos_trajectory=[waypoint["position"] for waypoint in waypoints],
-                joint_vel_trajectory=[waypoint["velocity"] for waypoint in waypoints],
+                joint_pos_trajectory=plan["position"],
+                joint_vel_trajectory=plan["velocity"],
                 Kq=self.Kq_default,
                 Kqd=self.Kqd_default,
                 Kx=self.Kx_default if Kx is None else Kx,
@@ -0,0 +1,63 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Round trip latencies of policy switches & updates, shared by the benchmarks."""
+import time
+from typing import Dict, List
+
+import torch
+
+from polymetis.utils.policy_cache import ScriptedPolicyCache
+
+
+def time_policy_switches(robot, use_cache: bool, num_switches: int) -> List[float]:
+    """Times start_joint_impedance until the new policy runs, in seconds.
+
+    Args:
+        robot: A connected RobotInterface.
+        use_cache: If False, every policy is scripted and sent in full.
+        num_switches: Number of policy switches to time.
+
+    """
+    latencies = []
+    for _ in range(num_switches):
+        if not use_cache:
+            # Forget what is cached, so that every policy is scripted and sent in full
+            robot._policy_cache = ScriptedPolicyCache()
+            robot._server_digests = set()
+            robot._param_schemas = {}
+        t0 = time.perf_counter()
+        robot.start_joint_impedance()
+        latencies.append(time.perf_counter() - t0)
+    robot.terminate_current_policy(return_log=False)
+    return latencies
+
+
+def time_param_updates(
+    robot,
+    param_dict: Dict[str, torch.Tensor],
+    use_fast_path: bool,
+    num_updates: int,
+) -> List[float]:
+    """Times update_current_policy on the running policy, in seconds.
+
+    Args:
+        robot: A connected RobotInterface, with a policy running.
+        param_dict: Parameters to send on every update.
+        use_fast_path: If False, updates are sent as scripted modules even when
+            they match the schema of the policy.
+        num_updates: Number of updates to time.
+
+    """
+    # Hiding the schema forces update_current_policy onto the scripted module path
+    schema = robot._param_schema
+    if not use_fast_path:
+        robot._param_schema = None
+    latencies = []
+    for _ in range(num_updates):
+        t0 = time.perf_counter()
+        robot.update_current_policy(param_dict)
+        latencies.append(time.perf_counter() - t0)
+    robot._param_schema = schema
+    return latencies
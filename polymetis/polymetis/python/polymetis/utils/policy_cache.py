@@ -0,0 +1,257 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Caching of scripted policies across `send_torch_policy` calls.
+
+Policies built from the same code with the same structure (module tree,
+parameter shapes, non-tensor configuration) only differ in the values of their
+tensors and of their bool / int / float attributes. Such policies share a
+structural digest: the client scripts them once, and the server keeps the
+loaded module under that digest, so that subsequent policies are sent as a
+digest plus the values to override.
+
+Attributes of other types are compared by value: containers recursively, and
+tensors in them by content. Policies with attributes that cannot be compared
+exactly have no digest, and are scripted and sent in full every time.
+"""
+import copy
+import hashlib
+import inspect
+import pickle
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import torch
+
+from polymetis_pb2 import ModuleAttribute, TensorData
+
+# Attributes that every torch.nn.Module carries. ControlModule._param_dict
+# aliases the parameters, which are already covered.
+_MODULE_INTERNALS = set(vars(torch.nn.Module())) | {"_param_dict"}
+
+# Tensor dtypes that can be sent as attribute overrides
+_OVERRIDE_DTYPES = {
+    torch.float32: "float32",
+    torch.float64: "float64",
+    torch.float16: "float16",
+    torch.int64: "int64",
+    torch.int32: "int32",
+    torch.int16: "int16",
+    torch.int8: "int8",
+    torch.uint8: "uint8",
+    torch.bool: "bool",
+}
+
+
+@lru_cache(maxsize=None)
+def _type_digest(cls: type) -> str:
+    """Identifies a module class by name and source, so that edited code is re-scripted."""
+    try:
+        source = inspect.getsource(cls)
+    except (OSError, TypeError):
+        source = ""
+    source_hash = hashlib.sha1(source.encode()).hexdigest()
+    return f"{cls.__module__}.{cls.__qualname__}:{source_hash}"
+
+
+def _module_attributes(module: torch.nn.Module) -> Iterator[Tuple[str, object]]:
+    """Yields the parameters, buffers and plain attributes of a single module."""
+    yield from module._parameters.items()
+    yield from module._buffers.items()
+    for name, value in vars(module).items():
+        if name not in _MODULE_INTERNALS:
+            yield name, value
+
+
+def _is_overridable(value) -> bool:
+    if isinstance(value, torch.Tensor):
+        return value.dtype in _OVERRIDE_DTYPES
+    return type(value) in (bool, int, float)
+
+
+# Types whose repr identifies their value exactly
+_EXACT_REPR_TYPES = (
+    str,
+    bytes,
+    type(None),
+    bool,
+    int,
+    float,
+    complex,
+    torch.dtype,
+    torch.device,
+)
+
+
+class _Uncacheable(Exception):
+    pass
+
+
+def _tensor_content(value: torch.Tensor) -> str:
+    data = value.detach().cpu().contiguous().numpy().tobytes()
+    return f"{value.dtype}, {tuple(value.shape)}, {hashlib.sha1(data).hexdigest()}"
+
+
+def _content_signature(value) -> str:
+    """Identifies the full value of a non-overridable attribute."""
+    if isinstance(value, torch.Tensor):
+        return f"tensor[{_tensor_content(value)}]"
+    if isinstance(value, _EXACT_REPR_TYPES):
+        return f"{type(value).__name__}[{value!r}]"
+    if isinstance(value, (list, tuple)):
+        items = ", ".join(_content_signature(item) for item in value)
+        return f"{type(value).__name__}[{items}]"
+    if isinstance(value, dict):
+        items = ", ".join(
+            f"{_content_signature(k)}: {_content_signature(v)}"
+            for k, v in value.items()
+        )
+        return f"dict[{items}]"
+    if isinstance(value, torch.ScriptObject):
+        state = pickle.dumps(value.__getstate__())
+        return f"object[{hashlib.sha1(state).hexdigest()}]"
+    # Not comparable by value: a lossy description (e.g. repr, which elides
+    # large tensors) could match a policy with different values
+    raise _Uncacheable(type(value).__qualname__)
+
+
+def _value_signature(value) -> str:
+    """Describes the part of an attribute that overrides cannot change."""
+    if isinstance(value, torch.nn.Parameter):
+        # Parameters are updated in place on the server, so their shape is fixed
+        return f"param[{value.dtype}, {tuple(value.shape)}]"
+    if isinstance(value, torch.Tensor):
+        if value.dtype in _OVERRIDE_DTYPES:
+            return f"tensor[{value.dtype}]"
+    if type(value) in (bool, int, float):
+        return type(value).__name__
+    return _content_signature(value)
+
+
+def policy_digest(policy: torch.nn.Module) -> Optional[str]:
+    """Computes the structural digest of an (unscripted) policy.
+
+    Returns None if the policy has attributes that cannot be compared by value.
+    """
+    h = hashlib.sha1()
+    try:
+        for prefix, module in policy.named_modules():
+            h.update(f"{prefix}:{_type_digest(type(module))}\n".encode())
+            for name, value in _module_attributes(module):
+                h.update(f"{name}={_value_signature(value)}\n".encode())
+    except _Uncacheable:
+        return None
+    return h.hexdigest()
+
+
+def policy_overrides(policy: torch.nn.Module) -> Dict[str, object]:
+    """Returns the overridable attributes of a policy as {dotted name: value}."""
+    overrides = {}
+    for prefix, module in policy.named_modules():
+        for name, value in _module_attributes(module):
+            if _is_overridable(value):
+                overrides[f"{prefix}.{name}" if prefix else name] = value
+    return overrides
+
+
+def _resolve(module: torch.jit.ScriptModule, path: str):
+    *submodules, name = path.split(".")
+    for submodule in submodules:
+        module = getattr(module, submodule)
+    return module, name
+
+
+def _has_attribute(scripted_policy: torch.jit.ScriptModule, path: str) -> bool:
+    # Constants and attributes that failed type inference are not settable
+    module, name = _resolve(scripted_policy, path)
+    return module._c.hasattr(name)
+
+
+def to_module_attribute(name: str, value) -> ModuleAttribute:
+    """Converts an override value to its protobuf message."""
+    if isinstance(value, torch.Tensor):
+        tensor = value.detach().cpu().contiguous()
+        return ModuleAttribute(
+            name=name,
+            tensor=TensorData(
+                dtype=_OVERRIDE_DTYPES[tensor.dtype],
+                shape=tensor.shape,
+                data=tensor.numpy().tobytes(),
+            ),
+        )
+    elif type(value) is bool:
+        return ModuleAttribute(name=name, bool_value=value)
+    elif type(value) is int:
+        return ModuleAttribute(name=name, int_value=value)
+    else:
+        return ModuleAttribute(name=name, float_value=value)
+
+
+class ScriptedPolicyCache:
+    """LRU cache of scripted policies, keyed by structural digest.
+
+    Args:
+        capacity: Maximum number of scripted policies kept.
+    """
+
+    def __init__(self, capacity: int = 16):
+        self.capacity = capacity
+        self._cache: "OrderedDict[str, Tuple[torch.jit.ScriptModule, List[str]]]" = (
+            OrderedDict()
+        )
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self._cache
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def get(
+        self, policy: torch.nn.Module, digest: Optional[str] = None
+    ) -> Tuple[torch.jit.ScriptModule, Dict[str, object]]:
+        """Returns the scripted policy and its overrides.
+
+        On a cache hit, the overrides are applied to the cached scripted module,
+        which then behaves as if `policy` itself had been scripted. Only the
+        overrides that exist in the scripted module are returned. Policies
+        without a digest are scripted every time, with no overrides.
+        """
+        if digest is None:
+            digest = policy_digest(policy)
+        if digest is None:
+            return torch.jit.script(policy), {}
+        overrides = policy_overrides(policy)
+
+        if digest in self._cache:
+            self._cache.move_to_end(digest)
+            scripted_policy, names = self._cache[digest]
+            overrides = {name: overrides[name] for name in names}
+            self._apply(scripted_policy, overrides)
+            return scripted_policy, overrides
+
+        # Scripted modules share their tensors with the original policy, which
+        # must not be modified when the cached copy is reused
+        scripted_policy = copy.deepcopy(torch.jit.script(policy))
+        names = [name for name in overrides if _has_attribute(scripted_policy, name)]
+        self._cache[digest] = (scripted_policy, names)
+        if len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+        return scripted_policy, {name: overrides[name] for name in names}
+
+    @staticmethod
+    def _apply(scripted_policy: torch.jit.ScriptModule, overrides: Dict[str, object]):
+        with torch.no_grad():
+            for path, value in overrides.items():
+                module, name = _resolve(scripted_policy, path)
+                current = getattr(module, name)
+                if (
+                    isinstance(value, torch.Tensor)
+                    and current.shape == value.shape
+                    and current.dtype == value.dtype
+                ):
+                    # In place, to keep aliases such as _param_dict consistent
+                    current.copy_(value)
+                else:
+                    setattr(module, name, value)
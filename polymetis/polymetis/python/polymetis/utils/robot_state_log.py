@@ -0,0 +1,97 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Columnar robot state logs.
+
+`GetRobotStateLogChunked` sends the logged robot states as chunks of columns,
+one per RobotState field, each packed into a single block of bytes. The
+columns are read with `np.frombuffer` and concatenated, so that a log of any
+length becomes a handful of arrays without building a message per state.
+"""
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+from polymetis_pb2 import RobotState, RobotStateLogChunk, TensorData
+
+# Fields that the server does not keep in its robot state log
+UNLOGGED_FIELDS = ("mass_matrix", "jacobian")
+
+_ARRAY_FIELDS = [
+    f.name
+    for f in RobotState.DESCRIPTOR.fields
+    if f.type == f.TYPE_FLOAT
+    and f.name not in UNLOGGED_FIELDS
+    and f.name != "prev_controller_latency_ms"
+]
+_SCALAR_DTYPES = {
+    "prev_controller_latency_ms": np.float32,
+    "prev_command_successful": np.bool_,
+    "error_code": np.int32,
+}
+
+
+def column_to_numpy(values: TensorData) -> np.ndarray:
+    """Reads a packed column, without copying its bytes."""
+    dtype = np.dtype(values.dtype).newbyteorder("<")
+    return np.frombuffer(values.data, dtype=dtype).reshape(values.shape)
+
+
+def _pad_columns(arrays: List[np.ndarray]) -> List[np.ndarray]:
+    # Repeated fields are as wide as their largest size in each chunk
+    width = max(a.shape[1] for a in arrays)
+    return [
+        np.pad(a, ((0, 0), (0, width - a.shape[1])), constant_values=np.nan)
+        if a.shape[1] < width
+        else a
+        for a in arrays
+    ]
+
+
+def chunks_to_columns(chunks: Iterable[RobotStateLogChunk]) -> Dict[str, np.ndarray]:
+    """Concatenates log chunks into a dict of arrays, one per RobotState field.
+
+    Returns:
+        ``timestamp`` (float64 seconds) and every logged RobotState field.
+        Repeated fields are ``num_states x size`` float32 arrays, where rows
+        shorter than the largest size are padded with NaN.
+    """
+    parts: Dict[str, List[np.ndarray]] = {}
+    for chunk in chunks:
+        for column in chunk.columns:
+            parts.setdefault(column.name, []).append(column_to_numpy(column.values))
+    if not parts:
+        return states_to_columns([])
+
+    columns = {}
+    for name, arrays in parts.items():
+        if arrays[0].ndim == 2:
+            arrays = _pad_columns(arrays)
+        columns[name] = np.concatenate(arrays)
+
+    seconds = columns.pop("timestamp_seconds")
+    nanos = columns.pop("timestamp_nanos")
+    columns["timestamp"] = seconds + 1e-9 * nanos
+    return columns
+
+
+def states_to_columns(states: List[RobotState]) -> Dict[str, np.ndarray]:
+    """Same as `chunks_to_columns`, from a list of RobotState messages."""
+    num_states = len(states)
+    columns = {
+        "timestamp": np.array(
+            [s.timestamp.seconds + 1e-9 * s.timestamp.nanos for s in states],
+            dtype=np.float64,
+        )
+    }
+    for name, dtype in _SCALAR_DTYPES.items():
+        columns[name] = np.array([getattr(s, name) for s in states], dtype=dtype)
+    for name in _ARRAY_FIELDS:
+        rows = [getattr(s, name) for s in states]
+        width = max((len(row) for row in rows), default=0)
+        array = np.full((num_states, width), np.nan, dtype=np.float32)
+        for i, row in enumerate(rows):
+            array[i, : len(row)] = row
+        columns[name] = array
+    return columns
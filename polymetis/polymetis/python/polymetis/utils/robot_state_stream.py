@@ -0,0 +1,366 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+import logging
+import threading
+import time
+from queue import Full, Queue
+from typing import Callable, Dict, Optional, Union
+
+import grpc
+import numpy as np
+import torch
+from google.protobuf.descriptor import FieldDescriptor
+
+from polymetis_pb2 import RobotState, RobotStateStreamRequest, Empty
+
+log = logging.getLogger(__name__)
+
+# Full method names of the server-side robot state streams
+SUBSCRIBE_ROBOT_STATE = "/PolymetisControllerServer/SubscribeRobotState"
+GET_ROBOT_STATE_STREAM = "/PolymetisControllerServer/GetRobotStateStream"
+
+_WIRE_VARINT = 0
+_WIRE_FIXED64 = 1
+_WIRE_LENGTH_DELIMITED = 2
+_WIRE_FIXED32 = 5
+
+
+def _is_repeated(field: FieldDescriptor) -> bool:
+    # FieldDescriptor.label was replaced by is_repeated in newer protobuf releases
+    if hasattr(field, "is_repeated"):
+        return field.is_repeated
+    return field.label == FieldDescriptor.LABEL_REPEATED
+
+
+# Field number -> field name, split by how the field is decoded
+_ARRAY_FIELDS = {
+    f.number: f.name
+    for f in RobotState.DESCRIPTOR.fields
+    if _is_repeated(f) and f.cpp_type == FieldDescriptor.CPPTYPE_FLOAT
+}
+_SCALAR_FIELDS = {
+    f.number: (f.name, f.cpp_type)
+    for f in RobotState.DESCRIPTOR.fields
+    if not _is_repeated(f) and f.message_type is None
+}
+_SCALAR_DEFAULTS = {
+    f.name: f.default_value
+    for f in RobotState.DESCRIPTOR.fields
+    if not _is_repeated(f) and f.message_type is None
+}
+_TIMESTAMP_FIELD = RobotState.DESCRIPTOR.fields_by_name["timestamp"].number
+_BATCH_STATES_FIELD = 1
+_BATCH_NUM_DROPPED_FIELD = 2
+_EMPTY_ARRAY = np.zeros(0, dtype=np.float32)
+
+
+def _read_varint(buf, pos: int):
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _parse_timestamp(buf, pos: int, end: int) -> float:
+    seconds = nanos = 0
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        value, pos = _read_varint(buf, pos)
+        if key >> 3 == 1:
+            seconds = value
+        elif key >> 3 == 2:
+            nanos = value
+    return seconds + 1e-9 * nanos
+
+
+def _parse_batch(buf: bytes):
+    """Splits RobotStateBatch wire bytes into the state slices and the dropped count."""
+    states = []
+    num_dropped = 0
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        number, wire_type = key >> 3, key & 0x7
+        if wire_type == _WIRE_LENGTH_DELIMITED:
+            length, pos = _read_varint(buf, pos)
+            if number == _BATCH_STATES_FIELD:
+                states.append(buf[pos : pos + length])
+            pos += length
+        elif wire_type == _WIRE_VARINT:
+            value, pos = _read_varint(buf, pos)
+            if number == _BATCH_NUM_DROPPED_FIELD:
+                num_dropped = value
+        else:
+            raise ValueError(f"Unsupported wire type {wire_type} in RobotStateBatch")
+    return states, num_dropped
+
+
+class RobotStateSample:
+    """A RobotState decoded straight from its wire bytes.
+
+    Repeated float fields are exposed as float32 NumPy arrays that are views
+    into the received buffer, so no per-element Python objects are created.
+    The full protobuf message is only parsed on demand via :meth:`to_proto`.
+
+    Attributes:
+        timestamp: robot-side timestamp of the state, in seconds.
+        received_time: local ``time.time()`` at which the state was received.
+        latency: ``received_time - timestamp``, in seconds.
+    """
+
+    __slots__ = ("_buf", "_arrays", "_scalars", "timestamp", "received_time")
+
+    def __init__(self, raw: bytes, received_time: Optional[float] = None):
+        # bytearray gives writable views, which torch.from_numpy requires
+        self._buf = bytearray(raw)
+        self._arrays = {}
+        self._scalars = {}
+        self.timestamp = 0.0
+        self.received_time = time.time() if received_time is None else received_time
+        self._parse()
+
+    def _parse(self):
+        buf = self._buf
+        pos = 0
+        end = len(buf)
+        while pos < end:
+            key, pos = _read_varint(buf, pos)
+            number, wire_type = key >> 3, key & 0x7
+            if wire_type == _WIRE_LENGTH_DELIMITED:
+                length, pos = _read_varint(buf, pos)
+                if number in _ARRAY_FIELDS:
+                    self._arrays[_ARRAY_FIELDS[number]] = np.frombuffer(
+                        buf, dtype="<f4", count=length // 4, offset=pos
+                    )
+                elif number == _TIMESTAMP_FIELD:
+                    self.timestamp = _parse_timestamp(buf, pos, pos + length)
+                pos += length
+            elif wire_type == _WIRE_VARINT:
+                value, pos = _read_varint(buf, pos)
+                if number in _SCALAR_FIELDS:
+                    name, cpp_type = _SCALAR_FIELDS[number]
+                    if cpp_type == FieldDescriptor.CPPTYPE_BOOL:
+                        value = bool(value)
+                    elif value >= 1 << 63:  # negative int32/int64
+                        value -= 1 << 64
+                    self._scalars[name] = value
+            elif wire_type == _WIRE_FIXED32:
+                if number in _SCALAR_FIELDS:
+                    self._scalars[_SCALAR_FIELDS[number][0]] = float(
+                        np.frombuffer(buf, dtype="<f4", count=1, offset=pos)[0]
+                    )
+                elif number in _ARRAY_FIELDS:
+                    raise ValueError(f"Unpacked repeated field {number} in RobotState")
+                pos += 4
+            elif wire_type == _WIRE_FIXED64:
+                pos += 8
+            else:
+                raise ValueError(f"Unsupported wire type {wire_type} in RobotState")
+
+    @property
+    def latency(self) -> float:
+        return self.received_time - self.timestamp
+
+    def numpy(self, name: str) -> np.ndarray:
+        """Returns a repeated float field (e.g. ``"joint_positions"``) as a float32 array view."""
+        if name not in self._arrays and name not in _ARRAY_FIELDS.values():
+            raise KeyError(f"RobotState has no repeated float field '{name}'")
+        return self._arrays.get(name, _EMPTY_ARRAY)
+
+    def torch(self, name: str) -> torch.Tensor:
+        """Same as :meth:`numpy`, as a tensor sharing memory with the received buffer."""
+        return torch.from_numpy(self.numpy(name))
+
+    def __getattr__(self, name: str):
+        # Mirror the RobotState attribute names for convenience
+        if name in self._scalars:
+            return self._scalars[name]
+        if name in _ARRAY_FIELDS.values():
+            return self.numpy(name)
+        if name in _SCALAR_DEFAULTS:
+            return _SCALAR_DEFAULTS[name]
+        raise AttributeError(name)
+
+    def to_proto(self) -> RobotState:
+        """Parses the full RobotState message."""
+        return RobotState.FromString(bytes(self._buf))
+
+
+class RobotStateSubscription:
+    """Reads the server's robot state stream on a background thread.
+
+    The server pushes every ``stride``-th state as soon as it is recorded, and
+    batches the states a slow reader missed. States that the server had to
+    drop before sending them are counted in the ``server_dropped`` stat. The
+    most recent state is always available through :meth:`latest`, a plain
+    reference swap that never blocks the reader. Optionally, every state (or
+    one every ``1 / rate`` seconds) is also handed to a callback or pushed to a
+    queue. States that do not fit in a full queue are dropped and counted.
+
+    Args:
+        channel: gRPC channel to the controller manager server.
+        callback: called with every delivered :class:`RobotStateSample`, on the reader thread.
+        queue: ``queue.Queue`` receiving every delivered :class:`RobotStateSample`.
+        rate: maximum delivery rate in Hz to the callback / queue. Defaults to every state.
+        stride: only every ``stride``-th robot state is streamed.
+    """
+
+    def __init__(
+        self,
+        channel: grpc.Channel,
+        callback: Optional[Callable[[RobotStateSample], None]] = None,
+        queue: Optional[Queue] = None,
+        rate: Optional[float] = None,
+        stride: int = 1,
+    ):
+        self.callback = callback
+        self.queue = queue
+        self.min_interval = 1.0 / rate if rate else 0.0
+        self.stride = max(stride, 1)
+
+        self.num_received = 0
+        self.num_delivered = 0
+        self.num_dropped = 0
+        self.num_server_dropped = 0
+        self.max_latency = 0.0
+        self._latency_sum = 0.0
+        self._latest: Optional[RobotStateSample] = None
+        self._new_state = threading.Event()
+        self._error: Optional[Exception] = None
+
+        # Receive raw bytes; the sample decodes them without building the message
+        self._channel = channel
+        self._closed = False
+        subscribe = channel.unary_stream(
+            SUBSCRIBE_ROBOT_STATE,
+            request_serializer=RobotStateStreamRequest.SerializeToString,
+            response_deserializer=None,
+        )
+        self._call = subscribe(RobotStateStreamRequest(stride=self.stride))
+        self._thread = threading.Thread(target=self._read_stream, daemon=True)
+        self._thread.start()
+
+    def _read_stream(self):
+        self._next_delivery = 0.0
+        try:
+            try:
+                for raw in self._call:
+                    states, self.num_server_dropped = _parse_batch(raw)
+                    received_time = time.time()
+                    for raw_state in states:
+                        self._receive(RobotStateSample(raw_state, received_time))
+            except grpc.RpcError as e:
+                if e.code() != grpc.StatusCode.UNIMPLEMENTED or self._closed:
+                    raise
+                self._read_legacy_stream()
+        except grpc.RpcError as e:
+            if e.code() != grpc.StatusCode.CANCELLED:
+                log.error(f"Robot state stream terminated: {e}")
+                self._error = e
+        except Exception as e:
+            # e.g. a malformed message; kept to be raised by latest() & get_stats()
+            log.exception("Robot state stream terminated")
+            self._error = e
+        finally:
+            # Wake up latest() callers still waiting for a first state
+            self._new_state.set()
+
+    def _read_legacy_stream(self):
+        # Servers without SubscribeRobotState send every state, one at a time
+        log.info(
+            "Server does not support batched state streams, using GetRobotStateStream"
+        )
+        get_stream = self._channel.unary_stream(
+            GET_ROBOT_STATE_STREAM,
+            request_serializer=Empty.SerializeToString,
+            response_deserializer=None,
+        )
+        self._call = get_stream(Empty())
+        if self._closed:
+            self._call.cancel()
+        for i, raw in enumerate(self._call):
+            if i % self.stride == 0:
+                self._receive(RobotStateSample(raw))
+
+    def _receive(self, sample: RobotStateSample):
+        self._latest = sample
+        self._new_state.set()
+
+        self.num_received += 1
+        latency = sample.latency
+        self._latency_sum += latency
+        if latency > self.max_latency:
+            self.max_latency = latency
+
+        if sample.received_time < self._next_delivery:
+            return
+        self._next_delivery = sample.received_time + self.min_interval
+        self._deliver(sample)
+
+    def _deliver(self, sample: RobotStateSample):
+        if self.queue is not None:
+            try:
+                self.queue.put_nowait(sample)
+            except Full:
+                self.num_dropped += 1
+                return
+        if self.callback is not None:
+            try:
+                self.callback(sample)
+            except Exception:
+                log.exception("Robot state callback raised an exception")
+        self.num_delivered += 1
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def latest(self, timeout: Optional[float] = None) -> Optional[RobotStateSample]:
+        """Returns the most recent state, waiting up to `timeout` seconds for the first one.
+
+        Raises the error that terminated the stream, if any.
+        """
+        if self._latest is None and timeout:
+            self._new_state.wait(timeout)
+        self._raise_error()
+        return self._latest
+
+    def get_stats(self) -> Dict[str, Union[int, float]]:
+        """Returns the received / delivered / dropped counters and latencies (in seconds).
+
+        ``dropped`` counts the states that did not fit in the queue, while
+        ``server_dropped`` counts the states that the server could not send in
+        time. Raises the error that terminated the stream, if any.
+        """
+        self._raise_error()
+        return {
+            "received": self.num_received,
+            "delivered": self.num_delivered,
+            "dropped": self.num_dropped,
+            "server_dropped": self.num_server_dropped,
+            "mean_latency": self._latency_sum / max(self.num_received, 1),
+            "max_latency": self.max_latency,
+        }
+
+    def is_active(self) -> bool:
+        return self._thread.is_alive()
+
+    def close(self, timeout: Optional[float] = None):
+        """Cancels the stream and waits for the reader thread to exit."""
+        self._closed = True
+        self._call.cancel()
+        self._thread.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -7,6 +7,7 @@
 
 from typing import Callable
 import time
+from queue import Queue
 from threading import Thread
 import numpy as np
 import hydra
@@ -29,6 +30,35 @@ import logging
 log = logging.getLogger(__name__)
 
 
+class ControlStream:
+    """Lockstep bidirectional control stream to the server.
+
+    `control_update` has the signature of the unary ControlUpdate RPC: each
+    robot state is written to the stream & the call blocks until its torque
+    command is read back.
+
+    Args:
+        connection: Stub of the controller manager server.
+
+    """
+
+    def __init__(self, connection: polymetis_pb2_grpc.PolymetisControllerServerStub):
+        self._states = Queue()
+        self._commands = connection.ControlStream(iter(self._states.get, None))
+
+    def control_update(
+        self, robot_state: polymetis_pb2.RobotState
+    ) -> polymetis_pb2.TorqueCommand:
+        # The state is serialized before the server responds, so the caller
+        # may modify it once this returns
+        self._states.put(robot_state)
+        return next(self._commands)
+
+    def close(self):
+        self._states.put(None)
+        self._commands.cancel()
+
+
 class GrpcSimulationClient(AbstractRobotClient):
     """A RobotClient which wraps a PyBullet simulation.
 
@@ -48,6 +78,12 @@ class GrpcSimulationClient(AbstractRobotClient):
         max_ping: The amount of time in seconds; if a request takes long than this,
                   send a debug message warning.
 
+        use_control_stream: Send robot states over a single bidirectional stream
+                            instead of one ControlUpdate call per timestep.
+
+        lockstep: Step the simulation as fast as the controller allows instead
+                  of pacing it to `hz`. Timestamps then follow simulated time.
+
     """
 
     def __init__(
@@ -60,6 +96,8 @@ class GrpcSimulationClient(AbstractRobotClient):
         log_interval: int = 0,
         max_ping: float = 0.0,
         mirror_hz: float = 24.0,
+        use_control_stream: bool = True,
+        lockstep: bool = False,
     ):
         super().__init__(metadata_cfg=metadata_cfg)
 
@@ -104,6 +142,9 @@ class GrpcSimulationClient(AbstractRobotClient):
 
         self.mirror_hz = mirror_hz
 
+        self.use_control_stream = use_control_stream
+        self.lockstep = lockstep
+
     def __del__(self):
         """Close connection in destructor"""
         self.channel.close()
@@ -128,12 +169,34 @@ class GrpcSimulationClient(AbstractRobotClient):
             time_horizon: If finite, the number of timesteps to stop the simulation.
 
         """
-        msg = self.connection.InitRobotClient(self.metadata.get_proto())
+        self.connection.InitRobotClient(self.metadata.get_proto())
 
+        control_stream = None
+        control_update = self.connection.ControlUpdate
+        if self.use_control_stream:
+            control_stream = ControlStream(self.connection)
+            control_update = control_stream.control_update
+
+        try:
+            self._run_loop(control_update, time_horizon, threaded)
+        except grpc.RpcError as e:
+            if control_stream is None or e.code() != grpc.StatusCode.UNIMPLEMENTED:
+                raise
+            log.warning("Server does not support ControlStream, using ControlUpdate")
+            # Stop the failed stream's request thread before falling back
+            control_stream.close()
+            control_stream = None
+            self._run_loop(self.connection.ControlUpdate, time_horizon, threaded)
+        finally:
+            if control_stream is not None:
+                control_stream.close()
+
+    def _run_loop(self, control_update: Callable, time_horizon, threaded):
         robot_state = polymetis_pb2.RobotState()
         # Main loop
         t = 0
-        spinner = Spinner(self.hz)
+        t0 = time.time()
+        spinner = Spinner(0.0 if self.lockstep else self.hz)
         while t < time_horizon:
             if threaded:
                 # print(f"Threaded run {t}")
@@ -155,7 +218,10 @@ class GrpcSimulationClient(AbstractRobotClient):
             robot_state.motor_torques_measured[:] = torques_measured
             robot_state.motor_torques_external[:] = torques_external
 
-            robot_state.timestamp.GetCurrentTime()
+            if self.lockstep:
+                robot_state.timestamp.FromNanoseconds(int((t0 + t / self.hz) * 1e9))
+            else:
+                robot_state.timestamp.GetCurrentTime()
             robot_state.prev_controller_latency_ms = self.round_trip_time_buffer
             robot_state.prev_command_successful = True
             robot_state.error_code = 0
@@ -165,7 +231,7 @@ class GrpcSimulationClient(AbstractRobotClient):
             # https://grpc.io/docs/languages/python/basics/#simple-rpc-1
             log_request_time = self.log_interval > 0 and t % self.log_interval == 0
             msg = self.execute_rpc_call(
-                self.connection.ControlUpdate,
+                control_update,
                 [robot_state],
                 log_request_time=log_request_time,
             )
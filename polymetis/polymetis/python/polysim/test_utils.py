@@ -82,10 +82,30 @@ FakeChannel = MagicMock()
 
 class FakeConnection:
     def __init__(self, channel):
-        pass
+        self.num_updates = 0
 
     def ControlUpdate(self, robot_state):
+        self.num_updates += 1
         return polymetis_pb2.TorqueCommand()
 
+    def ControlStream(self, robot_states):
+        return FakeControlStream(self.ControlUpdate(state) for state in robot_states)
+
     def InitRobotClient(self, metadata):
         pass
+
+
+class FakeControlStream:
+    """Stands in for the grpc call object of a bidirectional streaming RPC."""
+
+    def __init__(self, torque_commands):
+        self.torque_commands = torque_commands
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self.torque_commands)
+
+    def cancel(self):
+        pass
@@ -8,6 +8,9 @@
 import numpy as np
 
 from polymetis import RobotInterface
+from polymetis.utils.latency import time_policy_switches
+
+NUM_SWITCHES = 20
 
 
 def output_episode_stats(episode_name, robot_states):
@@ -29,6 +32,14 @@ def output_episode_stats(episode_name, robot_states):
     )
 
 
+def output_switch_stats(name, latencies_s):
+    latency_arr = 1000.0 * np.array(latencies_s)
+    print(
+        f"{name}: {np.mean(latency_arr):.4f} / {np.std(latency_arr):.4f} / "
+        f"{np.percentile(latency_arr, 50):.4f} / {np.max(latency_arr):.4f}"
+    )
+
+
 if __name__ == "__main__":
     robot = RobotInterface()
 
@@ -43,3 +54,14 @@ if __name__ == "__main__":
     # Test cartesian PD
     robot_states = robot.move_to_ee_pose(robot.get_ee_pose()[0])
     output_episode_stats("Cartesian PD", robot_states)
+
+    # Test policy switches
+    print(
+        "Policy switch latency in milliseconds (avg / std / p50 / max), until the new policy runs: "
+    )
+    output_switch_stats(
+        "Cold", time_policy_switches(robot, use_cache=False, num_switches=NUM_SWITCHES)
+    )
+    output_switch_stats(
+        "Cached", time_policy_switches(robot, use_cache=True, num_switches=NUM_SWITCHES)
+    )
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import time
+
+import numpy as np
+
+from polymetis import RobotInterface
+
+NUM_TRIALS = 5
+LOG_SECONDS = 30
+
+
+def time_retrieval(retrieve):
+    latencies = []
+    for _ in range(NUM_TRIALS):
+        t0 = time.perf_counter()
+        retrieve()
+        latencies.append(time.perf_counter() - t0)
+    return latencies
+
+
+def to_columns(states):
+    # What callers of get_previous_log typically do with the states
+    return {
+        "joint_positions": np.array([s.joint_positions for s in states]),
+        "joint_torques_computed": np.array([s.joint_torques_computed for s in states]),
+    }
+
+
+if __name__ == "__main__":
+    robot = RobotInterface()
+
+    robot.start_joint_impedance()
+    time.sleep(LOG_SECONDS)
+    log_interval = robot.get_previous_interval()
+    robot.terminate_current_policy()
+
+    num_states = len(robot._get_robot_state_log(log_interval))
+    print(
+        f"Retrieval time of a {num_states}-state log in milliseconds (avg / std / max): "
+    )
+    for name, retrieve in [
+        ("RobotState messages", lambda: robot._get_robot_state_log(log_interval)),
+        (
+            "RobotState messages + arrays",
+            lambda: to_columns(robot._get_robot_state_log(log_interval)),
+        ),
+        ("Chunked columns", lambda: robot._get_robot_state_log_columns(log_interval)),
+    ]:
+        latency_arr = 1000.0 * np.array(time_retrieval(retrieve))
+        print(
+            f"{name}: {np.mean(latency_arr):.2f} / {np.std(latency_arr):.2f} / "
+            f"{np.max(latency_arr):.2f}"
+        )
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+"""Measures the regularity of the control loop.
+
+Run against a server driven by a simulated client, e.g.
+`launch_robot.py robot_client=franka_sim gui=false`. With `--update-threads`,
+the episode runs while threads send controller updates back to back, which
+shows the worst-case tick under concurrent updates.
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from polymetis import RobotInterface
+
+
+def output_jitter_stats(name, values_ms):
+    print(
+        f"{name}: {np.mean(values_ms):.4f} / {np.std(values_ms):.4f} / "
+        f"{np.percentile(values_ms, 50):.4f} / {np.percentile(values_ms, 99):.4f} / "
+        f"{np.percentile(values_ms, 99.9):.4f} / {np.max(values_ms):.4f}"
+    )
+
+
+def run_update_storm(robot, duration, num_threads):
+    """Holds the current position while `num_threads` threads update the policy."""
+    robot.start_joint_impedance()
+    joint_pos = robot.get_joint_positions()
+
+    stop = threading.Event()
+    num_updates = [0] * num_threads
+
+    def send_updates(i):
+        while not stop.is_set():
+            robot.update_current_policy({"joint_pos_desired": joint_pos})
+            num_updates[i] += 1
+
+    threads = [
+        threading.Thread(target=send_updates, args=(i,)) for i in range(num_threads)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    print(f"{sum(num_updates)} controller updates sent during the episode")
+    return robot.terminate_current_policy()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--duration", type=float, default=10.0, help="Episode length in seconds."
+    )
+    parser.add_argument(
+        "--update-threads",
+        type=int,
+        default=0,
+        help="Number of threads sending controller updates during the episode.",
+    )
+    args = parser.parse_args()
+
+    robot = RobotInterface()
+
+    # Hold the current position for the duration of the episode
+    if args.update_threads > 0:
+        robot_states = run_update_storm(robot, args.duration, args.update_threads)
+    else:
+        robot_states = robot.move_to_joint_positions(
+            robot.get_joint_positions(), time_to_go=args.duration
+        )
+
+    timestamps = np.array(
+        [
+            robot_state.timestamp.seconds + 1e-9 * robot_state.timestamp.nanos
+            for robot_state in robot_states
+        ]
+    )
+    tick_ms = 1000.0 * np.diff(timestamps)
+    period_ms = 1000.0 / robot.metadata.hz
+    latency_ms = np.array(
+        [robot_state.prev_controller_latency_ms for robot_state in robot_states]
+    )
+
+    print(
+        f"{len(robot_states)} ticks at a nominal period of {period_ms:.4f} ms, "
+        "in milliseconds (avg / std / p50 / p99 / p99.9 / max): "
+    )
+    output_jitter_stats("Tick period", tick_ms)
+    output_jitter_stats("Tick jitter", np.abs(tick_ms - period_ms))
+    output_jitter_stats("Controller latency", latency_ms)
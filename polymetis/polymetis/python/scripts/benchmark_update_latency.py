@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+# Copyright (c) Facebook, Inc. and its affiliates.
+
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+
+import numpy as np
+
+from polymetis import RobotInterface
+from polymetis.utils.latency import time_param_updates
+
+NUM_UPDATES = 500
+
+
+def output_update_stats(name, latencies_s):
+    latency_arr = 1000.0 * np.array(latencies_s)
+    print(
+        f"{name}: {np.mean(latency_arr):.4f} / {np.std(latency_arr):.4f} / "
+        f"{np.percentile(latency_arr, 50):.4f} / {np.percentile(latency_arr, 99):.4f} / "
+        f"{np.max(latency_arr):.4f}"
+    )
+
+
+if __name__ == "__main__":
+    robot = RobotInterface()
+
+    robot.start_joint_impedance()
+    joint_pos = robot.get_joint_positions()
+    assert robot._param_schema is not None, "Server does not support tensor updates"
+
+    print(
+        "Controller update round trip latency in milliseconds (avg / std / p50 / p99 / max): "
+    )
+    param_dict = {"joint_pos_desired": joint_pos}
+    output_update_stats(
+        "Scripted module",
+        time_param_updates(
+            robot, param_dict, use_fast_path=False, num_updates=NUM_UPDATES
+        ),
+    )
+    output_update_stats(
+        "Tensor payload",
+        time_param_updates(
+            robot, param_dict, use_fast_path=True, num_updates=NUM_UPDATES
+        ),
+    )
+
+    robot.terminate_current_policy()
@@ -184,3 +184,113 @@ class RobotModelPinocchio(torch.nn.Module):
             dt,
             damping,
         ).to(link_pos)
+
+    def forward_kinematics_batch(
+        self,
+        joint_positions: torch.Tensor,
+        link_name: str = "",
+        num_threads: int = 1,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Batched version of :meth:`forward_kinematics`.
+
+        The whole batch is processed in a single call into the C++ extension.
+
+        Args:
+            joint_positions: (B, nq) joint angles.
+            link_name (str, optional): name of the link desired. Defaults to the
+                                       end-effector link, if it was set during initialization.
+            num_threads (int, optional): number of threads the batch is split across.
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: (B, 3) link positions, (B, 4) link orientations as quaternions
+        """
+        frame_idx = self._get_link_idx_or_use_ee(link_name)
+        pos, quat = self.model.forward_kinematics_batch(
+            joint_positions, frame_idx, num_threads
+        )
+        return pos.to(joint_positions), quat.to(joint_positions)
+
+    def compute_jacobian_batch(
+        self,
+        joint_positions: torch.Tensor,
+        link_name: str = "",
+        num_threads: int = 1,
+    ) -> torch.Tensor:
+        """Batched version of :meth:`compute_jacobian`.
+
+        Args:
+            joint_positions: (B, nq) joint angles.
+            link_name (str, optional): name of the link desired. Defaults to the
+                                       end-effector link, if it was set during initialization.
+            num_threads (int, optional): number of threads the batch is split across.
+
+        Returns:
+            torch.Tensor: (B, 6, nq) Jacobians relative to the link frame.
+        """
+        frame_idx = self._get_link_idx_or_use_ee(link_name)
+        return self.model.compute_jacobian_batch(
+            joint_positions, frame_idx, num_threads
+        ).to(joint_positions)
+
+    def inverse_dynamics_batch(
+        self,
+        joint_positions: torch.Tensor,
+        joint_velocities: torch.Tensor,
+        joint_accelerations: torch.Tensor,
+        num_threads: int = 1,
+    ) -> torch.Tensor:
+        """Batched version of :meth:`inverse_dynamics`, taking (B, nq) inputs.
+
+        Returns:
+            torch.Tensor: (B, nq) desired torques
+        """
+        return self.model.inverse_dynamics_batch(
+            joint_positions, joint_velocities, joint_accelerations, num_threads
+        ).to(joint_positions)
+
+    def inverse_kinematics_batch(
+        self,
+        link_pos: torch.Tensor,
+        link_quat: torch.Tensor,
+        link_name: str = "",
+        rest_pose: Optional[torch.Tensor] = None,
+        eps: float = 1e-4,
+        max_iters: int = 1000,
+        dt: float = 0.1,
+        damping: float = 1e-6,
+        num_threads: int = 1,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Batched version of :meth:`inverse_kinematics`.
+
+        Args:
+            link_pos (torch.Tensor): (B, 3) desired link positions
+            link_quat (torch.Tensor): (B, 4) desired link orientations
+            link_name (str, optional): name of the link desired. Defaults to the
+                                       end-effector link, if it was set during initialization.
+            rest_pose (torch.Tensor): (optional) initial solution for IK, either
+                                      shared (nq,) or one per target (B, nq)
+            eps (float): (optional) maximum allowed error
+            max_iters (int): (optional) maximum number of iterations
+            dt (float): (optional) time step for integration
+            damping: (optional) damping factor for numerical stability
+            num_threads (int, optional): number of threads the batch is split across.
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: (B, nq) joint positions, (B,) whether
+            IK converged for each target
+        """
+        frame_idx = self._get_link_idx_or_use_ee(link_name)
+        if rest_pose is None:
+            rest_pose = torch.zeros(self.model.get_joint_angle_limits()[0].numel())
+        joint_pos, converged = self.model.inverse_kinematics_batch(
+            link_pos,
+            link_quat,
+            frame_idx,
+            rest_pose,
+            eps,
+            max_iters,
+            dt,
+            damping,
+            num_threads,
+        )
+        return joint_pos.to(link_pos), converged
@@ -46,11 +46,54 @@ def _compute_num_steps(time_to_go: float, hz: float):
     return int(time_to_go * hz)
 
 
-def generate_joint_space_min_jerk(
+def _scaled_rotvec_to_quat(rotvec: torch.Tensor, scales: torch.Tensor) -> torch.Tensor:
+    """
+    Converts the rotation vectors `rotvec * scales[i]` to quaternions <x, y, z, w> in one
+    vectorized evaluation.
+
+    Args:
+        rotvec: Rotation vector of shape (3,)
+        scales: Scales of shape (N,)
+
+    Returns:
+        Quaternions of shape (N, 4)
+    """
+    angle = rotvec.norm()
+    axis = rotvec / (angle + 1e-36)
+    half_angles = 0.5 * angle * scales
+    quats = torch.empty(scales.shape[0], 4, dtype=rotvec.dtype)
+    quats[:, :3] = axis[None, :] * torch.sin(half_angles)[:, None]
+    quats[:, 3] = torch.cos(half_angles)
+    return quats
+
+
+def _quat_multiply(q1: torch.Tensor, q2: torch.Tensor) -> torch.Tensor:
+    """
+    Batched Hamilton product of quaternions <x, y, z, w> of shape (N, 4) and (4,)
+    (or broadcastable shapes).
+    """
+    v1, w1 = q1[..., :3], q1[..., 3:]
+    v2, w2 = q2[..., :3], q2[..., 3:]
+    v = w1 * v2 + w2 * v1 + torch.cross(v1, v2.expand_as(v1), dim=-1)
+    w = w1 * w2 - (v1 * v2).sum(dim=-1, keepdim=True)
+    return torch.cat([v, w], dim=-1)
+
+
+def _waypoints_from_plan(plan: Dict[str, torch.Tensor]) -> List[Dict]:
+    """Splits a time-major plan into a list of per-step waypoints (views into the plan)."""
+    time_from_start = plan["time_from_start"].tolist()
+    keys = [key for key in plan.keys() if key != "time_from_start"]
+    return [
+        {"time_from_start": t, **{key: plan[key][i, :] for key in keys}}
+        for i, t in enumerate(time_from_start)
+    ]
+
+
+def plan_joint_space_min_jerk(
     start: torch.Tensor, goal: torch.Tensor, time_to_go: float, hz: float
-) -> List[Dict]:
+) -> Dict[str, torch.Tensor]:
     """
-    Primitive joint space minimum jerk trajectory planner.
+    Joint space minimum jerk trajectory planner returning time-major tensors.
     Assumes zero velocity & acceleration at start & goal.
 
     Args:
@@ -60,38 +103,31 @@ def generate_joint_space_min_jerk(
         hz: Frequency of output trajectory
 
     Returns:
-        waypoints: List of waypoints
+        plan: Dict with "time_from_start" of shape (T,) and "position",
+            "velocity" & "acceleration" of shape (T, N)
     """
     steps = _compute_num_steps(time_to_go, hz)
-    dt = 1.0 / hz
-
     p_traj, pd_traj, pdd_traj = _min_jerk_spaces(steps, time_to_go)
 
     D = goal - start
-    q_traj = start[None, :] + D[None, :] * p_traj[:, None]
-    qd_traj = D[None, :] * pd_traj[:, None]
-    qdd_traj = D[None, :] * pdd_traj[:, None]
+    return {
+        "time_from_start": torch.arange(steps, dtype=torch.float64) / hz,
+        "position": start[None, :] + D[None, :] * p_traj[:, None],
+        "velocity": D[None, :] * pd_traj[:, None],
+        "acceleration": D[None, :] * pdd_traj[:, None],
+    }
 
-    waypoints = [
-        {
-            "time_from_start": i * dt,
-            "position": q_traj[i, :],
-            "velocity": qd_traj[i, :],
-            "acceleration": qdd_traj[i, :],
-        }
-        for i in range(steps)
-    ]
 
-    return waypoints
-
-
-def generate_cartesian_space_min_jerk(
+def plan_cartesian_space_min_jerk(
     start: T.TransformationObj,
     goal: T.TransformationObj,
     time_to_go: float,
     hz: float,
-) -> List[Dict]:
-    """Initializes planner object and plans the trajectory
+) -> Dict[str, torch.Tensor]:
+    """
+    Cartesian space minimum jerk trajectory planner returning time-major tensors.
+    Translation and rotation (about the fixed axis from start to goal) are both
+    computed in a single vectorized evaluation.
 
     Args:
         start: Start pose
@@ -100,13 +136,11 @@ def generate_cartesian_space_min_jerk(
         hz: Frequency of output trajectory
 
     Returns:
-        q_traj: Joint position trajectory
-        qd_traj: Joint velocity trajectory
-        qdd_traj: Joint acceleration trajectory
+        plan: Dict with "time_from_start" of shape (T,), "position" of shape (T, 3),
+            "orientation" (quaternions) of shape (T, 4) and "twist" & "acceleration"
+            of shape (T, 6)
     """
     steps = _compute_num_steps(time_to_go, hz)
-    dt = 1.0 / hz
-
     p_traj, pd_traj, pdd_traj = _min_jerk_spaces(steps, time_to_go)
 
     # Plan translation
@@ -124,32 +158,90 @@ def generate_cartesian_space_min_jerk(
     r_delta = r_goal * r_start.inv()
     rv_delta = r_delta.as_rotvec()
 
-    r_traj = torch.empty([steps, 4])
-    for i in range(steps):
-        r = R.from_rotvec(rv_delta * p_traj[i]) * r_start
-        r_traj[i, :] = r.as_quat()
+    r_traj = _quat_multiply(_scaled_rotvec_to_quat(rv_delta, p_traj), r_start.as_quat())
+    r_traj = r_traj / r_traj.norm(dim=-1, keepdim=True)
     rd_traj = rv_delta[None, :] * pd_traj[:, None]
     rdd_traj = rv_delta[None, :] * pdd_traj[:, None]
 
-    # Combine results
-    ee_twist_traj = torch.cat([xd_traj, rd_traj], dim=-1)
-    ee_accel_traj = torch.cat([xdd_traj, rdd_traj], dim=-1)
+    return {
+        "time_from_start": torch.arange(steps, dtype=torch.float64) / hz,
+        "position": x_traj,
+        "orientation": r_traj,
+        "twist": torch.cat([xd_traj, rd_traj], dim=-1),
+        "acceleration": torch.cat([xdd_traj, rdd_traj], dim=-1),
+    }
+
+
+def generate_joint_space_min_jerk(
+    start: torch.Tensor, goal: torch.Tensor, time_to_go: float, hz: float
+) -> List[Dict]:
+    """
+    Primitive joint space minimum jerk trajectory planner.
+    Assumes zero velocity & acceleration at start & goal.
+
+    Args:
+        start: Start joint position of shape (N,)
+        goal: Goal joint position of shape (N,)
+        time_to_go: Trajectory duration in seconds
+        hz: Frequency of output trajectory
+
+    Returns:
+        waypoints: List of waypoints
+    """
+    return _waypoints_from_plan(
+        plan_joint_space_min_jerk(start, goal, time_to_go, hz)
+    )
+
+
+def generate_cartesian_space_min_jerk(
+    start: T.TransformationObj,
+    goal: T.TransformationObj,
+    time_to_go: float,
+    hz: float,
+) -> List[Dict]:
+    """Initializes planner object and plans the trajectory
+
+    Args:
+        start: Start pose
+        goal: Goal pose
+        time_to_go: Trajectory duration in seconds
+        hz: Frequency of output trajectory
+
+    Returns:
+        q_traj: Joint position trajectory
+        qd_traj: Joint velocity trajectory
+        qdd_traj: Joint acceleration trajectory
+    """
+    plan = plan_cartesian_space_min_jerk(start, goal, time_to_go, hz)
 
     waypoints = [
         {
-            "time_from_start": i * dt,
+            "time_from_start": t,
             "pose": T.from_rot_xyz(
-                rotation=R.from_quat(r_traj[i, :]), translation=x_traj[i, :]
+                rotation=R.from_quat(plan["orientation"][i, :]),
+                translation=plan["position"][i, :],
             ),
-            "twist": ee_twist_traj[i, :],
-            "acceleration": ee_accel_traj[i, :],
+            "twist": plan["twist"][i, :],
+            "acceleration": plan["acceleration"][i, :],
         }
-        for i in range(steps)
+        for i, t in enumerate(plan["time_from_start"].tolist())
     ]
 
     return waypoints
 
 
+def plan_position_min_jerk(
+    start: torch.Tensor, goal: torch.Tensor, time_to_go: float, hz: float
+) -> Dict[str, torch.Tensor]:
+    """
+    Minimum jerk trajectory planner through XYZ space returning time-major tensors.
+    Equivalent to a joint space planner with 3 joints.
+    """
+    assert start.shape == torch.Size([3])
+    assert goal.shape == torch.Size([3])
+    return plan_joint_space_min_jerk(start, goal, time_to_go, hz)
+
+
 def generate_position_min_jerk(start, goal, time_to_go: float, hz: float) -> List[Dict]:
     """
     Minimum jerk trajectory planner through XYZ space.
@@ -172,33 +264,34 @@ def generate_position_min_jerk(start, goal, time_to_go: float, hz: float) -> Lis
     return generate_joint_space_min_jerk(start, goal, time_to_go, hz)
 
 
-def generate_cartesian_target_joint_min_jerk(
+def plan_cartesian_target_joint_min_jerk(
     joint_pos_start: torch.Tensor,
     ee_pose_goal: T.TransformationObj,
     time_to_go: float,
     hz: float,
     robot_model: torch.nn.Module,
     home_pose: Optional[torch.Tensor] = None,
-) -> List[Dict]:
+) -> Dict[str, torch.Tensor]:
     """
-    Cartesian space minimum jerk trajectory planner, but outputs plan in joint space.
+    Cartesian space minimum jerk trajectory planner, but outputs plan in joint space
+    as time-major tensors.
     Assumes zero velocity & acceleration at start & goal.
 
     Args:
-        start: Start pose
-        goal: Goal pose
+        joint_pos_start: Start joint position of shape (N,)
+        ee_pose_goal: Goal pose
         time_to_go: Trajectory duration in seconds
         hz: Frequency of output trajectory
         robot_model: A valid robot model module from torchcontrol.models
         home_pose: Default pose of robot to stabilize around in null (elbow) space
 
     Returns:
-        q_traj: Joint position trajectory
-        qd_traj: Joint velocity trajectory
-        qdd_traj: Joint acceleration trajectory
+        plan: Dict with "time_from_start" of shape (T,) and "position",
+            "velocity" & "acceleration" of shape (T, N)
     """
     steps = _compute_num_steps(time_to_go, hz)
     dt = 1.0 / hz
+    num_dofs = joint_pos_start.shape[0]
     home_pose = torch.zeros_like(joint_pos_start) if home_pose is None else home_pose
 
     # Compute start pose
@@ -206,14 +299,17 @@ def generate_cartesian_target_joint_min_jerk(
     ee_pose_start = T.from_rot_xyz(
         rotation=R.from_quat(ee_quat_start), translation=ee_pos_start
     )
-    cartesian_waypoints = generate_cartesian_space_min_jerk(
+    cartesian_plan = plan_cartesian_space_min_jerk(
         ee_pose_start, ee_pose_goal, time_to_go, hz
     )
+    ee_twist_traj = cartesian_plan["twist"]
+    ee_accel_traj = cartesian_plan["acceleration"]
 
     # Extract plan & convert to joint space
-    q_traj = torch.zeros(steps, joint_pos_start.shape[0])
-    qd_traj = torch.zeros(steps, joint_pos_start.shape[0])
-    qdd_traj = torch.zeros(steps, joint_pos_start.shape[0])
+    q_traj = torch.zeros(steps, num_dofs)
+    qd_traj = torch.zeros(steps, num_dofs)
+    qdd_traj = torch.zeros(steps, num_dofs)
+    eye = torch.eye(num_dofs)
 
     q_traj[0, :] = joint_pos_start
     for i in range(0, steps - 1):
@@ -222,19 +318,14 @@ def generate_cartesian_target_joint_min_jerk(
         jacobian = robot_model.compute_jacobian(joint_pos_current)
         jacobian_pinv = torch.pinverse(jacobian)
 
-        # Query Cartesian plan for next step & compute diff
-        ee_pose_desired = cartesian_waypoints[i + 1]["pose"]
-        ee_twist_desired = cartesian_waypoints[i + 1]["twist"]
-        ee_accel_desired = cartesian_waypoints[i + 1]["acceleration"]
-
-        # Convert next step to joint plan
-        qdd_traj[i + 1, :] = jacobian_pinv @ ee_accel_desired
-        qd_traj[i + 1, :] = jacobian_pinv @ ee_twist_desired
+        # Convert next step of the Cartesian plan to joint plan
+        qdd_traj[i + 1, :] = jacobian_pinv @ ee_accel_traj[i + 1, :]
+        qd_traj[i + 1, :] = jacobian_pinv @ ee_twist_traj[i + 1, :]
         q_delta = qd_traj[i + 1, :] * dt
         q_traj[i + 1, :] = joint_pos_current + q_delta
 
         # Null space correction
-        null_space_proj = torch.eye(joint_pos_start.shape[0]) - jacobian_pinv @ jacobian
+        null_space_proj = eye - jacobian_pinv @ jacobian
         q_null_err = null_space_proj @ (home_pose - q_traj[i + 1, :])
         q_null_err_norm = q_null_err.norm() + 1e-27  # prevent zero division
         q_null_err_clamped = (
@@ -242,14 +333,41 @@ def generate_cartesian_target_joint_min_jerk(
         )  # norm of correction clamped to norm of current action
         q_traj[i + 1, :] = q_traj[i + 1, :] + q_null_err_clamped
 
-    waypoints = [
-        {
-            "time_from_start": i * dt,
-            "position": q_traj[i, :],
-            "velocity": qd_traj[i, :],
-            "acceleration": qdd_traj[i, :],
-        }
-        for i in range(steps)
-    ]
+    return {
+        "time_from_start": cartesian_plan["time_from_start"],
+        "position": q_traj,
+        "velocity": qd_traj,
+        "acceleration": qdd_traj,
+    }
 
-    return waypoints
+
+def generate_cartesian_target_joint_min_jerk(
+    joint_pos_start: torch.Tensor,
+    ee_pose_goal: T.TransformationObj,
+    time_to_go: float,
+    hz: float,
+    robot_model: torch.nn.Module,
+    home_pose: Optional[torch.Tensor] = None,
+) -> List[Dict]:
+    """
+    Cartesian space minimum jerk trajectory planner, but outputs plan in joint space.
+    Assumes zero velocity & acceleration at start & goal.
+
+    Args:
+        start: Start pose
+        goal: Goal pose
+        time_to_go: Trajectory duration in seconds
+        hz: Frequency of output trajectory
+        robot_model: A valid robot model module from torchcontrol.models
+        home_pose: Default pose of robot to stabilize around in null (elbow) space
+
+    Returns:
+        q_traj: Joint position trajectory
+        qd_traj: Joint velocity trajectory
+        qdd_traj: Joint acceleration trajectory
+    """
+    return _waypoints_from_plan(
+        plan_cartesian_target_joint_min_jerk(
+            joint_pos_start, ee_pose_goal, time_to_go, hz, robot_model, home_pose
+        )
+    )
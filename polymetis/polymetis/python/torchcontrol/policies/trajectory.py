@@ -2,7 +2,7 @@
 
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
-from typing import Dict, List
+from typing import Dict, List, Union
 
 import torch
 
@@ -14,8 +14,8 @@ from torchcontrol.utils.tensor_utils import to_tensor, stack_trajectory
 class JointTrajectoryExecutor(toco.PolicyModule):
     def __init__(
         self,
-        joint_pos_trajectory: List[torch.Tensor],
-        joint_vel_trajectory: List[torch.Tensor],
+        joint_pos_trajectory: Union[List[torch.Tensor], torch.Tensor],
+        joint_vel_trajectory: Union[List[torch.Tensor], torch.Tensor],
         Kq,
         Kqd,
         Kx,
@@ -27,8 +27,8 @@ class JointTrajectoryExecutor(toco.PolicyModule):
         Executes a joint trajectory by using a joint PD controller to stabilize around waypoints in the trajectory.
 
         Args:
-            joint_pos_trajectory: Joint position trajectory as list of tensors
-            joint_vel_trajectory: Joint position trajectory as list of tensors
+            joint_pos_trajectory: Joint position trajectory as list of tensors or a time-major tensor of shape (T, N)
+            joint_vel_trajectory: Joint velocity trajectory as list of tensors or a time-major tensor of shape (T, N)
             Kq: P gain matrix of shape (nA, N) or shape (N,) representing a N-by-N diagonal matrix (if nA=N)
             Kqd: D gain matrix of shape (nA, N) or shape (N,) representing a N-by-N diagonal matrix (if nA=N)
             Kx: P gain matrix of shape (6, 6) or shape (6,) representing a 6-by-6 diagonal matrix
@@ -89,8 +89,8 @@ class JointTrajectoryExecutor(toco.PolicyModule):
 class EndEffectorTrajectoryExecutor(toco.PolicyModule):
     def __init__(
         self,
-        ee_pose_trajectory: List[T.TransformationObj],
-        ee_twist_trajectory: List[torch.Tensor],
+        ee_pose_trajectory: Union[List[T.TransformationObj], torch.Tensor],
+        ee_twist_trajectory: Union[List[torch.Tensor], torch.Tensor],
         Kp,
         Kd,
         robot_model: torch.nn.Module,
@@ -100,8 +100,11 @@ class EndEffectorTrajectoryExecutor(toco.PolicyModule):
         Executes a EE pose trajectory by using a Cartesian PD controller to stabilize around waypoints in the trajectory.
 
         Args:
-            ee_pose_trajectory: End effector pose trajectory as a list of TransformationObj
-            ee_twist_trajectory: End effector twist (velocity + angular velocity) trajectory as list of tensors
+            ee_pose_trajectory: End effector pose trajectory as a list of TransformationObj, or a time-major tensor
+                of shape (T, 7) of positions and quaternions (e.g. `torch.cat([plan["position"], plan["orientation"]], dim=-1)`
+                with `plan` from `toco.planning.plan_cartesian_space_min_jerk`)
+            ee_twist_trajectory: End effector twist (velocity + angular velocity) trajectory as list of tensors or a
+                time-major tensor of shape (T, 6)
             Kp: P gain matrix of shape (6, 6) or shape (6,) representing a 6-by-6 diagonal matrix
             Kd: D gain matrix of shape (6, 6) or shape (6,) representing a 6-by-6 diagonal matrix
             robot_model: A robot model from torchcontrol.models
@@ -109,12 +112,18 @@ class EndEffectorTrajectoryExecutor(toco.PolicyModule):
         """
         super().__init__()
 
-        self.ee_pos_trajectory = to_tensor(
-            stack_trajectory([pose.translation() for pose in ee_pose_trajectory])
-        )
-        self.ee_quat_trajectory = to_tensor(
-            stack_trajectory([pose.rotation().as_quat() for pose in ee_pose_trajectory])
-        )
+        if torch.is_tensor(ee_pose_trajectory):
+            self.ee_pos_trajectory = to_tensor(ee_pose_trajectory[:, :3])
+            self.ee_quat_trajectory = to_tensor(ee_pose_trajectory[:, 3:])
+        else:
+            self.ee_pos_trajectory = to_tensor(
+                stack_trajectory([pose.translation() for pose in ee_pose_trajectory])
+            )
+            self.ee_quat_trajectory = to_tensor(
+                stack_trajectory(
+                    [pose.rotation().as_quat() for pose in ee_pose_trajectory]
+                )
+            )
         self.ee_twist_trajectory = to_tensor(stack_trajectory(ee_twist_trajectory))
 
         self.N = self.ee_pos_trajectory.shape[0]
@@ -18,7 +18,8 @@ Status PolymetisControllerServerImpl::GetRobotState(ServerContext *context,
     return Status(StatusCode::FAILED_PRECONDITION,
                   "Cannot retrieve robot state from empty buffer!");
   }
-  *robot_state = *robot_state_buffer_.get(robot_state_buffer_.size() - 1);
+  fromRecord(*robot_state_buffer_.get(robot_state_buffer_.size() - 1),
+             robot_state);
   return Status::OK;
 }
 
@@ -35,14 +36,17 @@ Status PolymetisControllerServerImpl::GetRobotClientMetadata(
 
 Status PolymetisControllerServerImpl::GetRobotStateStream(
     ServerContext *context, const Empty *, ServerWriter<RobotState> *writer) {
-  uint i = robot_state_buffer_.size();
+  RobotState robot_state;
+  ulong i = robot_state_buffer_.size();
   while (!context->IsCancelled()) {
     if (i >= robot_state_buffer_.size()) {
-      usleep(SPIN_INTERVAL_USEC);
+      waitForRobotState(i);
     } else {
-      RobotState *robot_state_ptr = robot_state_buffer_.get(i);
-      if (robot_state_ptr != NULL) {
-        writer->Write(RobotState(*robot_state_ptr));
+      RobotStateRecord *record_ptr = robot_state_buffer_.get(i);
+      if (record_ptr != NULL) {
+        robot_state.Clear();
+        fromRecord(*record_ptr, &robot_state);
+        writer->Write(robot_state);
       }
       i++;
     }
@@ -50,6 +54,50 @@ Status PolymetisControllerServerImpl::GetRobotStateStream(
   return Status::OK;
 }
 
+Status PolymetisControllerServerImpl::SubscribeRobotState(
+    ServerContext *context, const RobotStateStreamRequest *request,
+    ServerWriter<RobotStateBatch> *writer) {
+  ulong stride = std::max(request->stride(), 1u);
+  int max_batch_size = request->max_batch_size() > 0
+                           ? request->max_batch_size()
+                           : DEFAULT_STATE_BATCH_SIZE;
+
+  // The batch is reused, so that its messages are only allocated once
+  RobotStateBatch batch;
+  uint64_t num_dropped = 0;
+  ulong i = robot_state_buffer_.size();
+  while (!context->IsCancelled()) {
+    ulong size = robot_state_buffer_.size();
+    if (i >= size) {
+      waitForRobotState(i);
+      continue;
+    }
+
+    // Skip the states overwritten before they could be sent
+    ulong oldest = size - std::min<ulong>(size, robot_state_buffer_.capacity());
+    if (i < oldest) {
+      ulong num_skipped = (oldest - i + stride - 1) / stride;
+      i += num_skipped * stride;
+      num_dropped += num_skipped;
+    }
+
+    batch.Clear();
+    for (; i < size && batch.states_size() < max_batch_size; i += stride) {
+      RobotStateRecord *record_ptr = robot_state_buffer_.get(i);
+      if (record_ptr == NULL) {
+        num_dropped++;
+        continue;
+      }
+      fromRecord(*record_ptr, batch.add_states());
+    }
+    batch.set_num_dropped(num_dropped);
+    if (!writer->Write(batch)) {
+      break;
+    }
+  }
+  return Status::OK;
+}
+
 Status PolymetisControllerServerImpl::GetRobotStateLog(
     ServerContext *context, const LogInterval *interval,
     ServerWriter<RobotState> *writer) {
@@ -60,10 +108,13 @@ Status PolymetisControllerServerImpl::GetRobotStateLog(
   }
 
   // Stream interval from robot state buffer
+  RobotState robot_state;
   for (uint i = interval->start(); i <= end; i++) {
-    RobotState *robot_state_ptr = robot_state_buffer_.get(i);
-    if (robot_state_ptr != NULL) {
-      writer->Write(RobotState(*robot_state_ptr));
+    RobotStateRecord *record_ptr = robot_state_buffer_.get(i);
+    if (record_ptr != NULL) {
+      robot_state.Clear();
+      fromRecord(*record_ptr, &robot_state);
+      writer->Write(robot_state);
     }
 
     // Break if request cancelled
@@ -74,11 +125,54 @@ Status PolymetisControllerServerImpl::GetRobotStateLog(
   return Status::OK;
 }
 
+Status PolymetisControllerServerImpl::GetRobotStateLogChunked(
+    ServerContext *context, const RobotStateLogRequest *request,
+    ServerWriter<RobotStateLogChunk> *writer) {
+  // Stream until latest if end == -1
+  long end = request->interval().end();
+  if (end == -1) {
+    end = robot_state_buffer_.size() - 1;
+  }
+  uint chunk_size = request->chunk_size() > 0 ? request->chunk_size()
+                                              : DEFAULT_LOG_CHUNK_SIZE;
+
+  std::vector<const RobotStateRecord *> records;
+  records.reserve(chunk_size);
+  RobotStateLogChunk chunk;
+  long i = request->interval().start();
+  while (i <= end && !context->IsCancelled()) {
+    records.clear();
+    for (; i <= end && records.size() < chunk_size; i++) {
+      RobotStateRecord *record_ptr = robot_state_buffer_.get(i);
+      if (record_ptr != NULL) {
+        records.push_back(record_ptr);
+      }
+    }
+    if (records.empty()) {
+      continue;
+    }
+
+    chunk.Clear();
+    toLogChunk(records, &chunk);
+    if (!writer->Write(chunk)) {
+      break;
+    }
+  }
+  return Status::OK;
+}
+
 Status PolymetisControllerServerImpl::InitRobotClient(
     ServerContext *context, const RobotClientMetadata *robot_client_metadata,
     Empty *) {
   spdlog::info("==== Initializing new RobotClient... ====");
 
+  if (robot_client_metadata->dof() > MAX_RECORD_DOFS) {
+    std::string error_msg = "Robots with more than " +
+                            std::to_string(MAX_RECORD_DOFS) +
+                            " DOFs are not supported.";
+    spdlog::error(error_msg);
+    return Status(StatusCode::INVALID_ARGUMENT, error_msg);
+  }
   num_dofs_ = robot_client_metadata->dof();
 
   torch_robot_state_ =
@@ -154,39 +248,64 @@ PolymetisControllerServerImpl::ControlUpdate(ServerContext *context,
     custom_controller_context_.status = TERMINATING;
   }
 
-  // Parse robot state
-  torch_robot_state_->update_state(
-      robot_state->timestamp().seconds(), robot_state->timestamp().nanos(),
-      std::vector<float>(robot_state->joint_positions().begin(),
-                         robot_state->joint_positions().end()),
-      std::vector<float>(robot_state->joint_velocities().begin(),
-                         robot_state->joint_velocities().end()),
-      std::vector<float>(robot_state->motor_torques_measured().begin(),
-                         robot_state->motor_torques_measured().end()),
-      std::vector<float>(robot_state->motor_torques_external().begin(),
-                         robot_state->motor_torques_external().end()),
-      std::vector<float>(robot_state->mass_matrix().begin(),
-                         robot_state->mass_matrix().end()),
-      std::vector<float>(robot_state->ee_pose().begin(),
-                         robot_state->ee_pose().end()),
-      std::vector<float>(robot_state->jacobian().begin(),
-                         robot_state->jacobian().end()));
-
-  // Lock to prevent 1) controller updates while controller is running; 2)
-  // external termination during controller selection, which might cause loading
-  // of a uninitialized default controller
-  custom_controller_context_.controller_mtx.lock();
+  // Parse robot state into the preallocated state tensors
+  torch_robot_state_->update_timestamp(robot_state->timestamp().seconds(),
+                                       robot_state->timestamp().nanos());
+  updateStateField(TorchRobotState::JOINT_POSITIONS,
+                   robot_state->joint_positions());
+  updateStateField(TorchRobotState::JOINT_VELOCITIES,
+                   robot_state->joint_velocities());
+  updateStateField(TorchRobotState::MOTOR_TORQUES_MEASURED,
+                   robot_state->motor_torques_measured());
+  updateStateField(TorchRobotState::MOTOR_TORQUES_EXTERNAL,
+                   robot_state->motor_torques_external());
+  updateStateField(TorchRobotState::MASS_MATRIX, robot_state->mass_matrix());
+  updateStateField(TorchRobotState::EE_POSE, robot_state->ee_pose());
+  updateStateField(TorchRobotState::JACOBIAN, robot_state->jacobian());
+
+  // Pick up the controller & parameters published by the RPCs. Nothing is
+  // freed here: the replaced controller is handed back to the RPC thread.
+  bool control_loop_changed = false;
+  TorchScriptedController *pending_controller =
+      custom_controller_context_.pending_controller.exchange(nullptr);
+  if (pending_controller != nullptr) {
+    custom_controller_context_.retired_controller.store(
+        custom_controller_context_.custom_controller.release());
+    custom_controller_context_.custom_controller.reset(pending_controller);
+    resetControllerContext();
+    custom_controller_context_.status = READY;
+  }
+
+  PendingUpdate pending_update = custom_controller_context_.pending_update;
+  if (pending_update != NO_UPDATE) {
+    try {
+      if (pending_update == PARAM_DICT_UPDATE) {
+        custom_controller_context_.custom_controller->param_dict_update_module();
+      } else {
+        custom_controller_context_.custom_controller
+            ->param_tensor_update_module();
+      }
+      custom_controller_context_.update_index = robot_state_buffer_.size();
+    } catch (const std::exception &e) {
+      spdlog::error("Failed to update controller: {}", e.what());
+      custom_controller_context_.update_index = -1;
+    }
+    custom_controller_context_.pending_update = NO_UPDATE;
+    control_loop_changed = true;
+  }
 
   // Update episode markers
   if (custom_controller_context_.status == READY) {
     // First step of episode: update episode marker
     custom_controller_context_.episode_begin = robot_state_buffer_.size();
     custom_controller_context_.status = RUNNING;
+    control_loop_changed = true;
 
   } else if (custom_controller_context_.status == TERMINATING) {
     // Last step of episode: update episode marker & reset default controller
     custom_controller_context_.episode_end = robot_state_buffer_.size() - 1;
     custom_controller_context_.status = TERMINATED;
+    control_loop_changed = true;
 
     robot_client_context_.default_controller->reset();
 
@@ -205,27 +324,29 @@ PolymetisControllerServerImpl::ControlUpdate(ServerContext *context,
   try {
     desired_torque = controller->forward(*torch_robot_state_);
   } catch (const std::exception &e) {
-    custom_controller_context_.controller_mtx.unlock();
     std::string error_msg =
         "Failed to run controller forward function: " + std::string(e.what());
     spdlog::error(error_msg);
     return Status(StatusCode::CANCELLED, error_msg);
   }
 
-  // Unlock
-  custom_controller_context_.controller_mtx.unlock();
+  if (control_loop_changed) {
+    control_loop_cv_.notify_all();
+  }
   for (int i = 0; i < num_dofs_; i++) {
     torque_command->add_joint_torques(desired_torque[i]);
   }
   setTimestampToNow(torque_command->mutable_timestamp());
 
   // Record robot state
-  RobotState robot_state_copy(*robot_state);
-  for (int i = 0; i < num_dofs_; i++) {
-    robot_state_copy.add_joint_torques_computed(
-        torque_command->joint_torques(i));
-  }
-  robot_state_buffer_.append(robot_state_copy);
+  RobotStateRecord *record = robot_state_buffer_.next();
+  toRecord(*robot_state, record);
+  int num_torques = std::min(num_dofs_, MAX_RECORD_DOFS);
+  std::copy(desired_torque.begin(), desired_torque.begin() + num_torques,
+            record->values[RobotStateRecord::JOINT_TORQUES_COMPUTED]);
+  record->sizes[RobotStateRecord::JOINT_TORQUES_COMPUTED] = num_torques;
+  robot_state_buffer_.commit();
+  robot_state_cv_.notify_all();
 
   // Update timestep & check termination
   if (custom_controller_context_.status == RUNNING) {
@@ -240,6 +361,25 @@ PolymetisControllerServerImpl::ControlUpdate(ServerContext *context,
   return Status::OK;
 }
 
+Status PolymetisControllerServerImpl::ControlStream(
+    ServerContext *context,
+    ServerReaderWriter<TorqueCommand, RobotState> *stream) {
+  // Reused across reads, so that messages are only allocated once
+  RobotState robot_state;
+  TorqueCommand torque_command;
+  while (stream->Read(&robot_state)) {
+    torque_command.Clear();
+    Status status = ControlUpdate(context, &robot_state, &torque_command);
+    if (!status.ok()) {
+      return status;
+    }
+    if (!stream->Write(torque_command)) {
+      break;
+    }
+  }
+  return Status::OK;
+}
+
 Status PolymetisControllerServerImpl::SetController(
     ServerContext *context, ServerReader<ControllerChunk> *stream,
     LogInterval *interval) {
@@ -254,49 +394,180 @@ Status PolymetisControllerServerImpl::SetController(
   // would be written into the preallocated buffer used for the Torch
   // controllers.
   controller_model_buffer_.clear();
+  std::string module_digest;
   ControllerChunk chunk;
   while (stream->Read(&chunk)) {
+    if (!chunk.module_digest().empty()) {
+      module_digest = chunk.module_digest();
+    }
     std::string binary_blob = chunk.torchscript_binary_chunk();
     for (int i = 0; i < binary_blob.size(); i++) {
       controller_model_buffer_.push_back(binary_blob[i]);
     }
   }
 
+  std::unique_ptr<TorchScriptedController> new_controller;
   try {
     // Load new controller
-    auto new_controller = std::make_unique<TorchScriptedController>(
-        controller_model_buffer_.data(), controller_model_buffer_.size(),
-        *torch_robot_state_);
+    if (module_digest.empty()) {
+      new_controller = std::make_unique<TorchScriptedController>(
+          controller_model_buffer_.data(), controller_model_buffer_.size(),
+          *torch_robot_state_);
+    } else {
+      // Keep the module for later SetCachedController calls
+      controller_cache_.insert(module_digest.c_str(),
+                               controller_model_buffer_.data(),
+                               controller_model_buffer_.size());
+      new_controller = std::make_unique<TorchScriptedController>(
+          controller_cache_, module_digest.c_str(),
+          std::vector<ModuleAttributeValue>(), *torch_robot_state_);
+    }
 
-    // Switch in new controller by updating controller context
-    // (note: use std::swap to put ptr to old controller in new_controller,
-    // which destructs automatically after going out of scope)
-    custom_controller_context_.controller_mtx.lock();
+  } catch (const std::exception &e) {
+    std::string error_msg =
+        "Failed to load new controller: " + std::string(e.what());
+    spdlog::error(error_msg);
+    return Status(StatusCode::CANCELLED, error_msg);
+  }
 
-    resetControllerContext();
-    std::swap(custom_controller_context_.custom_controller, new_controller);
-    custom_controller_context_.status = READY;
+  switchController(new_controller, interval);
+
+  setThreadPriority(orig_prio);
+  return Status::OK;
+}
+
+Status PolymetisControllerServerImpl::SetCachedController(
+    ServerContext *context, const CachedController *cached_controller,
+    LogInterval *interval) {
+  std::lock_guard<std::mutex> service_lock(service_mtx_);
+
+  interval->set_start(-1);
+  interval->set_end(-1);
+
+  const std::string &module_digest = cached_controller->module_digest();
+  if (!controller_cache_.contains(module_digest.c_str())) {
+    return Status(StatusCode::NOT_FOUND,
+                  "No cached controller with digest " + module_digest);
+  }
+
+  // The attribute values point into the request, which outlives the
+  // construction of the controller
+  std::vector<ModuleAttributeValue> attributes;
+  for (const ModuleAttribute &attribute : cached_controller->attributes()) {
+    ModuleAttributeValue value = {};
+    value.name = attribute.name().c_str();
+    switch (attribute.value_case()) {
+    case ModuleAttribute::kTensor:
+      value.kind = ModuleAttributeValue::TENSOR;
+      value.dtype = attribute.tensor().dtype().c_str();
+      value.shape = attribute.tensor().shape().data();
+      value.ndim = attribute.tensor().shape_size();
+      value.data = attribute.tensor().data().data();
+      value.size = attribute.tensor().data().size();
+      break;
+    case ModuleAttribute::kIntValue:
+      value.kind = ModuleAttributeValue::INT;
+      value.int_value = attribute.int_value();
+      break;
+    case ModuleAttribute::kFloatValue:
+      value.kind = ModuleAttributeValue::FLOAT;
+      value.float_value = attribute.float_value();
+      break;
+    case ModuleAttribute::kBoolValue:
+      value.kind = ModuleAttributeValue::BOOL;
+      value.bool_value = attribute.bool_value();
+      break;
+    default:
+      return Status(StatusCode::INVALID_ARGUMENT,
+                    "No value given for attribute " + attribute.name());
+    }
+    attributes.push_back(value);
+  }
 
-    custom_controller_context_.controller_mtx.unlock();
-    spdlog::info("Loaded new controller.");
+  int orig_prio = setThreadPriority(RT_LOW_PRIO);
 
+  std::unique_ptr<TorchScriptedController> new_controller;
+  try {
+    new_controller = std::make_unique<TorchScriptedController>(
+        controller_cache_, module_digest.c_str(), attributes,
+        *torch_robot_state_);
   } catch (const std::exception &e) {
+    setThreadPriority(orig_prio);
     std::string error_msg =
-        "Failed to load new controller: " + std::string(e.what());
+        "Failed to load cached controller: " + std::string(e.what());
     spdlog::error(error_msg);
     return Status(StatusCode::CANCELLED, error_msg);
   }
 
+  switchController(new_controller, interval);
+
+  setThreadPriority(orig_prio);
+  return Status::OK;
+}
+
+void PolymetisControllerServerImpl::switchController(
+    std::unique_ptr<TorchScriptedController> &new_controller,
+    LogInterval *interval) {
+  // Hand the new controller over to the control loop, which switches to it at
+  // the start of its next tick
+  custom_controller_context_.controller_id++;
+  custom_controller_context_.pending_controller.store(new_controller.release());
+  spdlog::info("Loaded new controller.");
+
   // Respond with start index
-  while (custom_controller_context_.status == READY) {
-    usleep(SPIN_INTERVAL_USEC);
+  while (custom_controller_context_.pending_controller != nullptr ||
+         custom_controller_context_.status == READY) {
+    waitForControlLoop();
   }
   interval->set_start(custom_controller_context_.episode_begin);
+  interval->set_controller_id(custom_controller_context_.controller_id);
 
-  setThreadPriority(orig_prio);
+  // Free the replaced controller here rather than in the control loop
+  delete custom_controller_context_.retired_controller.exchange(nullptr);
+}
+
+Status PolymetisControllerServerImpl::publishUpdate(PendingUpdate update,
+                                                   LogInterval *interval) {
+  custom_controller_context_.pending_update = update;
+  while (custom_controller_context_.pending_update != NO_UPDATE) {
+    // Withdraw the update if the control loop has stopped
+    PendingUpdate expected = update;
+    if (!validRobotContext() &&
+        custom_controller_context_.pending_update.compare_exchange_strong(
+            expected, NO_UPDATE)) {
+      std::string error_msg =
+          "Robot client stopped before the controller update was applied.";
+      spdlog::error(error_msg);
+      return Status(StatusCode::CANCELLED, error_msg);
+    }
+    waitForControlLoop();
+  }
+
+  if (custom_controller_context_.update_index == -1) {
+    std::string error_msg = "Failed to update controller.";
+    return Status(StatusCode::CANCELLED, error_msg);
+  }
+  interval->set_start(custom_controller_context_.update_index);
   return Status::OK;
 }
 
+void PolymetisControllerServerImpl::waitForRobotState(ulong index) {
+  // As above, notifications can be missed & the timeout bounds the delay
+  std::unique_lock<std::mutex> robot_state_lock(robot_state_mtx_);
+  robot_state_cv_.wait_for(
+      robot_state_lock, std::chrono::microseconds(SPIN_INTERVAL_USEC),
+      [this, index] { return robot_state_buffer_.size() > index; });
+}
+
+void PolymetisControllerServerImpl::waitForControlLoop() {
+  // The control loop notifies without taking control_loop_mtx_, so a
+  // notification sent right before waiting is missed; the timeout bounds the
+  // delay.
+  std::unique_lock<std::mutex> control_loop_lock(control_loop_mtx_);
+  control_loop_cv_.wait_for(control_loop_lock,
+                            std::chrono::microseconds(SPIN_INTERVAL_USEC));
+}
+
 Status PolymetisControllerServerImpl::UpdateController(
     ServerContext *context, ServerReader<ControllerChunk> *stream,
     LogInterval *interval) {
@@ -316,7 +587,15 @@ Status PolymetisControllerServerImpl::UpdateController(
     }
   }
 
-  // Load param container
+  if (custom_controller_context_.status != RUNNING) {
+    std::string error_msg =
+        "Tried to perform a controller update with no controller running.";
+    spdlog::warn(error_msg);
+    return Status(StatusCode::CANCELLED, error_msg);
+  }
+
+  // Load param container & run the controller's update() here, so that the
+  // control loop only copies in the values it changed
   if (!custom_controller_context_.custom_controller->param_dict_load(
           updates_model_buffer_.data(), updates_model_buffer_.size())) {
     std::string error_msg = "Failed to load new controller params.";
@@ -325,31 +604,70 @@ Status PolymetisControllerServerImpl::UpdateController(
   }
 
   // Update controller & set intervals
-  if (custom_controller_context_.status == RUNNING) {
-    try {
-      custom_controller_context_.controller_mtx.lock();
-      interval->set_start(robot_state_buffer_.size());
-      custom_controller_context_.custom_controller->param_dict_update_module();
-      custom_controller_context_.controller_mtx.unlock();
+  Status status = publishUpdate(PARAM_DICT_UPDATE, interval);
 
-    } catch (const std::exception &e) {
-      custom_controller_context_.controller_mtx.unlock();
+  setThreadPriority(orig_prio);
+  return status;
+}
 
-      std::string error_msg =
-          "Failed to update controller: " + std::string(e.what());
-      spdlog::error(error_msg);
-      return Status(StatusCode::CANCELLED, error_msg);
+Status PolymetisControllerServerImpl::GetControllerParamSchema(
+    ServerContext *context, const Empty *, ParamSchema *schema) {
+  // Controllers are only swapped under the service lock
+  std::lock_guard<std::mutex> service_lock(service_mtx_);
+
+  if (!custom_controller_context_.custom_controller) {
+    std::string error_msg = "No controller has been loaded.";
+    return Status(StatusCode::FAILED_PRECONDITION, error_msg);
+  }
+
+  TorchScriptedController *controller =
+      custom_controller_context_.custom_controller.get();
+  for (int i = 0; i < controller->param_count(); i++) {
+    ParamSchema::Param *param = schema->add_params();
+    param->set_name(controller->param_name(i));
+    param->set_dtype(controller->param_dtype(i));
+    for (int64_t dim : controller->param_shape(i)) {
+      param->add_shape(dim);
     }
+  }
+  schema->set_controller_id(custom_controller_context_.controller_id);
+  return Status::OK;
+}
 
-  } else {
+Status PolymetisControllerServerImpl::UpdateControllerParams(
+    ServerContext *context, const ParamUpdate *update, LogInterval *interval) {
+  std::lock_guard<std::mutex> service_lock(service_mtx_);
+
+  interval->set_start(-1);
+  interval->set_end(-1);
+
+  if (custom_controller_context_.status != RUNNING) {
     std::string error_msg =
         "Tried to perform a controller update with no controller running.";
     spdlog::warn(error_msg);
     return Status(StatusCode::CANCELLED, error_msg);
   }
+  if (update->controller_id() != custom_controller_context_.controller_id) {
+    std::string error_msg = "Parameter update was built for a controller that "
+                            "is no longer running.";
+    spdlog::warn(error_msg);
+    return Status(StatusCode::FAILED_PRECONDITION, error_msg);
+  }
 
-  setThreadPriority(orig_prio);
-  return Status::OK;
+  // Stage the new values, for the control loop to copy them in
+  TorchScriptedController *controller =
+      custom_controller_context_.custom_controller.get();
+  if (!controller->param_tensor_load(update->param_indices().data(),
+                                     update->param_indices_size(),
+                                     update->data().data(),
+                                     update->data().size())) {
+    std::string error_msg = "Parameter update does not match the schema of "
+                            "the current controller.";
+    spdlog::error(error_msg);
+    return Status(StatusCode::INVALID_ARGUMENT, error_msg);
+  }
+
+  return publishUpdate(PARAM_TENSOR_UPDATE, interval);
 }
 
 Status PolymetisControllerServerImpl::TerminateController(
@@ -359,14 +677,12 @@ Status PolymetisControllerServerImpl::TerminateController(
   interval->set_start(-1);
   interval->set_end(-1);
 
-  if (custom_controller_context_.status == RUNNING) {
-    custom_controller_context_.controller_mtx.lock();
-    custom_controller_context_.status = TERMINATING;
-    custom_controller_context_.controller_mtx.unlock();
-
+  ControllerStatus running = RUNNING;
+  if (custom_controller_context_.status.compare_exchange_strong(running,
+                                                                TERMINATING)) {
     // Respond with start & end index
     while (custom_controller_context_.status == TERMINATING) {
-      usleep(SPIN_INTERVAL_USEC);
+      waitForControlLoop();
     }
     interval->set_start(custom_controller_context_.episode_begin);
     interval->set_end(custom_controller_context_.episode_end);
@@ -392,4 +708,24 @@ Status PolymetisControllerServerImpl::GetEpisodeInterval(
   }
 
   return Status::OK;
-}
\ No newline at end of file
+}
+
+Status PolymetisControllerServerImpl::StreamEpisodeInterval(
+    ServerContext *context, const Empty *, ServerWriter<LogInterval> *writer) {
+  LogInterval last_interval;
+  bool first = true;
+  while (!context->IsCancelled()) {
+    LogInterval interval;
+    GetEpisodeInterval(context, nullptr, &interval);
+    if (first || interval.start() != last_interval.start() ||
+        interval.end() != last_interval.end()) {
+      if (!writer->Write(interval)) {
+        break;
+      }
+      last_interval = interval;
+      first = false;
+    }
+    waitForControlLoop();
+  }
+  return Status::OK;
+}
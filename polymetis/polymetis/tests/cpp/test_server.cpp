@@ -2,9 +2,11 @@
 
 // This source code is licensed under the MIT license found in the
 // LICENSE file in the root directory of this source tree.
+#include <atomic>
 #include <chrono>
 #include <memory>
 #include <thread>
+#include <vector>
 
 #include "yaml-cpp/yaml.h"
 #include "gtest/gtest.h"
@@ -88,6 +90,141 @@ TEST_F(ServiceTest, ControlUpdate) {
   EXPECT_FALSE(service_.validRobotContext());
 }
 
+TEST_F(ServiceTest, ControlStream) {
+  stub_.get()->InitRobotClient(new grpc::ClientContext, metadata_, new Empty);
+
+  grpc::ClientContext context;
+  auto stream = stub_.get()->ControlStream(&context);
+  TorqueCommand torque_command;
+  for (int i = 0; i < 3; i++) {
+    ASSERT_TRUE(stream->Write(dummy_robot_state_));
+    ASSERT_TRUE(stream->Read(&torque_command));
+    EXPECT_EQ(torque_command.joint_torques_size(), metadata_.dof());
+  }
+  stream->WritesDone();
+  EXPECT_TRUE(stream->Finish().ok());
+
+  LogInterval interval;
+  interval.set_start(0);
+  interval.set_end(-1);
+  grpc::ClientContext log_context;
+  auto reader = stub_.get()->GetRobotStateLog(&log_context, interval);
+  int num_states = 0;
+  RobotState robot_state;
+  while (reader->Read(&robot_state)) {
+    num_states++;
+  }
+  EXPECT_EQ(num_states, 3);
+}
+
+TEST_F(ServiceTest, RecordedRobotState) {
+  stub_.get()->InitRobotClient(new grpc::ClientContext, metadata_, new Empty);
+
+  RobotState robot_state(dummy_robot_state_);
+  for (int i = 0; i < metadata_.dof() * metadata_.dof(); i++) {
+    robot_state.add_mass_matrix(1.0);
+  }
+  robot_state.set_prev_controller_latency_ms(0.5);
+  robot_state.set_error_code(3);
+
+  TorqueCommand torque_command;
+  ASSERT_TRUE(stub_.get()
+                  ->ControlUpdate(new grpc::ClientContext, robot_state,
+                                  &torque_command)
+                  .ok());
+
+  // The state log keeps everything but the mass matrix & Jacobian, plus the
+  // computed torques
+  RobotState recorded_robot_state;
+  ASSERT_TRUE(stub_.get()
+                  ->GetRobotState(new grpc::ClientContext, empty_,
+                                  &recorded_robot_state)
+                  .ok());
+  EXPECT_EQ(recorded_robot_state.joint_positions_size(), metadata_.dof());
+  EXPECT_EQ(recorded_robot_state.joint_torques_computed_size(),
+            metadata_.dof());
+  EXPECT_EQ(recorded_robot_state.mass_matrix_size(), 0);
+  EXPECT_FLOAT_EQ(recorded_robot_state.prev_controller_latency_ms(), 0.5);
+  EXPECT_EQ(recorded_robot_state.error_code(), 3);
+  EXPECT_EQ(recorded_robot_state.timestamp().seconds(),
+            robot_state.timestamp().seconds());
+}
+
+TEST_F(ServiceTest, GetRobotStateLogChunked) {
+  stub_.get()->InitRobotClient(new grpc::ClientContext, metadata_, new Empty);
+
+  RobotState robot_state(dummy_robot_state_);
+  TorqueCommand torque_command;
+  for (int i = 0; i < 5; i++) {
+    robot_state.set_error_code(i);
+    ASSERT_TRUE(stub_.get()
+                    ->ControlUpdate(new grpc::ClientContext, robot_state,
+                                    &torque_command)
+                    .ok());
+  }
+
+  RobotStateLogRequest request;
+  request.mutable_interval()->set_start(1);
+  request.mutable_interval()->set_end(-1);
+  request.set_chunk_size(3);
+  grpc::ClientContext context;
+  auto reader = stub_.get()->GetRobotStateLogChunked(&context, request);
+
+  std::vector<int> error_codes;
+  RobotStateLogChunk chunk;
+  while (reader->Read(&chunk)) {
+    for (const RobotStateColumn &column : chunk.columns()) {
+      const TensorData &values = column.values();
+      if (column.name() == "error_code") {
+        ASSERT_EQ(values.dtype(), "int32");
+        const int32_t *data =
+            reinterpret_cast<const int32_t *>(values.data().data());
+        error_codes.insert(error_codes.end(), data, data + chunk.num_states());
+      } else if (column.name() == "joint_positions") {
+        ASSERT_EQ(values.shape_size(), 2);
+        EXPECT_EQ(values.shape(0), chunk.num_states());
+        EXPECT_EQ(values.shape(1), metadata_.dof());
+        EXPECT_EQ(values.data().size(),
+                  sizeof(float) * chunk.num_states() * metadata_.dof());
+      }
+    }
+  }
+  EXPECT_TRUE(reader->Finish().ok());
+  EXPECT_EQ(error_codes, std::vector<int>({1, 2, 3, 4}));
+}
+
+TEST_F(ServiceTest, SubscribeRobotState) {
+  stub_.get()->InitRobotClient(new grpc::ClientContext, metadata_, new Empty);
+
+  RobotStateStreamRequest request;
+  request.set_stride(2);
+  grpc::ClientContext context;
+  auto reader = stub_.get()->SubscribeRobotState(&context, request);
+  std::this_thread::sleep_for(std::chrono::milliseconds(50));
+
+  // Tag the states with their index
+  RobotState robot_state(dummy_robot_state_);
+  TorqueCommand torque_command;
+  for (int i = 0; i < 5; i++) {
+    robot_state.set_error_code(i);
+    ASSERT_TRUE(stub_.get()
+                    ->ControlUpdate(new grpc::ClientContext, robot_state,
+                                    &torque_command)
+                    .ok());
+  }
+
+  std::vector<int> error_codes;
+  RobotStateBatch batch;
+  while (error_codes.size() < 3 && reader->Read(&batch)) {
+    EXPECT_EQ(batch.num_dropped(), 0);
+    for (const RobotState &state : batch.states()) {
+      error_codes.push_back(state.error_code());
+    }
+  }
+  context.TryCancel();
+  EXPECT_EQ(error_codes, std::vector<int>({0, 2, 4}));
+}
+
 TEST_F(ServiceTest, GetRobotClientMetadata) {
   // Init
   stub_.get()->InitRobotClient(new grpc::ClientContext, metadata_, new Empty);
@@ -167,6 +304,74 @@ TEST_F(ServiceTest, SetController) {
   EXPECT_EQ(interval_terminated_repeated.end(), 2);
 }
 
+TEST_F(ServiceTest, UpdateControllerParams) {
+  stub_.get()->InitRobotClient(new grpc::ClientContext, metadata_, new Empty);
+
+  // Run the control loop until the test is done
+  std::atomic<bool> done(false);
+  std::thread robot_client_thread([this, &done]() {
+    while (!done) {
+      stub_.get()->ControlUpdate(new grpc::ClientContext, dummy_robot_state_,
+                                 new TorqueCommand);
+      usleep(1000);
+    }
+  });
+
+  // Send default controller as a policy
+  LogInterval controller_interval;
+  auto writer = stub_.get()->SetController(new grpc::ClientContext,
+                                           &controller_interval);
+  ControllerChunk chunk;
+  chunk.set_torchscript_binary_chunk(metadata_.default_controller());
+  writer->Write(chunk);
+  writer->WritesDone();
+  ASSERT_TRUE((writer->Finish()).ok());
+
+  ParamSchema schema;
+  ASSERT_TRUE(stub_.get()
+                  ->GetControllerParamSchema(new grpc::ClientContext, empty_,
+                                             &schema)
+                  .ok());
+  ASSERT_GT(schema.params_size(), 0);
+  EXPECT_EQ(schema.controller_id(), controller_interval.controller_id());
+  ASSERT_EQ(schema.params(0).dtype(), "float32");
+  int num_values = 1;
+  for (int64_t dim : schema.params(0).shape()) {
+    num_values *= dim;
+  }
+
+  // Updates are applied by the control loop, one per tick at most
+  ParamUpdate update;
+  update.add_param_indices(0);
+  update.set_data(std::string(num_values * sizeof(float), 0));
+  update.set_controller_id(schema.controller_id());
+  LogInterval first_update, second_update;
+  ASSERT_TRUE(stub_.get()
+                  ->UpdateControllerParams(new grpc::ClientContext, update,
+                                           &first_update)
+                  .ok());
+  ASSERT_TRUE(stub_.get()
+                  ->UpdateControllerParams(new grpc::ClientContext, update,
+                                           &second_update)
+                  .ok());
+  EXPECT_GE(first_update.start(), 0);
+  EXPECT_GT(second_update.start(), first_update.start());
+
+  // Payloads that do not match the schema are rejected before the handoff
+  update.set_data("invalid");
+  EXPECT_FALSE(stub_.get()
+                   ->UpdateControllerParams(new grpc::ClientContext, update,
+                                            new LogInterval)
+                   .ok());
+
+  EXPECT_TRUE(stub_.get()
+                  ->TerminateController(new grpc::ClientContext, empty_,
+                                        new LogInterval)
+                  .ok());
+  done = true;
+  robot_client_thread.join();
+}
+
 TEST_F(ServiceTest, TestInvalidRequests) {
   // Init
   stub_.get()->InitRobotClient(new grpc::ClientContext, metadata_, new Empty);
@@ -141,3 +141,58 @@ def test_cartesian_joint_planner(num_steps):
         "qdd_arr": torch.stack(qdd_ls),
     }
     record_or_compare(f"module_planning_cartesian_joints_{num_steps}", output_dict)
+
+
+def test_joint_plan_tensors(num_steps):
+    joint_start = torch.rand(N_DOFS)
+    joint_goal = torch.rand(N_DOFS)
+    hz = num_steps / TIME_TO_GO
+
+    plan = toco.planning.plan_joint_space_min_jerk(
+        start=joint_start, goal=joint_goal, time_to_go=TIME_TO_GO, hz=hz
+    )
+    waypoints = toco.planning.generate_joint_space_min_jerk(
+        start=joint_start, goal=joint_goal, time_to_go=TIME_TO_GO, hz=hz
+    )
+
+    assert plan["position"].shape == torch.Size([num_steps, N_DOFS])
+    assert plan["time_from_start"].shape == torch.Size([num_steps])
+    for key in ["position", "velocity", "acceleration"]:
+        assert torch.allclose(
+            plan[key], torch.stack([waypoint[key] for waypoint in waypoints])
+        )
+
+
+def test_cartesian_plan_tensors(num_steps):
+    pose_start = T.from_rot_xyz(
+        translation=torch.rand(3),
+        rotation=R.from_rotvec(torch.rand(3)),
+    )
+    pose_goal = T.from_rot_xyz(
+        translation=torch.rand(3),
+        rotation=R.from_rotvec(torch.rand(3)),
+    )
+
+    plan = toco.planning.plan_cartesian_space_min_jerk(
+        start=pose_start,
+        goal=pose_goal,
+        time_to_go=TIME_TO_GO,
+        hz=num_steps / TIME_TO_GO,
+    )
+
+    assert plan["orientation"].shape == torch.Size([num_steps, 4])
+    assert plan["twist"].shape == torch.Size([num_steps, 6])
+    assert torch.allclose(plan["position"][0], pose_start.translation())
+    assert torch.allclose(plan["position"][-1], pose_goal.translation())
+    assert torch.allclose(plan["orientation"][0], pose_start.rotation().as_quat())
+    assert torch.allclose(
+        plan["orientation"][-1], pose_goal.rotation().as_quat(), atol=1e-6
+    )
+
+    # Vectorized rotations match composing the RotationObj step by step
+    rv_delta = (pose_goal.rotation() * pose_start.rotation().inv()).as_rotvec()
+    p_traj = torch.linspace(0, 1, num_steps)
+    p_traj = 10 * p_traj**3 - 15 * p_traj**4 + 6 * p_traj**5
+    for i in range(num_steps):
+        r = R.from_rotvec(rv_delta * p_traj[i]) * pose_start.rotation()
+        assert torch.allclose(plan["orientation"][i], r.as_quat(), atol=1e-6)
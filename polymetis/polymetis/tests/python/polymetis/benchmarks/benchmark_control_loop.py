@@ -0,0 +1,290 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+"""Latency of the real-time control path, on CPU-only machines.
+
+The control loop suites start a server and drive it from a background thread
+with either the PyBullet simulation client ("sim") or a synthetic robot that
+always reports the same state ("dummy"), over unary ControlUpdate calls or the
+ControlStream RPC. Latencies are in milliseconds.
+
+Besides `asv run`, the module runs as a script that writes every metric to a
+JSON report, to compare against a previous run:
+
+    python benchmark_control_loop.py --output control_loop.json
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import socket
+import subprocess
+import time
+
+import grpc
+import numpy as np
+import torch
+from omegaconf import OmegaConf
+
+from polymetis import RobotInterface
+from polymetis.utils.data_dir import BUILD_DIR, which
+from polymetis.utils.grpc_utils import check_server_exists
+from polymetis.utils import latency
+from polymetis.utils.test_policies import num_dofs, test_parametrized_data
+from polymetis_pb2 import LogInterval
+from polysim import GrpcSimulationClient
+from polysim.envs import BulletManipulatorEnv
+from polysim.sim_interface import DEFAULT_METADATA_CFG_PATH
+from polysim.test_utils import FakeEnv
+
+HZ = 1000
+NUM_TICKS = 5000
+NUM_FORWARDS = 1000
+NUM_SWITCHES = 20
+NUM_UPDATES = 200
+STREAM_SECONDS = 2.0
+SERVER_TIMEOUT = 15.0
+
+ROBOT_CLIENTS = ["dummy", "sim"]
+TRANSPORTS = ["unary", "stream"]
+
+inputs = {
+    "joint_positions": torch.zeros(num_dofs),
+    "joint_velocities": torch.zeros(num_dofs),
+}
+policy_names = [x[0].__name__ for x in test_parametrized_data]
+
+
+def latency_stats(latencies_s):
+    latency_arr = 1000.0 * np.asarray(latencies_s)
+    return {
+        "mean": float(np.mean(latency_arr)),
+        "p50": float(np.percentile(latency_arr, 50)),
+        "p99": float(np.percentile(latency_arr, 99)),
+        "max": float(np.max(latency_arr)),
+    }
+
+
+def measure_policy_forwards(policy_class, policy_kwargs):
+    """Times the forward pass of a scripted policy, restarting it when it terminates."""
+    template = torch.jit.script(policy_class(**policy_kwargs))
+    policy = copy.deepcopy(template)
+    latencies = []
+    with torch.no_grad():
+        for _ in range(NUM_FORWARDS):
+            t0 = time.perf_counter()
+            policy.forward(inputs)
+            latencies.append(time.perf_counter() - t0)
+            if policy.is_terminated():
+                policy = copy.deepcopy(template)
+    return latency_stats(latencies)
+
+
+def run_forward_suite():
+    return {
+        name: measure_policy_forwards(policy_class, policy_kwargs)
+        for name, (policy_class, policy_kwargs, _, _) in zip(
+            policy_names, test_parametrized_data
+        )
+    }
+
+
+class ControlLoopSession:
+    """A server on a free port, driven at HZ by a robot client on a background thread."""
+
+    def __init__(self, robot_client, transport):
+        with socket.socket() as s:
+            s.bind(("localhost", 0))
+            self.port = s.getsockname()[1]
+
+        os.environ["PATH"] = BUILD_DIR + os.pathsep + os.environ["PATH"]
+        self.server = subprocess.Popen(
+            [which("run_server"), "-s", "localhost", "-p", str(self.port)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            preexec_fn=os.setpgrp,
+        )
+        t0 = time.time()
+        while not check_server_exists("localhost", self.port):
+            time.sleep(0.1)
+            if time.time() - t0 > SERVER_TIMEOUT:
+                self.close()
+                raise ConnectionError("Unable to locate server.")
+
+        metadata_cfg = OmegaConf.load(DEFAULT_METADATA_CFG_PATH)
+        metadata_cfg.hz = HZ
+        if robot_client == "sim":
+            env = BulletManipulatorEnv(metadata_cfg.robot_model_cfg, gui=False)
+        else:
+            env = FakeEnv(metadata_cfg.robot_model_cfg.num_dofs)
+        self.client = GrpcSimulationClient(
+            metadata_cfg=metadata_cfg,
+            env=env,
+            port=self.port,
+            use_control_stream=transport == "stream",
+        )
+        self.client.run_no_wait()
+
+        # User clients are only served once the robot client is running
+        t0 = time.time()
+        while True:
+            try:
+                self.robot = RobotInterface(ip_address="localhost", port=self.port)
+                break
+            except grpc.RpcError:
+                time.sleep(0.1)
+                if time.time() - t0 > SERVER_TIMEOUT:
+                    self.close()
+                    raise
+
+    def close(self):
+        if getattr(self, "client", None) is not None:
+            self.client.kill_run()
+        os.killpg(os.getpgid(self.server.pid), 9)
+        self.server.wait()
+
+
+def measure_ticks(session):
+    """Round trip times of the control updates, as reported by the robot client."""
+    last_tick = LogInterval(start=NUM_TICKS, end=NUM_TICKS)
+    while not session.robot._get_robot_state_log(last_tick):
+        time.sleep(0.1)
+    # The first state has no previous round trip
+    log = session.robot._get_robot_state_log_columns(
+        LogInterval(start=1, end=NUM_TICKS)
+    )
+    return latency_stats(1e-3 * log["prev_controller_latency_ms"])
+
+
+def measure_policy_switches(robot, use_cache):
+    return latency_stats(latency.time_policy_switches(robot, use_cache, NUM_SWITCHES))
+
+
+def measure_param_updates(robot, use_fast_path):
+    robot.start_joint_impedance()
+    joint_pos = robot.get_joint_positions()
+    latencies = latency.time_param_updates(
+        robot, {"joint_pos_desired": joint_pos}, use_fast_path, NUM_UPDATES
+    )
+    robot.terminate_current_policy(return_log=False)
+    return latency_stats(latencies)
+
+
+def measure_state_stream(robot):
+    with robot.subscribe_robot_state() as sub:
+        time.sleep(STREAM_SECONDS)
+        stats = sub.get_stats()
+    return {
+        "rate": stats["received"] / STREAM_SECONDS,
+        "mean_latency": 1000.0 * stats["mean_latency"],
+        "server_dropped": stats["server_dropped"],
+    }
+
+
+def run_control_loop_suite(robot_client, transport):
+    session = ControlLoopSession(robot_client, transport)
+    try:
+        return {
+            "tick": measure_ticks(session),
+            "switch_cold": measure_policy_switches(session.robot, use_cache=False),
+            "switch_cached": measure_policy_switches(session.robot, use_cache=True),
+            "update_module": measure_param_updates(session.robot, use_fast_path=False),
+            "update_tensor": measure_param_updates(session.robot, use_fast_path=True),
+            "state_stream": measure_state_stream(session.robot),
+        }
+    finally:
+        session.close()
+
+
+class TrackPolicyForward:
+    params = policy_names
+    param_names = ["policy"]
+    unit = "ms"
+
+    def setup_cache(self):
+        return run_forward_suite()
+
+    def track_forward_p50(self, results, policy):
+        return results[policy]["p50"]
+
+    def track_forward_p99(self, results, policy):
+        return results[policy]["p99"]
+
+    def track_forward_max(self, results, policy):
+        return results[policy]["max"]
+
+
+class TrackControlLoop:
+    params = (ROBOT_CLIENTS, TRANSPORTS)
+    param_names = ["robot_client", "transport"]
+    unit = "ms"
+    timeout = 600
+
+    def setup_cache(self):
+        return {
+            f"{robot_client}/{transport}": run_control_loop_suite(
+                robot_client, transport
+            )
+            for robot_client in ROBOT_CLIENTS
+            for transport in TRANSPORTS
+        }
+
+    def track_tick_p50(self, results, robot_client, transport):
+        return results[f"{robot_client}/{transport}"]["tick"]["p50"]
+
+    def track_tick_p99(self, results, robot_client, transport):
+        return results[f"{robot_client}/{transport}"]["tick"]["p99"]
+
+    def track_tick_max(self, results, robot_client, transport):
+        return results[f"{robot_client}/{transport}"]["tick"]["max"]
+
+    def track_switch_cold_p50(self, results, robot_client, transport):
+        return results[f"{robot_client}/{transport}"]["switch_cold"]["p50"]
+
+    def track_switch_cached_p50(self, results, robot_client, transport):
+        return results[f"{robot_client}/{transport}"]["switch_cached"]["p50"]
+
+    def track_update_module_p50(self, results, robot_client, transport):
+        return results[f"{robot_client}/{transport}"]["update_module"]["p50"]
+
+    def track_update_tensor_p50(self, results, robot_client, transport):
+        return results[f"{robot_client}/{transport}"]["update_tensor"]["p50"]
+
+    def track_update_tensor_p99(self, results, robot_client, transport):
+        return results[f"{robot_client}/{transport}"]["update_tensor"]["p99"]
+
+    def track_state_stream_rate(self, results, robot_client, transport):
+        return results[f"{robot_client}/{transport}"]["state_stream"]["rate"]
+
+    track_state_stream_rate.unit = "states/s"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--output", default="control_loop.json")
+    parser.add_argument("--robot-clients", nargs="+", default=ROBOT_CLIENTS)
+    parser.add_argument("--transports", nargs="+", default=TRANSPORTS)
+    args = parser.parse_args()
+
+    report = {
+        "host": {
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "torch": torch.__version__,
+        },
+        "config": {"hz": HZ, "num_ticks": NUM_TICKS, "num_forwards": NUM_FORWARDS},
+        "policy_forward": run_forward_suite(),
+        "control_loop": {
+            f"{robot_client}/{transport}": run_control_loop_suite(
+                robot_client, transport
+            )
+            for robot_client in args.robot_clients
+            for transport in args.transports
+        },
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
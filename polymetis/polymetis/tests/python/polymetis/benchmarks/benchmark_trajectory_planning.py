@@ -0,0 +1,87 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+import torch
+
+import torchcontrol as toco
+from torchcontrol.transform import Rotation as R
+from torchcontrol.transform import Transformation as T
+
+from polymetis.utils.test_policies import robot_model, num_dofs
+
+
+num_steps = 10000
+hz = 1000
+time_to_go = num_steps / hz
+inputs = {
+    "joint_positions": torch.zeros(num_dofs),
+    "joint_velocities": torch.zeros(num_dofs),
+}
+
+
+class TimeTrajectoryPlanning:
+    """Planning a 10k-step trajectory, as tensors & as a list of waypoints"""
+
+    def setup(self):
+        self.joint_start = torch.rand(num_dofs)
+        self.joint_goal = torch.rand(num_dofs)
+        self.pose_start = T.from_rot_xyz(
+            translation=torch.rand(3), rotation=R.from_rotvec(torch.rand(3))
+        )
+        self.pose_goal = T.from_rot_xyz(
+            translation=torch.rand(3), rotation=R.from_rotvec(torch.rand(3))
+        )
+
+    def time_joint_plan(self):
+        toco.planning.plan_joint_space_min_jerk(
+            self.joint_start, self.joint_goal, time_to_go, hz
+        )
+
+    def time_joint_waypoints(self):
+        toco.planning.generate_joint_space_min_jerk(
+            self.joint_start, self.joint_goal, time_to_go, hz
+        )
+
+    def time_cartesian_plan(self):
+        toco.planning.plan_cartesian_space_min_jerk(
+            self.pose_start, self.pose_goal, time_to_go, hz
+        )
+
+    def time_cartesian_waypoints(self):
+        toco.planning.generate_cartesian_space_min_jerk(
+            self.pose_start, self.pose_goal, time_to_go, hz
+        )
+
+
+class TimeTrajectoryExecutor:
+    """Building a 10k-step trajectory executor & its per-tick cost at the start & end of the trajectory"""
+
+    params = ["start", "end"]
+
+    def setup(self, step):
+        plan = toco.planning.plan_joint_space_min_jerk(
+            torch.rand(num_dofs), torch.rand(num_dofs), time_to_go, hz
+        )
+        self.policy_kwargs = dict(
+            joint_pos_trajectory=plan["position"],
+            joint_vel_trajectory=plan["velocity"],
+            Kq=torch.rand(num_dofs, num_dofs),
+            Kqd=torch.rand(num_dofs, num_dofs),
+            Kx=torch.rand(6, 6),
+            Kxd=torch.rand(6, 6),
+            robot_model=robot_model,
+            ignore_gravity=True,
+        )
+        self.policy = torch.jit.script(
+            toco.policies.JointTrajectoryExecutor(**self.policy_kwargs)
+        )
+        self.policy.i = 0 if step == "start" else num_steps - 2
+
+    def time_build_policy(self, step):
+        toco.policies.JointTrajectoryExecutor(**self.policy_kwargs)
+
+    def time_policy_tick(self, step):
+        with torch.no_grad():
+            self.policy.forward(inputs)
+        self.policy.i -= 1
@@ -0,0 +1,115 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+from typing import Dict
+
+import pytest
+import torch
+
+from polymetis.utils.policy_cache import (
+    ScriptedPolicyCache,
+    policy_digest,
+    to_module_attribute,
+)
+
+
+class Gain(torch.nn.Module):
+    def __init__(self, gain):
+        super().__init__()
+        self.gain = torch.nn.Parameter(torch.full((3,), gain))
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.gain * x
+
+
+class Policy(torch.nn.Module):
+    _param_dict: Dict[str, torch.Tensor]
+
+    def __init__(self, goal, num_steps, scale=1.0, mode="pd"):
+        self._param_dict = {"_": torch.Tensor()}
+        super().__init__()
+        self.feedback = Gain(goal)
+        self.goal = torch.nn.Parameter(torch.full((3,), goal))
+        self._param_dict["goal"] = self.goal
+        self.traj = torch.arange(num_steps * 3, dtype=torch.float32).reshape(-1, 3)
+        self.scale = scale
+        self.mode = mode
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.scale * (
+            self.feedback(x) + self._param_dict["goal"] + self.traj.sum(dim=0)
+        )
+
+
+def test_policy_digest():
+    assert policy_digest(Policy(1.0, 5)) == policy_digest(Policy(2.0, 10, scale=3.0))
+    assert policy_digest(Policy(1.0, 5)) != policy_digest(Policy(1.0, 5, mode="ff"))
+
+
+@pytest.mark.parametrize("num_steps", [5, 10])
+def test_scripted_policy_cache(num_steps):
+    cache = ScriptedPolicyCache()
+    first = Policy(1.0, 5)
+    scripted_first, _ = cache.get(first)
+
+    policy = Policy(2.0, num_steps, scale=3.0)
+    scripted, overrides = cache.get(policy)
+    assert scripted is scripted_first
+    assert len(cache) == 1
+    assert set(overrides) == {"goal", "traj", "scale", "feedback.gain"}
+
+    x = torch.ones(3)
+    assert torch.allclose(scripted(x), policy(x))
+    # The cached module does not share its tensors with the first policy
+    assert torch.allclose(first.goal, torch.full((3,), 1.0))
+
+
+def test_to_module_attribute():
+    msg = to_module_attribute("traj", torch.zeros(4, 3, dtype=torch.float64))
+    assert msg.tensor.dtype == "float64"
+    assert list(msg.tensor.shape) == [4, 3]
+    assert len(msg.tensor.data) == 4 * 3 * 8
+    assert to_module_attribute("scale", 3.0).float_value == 3.0
+    assert to_module_attribute("steps", 3).int_value == 3
+    assert to_module_attribute("enabled", True).bool_value
+
+
+class ListPolicy(torch.nn.Module):
+    def __init__(self, waypoints, extra=None):
+        super().__init__()
+        self.waypoints = waypoints
+        self.extra = extra
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return x + self.waypoints[0]
+
+
+def test_policy_digest_containers():
+    # Tensors in containers are not overridden, so they are hashed by content,
+    # including large tensors that repr elides
+    waypoints = [torch.zeros(2000), torch.ones(3)]
+    other_waypoints = [torch.zeros(2000), torch.ones(3)]
+    other_waypoints[0][1000] = 1.0
+    assert repr(waypoints) == repr(other_waypoints)
+    assert policy_digest(ListPolicy(waypoints)) != policy_digest(
+        ListPolicy(other_waypoints)
+    )
+    assert policy_digest(ListPolicy(waypoints)) == policy_digest(
+        ListPolicy([w.clone() for w in waypoints])
+    )
+    assert policy_digest(ListPolicy(waypoints, {"a": [1, 2.0]})) != policy_digest(
+        ListPolicy(waypoints, {"a": [1, 3.0]})
+    )
+
+
+def test_uncacheable_policy():
+    # Attributes of unknown types make the policy uncacheable
+    policy = ListPolicy([torch.ones(3)], extra=object())
+    assert policy_digest(policy) is None
+
+    cache = ScriptedPolicyCache()
+    scripted, overrides = cache.get(policy)
+    assert overrides == {}
+    assert len(cache) == 0
+    assert torch.allclose(scripted(torch.ones(3)), policy(torch.ones(3)))
@@ -0,0 +1,78 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+import numpy as np
+
+import polymetis_pb2
+from polymetis.utils.robot_state_log import chunks_to_columns, states_to_columns
+
+
+def make_state(i, dof=7):
+    state = polymetis_pb2.RobotState(
+        joint_positions=[0.1 * i + j for j in range(dof)],
+        joint_velocities=[-0.2 * j for j in range(dof)],
+        prev_controller_latency_ms=0.5 * i,
+        prev_command_successful=i % 2 == 0,
+        error_code=i,
+    )
+    state.timestamp.seconds = 100 + i
+    state.timestamp.nanos = 1000 * i
+    return state
+
+
+def make_column(name, array):
+    array = np.ascontiguousarray(array)
+    return polymetis_pb2.RobotStateColumn(
+        name=name,
+        values=polymetis_pb2.TensorData(
+            dtype=array.dtype.name, shape=array.shape, data=array.tobytes()
+        ),
+    )
+
+
+def make_chunk(states):
+    """Packs states the way the server does."""
+    columns = states_to_columns(states)
+    chunk = polymetis_pb2.RobotStateLogChunk(num_states=len(states))
+    chunk.columns.append(
+        make_column(
+            "timestamp_seconds",
+            np.array([s.timestamp.seconds for s in states], dtype=np.int64),
+        )
+    )
+    chunk.columns.append(
+        make_column(
+            "timestamp_nanos",
+            np.array([s.timestamp.nanos for s in states], dtype=np.int32),
+        )
+    )
+    for name, array in columns.items():
+        if name != "timestamp":
+            chunk.columns.append(make_column(name, array))
+    return chunk
+
+
+def test_chunks_to_columns():
+    states = [make_state(i) for i in range(5)]
+    # The second chunk has a wider repeated field, which pads the first one
+    states.append(make_state(5, dof=9))
+    columns = chunks_to_columns([make_chunk(states[:3]), make_chunk(states[3:])])
+    expected = states_to_columns(states)
+
+    assert columns.keys() == expected.keys()
+    for name, array in expected.items():
+        assert columns[name].dtype == array.dtype
+        np.testing.assert_array_equal(columns[name], array)
+
+    assert columns["joint_positions"].shape == (6, 9)
+    assert np.isnan(columns["joint_positions"][0, 7:]).all()
+    assert columns["timestamp"][2] == 102 + 2e-6
+    assert columns["error_code"].tolist() == list(range(6))
+    assert "mass_matrix" not in columns
+
+
+def test_empty_log():
+    columns = chunks_to_columns([])
+    assert columns["timestamp"].shape == (0,)
+    assert columns["joint_positions"].shape == (0, 0)
@@ -0,0 +1,191 @@
+# Copyright (c) Facebook, Inc. and its affiliates.
+#
+# This source code is licensed under the MIT license found in the
+# LICENSE file in the root directory of this source tree.
+import queue
+import threading
+import time
+
+import grpc
+import numpy as np
+import pytest
+import torch
+from unittest.mock import MagicMock
+
+import polymetis_pb2
+from polymetis.utils.robot_state_stream import RobotStateSample, RobotStateSubscription
+
+
+def make_state(i):
+    state = polymetis_pb2.RobotState(
+        joint_positions=[0.1 * i + j for j in range(7)],
+        joint_velocities=[-0.2 * j for j in range(7)],
+        prev_controller_latency_ms=1.5,
+        prev_command_successful=True,
+        error_code=-3,
+    )
+    state.timestamp.GetCurrentTime()
+    return state
+
+
+def make_batch(states, num_dropped=0):
+    return polymetis_pb2.RobotStateBatch(
+        states=states, num_dropped=num_dropped
+    ).SerializeToString()
+
+
+class FakeStream:
+    """Stands in for the grpc call object of a server-streaming RPC."""
+
+    def __init__(self, messages, error=None):
+        self.messages = messages
+        self.error = error
+        self.cancelled = threading.Event()
+
+    def __iter__(self):
+        for msg in self.messages:
+            yield msg
+        if self.error is not None:
+            raise self.error
+        self.cancelled.wait()
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+@pytest.fixture
+def mocked_channel():
+    states = [make_state(i) for i in range(10)]
+    stream = FakeStream([make_batch(states[:3]), make_batch(states[3:])])
+    channel = MagicMock()
+    channel.unary_stream.return_value = MagicMock(return_value=stream)
+    return channel
+
+
+def test_robot_state_sample():
+    state = make_state(2)
+    sample = RobotStateSample(state.SerializeToString())
+
+    assert np.allclose(sample.numpy("joint_positions"), state.joint_positions)
+    assert torch.allclose(
+        sample.torch("joint_velocities"), torch.Tensor(state.joint_velocities)
+    )
+    assert sample.joint_positions.dtype == np.float32
+    assert sample.numpy("jacobian").size == 0
+    assert sample.prev_controller_latency_ms == pytest.approx(1.5)
+    assert sample.prev_command_successful
+    assert sample.error_code == -3
+    assert sample.timestamp == pytest.approx(
+        state.timestamp.seconds + 1e-9 * state.timestamp.nanos
+    )
+    assert sample.to_proto() == state
+    with pytest.raises(KeyError):
+        sample.numpy("error_code")
+
+
+def test_subscription_queue(mocked_channel):
+    q = queue.Queue(maxsize=4)
+    callback = MagicMock()
+    sub = RobotStateSubscription(mocked_channel, callback=callback, queue=q)
+
+    # Wait for the stream to be consumed
+    for _ in range(100):
+        if sub.num_received == 10:
+            break
+        time.sleep(0.01)
+    sub.close()
+
+    stats = sub.get_stats()
+    assert stats["received"] == 10
+    assert stats["delivered"] == 4
+    assert stats["dropped"] == 6
+    assert callback.call_count == 4
+    assert np.allclose(sub.latest().joint_positions, make_state(9).joint_positions)
+    assert np.allclose(q.get().joint_positions, make_state(0).joint_positions)
+    assert not sub.is_active()
+
+
+def test_subscription_rate(mocked_channel):
+    callback = MagicMock()
+    with RobotStateSubscription(mocked_channel, callback=callback, rate=1.0) as sub:
+        assert sub.latest(timeout=1.0) is not None
+        for _ in range(100):
+            if sub.num_received == 10:
+                break
+            time.sleep(0.01)
+
+    # The stream arrives within a second, so only the first state is delivered
+    assert callback.call_count == 1
+
+
+class FakeRpcError(grpc.RpcError):
+    def __init__(self, code):
+        self._code = code
+
+    def code(self):
+        return self._code
+
+
+def wait_for_states(sub, num_states):
+    for _ in range(100):
+        if sub.num_received == num_states:
+            break
+        time.sleep(0.01)
+
+
+def test_subscription_server_dropped():
+    stream = FakeStream(
+        [make_batch([make_state(0)]), make_batch([make_state(5)], num_dropped=4)]
+    )
+    channel = MagicMock()
+    channel.unary_stream.return_value = MagicMock(return_value=stream)
+
+    with RobotStateSubscription(channel, stride=2) as sub:
+        wait_for_states(sub, 2)
+
+    request = channel.unary_stream.return_value.call_args[0][0]
+    assert request.stride == 2
+    stats = sub.get_stats()
+    assert stats["received"] == 2
+    assert stats["server_dropped"] == 4
+    assert np.allclose(sub.latest().joint_positions, make_state(5).joint_positions)
+
+
+def test_subscription_legacy_fallback():
+    # Servers without SubscribeRobotState send unbatched states
+    batched = FakeStream([], error=FakeRpcError(grpc.StatusCode.UNIMPLEMENTED))
+    legacy = FakeStream([make_state(i).SerializeToString() for i in range(10)])
+    channel = MagicMock()
+    channel.unary_stream.return_value = MagicMock(side_effect=[batched, legacy])
+
+    with RobotStateSubscription(channel, stride=3) as sub:
+        wait_for_states(sub, 4)
+
+    assert sub.get_stats()["received"] == 4
+    assert np.allclose(sub.latest().joint_positions, make_state(9).joint_positions)
+
+
+def test_subscription_parse_error():
+    # A malformed message ends the stream, and the error surfaces to the user
+    stream = FakeStream([make_batch([make_state(0)]), b"\x0b"])
+    channel = MagicMock()
+    channel.unary_stream.return_value = MagicMock(return_value=stream)
+
+    sub = RobotStateSubscription(channel)
+    sub._thread.join(1.0)
+
+    assert not sub.is_active()
+    with pytest.raises(ValueError):
+        sub.latest()
+    with pytest.raises(ValueError):
+        sub.get_stats()
+
+
+def test_subscription_callback_error(mocked_channel):
+    # A failing callback does not stop the stream
+    callback = MagicMock(side_effect=RuntimeError)
+    with RobotStateSubscription(mocked_channel, callback=callback) as sub:
+        wait_for_states(sub, 10)
+
+    assert callback.call_count == 10
+    assert sub.get_stats()["received"] == 10
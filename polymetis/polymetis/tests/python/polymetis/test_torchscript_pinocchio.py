@@ -195,3 +195,52 @@ def test_inverse_kinematics(pybullet_env, pinocchio_wrapper, joint_states):
 
     # Compare
     assert torch.allclose(pinocchio_joint_pos, pybullet_joint_pos, atol=1e-1)
+
+
+@pytest.mark.parametrize("num_threads", [1, 3])
+def test_batched_kinematics(pinocchio_wrapper, num_threads):
+    batch_size = 8
+    torch.manual_seed(0)
+    joint_pos = 0.1 * torch.randn(batch_size, 7)
+    joint_vel = 0.03 * torch.randn(batch_size, 7)
+    joint_acc = 0.01 * torch.randn(batch_size, 7)
+
+    pos, quat = pinocchio_wrapper.forward_kinematics_batch(
+        joint_pos, num_threads=num_threads
+    )
+    jacobians = pinocchio_wrapper.compute_jacobian_batch(
+        joint_pos, num_threads=num_threads
+    )
+    torques = pinocchio_wrapper.inverse_dynamics_batch(
+        joint_pos, joint_vel, joint_acc, num_threads=num_threads
+    )
+    assert pos.shape == (batch_size, 3)
+    assert quat.shape == (batch_size, 4)
+    assert jacobians.shape == (batch_size, 6, 7)
+    assert torques.shape == (batch_size, 7)
+
+    # Batched results match the single-configuration API
+    for i in range(batch_size):
+        pos_i, quat_i = pinocchio_wrapper.forward_kinematics(joint_pos[i])
+        assert torch.allclose(pos[i], pos_i)
+        assert torch.allclose(quat[i], quat_i)
+        assert torch.allclose(
+            jacobians[i], pinocchio_wrapper.compute_jacobian(joint_pos[i])
+        )
+        assert torch.allclose(
+            torques[i],
+            pinocchio_wrapper.inverse_dynamics(
+                joint_pos[i], joint_vel[i], joint_acc[i]
+            ),
+        )
+
+    # Batched IK recovers the sampled poses
+    ik_joint_pos, converged = pinocchio_wrapper.inverse_kinematics_batch(
+        pos, quat, rest_pose=torch.zeros(7), num_threads=num_threads
+    )
+    assert ik_joint_pos.shape == (batch_size, 7)
+    assert converged.shape == (batch_size,)
+    assert converged.all()
+    ik_pos, ik_quat = pinocchio_wrapper.forward_kinematics_batch(ik_joint_pos)
+    assert torch.allclose(pos, ik_pos, atol=1e-3)
+    assert torch.allclose(quat, ik_quat, atol=1e-3)
@@ -9,7 +9,13 @@ import grpc
 import polymetis_pb2_grpc
 
 from polysim import GrpcSimulationClient
-from polysim.test_utils import fake_metadata_cfg, FakeEnv, FakeChannel, FakeConnection
+from polysim.test_utils import (
+    fake_metadata_cfg,
+    FakeEnv,
+    FakeChannel,
+    FakeConnection,
+    FakeControlStream,
+)
 
 N_DIM = 7
 HZ = 250
@@ -32,3 +38,33 @@ def test_spinner(monkeypatch):
     # Run env
     t0 = time.time()
     sim.run(time_horizon=STEPS)
+
+
+class FakeRpcError(grpc.RpcError):
+    def code(self):
+        return grpc.StatusCode.UNIMPLEMENTED
+
+
+class FakeLegacyConnection(FakeConnection):
+    def ControlStream(self, robot_states):
+        def unimplemented():
+            raise FakeRpcError()
+            yield
+
+        return FakeControlStream(unimplemented())
+
+
+@pytest.mark.parametrize("connection", [FakeConnection, FakeLegacyConnection])
+def test_lockstep(monkeypatch, connection):
+    monkeypatch.setattr(grpc, "insecure_channel", FakeChannel)
+    monkeypatch.setattr(polymetis_pb2_grpc, "PolymetisControllerServerStub", connection)
+
+    env = FakeEnv(N_DIM)
+    fake_metadata_cfg.hz = HZ
+    sim = GrpcSimulationClient(env=env, metadata_cfg=fake_metadata_cfg, lockstep=True)
+
+    # Not paced to HZ
+    t0 = time.time()
+    sim.run(time_horizon=STEPS)
+    assert time.time() - t0 < 0.5 * STEPS / HZ
+    assert sim.connection.num_updates == STEPS
@@ -5,6 +5,8 @@
 #ifndef TORCH_SERVER_OPS_H
 #define TORCH_SERVER_OPS_H
 
+#include <cstddef>
+#include <cstdint>
 #include <map>
 #include <vector>
 
@@ -19,8 +21,24 @@ struct TorchTensor;       // torch::Tensor
 struct TorchScriptModule; // torch::jit::script::Module
 struct TorchInput;        // std::vector<torch::jit::IValue>
 struct StateDict;         // c10::Dict<std::string, struct TorchTensor>
+struct ParamTable;        // Parameters of a module, addressed by index
+struct ParamDictUpdate;   // Module attributes changed by update()
+struct ModuleCache;       // Loaded modules, addressed by digest
 
 class C_TORCH_EXPORT TorchRobotState {
+public:
+  // Float fields of the state dict
+  enum Field {
+    JOINT_POSITIONS,
+    JOINT_VELOCITIES,
+    MOTOR_TORQUES_MEASURED,
+    MOTOR_TORQUES_EXTERNAL,
+    MASS_MATRIX,
+    EE_POSE,
+    JACOBIAN,
+    NUM_FIELDS
+  };
+
 private:
   struct StateDict *state_dict_ = nullptr;
 
@@ -34,21 +52,68 @@ private:
   struct TorchTensor *rs_ee_pose_ = nullptr;
   struct TorchTensor *rs_jacobian_ = nullptr;
 
+  // Storage of the preallocated tensors above
+  int32_t *timestamp_data_ = nullptr;
+  float *field_data_[NUM_FIELDS];
+  int field_size_[NUM_FIELDS];
+
 public:
   TorchRobotState(int num_dofs);
   ~TorchRobotState();
-  void update_state(int timestamp_s, int timestamp_ns,
-                    std::vector<float> joint_positions,
-                    std::vector<float> joint_velocities,
-                    std::vector<float> motor_torques_measured,
-                    std::vector<float> motor_torques_external,
-                    std::vector<float> mass_matrix,
-                    std::vector<float> ee_pose,
-                    std::vector<float> jacobian);
+
+  /**
+  Copy new values into the preallocated state tensors, in place. At most the
+  size of the field is copied, so that `size` is typically the size of the
+  incoming protobuf field.
+  */
+  void update_timestamp(int timestamp_s, int timestamp_ns);
+  void update_field(Field field, const float *data, int size);
+
   struct TorchInput *input_ = nullptr;
   int num_dofs_;
 };
 
+/**
+A new value for an attribute of a cached module. `kind` selects which of the
+value fields is used; tensors are given as a raw buffer of `dtype`.
+*/
+struct ModuleAttributeValue {
+  enum Kind { TENSOR, INT, FLOAT, BOOL };
+
+  const char *name; // path from the root module, e.g. "joint_pd.Kp"
+  Kind kind;
+
+  const char *dtype;
+  const int64_t *shape;
+  int ndim;
+  const char *data;
+  size_t size;
+
+  int64_t int_value;
+  double float_value;
+  bool bool_value;
+};
+
+/**
+Least-recently-used cache of deserialized TorchScript modules, so that
+controllers sent before can be instantiated again without reloading them.
+*/
+class C_TORCH_EXPORT TorchModuleCache {
+private:
+  struct ModuleCache *cache_ = nullptr;
+
+public:
+  TorchModuleCache(int capacity);
+  ~TorchModuleCache();
+  TorchModuleCache(const TorchModuleCache &) = delete;
+  TorchModuleCache &operator=(const TorchModuleCache &) = delete;
+
+  bool contains(const char *digest);
+  void insert(const char *digest, char *data, size_t size);
+
+  friend class TorchScriptedController;
+};
+
 class C_TORCH_EXPORT TorchScriptedController {
 private:
   struct TorchScriptModule *module_ = nullptr;
@@ -58,18 +123,48 @@ private:
   struct TorchInput *param_dict_input_ = nullptr;
   struct TorchInput *empty_input_ = nullptr;
 
+  // Parameters updatable in place, and their staged updates
+  struct ParamTable *param_table_ = nullptr;
+
+  // Attributes changed by the module's update(), staged by param_dict_load
+  struct ParamDictUpdate *param_dict_update_ = nullptr;
+
 public:
   TorchScriptedController(char *data, size_t size,
                           TorchRobotState &init_robot_state);
+  // Copy of the module cached under `digest`, with some attributes replaced
+  TorchScriptedController(TorchModuleCache &cache, const char *digest,
+                          const std::vector<ModuleAttributeValue> &attributes,
+                          TorchRobotState &init_robot_state);
   ~TorchScriptedController();
 
+  void init(TorchRobotState &init_robot_state);
+
   void warmup_controller(int warmup_iters, TorchRobotState &init_robot_state);
 
   std::vector<float> forward(TorchRobotState &input);
 
+  // Run the module's update() on a copy of the module, and stage the tensors
+  // & scalars it changed. param_dict_update_module then only copies them into
+  // the module, so that a slow update() does not stall the control loop.
+  // Changes to other attributes (e.g. lists or dicts) are not carried over.
   bool param_dict_load(char *data, size_t size);
   void param_dict_update_module();
 
+  // Parameter schema: the entries of the module's parameter dict, by index
+  int param_count();
+  const char *param_name(int idx);
+  std::vector<int64_t> param_shape(int idx);
+  // torch dtype name, e.g. "float64"
+  const char *param_dtype(int idx);
+
+  // Stage new values for the parameters at `indices` from a flat buffer of
+  // their values, each in its own dtype, then copy them into the module's
+  // parameters in place.
+  bool param_tensor_load(const int *indices, int num_indices, const char *data,
+                         size_t size);
+  void param_tensor_update_module();
+
   bool is_terminated();
   void reset();
 };
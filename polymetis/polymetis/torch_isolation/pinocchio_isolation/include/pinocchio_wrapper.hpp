@@ -44,7 +44,34 @@ inverse_kinematics(State *state, const Eigen::Vector3d &link_pos,
                    const Eigen::Quaterniond &link_quat, int64_t frame_idx,
                    Eigen::VectorXd &rest_pose, double eps = 1e-4,
                    int64_t max_iters = 1000, double dt = 0.1,
-                   double damping = 1e-12);
+                   double damping = 1e-6);
+
+// Batched variants. Inputs and outputs are contiguous row-major buffers with
+// one row per batch element: q (B, nq), v and a (B, nv), link_pos (B, 3),
+// link_quat (B, 4) in xyzw order, result (B, 7) as position + xyzw quaternion,
+// J (B, 6, nv) and tau (B, nv). ik_sol holds the rest poses on input and the
+// IK solutions on output. The batch is split across num_threads threads, each
+// with its own pinocchio::Data.
+C_TORCH_EXPORT void forward_kinematics_batch(State *state, const double *q,
+                                             int64_t batch_size,
+                                             int64_t frame_idx, double *result,
+                                             int64_t num_threads = 1);
+C_TORCH_EXPORT void compute_jacobian_batch(State *state, const double *q,
+                                           int64_t batch_size,
+                                           int64_t frame_idx, double *J,
+                                           int64_t num_threads = 1);
+C_TORCH_EXPORT void inverse_dynamics_batch(State *state, const double *q,
+                                           const double *v, const double *a,
+                                           int64_t batch_size, double *tau,
+                                           int64_t num_threads = 1);
+// Sets converged (B,) to whether IK converged for each target, and returns the
+// number of targets for which it did not.
+C_TORCH_EXPORT int64_t inverse_kinematics_batch(
+    State *state, const double *link_pos, const double *link_quat,
+    int64_t batch_size, int64_t frame_idx, double *ik_sol, bool *converged,
+    double eps = 1e-4, int64_t max_iters = 1000, double dt = 0.1,
+    double damping = 1e-6, int64_t num_threads = 1);
+
 C_TORCH_EXPORT int64_t get_link_idx_from_name(State *state,
                                               const char *link_name);
 C_TORCH_EXPORT char *get_link_name_from_idx(State *state, int64_t link_idx);
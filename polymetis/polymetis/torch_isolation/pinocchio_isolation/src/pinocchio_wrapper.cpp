@@ -4,8 +4,12 @@
 // LICENSE file in the root directory of this source tree.
 
 #include "spdlog/spdlog.h"
+#include <algorithm>
+#include <limits>
 #include <stdexcept>
 #include <string>
+#include <thread>
+#include <vector>
 
 #include "pinocchio/algorithm/frames.hpp"
 #include "pinocchio/algorithm/jacobian.hpp"
@@ -17,29 +21,115 @@
 
 #include "pinocchio_wrapper.hpp"
 
+namespace {
+
+using RowMatrixXd =
+    Eigen::Matrix<double, Eigen::Dynamic, Eigen::Dynamic, Eigen::RowMajor>;
+
+void frame_pose(const pinocchio::Model &model, pinocchio::Data &model_data,
+                const Eigen::Ref<const Eigen::VectorXd> &q,
+                pinocchio::FrameIndex frame_idx, double *result) {
+  pinocchio::forwardKinematics(model, model_data, q);
+  pinocchio::updateFramePlacement(model, model_data, frame_idx);
+
+  auto pos_data = model_data.oMf[frame_idx].translation();
+  auto quat_data = Eigen::Quaterniond(model_data.oMf[frame_idx].rotation());
+
+  for (int i = 0; i < 3; i++) {
+    result[i] = pos_data[i];
+  }
+  result[3] = quat_data.x();
+  result[4] = quat_data.y();
+  result[5] = quat_data.z();
+  result[6] = quat_data.w();
+}
+
+// Closed-loop IK from the initial guess in ik_sol_p_. ik_sol_v and ik_sol_J
+// are scratch buffers. Returns whether the solver converged.
+bool clik(const pinocchio::Model &model, pinocchio::Data &model_data,
+          Eigen::VectorXd &ik_sol_v, pinocchio::Data::Matrix6x &ik_sol_J,
+          const pinocchio::SE3 &desired_ee, pinocchio::FrameIndex frame_idx,
+          Eigen::Ref<Eigen::VectorXd> ik_sol_p_, double eps, int64_t max_iters,
+          double dt, double damping) {
+  ik_sol_J.setZero();
+
+  Eigen::Matrix<double, 6, 1> err;
+  err.setConstant(std::numeric_limits<double>::infinity());
+  ik_sol_v.setZero();
+
+  // Solve IK iteratively
+  for (int i = 0; i < max_iters; i++) {
+    // Compute forward kinematics error
+    pinocchio::forwardKinematics(model, model_data, ik_sol_p_);
+    pinocchio::updateFramePlacement(model, model_data, frame_idx);
+    const pinocchio::SE3 dMf = desired_ee.actInv(model_data.oMf[frame_idx]);
+    err = pinocchio::log6(dMf).toVector();
+
+    // Check termination
+    if (err.norm() < eps) {
+      break;
+    }
+
+    // Descent solution
+    pinocchio::computeFrameJacobian(model, model_data, ik_sol_p_, frame_idx,
+                                    pinocchio::LOCAL, ik_sol_J);
+
+    pinocchio::Data::Matrix6 JJt;
+    JJt.noalias() = ik_sol_J * ik_sol_J.transpose();
+    JJt.diagonal().array() += damping;
+    ik_sol_v.noalias() = -ik_sol_J.transpose() * JJt.ldlt().solve(err);
+    ik_sol_p_ = pinocchio::integrate(model, ik_sol_p_, ik_sol_v * dt);
+  }
+
+  return err.norm() < eps;
+}
+
+// Runs fn(begin, end, model_data) over [0, batch_size) split into contiguous
+// chunks. pinocchio::Data is scratch space that cannot be shared between
+// threads, so every chunk gets its own copy.
+template <typename F>
+void parallel_for(pinocchio_wrapper::State *state, int64_t batch_size,
+                  int64_t num_threads, const F &fn) {
+  num_threads = std::max<int64_t>(1, std::min(num_threads, batch_size));
+  int64_t chunk_size = (batch_size + num_threads - 1) / num_threads;
+
+  std::vector<std::thread> workers;
+  for (int64_t begin = chunk_size; begin < batch_size; begin += chunk_size) {
+    int64_t end = std::min(begin + chunk_size, batch_size);
+    workers.emplace_back([state, begin, end, &fn]() {
+      pinocchio::Data model_data(*state->model);
+      fn(begin, end, model_data);
+    });
+  }
+  pinocchio::Data model_data(*state->model);
+  fn(0, std::min(chunk_size, batch_size), model_data);
+  for (auto &worker : workers) {
+    worker.join();
+  }
+}
+
+} // namespace
+
 extern "C" {
 
 namespace pinocchio_wrapper {
 
+// Only the model is shared, and it is never written after initialize. Every
+// call allocates its own pinocchio::Data, so calls on the same State may run
+// concurrently.
 struct State {
   pinocchio::Model *model = nullptr;
-  pinocchio::Data *model_data = nullptr;
-  Eigen::VectorXd ik_sol_v;
-  pinocchio::Data::Matrix6x ik_sol_J;
 };
 
 State *initialize(const char *xml_buffer) {
   auto model = new pinocchio::Model();
   pinocchio::urdf::buildModelFromXML(xml_buffer, *model);
-  auto model_data = new pinocchio::Data(*model);
 
-  return new State{model, model_data, Eigen::VectorXd(model->nv),
-                   pinocchio::Data::Matrix6x(6, model->nv)};
+  return new State{model};
 }
 
 void destroy(State *state) {
   delete state->model;
-  delete state->model_data;
   delete state;
 }
 
@@ -57,27 +147,28 @@ int get_nq(State *pinocchio_state) { return pinocchio_state->model->nq; }
 Eigen::VectorXd forward_kinematics(State *pinocchio_state,
                                    const Eigen::VectorXd &q,
                                    int64_t frame_idx) {
+  Eigen::VectorXd result(7);
+  pinocchio::Data model_data(*pinocchio_state->model);
+  frame_pose(*pinocchio_state->model, model_data, q,
+             static_cast<pinocchio::FrameIndex>(frame_idx), result.data());
+  return result;
+}
+
+void forward_kinematics_batch(State *state, const double *q,
+                              int64_t batch_size, int64_t frame_idx,
+                              double *result, int64_t num_threads) {
+  const auto &model = *state->model;
+  Eigen::Map<const RowMatrixXd> q_(q, batch_size, model.nq);
   pinocchio::FrameIndex frame_idx_ =
       static_cast<pinocchio::FrameIndex>(frame_idx);
-  auto model = *pinocchio_state->model;
-  auto model_data = *pinocchio_state->model_data;
-
-  pinocchio::forwardKinematics(model, model_data, q);
-  pinocchio::updateFramePlacement(model, model_data, frame_idx_);
 
-  auto pos_data = model_data.oMf[frame_idx_].translation().transpose();
-  auto quat_data = Eigen::Quaterniond(model_data.oMf[frame_idx_].rotation());
-
-  Eigen::VectorXd result(7);
-  for (int i = 0; i < 3; i++) {
-    result[i] = pos_data[i];
-  }
-  result[3] = quat_data.x();
-  result[4] = quat_data.y();
-  result[5] = quat_data.z();
-  result[6] = quat_data.w();
-
-  return result;
+  parallel_for(state, batch_size, num_threads,
+               [&](int64_t begin, int64_t end, pinocchio::Data &model_data) {
+                 for (int64_t b = begin; b < end; b++) {
+                   frame_pose(model, model_data, q_.row(b).transpose(),
+                              frame_idx_, result + 7 * b);
+                 }
+               });
 }
 
 void compute_jacobian(
@@ -87,8 +178,8 @@ void compute_jacobian(
     int64_t frame_idx) {
   pinocchio::FrameIndex frame_idx_ =
       static_cast<pinocchio::FrameIndex>(frame_idx);
-  auto model = *state->model;
-  auto model_data = *state->model_data;
+  const auto &model = *state->model;
+  pinocchio::Data model_data(model);
   pinocchio::computeFrameJacobian(model, model_data, joint_positions,
                                   frame_idx_, pinocchio::LOCAL_WORLD_ALIGNED,
                                   J);
@@ -97,63 +188,112 @@ void compute_jacobian(
 Eigen::Matrix<double, Eigen::Dynamic, 1>
 inverse_dynamics(State *state, const Eigen::VectorXd &q,
                  const Eigen::VectorXd &v, const Eigen::VectorXd &a) {
-  auto model = *state->model;
-  auto model_data = *state->model_data;
+  const auto &model = *state->model;
+  pinocchio::Data model_data(model);
   return pinocchio::rnea(model, model_data, q, v, a);
 }
 
-void inverse_kinematics(State *state, const Eigen::Vector3d &link_pos,
-                        const Eigen::Quaterniond &link_quat, int64_t frame_idx,
-                        Eigen::VectorXd &ik_sol_p_, double eps,
-                        int64_t max_iters, double dt, double damping) {
+void compute_jacobian_batch(State *state, const double *q,
+                            int64_t batch_size, int64_t frame_idx, double *J,
+                            int64_t num_threads) {
+  const auto &model = *state->model;
+  Eigen::Map<const RowMatrixXd> q_(q, batch_size, model.nq);
   pinocchio::FrameIndex frame_idx_ =
       static_cast<pinocchio::FrameIndex>(frame_idx);
-  auto model = *state->model;
-  auto model_data = *state->model_data;
-  auto ik_sol_v = state->ik_sol_v;
-  auto ik_sol_J = state->ik_sol_J;
-
-  auto link_orient = link_quat.toRotationMatrix();
-
-  // Initialize IK variables
-  const pinocchio::SE3 desired_ee(link_orient, link_pos);
-
-  ik_sol_J.setZero();
 
-  Eigen::Matrix<double, 6, 1> err;
-  ik_sol_v.setZero();
-
-  // Reset robot pose
-  pinocchio::forwardKinematics(model, model_data, ik_sol_p_);
-  pinocchio::updateFramePlacement(model, model_data, frame_idx_);
+  parallel_for(state, batch_size, num_threads,
+               [&](int64_t begin, int64_t end, pinocchio::Data &model_data) {
+                 pinocchio::Data::Matrix6x J_b(6, model.nv);
+                 for (int64_t b = begin; b < end; b++) {
+                   J_b.setZero();
+                   pinocchio::computeFrameJacobian(
+                       model, model_data, q_.row(b).transpose(), frame_idx_,
+                       pinocchio::LOCAL_WORLD_ALIGNED, J_b);
+                   Eigen::Map<RowMatrixXd>(J + 6 * model.nv * b, 6,
+                                           model.nv) = J_b;
+                 }
+               });
+}
 
-  // Solve IK iteratively
-  for (int i = 0; i < max_iters; i++) {
-    // Compute forward kinematics error
-    pinocchio::forwardKinematics(model, model_data, ik_sol_p_);
-    pinocchio::updateFramePlacement(model, model_data, frame_idx_);
-    const pinocchio::SE3 dMf = desired_ee.actInv(model_data.oMf[frame_idx_]);
-    err = pinocchio::log6(dMf).toVector();
+void inverse_dynamics_batch(State *state, const double *q, const double *v,
+                            const double *a, int64_t batch_size, double *tau,
+                            int64_t num_threads) {
+  const auto &model = *state->model;
+  Eigen::Map<const RowMatrixXd> q_(q, batch_size, model.nq);
+  Eigen::Map<const RowMatrixXd> v_(v, batch_size, model.nv);
+  Eigen::Map<const RowMatrixXd> a_(a, batch_size, model.nv);
+  Eigen::Map<RowMatrixXd> tau_(tau, batch_size, model.nv);
+
+  parallel_for(state, batch_size, num_threads,
+               [&](int64_t begin, int64_t end, pinocchio::Data &model_data) {
+                 for (int64_t b = begin; b < end; b++) {
+                   tau_.row(b) = pinocchio::rnea(model, model_data,
+                                                 q_.row(b).transpose(),
+                                                 v_.row(b).transpose(),
+                                                 a_.row(b).transpose())
+                                     .transpose();
+                 }
+               });
+}
 
-    // Check termination
-    if (err.norm() < eps) {
-      break;
-    }
+void inverse_kinematics(State *state, const Eigen::Vector3d &link_pos,
+                        const Eigen::Quaterniond &link_quat, int64_t frame_idx,
+                        Eigen::VectorXd &ik_sol_p_, double eps,
+                        int64_t max_iters, double dt, double damping) {
+  // Initialize IK variables
+  const auto &model = *state->model;
+  pinocchio::Data model_data(model);
+  Eigen::VectorXd ik_sol_v(model.nv);
+  pinocchio::Data::Matrix6x ik_sol_J(6, model.nv);
+  const pinocchio::SE3 desired_ee(link_quat.toRotationMatrix(), link_pos);
 
-    // Descent solution
-    pinocchio::computeFrameJacobian(model, model_data, ik_sol_p_, frame_idx_,
-                                    pinocchio::LOCAL, ik_sol_J);
+  bool converged = clik(model, model_data, ik_sol_v, ik_sol_J, desired_ee,
+                        static_cast<pinocchio::FrameIndex>(frame_idx),
+                        ik_sol_p_, eps, max_iters, dt, damping);
 
-    pinocchio::Data::Matrix6 JJt;
-    JJt.noalias() = ik_sol_J * ik_sol_J.transpose();
-    JJt.diagonal().array() += damping;
-    ik_sol_v.noalias() = -ik_sol_J.transpose() * JJt.ldlt().solve(err);
-    ik_sol_p_ = pinocchio::integrate(model, ik_sol_p_, ik_sol_v * dt);
+  if (!converged) {
+    spdlog::warn("WARNING: IK did not converge!");
   }
+}
 
-  if (err.norm() >= eps) {
-    spdlog::warn("WARNING: IK did not converge!");
+int64_t inverse_kinematics_batch(State *state, const double *link_pos,
+                                 const double *link_quat, int64_t batch_size,
+                                 int64_t frame_idx, double *ik_sol,
+                                 bool *converged, double eps,
+                                 int64_t max_iters, double dt, double damping,
+                                 int64_t num_threads) {
+  const auto &model = *state->model;
+  Eigen::Map<RowMatrixXd> ik_sol_(ik_sol, batch_size, model.nq);
+  pinocchio::FrameIndex frame_idx_ =
+      static_cast<pinocchio::FrameIndex>(frame_idx);
+
+  parallel_for(
+      state, batch_size, num_threads,
+      [&](int64_t begin, int64_t end, pinocchio::Data &model_data) {
+        Eigen::VectorXd ik_sol_v(model.nv);
+        pinocchio::Data::Matrix6x ik_sol_J(6, model.nv);
+        Eigen::VectorXd ik_sol_p_(model.nq);
+        for (int64_t b = begin; b < end; b++) {
+          const double *quat = link_quat + 4 * b;
+          const pinocchio::SE3 desired_ee(
+              Eigen::Quaterniond(quat[3], quat[0], quat[1], quat[2])
+                  .normalized()
+                  .toRotationMatrix(),
+              Eigen::Map<const Eigen::Vector3d>(link_pos + 3 * b));
+          ik_sol_p_ = ik_sol_.row(b).transpose();
+          converged[b] = clik(model, model_data, ik_sol_v, ik_sol_J,
+                              desired_ee, frame_idx_, ik_sol_p_, eps,
+                              max_iters, dt, damping);
+          ik_sol_.row(b) = ik_sol_p_.transpose();
+        }
+      });
+
+  int64_t num_failed = std::count(converged, converged + batch_size, false);
+  if (num_failed > 0) {
+    spdlog::warn("WARNING: IK did not converge for {} of {} targets!",
+                 num_failed, batch_size);
   }
+  return num_failed;
 }
 
 int64_t get_link_idx_from_name(State *state, const char *link_name) {
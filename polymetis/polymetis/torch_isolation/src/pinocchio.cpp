@@ -24,6 +24,14 @@ torch::Tensor validTensor(torch::Tensor x) {
   return x.to(torch::kDouble);
 }
 
+// Contiguous float64 copy of a (B, n) batch, so the wrapper can read it as a
+// row-major buffer.
+torch::Tensor batchTensor(torch::Tensor x, int64_t n, const char *name) {
+  TORCH_CHECK(x.dim() == 2 && x.size(1) == n, name, " must be of shape (B, ",
+              n, "), got ", x.sizes());
+  return x.to(torch::kDouble).contiguous();
+}
+
 Eigen::VectorXd matrixToVector(Eigen::MatrixXd A) {
   return Eigen::VectorXd(
       Eigen::Map<Eigen::VectorXd>(A.data(), A.cols() * A.rows()));
@@ -152,7 +160,7 @@ struct RobotModelPinocchio : torch::CustomClassHolder {
                                    torch::Tensor link_quat, int64_t frame_idx,
                                    torch::Tensor rest_pose, double eps = 1e-4,
                                    int64_t max_iters = 1000, double dt = 0.1,
-                                   double damping = 1e-12) {
+                                   double damping = 1e-6) {
     link_pos = validTensor(link_pos);
     Eigen::Vector3d link_pos_(
         Eigen::Map<Eigen::Vector3d>(link_pos.data_ptr<double>(), 3));
@@ -170,6 +178,92 @@ struct RobotModelPinocchio : torch::CustomClassHolder {
     return torch::from_blob(ik_sol_p_.data(), dims, torch::kFloat64).clone();
   }
 
+  c10::List<torch::Tensor>
+  forward_kinematics_batch(torch::Tensor joint_positions, int64_t frame_idx,
+                           int64_t num_threads = 1) {
+    int nq = pinocchio_wrapper::get_nq(pinocchio_state_);
+    joint_positions = batchTensor(joint_positions, nq, "joint_positions");
+    int64_t batch_size = joint_positions.size(0);
+
+    torch::Tensor pose = torch::empty({batch_size, 7}, torch::kFloat64);
+    pinocchio_wrapper::forward_kinematics_batch(
+        pinocchio_state_, joint_positions.data_ptr<double>(), batch_size,
+        frame_idx, pose.data_ptr<double>(), num_threads);
+
+    pose = pose.to(torch::kFloat32);
+    c10::List<torch::Tensor> result;
+    result.push_back(pose.narrow(1, 0, 3).contiguous());
+    result.push_back(pose.narrow(1, 3, 4).contiguous());
+    return result;
+  }
+
+  torch::Tensor compute_jacobian_batch(torch::Tensor joint_positions,
+                                       int64_t frame_idx,
+                                       int64_t num_threads = 1) {
+    int nq = pinocchio_wrapper::get_nq(pinocchio_state_);
+    joint_positions = batchTensor(joint_positions, nq, "joint_positions");
+    int64_t batch_size = joint_positions.size(0);
+
+    torch::Tensor result = torch::empty({batch_size, 6, nq}, torch::kFloat64);
+    pinocchio_wrapper::compute_jacobian_batch(
+        pinocchio_state_, joint_positions.data_ptr<double>(), batch_size,
+        frame_idx, result.data_ptr<double>(), num_threads);
+    return result;
+  }
+
+  torch::Tensor inverse_dynamics_batch(torch::Tensor joint_positions,
+                                       torch::Tensor joint_velocities,
+                                       torch::Tensor joint_accelerations,
+                                       int64_t num_threads = 1) {
+    int nq = pinocchio_wrapper::get_nq(pinocchio_state_);
+    joint_positions = batchTensor(joint_positions, nq, "joint_positions");
+    joint_velocities = batchTensor(joint_velocities, nq, "joint_velocities");
+    joint_accelerations =
+        batchTensor(joint_accelerations, nq, "joint_accelerations");
+    int64_t batch_size = joint_positions.size(0);
+    TORCH_CHECK(joint_velocities.size(0) == batch_size &&
+                    joint_accelerations.size(0) == batch_size,
+                "inverse_dynamics_batch: batch sizes do not match");
+
+    torch::Tensor result = torch::empty({batch_size, nq}, torch::kFloat64);
+    pinocchio_wrapper::inverse_dynamics_batch(
+        pinocchio_state_, joint_positions.data_ptr<double>(),
+        joint_velocities.data_ptr<double>(),
+        joint_accelerations.data_ptr<double>(), batch_size,
+        result.data_ptr<double>(), num_threads);
+    return result;
+  }
+
+  c10::List<torch::Tensor>
+  inverse_kinematics_batch(torch::Tensor link_pos, torch::Tensor link_quat,
+                           int64_t frame_idx, torch::Tensor rest_pose,
+                           double eps = 1e-4, int64_t max_iters = 1000,
+                           double dt = 0.1, double damping = 1e-6,
+                           int64_t num_threads = 1) {
+    int nq = pinocchio_wrapper::get_nq(pinocchio_state_);
+    link_pos = batchTensor(link_pos, 3, "link_pos");
+    link_quat = batchTensor(link_quat, 4, "link_quat");
+    int64_t batch_size = link_pos.size(0);
+    TORCH_CHECK(link_quat.size(0) == batch_size,
+                "inverse_kinematics_batch: batch sizes do not match");
+
+    // The solutions are written in place over a copy of the rest poses
+    torch::Tensor result =
+        batchTensor(rest_pose.expand({batch_size, nq}), nq, "rest_pose")
+            .clone();
+    torch::Tensor converged = torch::empty({batch_size}, torch::kBool);
+    pinocchio_wrapper::inverse_kinematics_batch(
+        pinocchio_state_, link_pos.data_ptr<double>(),
+        link_quat.data_ptr<double>(), batch_size, frame_idx,
+        result.data_ptr<double>(), converged.data_ptr<bool>(), eps, max_iters,
+        dt, damping, num_threads);
+
+    c10::List<torch::Tensor> solution;
+    solution.push_back(result);
+    solution.push_back(converged);
+    return solution;
+  }
+
   int64_t get_link_idx_from_name(std::string link_name) {
     return pinocchio_wrapper::get_link_idx_from_name(pinocchio_state_,
                                                      link_name.c_str());
@@ -193,6 +287,14 @@ TORCH_LIBRARY(torchscript_pinocchio, m) {
       .def("compute_jacobian", &RobotModelPinocchio::compute_jacobian)
       .def("inverse_dynamics", &RobotModelPinocchio::inverse_dynamics)
       .def("inverse_kinematics", &RobotModelPinocchio::inverse_kinematics)
+      .def("forward_kinematics_batch",
+           &RobotModelPinocchio::forward_kinematics_batch)
+      .def("compute_jacobian_batch",
+           &RobotModelPinocchio::compute_jacobian_batch)
+      .def("inverse_dynamics_batch",
+           &RobotModelPinocchio::inverse_dynamics_batch)
+      .def("inverse_kinematics_batch",
+           &RobotModelPinocchio::inverse_kinematics_batch)
       .def("get_link_idx_from_name",
            &RobotModelPinocchio::get_link_idx_from_name)
       .def("get_link_name_from_idx",
@@ -3,7 +3,12 @@
 // This source code is licensed under the MIT license found in the
 // LICENSE file in the root directory of this source tree.
 #include "torch_server_ops.hpp"
+#include <algorithm>
+#include <cstring>
 #include <istream>
+#include <list>
+#include <map>
+#include <stdexcept>
 #include <streambuf>
 #include <torch/jit.h>
 #include <torch/script.h>
@@ -64,6 +69,23 @@ struct StateDict {
   c10::Dict<std::string, torch::Tensor> data;
 };
 
+struct ParamTable {
+  std::vector<std::string> names;
+  std::vector<torch::Tensor> params;  // aliases of the module's parameters
+  std::vector<torch::Tensor> staging; // buffers for staged updates
+  std::vector<int> staged;            // indices staged by param_tensor_load
+};
+
+struct StagedAttribute {
+  torch::jit::script::Module owner; // running module or one of its submodules
+  std::string name;
+  torch::jit::IValue value;
+};
+
+struct ParamDictUpdate {
+  std::vector<StagedAttribute> staged;
+};
+
 TorchRobotState::TorchRobotState(int num_dofs) {
   num_dofs_ = num_dofs;
 
@@ -94,6 +116,17 @@ TorchRobotState::TorchRobotState(int num_dofs) {
 
   input_ = new TorchInput{std::vector<torch::jit::IValue>()};
   input_->data.push_back(state_dict_->data);
+
+  timestamp_data_ = rs_timestamp_->data.data_ptr<int32_t>();
+  TorchTensor *fields[NUM_FIELDS] = {
+      rs_joint_positions_,        rs_joint_velocities_,
+      rs_motor_torques_measured_, rs_motor_torques_external_,
+      rs_mass_matrix_,            rs_ee_pose_,
+      rs_jacobian_};
+  for (int i = 0; i < NUM_FIELDS; i++) {
+    field_data_[i] = fields[i]->data.data_ptr<float>();
+    field_size_[i] = fields[i]->data.numel();
+  }
 }
 
 TorchRobotState::~TorchRobotState() {
@@ -109,30 +142,177 @@ TorchRobotState::~TorchRobotState() {
   delete input_;
 }
 
-void TorchRobotState::update_state(int timestamp_s, int timestamp_ns,
-                                   std::vector<float> joint_positions,
-                                   std::vector<float> joint_velocities,
-                                   std::vector<float> motor_torques_measured,
-                                   std::vector<float> motor_torques_external,
-                                   std::vector<float> mass_matrix,
-                                   std::vector<float> ee_pose,
-                                   std::vector<float> jacobian) {
-  rs_timestamp_->data[0] = timestamp_s;
-  rs_timestamp_->data[1] = timestamp_ns;
-  for (int i = 0; i < joint_positions.size(); i++) {
-    rs_joint_positions_->data[i] = joint_positions[i];
-    rs_joint_velocities_->data[i] = joint_velocities[i];
-    rs_motor_torques_measured_->data[i] = motor_torques_measured[i];
-    rs_motor_torques_external_->data[i] = motor_torques_external[i];
+void TorchRobotState::update_timestamp(int timestamp_s, int timestamp_ns) {
+  timestamp_data_[0] = timestamp_s;
+  timestamp_data_[1] = timestamp_ns;
+}
+
+void TorchRobotState::update_field(Field field, const float *data, int size) {
+  std::copy(data, data + std::min(size, field_size_[field]),
+            field_data_[field]);
+}
+
+struct ModuleCache {
+  int capacity;
+  // Most recently used first
+  std::list<std::pair<std::string, torch::jit::script::Module>> modules;
+};
+
+TorchModuleCache::TorchModuleCache(int capacity) {
+  cache_ = new ModuleCache{capacity};
+}
+
+TorchModuleCache::~TorchModuleCache() { delete cache_; }
+
+bool TorchModuleCache::contains(const char *digest) {
+  for (const auto &entry : cache_->modules) {
+    if (entry.first == digest) {
+      return true;
+    }
+  }
+  return false;
+}
+
+void TorchModuleCache::insert(const char *digest, char *data, size_t size) {
+  memstream stream(data, size);
+  torch::jit::script::Module module = torch::jit::load(stream);
+
+  cache_->modules.remove_if(
+      [digest](const auto &entry) { return entry.first == digest; });
+  cache_->modules.emplace_front(digest, module);
+  while (cache_->modules.size() > static_cast<size_t>(cache_->capacity)) {
+    cache_->modules.pop_back();
+  }
+}
+
+const std::map<std::string, torch::ScalarType> scalar_types = {
+    {"float32", torch::kFloat32}, {"float64", torch::kFloat64},
+    {"float16", torch::kFloat16}, {"int64", torch::kInt64},
+    {"int32", torch::kInt32},     {"int16", torch::kInt16},
+    {"int8", torch::kInt8},       {"uint8", torch::kUInt8},
+    {"bool", torch::kBool},
+};
+
+torch::ScalarType scalarType(const std::string &dtype) {
+  auto it = scalar_types.find(dtype);
+  if (it == scalar_types.end()) {
+    throw std::invalid_argument("Unsupported tensor dtype " + dtype);
   }
-  for (int i = 0; i < mass_matrix.size(); i++) {
-    rs_mass_matrix_->data[i] = mass_matrix[i];
+  return it->second;
+}
+
+// Name of `scalar_type` in scalar_types, or "" if it is not one of them
+const char *dtypeName(torch::ScalarType scalar_type) {
+  for (const auto &item : scalar_types) {
+    if (item.second == scalar_type) {
+      return item.first.c_str();
+    }
   }
-  for (int i = 0; i < ee_pose.size(); ++i) {
-    rs_ee_pose_->data[i] = ee_pose[i];
+  return "";
+}
+
+/*
+Sets the attribute at `path` (e.g. "joint_pd.Kp") of `module`. Tensors of
+unchanged shape & dtype are copied in place, so that aliases of them (such as
+the entries of ControlModule._param_dict) keep pointing to the new values.
+*/
+void set_module_attribute(torch::jit::script::Module module,
+                          const ModuleAttributeValue &attribute) {
+  std::string path(attribute.name);
+  size_t begin = 0;
+  size_t end;
+  while ((end = path.find('.', begin)) != std::string::npos) {
+    module = module.attr(path.substr(begin, end - begin)).toModule();
+    begin = end + 1;
+  }
+  std::string name = path.substr(begin);
+  if (!module.hasattr(name)) {
+    throw std::invalid_argument("Module has no attribute " + path);
+  }
+
+  switch (attribute.kind) {
+  case ModuleAttributeValue::TENSOR: {
+    torch::NoGradGuard no_grad;
+    std::vector<int64_t> shape(attribute.shape,
+                               attribute.shape + attribute.ndim);
+    auto options = torch::TensorOptions().dtype(scalarType(attribute.dtype));
+    torch::Tensor value = torch::empty(shape, options);
+    if (value.nbytes() != attribute.size) {
+      throw std::invalid_argument("Wrong number of bytes for attribute " +
+                                  path);
+    }
+    std::memcpy(value.data_ptr(), attribute.data, attribute.size);
+
+    torch::jit::IValue current = module.attr(name);
+    if (current.isTensor() && current.toTensor().sizes() == value.sizes() &&
+        current.toTensor().scalar_type() == value.scalar_type()) {
+      current.toTensor().copy_(value);
+    } else {
+      module.setattr(name, value);
+    }
+    break;
+  }
+  case ModuleAttributeValue::INT:
+    module.setattr(name, attribute.int_value);
+    break;
+  case ModuleAttributeValue::FLOAT:
+    module.setattr(name, attribute.float_value);
+    break;
+  case ModuleAttributeValue::BOOL:
+    module.setattr(name, attribute.bool_value);
+    break;
   }
-  for (int i = 0; i < jacobian.size(); ++i) {
-    rs_jacobian_->data[i] = jacobian[i];
+}
+
+static bool same_scalar(const torch::jit::IValue &a,
+                        const torch::jit::IValue &b) {
+  if (a.isInt() && b.isInt()) {
+    return a.toInt() == b.toInt();
+  }
+  if (a.isDouble() && b.isDouble()) {
+    return a.toDouble() == b.toDouble();
+  }
+  if (a.isBool() && b.isBool()) {
+    return a.toBool() == b.toBool();
+  }
+  return false;
+}
+
+static bool same_tensor(const torch::Tensor &a, const torch::Tensor &b) {
+  if (!a.defined() || !b.defined()) {
+    return a.defined() == b.defined();
+  }
+  return a.sizes() == b.sizes() && a.scalar_type() == b.scalar_type() &&
+         torch::equal(a, b);
+}
+
+/*
+Stages the tensor & scalar attributes of `after` that differ from `before`, to
+be set on the matching attributes of `live`. The three modules are copies of
+one another, so they have the same submodules & attributes.
+*/
+static void stage_changed_attributes(torch::jit::script::Module live,
+                                     const torch::jit::script::Module &before,
+                                     const torch::jit::script::Module &after,
+                                     std::vector<StagedAttribute> &staged) {
+  for (const auto &attribute : after.named_attributes(/*recurse=*/false)) {
+    torch::jit::IValue old_value = before.attr(attribute.name);
+    const torch::jit::IValue &new_value = attribute.value;
+    if (new_value.isModule()) {
+      stage_changed_attributes(live.attr(attribute.name).toModule(),
+                               old_value.toModule(), new_value.toModule(),
+                               staged);
+    } else if (new_value.isTensor()) {
+      if (!old_value.isTensor() ||
+          !same_tensor(old_value.toTensor(), new_value.toTensor())) {
+        staged.push_back({live, attribute.name, new_value});
+      }
+    } else if (new_value.isInt() || new_value.isDouble() ||
+               new_value.isBool()) {
+      if (!same_scalar(old_value, new_value)) {
+        staged.push_back({live, attribute.name, new_value});
+      }
+    }
   }
 }
 
@@ -140,19 +320,70 @@ TorchScriptedController::TorchScriptedController(
     char *data, size_t size, TorchRobotState &init_robot_state) {
   memstream stream(data, size);
   module_ = new TorchScriptModule{torch::jit::load(stream)};
+  this->init(init_robot_state);
+}
+
+TorchScriptedController::TorchScriptedController(
+    TorchModuleCache &cache, const char *digest,
+    const std::vector<ModuleAttributeValue> &attributes,
+    TorchRobotState &init_robot_state) {
+  auto &modules = cache.cache_->modules;
+  auto entry = std::find_if(modules.begin(), modules.end(),
+                            [digest](const auto &e) { return e.first == digest; });
+  if (entry == modules.end()) {
+    throw std::out_of_range("No cached module with digest " +
+                            std::string(digest));
+  }
+  modules.splice(modules.begin(), modules, entry);
 
+  module_ = new TorchScriptModule{entry->second.deepcopy()};
+  try {
+    for (const auto &attribute : attributes) {
+      set_module_attribute(module_->data, attribute);
+    }
+  } catch (...) {
+    delete module_;
+    throw;
+  }
+  this->init(init_robot_state);
+}
+
+void TorchScriptedController::init(TorchRobotState &init_robot_state) {
   param_dict_input_ = new TorchInput{std::vector<torch::jit::IValue>()};
+  param_dict_update_ = new ParamDictUpdate();
   empty_input_ = new TorchInput{std::vector<torch::jit::IValue>()};
 
   // Warm up controller (TorchScript models take time to compile during first 2
   // queries)
   this->warmup_controller(WARM_UP_ITERS, init_robot_state);
+
+  // Index the parameters registered in the module's parameter dict (see
+  // torchcontrol.ControlModule), after warmup has restored the module
+  param_table_ = new ParamTable();
+  if (module_->data.hasattr("_param_dict")) {
+    auto param_dict = module_->data.attr("_param_dict").toGenericDict();
+    for (const auto &item : param_dict) {
+      torch::Tensor param = item.value().toTensor();
+      if (!param.defined() || param.numel() == 0) {
+        continue; // placeholder entry of an empty dict
+      }
+      if (*dtypeName(param.scalar_type()) == '\0') {
+        continue; // dtype that cannot be sent in a ParamUpdate
+      }
+      param_table_->names.push_back(item.key().toStringRef());
+      param_table_->params.push_back(param);
+      param_table_->staging.push_back(torch::empty(
+          param.sizes(), torch::TensorOptions().dtype(param.scalar_type())));
+    }
+  }
 }
 
 TorchScriptedController::~TorchScriptedController() {
   delete module_;
   delete param_dict_input_;
+  delete param_dict_update_;
   delete empty_input_;
+  delete param_table_;
 }
 
 std::vector<float> TorchScriptedController::forward(TorchRobotState &input) {
@@ -210,11 +441,98 @@ bool TorchScriptedController::param_dict_load(char *data, size_t size) {
   param_dict_input_->data.push_back(
       param_dict_container.forward(empty_input_->data));
 
+  // The control loop keeps running the module meanwhile, so update() runs on
+  // a copy. Comparing it against a copy taken before update() isolates the
+  // changes of update() from those of the control loop.
+  param_dict_update_->staged.clear();
+  try {
+    torch::NoGradGuard no_grad;
+    torch::jit::script::Module before = module_->data.deepcopy();
+    torch::jit::script::Module after = before.deepcopy();
+    after.get_method("update")(param_dict_input_->data);
+    stage_changed_attributes(module_->data, before, after,
+                             param_dict_update_->staged);
+  } catch (const std::exception &e) {
+    std::cerr << "error updating the controller params:\n";
+    std::cerr << e.what() << std::endl;
+    param_dict_update_->staged.clear();
+    return false;
+  }
+
   return true;
 }
 
 void TorchScriptedController::param_dict_update_module() {
-  module_->data.get_method("update")(param_dict_input_->data);
+  // As in set_module_attribute, tensors of unchanged shape & dtype are copied
+  // in place, so that their aliases see the new values
+  torch::NoGradGuard no_grad;
+  for (StagedAttribute &attribute : param_dict_update_->staged) {
+    torch::jit::IValue current = attribute.owner.attr(attribute.name);
+    if (attribute.value.isTensor() && current.isTensor() &&
+        current.toTensor().defined() &&
+        current.toTensor().sizes() == attribute.value.toTensor().sizes() &&
+        current.toTensor().scalar_type() ==
+            attribute.value.toTensor().scalar_type()) {
+      current.toTensor().copy_(attribute.value.toTensor());
+    } else {
+      attribute.owner.setattr(attribute.name, attribute.value);
+    }
+  }
+  param_dict_update_->staged.clear();
+}
+
+int TorchScriptedController::param_count() {
+  return param_table_->names.size();
+}
+
+const char *TorchScriptedController::param_name(int idx) {
+  return param_table_->names.at(idx).c_str();
+}
+
+std::vector<int64_t> TorchScriptedController::param_shape(int idx) {
+  return param_table_->params.at(idx).sizes().vec();
+}
+
+const char *TorchScriptedController::param_dtype(int idx) {
+  return dtypeName(param_table_->params.at(idx).scalar_type());
+}
+
+bool TorchScriptedController::param_tensor_load(const int *indices,
+                                                int num_indices,
+                                                const char *data,
+                                                size_t size) {
+  param_table_->staged.clear();
+  size_t offset = 0;
+  for (int i = 0; i < num_indices; i++) {
+    int idx = indices[i];
+    if (idx < 0 || idx >= param_count()) {
+      std::cerr << "invalid param index " << idx << std::endl;
+      return false;
+    }
+    torch::Tensor &staging = param_table_->staging[idx];
+    size_t num_bytes = staging.nbytes();
+    if (offset + num_bytes > size) {
+      std::cerr << "param update payload too short for "
+                << param_table_->names[idx] << std::endl;
+      return false;
+    }
+    std::memcpy(staging.data_ptr(), data + offset, num_bytes);
+    offset += num_bytes;
+    param_table_->staged.push_back(idx);
+  }
+  if (offset != size) {
+    std::cerr << "param update payload has " << size - offset
+              << " trailing bytes" << std::endl;
+    return false;
+  }
+  return true;
+}
+
+void TorchScriptedController::param_tensor_update_module() {
+  torch::NoGradGuard no_grad;
+  for (int idx : param_table_->staged) {
+    param_table_->params[idx].copy_(param_table_->staging[idx]);
+  }
 }
 
 } /* extern "C" */